@@ -6,10 +6,24 @@ import os
 from os import path
 import re
 import sys
+import subprocess
+import gzip
+import io
+from contextlib import contextmanager, nullcontext
 from multiprocessing import Pool
+import glob
 from datetime import datetime
 import argparse
-from reframed import load_cbmodel, save_cbmodel
+import pickle
+import hashlib
+import json
+import time
+import threading
+import asyncio
+import ssl
+import urllib.parse
+import zipfile
+from array import array
 
 ###############
 # extra specs #
@@ -18,7 +32,31 @@ _ktest_formats = ["eggnog", "kaas", "kofamkoala"]
 _hmm_modes = ["onebm", "modules", "kos"]
 _def_thr = 0.43
 _gapfill_modes = ["existing", "denovo"]
-_base_com_KEGGget = "curl --silent https://rest.kegg.jp/get/"
+_kegg_rest_url = "https://rest.kegg.jp/"
+_kkdb_version = 4
+_kkdb_cache = "kk_database.pkl"
+_annotation_suffixes = {"kaas": (".ko", ".txt"), "eggnog": (".emapper.annotations",), "kofamkoala": (".tsv", ".txt")}
+_compression_suffixes = (".gz", ".zst")
+_def_genome_pattern = r"^([^|]+)\|"
+_ko_store = "ko_store"
+_columnar_formats = ["npz", "arrow", "parquet"]
+_completeness_levels = ["COMPLETE", "1 BLOCK MISSING", "2 BLOCKS MISSING", "INCOMPLETE"]
+_def_kmc_cache_size = 512
+_kmc_cache_low_mark = 0.9 # evictions free the completeness cache down to this fraction of its size bound
+_module_catalog_version = 1
+_module_catalog_cache = "module_catalog.pkl"
+_taxonomy_index_version = 1
+_taxonomy_index_cache = "br08601_index.pkl"
+_def_seq_cache_size = 10240
+_def_seq_cache_ttl = 90
+_kegg_get_batch = 10 # KEGG API "GET" entries per request
+_def_kegg_rate = 3.0
+_def_kegg_connections = 3
+_kegg_retries = 3
+_kegg_backoff = 1.0
+_kegg_timeout = 120
+_ko_manifest_version = 1
+_nt_sequence = re.compile(r"^[ACGTURYKMSWBDHVN]*$", re.IGNORECASE)
 
 # External dependencies base commands
 # experienced users can edit variables with proper parameters e.g. to modify threads etc.
@@ -37,10 +75,272 @@ def _timeinfo():
     timeinfo = datetime.now().strftime("%Y-%m-%d %H-%M-%S")
     return timeinfo
 
+def _run_command(command, cwd):
+    """
+    Helper function to run a shell command from a given folder,
+    without changing the working directory of the KEMET process.
+
+    Args:
+        command     (str): shell command
+        cwd         (str): folder path in which the command is run
+    """
+    subprocess.run(command, shell=True, cwd=cwd)
+
+def _open_annotation(annotation_file, KAnnotation_directory):
+    """
+    Helper function to open a KO pre-annotation file as text, to be read only once.
+    ".gz" and ".zst" compressed files are decompressed on the fly, "-" reads from standard input.
+
+    Args:
+        annotation_file         (str): pre-annotation file name (or path), or "-" for standard input
+        KAnnotation_directory   (str): pre-annotation files folder path
+
+    Returns:
+        handle          (file object): text file object, to be used as a context manager
+    """
+    if annotation_file == "-":
+        return nullcontext(sys.stdin)
+
+    annotation_path = path.join(KAnnotation_directory, annotation_file)
+    if annotation_path.endswith(".gz"):
+        return gzip.open(annotation_path, "rt")
+    if annotation_path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstandard is required for \".zst\" pre-annotation files (e.g. 'pip install zstandard')")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(annotation_path, "rb"), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader)
+    return open(annotation_path)
+
+def _ko_store_files(ktests_directory):
+    """
+    Helper function to point out the files of the KO store, in the ".ktest" files folder:
+    ".kos" interned KOs (1 per line, the line number being the KO id),
+    ".bin" KO ids of every genome one after the other (unsigned 32-bit little-endian integers, memory-mappable),
+    ".idx" genome name, offset and number of its KO ids in the ".bin" file (the last line of a genome wins).
+
+    Args:
+        ktests_directory        (str): KO store folder path
+
+    Returns:
+        store_files            (dict): {".kos"/".bin"/".idx" : file path}
+    """
+    return { ext: path.join(ktests_directory, _ko_store + ext) for ext in (".kos", ".bin", ".idx") }
+
+_ko_stores = {} # KO stores already read by this process, by folder path
+_ko_stores_lock = threading.RLock() # KO stores of this process may be read and appended by concurrent threads
+
+def open_ko_store(ktests_directory):
+    """
+    Opens the persistent KO store of a ".ktest" files folder, i.e. the KOs of every pre-annotated genome.
+    Only lines appended since the last call (e.g. by other KEMET processes) are read;
+    the store is read again from the beginning if its files were removed or replaced meanwhile.
+
+    Args:
+        ktests_directory        (str): KO store folder path
+
+    Returns:
+        store                  (dict): Python-dictionary object:
+                                        "files": output of "_ko_store_files()"
+                                        "ko_ids": interned KOs, by KO id
+                                        "ko_index": {KO : KO id}
+                                        "genomes": {genome name : (offset, number of KOs)}
+    """
+    with _ko_stores_lock:
+        store = _ko_stores.get(ktests_directory)
+        if store is not None and any( (path.getsize(file) if path.isfile(file) else 0) < store["read"][ext]
+                                      for ext, file in store["files"].items() if ext in store["read"] ):
+            store = None
+        if store is None:
+            store = {"files": _ko_store_files(ktests_directory), "ko_ids": [], "ko_index": {}, "genomes": {}, "read": {".kos": 0, ".idx": 0}}
+            _ko_stores[ktests_directory] = store
+
+        for ext in (".kos", ".idx"):
+            if not path.isfile(store["files"][ext]):
+                continue
+            with open(store["files"][ext], "rb") as f:
+                f.seek(store["read"][ext])
+                tail = f.read()
+            # an appending process may not have completed its last line yet
+            tail = tail[:tail.rfind(b"\n") + 1]
+            store["read"][ext] += len(tail)
+            for line in tail.decode().splitlines():
+                if ext == ".kos":
+                    store["ko_index"][line] = len(store["ko_ids"])
+                    store["ko_ids"].append(line)
+                else:
+                    genome, offset, count = line.split("\t")
+                    store["genomes"][genome] = (int(offset), int(count))
+
+    return store
+
+def ko_store_genome(store, genome):
+    """
+    Returns the KOs of a genome from the KO store, reading only its own KO ids.
+
+    Args:
+        store                  (dict): output of "open_ko_store()"
+        genome                  (str): genome name
+
+    Returns:
+        ko_list                (list): KOs of the genome, in pre-annotation order (None if the genome is not in the store)
+    """
+    if genome not in store["genomes"]:
+        return None
+    offset, count = store["genomes"][genome]
+    ids = array("I")
+    with open(store["files"][".bin"], "rb") as f:
+        f.seek(offset * ids.itemsize)
+        ids.frombytes(f.read(count * ids.itemsize))
+    if sys.byteorder == "big":
+        ids.byteswap()
+
+    ko_list = [ store["ko_ids"][i] for i in ids ]
+    return ko_list
+
+def ko_store_append(ktests_directory, genome, KOs):
+    """
+    Appends (or replaces) the KOs of a genome in the KO store, creating it if needed.
+    Appends of concurrent KEMET processes are serialized via a file lock (where available),
+    appends and reads of concurrent threads via the lock of the KO stores of this process.
+
+    Args:
+        ktests_directory        (str): KO store folder path
+        genome                  (str): genome name
+        KOs                (iterable): KOs of the genome
+    """
+    os.makedirs(ktests_directory, exist_ok=True)
+    store_files = _ko_store_files(ktests_directory)
+
+    with open(store_files[".idx"], "a") as idx, _ko_stores_lock:
+        try:
+            import fcntl
+            fcntl.flock(idx, fcntl.LOCK_EX) # released when closing the file
+        except ImportError:
+            pass
+        store = open_ko_store(ktests_directory)
+
+        ids = array("I")
+        new_kos = []
+        for ko in dict.fromkeys(KOs):
+            if ko not in store["ko_index"]:
+                store["ko_index"][ko] = len(store["ko_ids"])
+                store["ko_ids"].append(ko)
+                new_kos.append(ko)
+            ids.append(store["ko_index"][ko])
+        if sys.byteorder == "big":
+            ids.byteswap()
+
+        if new_kos:
+            with open(store_files[".kos"], "a") as f:
+                f.write("".join( ko + "\n" for ko in new_kos ))
+            store["read"][".kos"] = path.getsize(store_files[".kos"])
+        with open(store_files[".bin"], "ab") as f:
+            offset = f.tell() // ids.itemsize
+            f.write(ids.tobytes())
+        line = f"{genome}\t{offset}\t{len(ids)}\n"
+        idx.write(line)
+        idx.flush()
+        store["read"][".idx"] += len(line.encode())
+        store["genomes"][genome] = (offset, len(ids))
+
+def _write_ktest(KOs, converted_output, ktests_directory):
+    """
+    Helper function to save the KOs of a pre-annotation in the KO store (formerly a ".ktest" file).
+
+    Args:
+        KOs                    (dict): KOs of the pre-annotation (as keys)
+        converted_output        (str): genome name in the KO store, ".ktest" extension being optional
+        ktests_directory        (str): KO store folder path
+    """
+    genome = converted_output[:-6] if converted_output.endswith(".ktest") else converted_output
+    ko_store_append(ktests_directory, genome, KOs)
+
+def _eggnog_records(handle):
+    """
+    Helper generator to stream eggNOG pre-annotations (".emapper.annotations") in one pass.
+
+    Args:
+        handle          (file object): text file object, from "_open_annotation()"
+
+    Yields:
+        (gene, KOs)           (tuple): gene (query) ID and its KOs
+    """
+    header = ""
+    koslice = None
+    for line in handle:
+        if line.startswith("#"):
+            header = line
+            continue
+        if koslice is None:
+            # the last comment line before the first gene holds the column names
+            koslice = header.strip().split("\t").index("KEGG_ko")
+
+        fields = line.strip().split("\t")
+        egg_kos = fields[koslice].replace("ko:", "")
+
+        if egg_kos == "" or egg_kos == "-":
+            continue
+
+        yield fields[0], egg_kos.split(",")
+
+def _kaas_records(handle):
+    """
+    Helper generator to stream KAAS pre-annotations in one pass.
+
+    Args:
+        handle          (file object): text file object, from "_open_annotation()"
+
+    Yields:
+        (gene, KOs)           (tuple): gene ID and its KO (as a 1-element list)
+    """
+    for line in handle:
+        line = line.strip().split("\t")
+        if len(line) == 2:
+            yield line[0], [line[1]]
+
+def _kofam_records(handle):
+    """
+    Helper generator to stream KofamKOALA pre-annotations (detail or detail-tsv format) in one pass,
+    only considering hits above the KO threshold ("*" lines).
+
+    Args:
+        handle          (file object): text file object, from "_open_annotation()"
+
+    Yields:
+        (gene, KOs)           (tuple): gene ID and its KO (as a 1-element list)
+    """
+    tsvflag = False
+    for linum, line in enumerate(handle):
+        if linum == 0:
+            continue
+        if linum == 1:
+            tsvflag = "\t" in line.strip()
+            continue
+
+    # skip header, spacer line & gene hits under threshold
+        if not line.startswith("*"):
+            continue
+
+        if tsvflag:
+            fields = line.split("\t")
+            gene, kofam_ko = fields[1], fields[2]
+        else:
+            # gene IDs have no blanks, columns are only padded for alignment (e.g. longer gene IDs)
+            gene, kofam_ko = line[1:].split(None, 2)[:2]
+
+        if not kofam_ko.startswith("K"):
+            continue
+        yield gene, [kofam_ko]
+
+_annotation_records = {"eggnog": _eggnog_records, "kaas": _kaas_records, "kofamkoala": _kofam_records}
+
 def eggnogXktest(eggnog_file, converted_output, KAnnotation_directory, ktests_directory):
     """
     Starting from eggNOG pre-annotations (".emapper.annotations"),
     (1 gene - many annotations), keeps only KOs in a converted ".ktest" file.
+    The input is read once (see "_open_annotation()" for compressed files and standard input).
 
     Args:
         eggnog_file             (str): eggnog mapper output file name
@@ -50,31 +350,16 @@ def eggnogXktest(eggnog_file, converted_output, KAnnotation_directory, ktests_di
 
     Returns:
         converted_output        (str): output .ktest file name
-        KOs                    (dict): (not used in current version)
+        KOs                    (dict): Python-dictionary object:
+                                        keys: "KO"
+                                        values: number of genes annotated with the KO
     """
-    os.chdir(KAnnotation_directory)
     KOs = {}
 
-    with open(eggnog_file) as g:
-        for linum, line in enumerate(g, -1):
-            if not line.startswith("#"):
-                break
-        g.seek(0)
-        fields = g.readlines()[linum].strip().split("\t")
-        koslice = fields.index("KEGG_ko")
-        g.seek(0)
-        for line in g:
-            if line.startswith("#"):
-                continue
-
-            egg_kos = line.strip().split("\t")[koslice].replace("ko:", "")
-
-            if egg_kos == "" or egg_kos == "-":
-                continue
-
-            for ko in egg_kos.split(","):
-                KOs.setdefault(ko, 0)
-                KOs[ko] += 1
+    with _open_annotation(eggnog_file, KAnnotation_directory) as g:
+        for gene, egg_kos in _eggnog_records(g):
+            for ko in egg_kos:
+                KOs[ko] = KOs.get(ko, 0) + 1
 
             # POSSIBILITY:
             # for each gene, correct per diff. ortholog hits
@@ -84,12 +369,7 @@ def eggnogXktest(eggnog_file, converted_output, KAnnotation_directory, ktests_di
                 #else:
                     #KOs[ko] += round(1/len(egg_kos_hits), 2)
 
-    if not path.isdir(ktests_directory):
-        os.mkdir(ktests_directory)
-
-    with open(path.join(ktests_directory, converted_output), "w") as g:
-        for ko in KOs:
-            print(ko, file=g)
+    _write_ktest(KOs, converted_output, ktests_directory)
 
     return converted_output, KOs
 
@@ -98,6 +378,7 @@ def KAASXktest(file_kaas, converted_output, KAnnotation_directory, ktests_direct
     """
     Starting from KAAS output (1 gene - 1 KO),
     keeps only KOs in a converted ".ktest" file.
+    The input is read once (see "_open_annotation()" for compressed files and standard input).
 
     Args:
         file_kaas               (str): KAAS output file name
@@ -107,23 +388,16 @@ def KAASXktest(file_kaas, converted_output, KAnnotation_directory, ktests_direct
 
     Returns:
         converted_output        (str): output .ktest file name
-        KOs                    (dict): (not used in this version)
+        KOs                    (dict): Python-dictionary object:
+                                        keys: "KO"
+                                        values: number of genes annotated with the KO
     """
-    os.chdir(KAnnotation_directory)
-    KOs = []
-    with open(file_kaas) as f:
-        for line in f:
-            line = line.strip().split("\t")
-            if len(line) == 2:
-                if line[1] not in KOs:
-                    KOs.append(line[1])
-
-    if not path.isdir(ktests_directory):
-        os.mkdir(ktests_directory)
+    KOs = {}
+    with _open_annotation(file_kaas, KAnnotation_directory) as f:
+        for gene, (ko,) in _kaas_records(f):
+            KOs[ko] = KOs.get(ko, 0) + 1
 
-    with open(path.join(ktests_directory, converted_output), "w") as g:
-        for ko in KOs:
-            print(ko, file=g)
+    _write_ktest(KOs, converted_output, ktests_directory)
 
     return converted_output, KOs
 
@@ -132,6 +406,7 @@ def kofamXktest(kofamkoala_file, converted_output, KAnnotation_directory, ktests
     """
     Starting from KofamKOALA output (1 gene - many annotations),
     keeps only KOs in a converted ".ktest" file.
+    The input is read once (see "_open_annotation()" for compressed files and standard input).
 
     Args:
         kofamkoala_file         (str): KofamKOALA output file name
@@ -141,2155 +416,4815 @@ def kofamXktest(kofamkoala_file, converted_output, KAnnotation_directory, ktests
 
     Returns:
         converted_output        (str): output .ktest file name
-        KOs                    (dict): (not used)
+        KOs                    (dict): Python-dictionary object:
+                                        keys: "KO"
+                                        values: number of genes annotated with the KO
     """
-    os.chdir(KAnnotation_directory)
     KOs = {}
-    tsvflag = False
 
-    with open(kofamkoala_file) as g:
-        spacer = g.readlines()[1].strip()
-        if "\t" in spacer:
-            tsvflag = True
-        else:
-            fastaslice = spacer.index(" ", 5) + 1 # account for longer gene IDs
-            koslice = spacer.index(" ", fastaslice) + 1
-        g.seek(0)
+    with _open_annotation(kofamkoala_file, KAnnotation_directory) as g:
+        for gene, (kofam_ko,) in _kofam_records(g):
+            KOs[kofam_ko] = KOs.get(kofam_ko, 0) + 1
 
-        for line in g.readlines()[2:]:
-        # skip header, spacer line & gene hits under threshold
-            if not line.startswith("*"):
-                continue
+    _write_ktest(KOs, converted_output, ktests_directory)
 
-            if tsvflag:
-                kofam_ko = line.split("\t")[2]
-            else:
-                kofam_ko = line[koslice:koslice+6].strip()
+    return converted_output, KOs
 
-            if not kofam_ko.startswith("K"):
-                continue
-            KOs.setdefault(kofam_ko, 0)
-            KOs[kofam_ko] += 1
+def demultiplex_annotation(annotation_file, annotation_format, KAnnotation_directory, genome_pattern=_def_genome_pattern):
+    """
+    Streams a combined pre-annotation file, covering many MAGs/Genomes, only once.
+    Genes are assigned to MAGs/Genomes via a regular expression on their IDs,
+    building the KOs of every MAG/Genome in memory (no per-genome intermediate files).
 
-    if not path.isdir(ktests_directory):
-        os.mkdir(ktests_directory)
+    Args:
+        annotation_file             (str): combined pre-annotation file name (or path), or "-" for standard input
+        annotation_format           (str): pre-annotation format, one of _ktest_formats
+        KAnnotation_directory       (str): pre-annotation files folder path
+        genome_pattern    (str, optional): regular expression matching gene IDs, whose "genome" named group
+                                           (or first group) is the MAG/Genome name. Defaults to _def_genome_pattern.
 
-    with open(path.join(ktests_directory, converted_output), "w") as g:
-        for ko in KOs.keys():
-            print(ko, file=g)
+    Returns:
+        genomes_KOs                (dict): Python-dictionary object:
+                                            keys: "MAG/Genome name"
+                                            values: {KO : number of genes annotated with the KO}
+        unassigned                  (int): number of annotated genes whose ID did not match the pattern
+    """
+    genome_regex = re.compile(genome_pattern)
+    group = "genome" if "genome" in genome_regex.groupindex else 1
+    genomes_KOs = {}
+    unassigned = 0
+
+    with _open_annotation(annotation_file, KAnnotation_directory) as f:
+        for gene, gene_kos in _annotation_records[annotation_format](f):
+            match = genome_regex.search(gene)
+            if match is None:
+                unassigned += 1
+                continue
+            KOs = genomes_KOs.setdefault(match.group(group), {})
+            for ko in gene_kos:
+                KOs[ko] = KOs.get(ko, 0) + 1
 
-    return converted_output, KOs
+    return genomes_KOs, unassigned
 
 def create_KO_list(file_ko_list, ktests_directory):
     """
-    Returns a Python list-object from KOs file as recovered in pre-annotations (".ktest" file).
+    Returns a Python list-object from KOs as recovered in pre-annotations,
+    from the KO store or from a ".ktest" file of previous KEMET versions.
 
     Args:
-        file_ko_list            (str): KO list file name (".ktest")
-        ktests_directory        (str): ".ktest" input file folder path
+        file_ko_list            (str): genome name in the KO store or KO list file name (".ktest")
+        ktests_directory        (str): KO store / ".ktest" input file folder path
 
     Returns:
         ko_list                (list): list of single KOs present in the input pre-annotation
     """
-    os.chdir(ktests_directory)
-    ko_list = []
-    with open(file_ko_list) as f:
-        ko_list = [ line.strip() for line in f ]
+    genome = file_ko_list[:-6] if file_ko_list.endswith(".ktest") else file_ko_list
+    ko_list = ko_store_genome(open_ko_store(ktests_directory), genome)
+    if ko_list is None:
+        with open(path.join(ktests_directory, genome+".ktest")) as f:
+            ko_list = [ line.strip() for line in f ]
 
     return ko_list
 
-def testcompleteness(ko_list, kk_file, kkfiles_directory, report_txt_directory, file_output, cutoff=0):
+def stored_genomes(ktests_directory):
     """
-    Computes KEGG Modules completeness from KO pre-annotation.
-    Reports that in a flat-file,
-    including single missing KOs and their position, relative to KEGG Modules blocks
+    Lists the genomes with KOs in the KO store, together with ".ktest" files of previous KEMET versions.
 
     Args:
-        ko_list                (list): output from previous "create_KO_list" function
-        kk_file                 (str): .kk file, which includes a KEGG Module definition properly parsed and organized in blocks
-        kkfiles_directory       (str): input .kk files folder
-        report_txt_directory    (str): output folder
-        file_output             (str): output file name
-        cutoff        (int, optional): Minimum obtained KEGG Module completeness percentage to be included in report file.
-                                        Defaults to 0.
-    """
-    os.chdir(kkfiles_directory)
-    report = []
-    with open(kk_file) as f:
-        count_lines = 0
-        linenumber = 0
-        missing = 0
-        present = 0
-        complexes = []
-        optional = []
-        submodules = False
-        submodule = ""
-        subOR_presence = False
-        subOR_dict = {}
-        to_remove = []
-        ko_list_optional = ko_list
-        extended_name = f.readline().strip().replace(".txt", "")
-        f.seek(0)
-        report.append(kk_file + "\t" + extended_name + "\n")
-        v = f.readlines()
-        end = len(v)
+        ktests_directory        (str): KO store / ".ktest" files folder path
 
-# search presence-absence complexes//optional//list-type
-        f.seek(0)
+    Returns:
+        genomes                (list): sorted genome names
+    """
+    genomes = set(open_ko_store(ktests_directory)["genomes"])
+    if path.isdir(ktests_directory):
+        genomes.update( file[:-6] for file in os.listdir(ktests_directory) if file.endswith(".ktest") )
+    return sorted(genomes)
 
-        #COMPLEXES
-        v_complex = v.index("COMPLEXES_LIST\n") if "COMPLEXES_LIST\n" in v else None
-        v_optional = v.index("OPTIONAL_LIST\n") if "OPTIONAL_LIST\n" in v else None
-
-#         if "COMPLEXES_LIST\n" in v:
-#             v_complex = v.index("COMPLEXES_LIST\n")
-#         else:
-#             v_complex = -1
-# 
-#         #OPTIONALS
-#         if "OPTIONAL_LIST\n" in v:
-#             v_optional = v.index("OPTIONAL_LIST\n")
-#         else:
-#             v_optional = -1
-
-        if "/\n" in v:
-            submodules = True
-            submodule = 0
-        if "//\n" in v:
-            submodules = True
-            submodule = 0
-            subOR_presence = True
-            subOR = -1
-
-# search complexes
-        if v_complex is not None:
-            end = v_complex
-            c_list = v[v_complex+1].replace("\n", "").replace("\t", "").split(", ")
-            for el in c_list:
-                complexes.append(el)
-# search optionals
-        if v_optional is not None:
-            o_list = v[v_optional + 1].replace("\n", "").replace("\t", "").split(", ")
-            for el in o_list:
-                optional.append(el)
-            ko_list_optional = [ el for el in ko_list ]
-            for el in optional:
-                ko_list_optional.append(el)
-
-        for line in v[1:end]:
-            count_lines += 1
-            if submodules:
-                if line == "/\n":
-                    linenumber = 0
-                    check = False
-                    submodule += 1
-                    continue
-                if subOR_presence:
-                    end_or = end - 1
-                    if line == "//\n"  or count_lines == end_or:
-                        linenumber = 0
-                        check = False
-                        submodule += 1
-                        if count_lines != end_or:
-                            subOR += 1
-                        if subOR != 0:
-                            if count_lines != end_or:
-                                tmp = str(present) + "__" + str(present+missing)
-                                subOR_infos += tmp
-                                subOR_dict.update({subOR:subOR_infos})
-                                present = 0
-                                missing = 0
-
-                        subOR_infos = ""
-                        if count_lines != end_or:
-                            continue
-                        else:
-                            pass
+def parse_kk_file(kk_file, kkfiles_directory):
+    """
+    Parses a single .kk file into a compiled KEGG Module definition.
+    Blocks are stored with their KOs already split, together with the complexes they fully include,
+    the KOs not involved in any complex, their position in the Module and the "//" alternative they belong to.
 
-            linenumber += 1
-            check = False
-            ko_line = line.strip().split(", ")
-
-            if len(complexes) != 0:
-                while check is False:
-                    for singlecomplex in complexes:
-                        k_singlecomplex = re.split("[+-]", singlecomplex.strip())
-                        if all(el in ko_line for el in k_singlecomplex):
-                            if all(el in ko_list_optional for el in k_singlecomplex):
-                                check = True
-                            else:
-                                continue
-                    else:
-                        for element in ko_line:
-                            if element not in str(complexes):
-                                if element in ko_list:
-                                    check = True
-                                    break
-                                else:
-                                    continue
-                        else:
-                            break
+    Args:
+        kk_file                 (str): .kk file, which includes a KEGG Module definition properly parsed and organized in blocks
+        kkfiles_directory       (str): input .kk files folder
 
-                if check:
-                    present += 1
-                else:
-                    missing += 1
-                    control = str(linenumber) + "." + str(submodule) + "\t" + str(line)
-                    report.append(control)
-
-            elif len(complexes) == 0:
-                for element in ko_list:
-                    if element in line:
-                        check = True
-                else:
-                    if check:
-                        present += 1
-                    else:
-                        missing += 1
-                        control = str(linenumber) + "." + str(submodule) + "\t" + str(line)
-                        report.append(control)
+    Returns:
+        kk_module              (dict): Python-dictionary object with the compiled KEGG Module definition
+    """
+    with open(path.join(kkfiles_directory, kk_file)) as f:
+        v = f.readlines()
 
-            total = present + missing
-            percentage_round = round((present/(total))*100, 2)
+    extended_name = v[0].strip().replace(".txt", "")
+    end = len(v)
+    complexes = []
+    optional = []
+
+# search complexes//optionals
+    if "COMPLEXES_LIST\n" in v:
+        #KOs search stops at complex line
+        end = v.index("COMPLEXES_LIST\n")
+        complexes = v[end+1].replace("\n", "").replace("\t", "").split(", ")
+    if "OPTIONAL_LIST\n" in v:
+        v_optional = v.index("OPTIONAL_LIST\n")
+        optional = v[v_optional+1].replace("\n", "").replace("\t", "").split(", ")
+
+    str_complexes = str(complexes)
+    complexes_kos = [ tuple(re.split("[+-]", singlecomplex.strip())) for singlecomplex in complexes ]
+
+# list-indications: "/" sub-modules are AND-ed, "//" sub-modules are alternatives
+    submodules = "/\n" in v or "//\n" in v
+    subOR_presence = "//\n" in v
+
+    body = v[1:end]
+    blocks = []
+    linenumber = 0
+    submodule = 0 if submodules else ""
+    subOR = 0
+    for count_lines, line in enumerate(body, 1):
+        if submodules:
+            if line == "/\n":
+                linenumber = 0
+                submodule += 1
+                continue
+            if subOR_presence and (line == "//\n" or count_lines == len(body)):
+                linenumber = 0
+                submodule += 1
+                if count_lines != len(body):
+                    subOR += 1
+                    continue
 
+        linenumber += 1
+        ko_line = line.strip().split(", ")
+        if complexes:
+            # a complex counts for a block only if each of its KOs is in the block
+            block_complexes = tuple(k_singlecomplex for k_singlecomplex in complexes_kos
+                                    if all(el in ko_line for el in k_singlecomplex))
+            block_free = tuple(ko for ko in ko_line if ko not in str_complexes)
         else:
-            if subOR_presence and count_lines == end_or:
-                subOR += 1
-                tmp = str(present)+"__"+str(present+missing)
-                subOR_infos += tmp
-                subOR_dict.update({subOR:subOR_infos})
-                percentage_round = -1
-
-        for subOR, value in subOR_dict.items():
-            tmp_present = int(value.split("__")[0])
-            tmp_total = int(value.split("__")[1])
-            tmp_percentage_round = round((tmp_present/(tmp_total))*100, 2)
-
-            if tmp_percentage_round > percentage_round:
-                present = tmp_present
-                total = tmp_total
-                percentage_round = round((present/(total))*100, 2)
-                subOR_most = subOR
+            # without complexes, any KO found in the block line is enough
+            block_complexes = ()
+            block_free = tuple(re.findall("K[0-9]{5}", line))
+
+        blocks.append({
+            "line": line,
+            "free": block_free,
+            "complexes": block_complexes,
+            "label": str(linenumber) + "." + str(submodule),
+            "submodule": submodule,
+            "subOR": max(subOR, 1) if subOR_presence else 0,
+        })
+
+    module_kos = [ ko for line in body for ko in line.strip().split(", ")
+                   if ko != "/" and ko != "//" ]
+
+    kk_module = {
+        "kk_file": kk_file,
+        "extended_name": extended_name,
+        "blocks": blocks,
+        "optional": tuple(optional),
+        "subOR_presence": subOR_presence,
+        "module_kos": tuple(module_kos),
+    }
+    return kk_module
+
+def _kk_signature(kkfiles_directory, suffix=".kk"):
+    """
+    Helper function to fingerprint the .kk files folder (file names, sizes and modification times),
+    used to check whether a compiled KEGG Module database is still valid.
 
-        completeness = "COMPLETE" if percentage_round == 100 else "INCOMPLETE"
+    Args:
+        kkfiles_directory       (str): input .kk files folder
+        suffix        (str, optional): suffix of the files to fingerprint (e.g. ".txt" for KEGG Modules flat-files). Defaults to ".kk".
 
-        report.insert(1, "%\t" + str(percentage_round) + "\t" + str(present) + "__" + str(total) + "\t" + completeness + "\n")
+    Returns:
+        signature              (list): Python-list object with a (name, size, mtime) entry per .kk file
+    """
+    signature = []
+    for kk_file in sorted(os.listdir(kkfiles_directory)):
+        if kk_file.endswith(suffix):
+            kk_stat = os.stat(path.join(kkfiles_directory, kk_file))
+            signature.append((kk_file, kk_stat.st_size, kk_stat.st_mtime_ns))
+    return signature
+
+def ko_bitset(ko_list, ko_ids):
+    """
+    Converts KOs into an integer bitset, using the KO integer IDs interned in the compiled KEGG Modules database.
+    KOs absent from every KEGG Module are not included.
 
-        if subOR_presence:
-            for info in report[2:]:
-                info = info.strip()
-                sub = int(info.split(".")[1].split("\t")[0].strip())
-                if sub != subOR_most:
-                    to_remove.append(info)
+    Args:
+        ko_list                (list): KOs to be converted
+        ko_ids                 (dict): Python-dictionary object: {KO : integer ID}
 
-        for el in to_remove:
-            report.remove(el+"\n")
+    Returns:
+        ko_bits                 (int): bitset with the bit of each KO ID set
+    """
+    ko_bits = 0
+    for ko in ko_list:
+        ko_id = ko_ids.get(ko)
+        if ko_id is not None:
+            ko_bits |= 1 << ko_id
+    return ko_bits
+
+def _intern_kk_modules(modules):
+    """
+    Helper function to intern every KO of the compiled KEGG Modules to an integer ID,
+    then adds to each Module its optionals bitset and to each block the bitsets of its KOs and complexes.
 
-    if percentage_round >= cutoff:
-        if not path.isdir(report_txt_directory):
-            os.mkdir(report_txt_directory)
-        os.chdir(report_txt_directory)
-        with open(file_output, "a") as g:
-            for el in report:
-                g.write(el)
-            g.write("\n")
+    Args:
+        modules                (dict): Python-dictionary object: {".kk file name" : output of "parse_kk_file()"}
 
-def testcompleteness_tsv(ko_list, kk_file, kkfiles_directory, report_tsv_directory, file_report_tsv, as_kegg=False, cutoff=0):
+    Returns:
+        ko_ids                 (dict): Python-dictionary object: {KO : integer ID}
     """
-    Computes KEGG Modules completeness from KO pre-annotation.
-    Reports that in a tab-separated file,
-    including single missing KOs and their position, relative to KEGG Modules blocks.
+    all_kos = set()
+    for kk_module in modules.values():
+        all_kos.update(kk_module["module_kos"], kk_module["optional"])
+        for block in kk_module["blocks"]:
+            all_kos.update(block["free"])
+            for k_singlecomplex in block["complexes"]:
+                all_kos.update(k_singlecomplex)
+
+    ko_ids = { ko: ko_id for ko_id, ko in enumerate(sorted(all_kos)) }
+
+    for kk_module in modules.values():
+        kk_module["optional_bits"] = ko_bitset(kk_module["optional"], ko_ids)
+        for block in kk_module["blocks"]:
+            block["free_bits"] = ko_bitset(block["free"], ko_ids)
+            block["complexes_bits"] = tuple(ko_bitset(k_singlecomplex, ko_ids)
+                                            for k_singlecomplex in block["complexes"])
+    return ko_ids
+
+def _kk_inverted_index(modules):
+    """
+    Helper function to build the inverted index from each KO to the KEGG Modules entries that reference it,
+    i.e. the blocks (and complexes) in which it is found.
 
     Args:
-        ko_list                    (list): output from previous "create_KO_list" function
-        kk_file                     (str): .kk file, which includes a KEGG Module definition properly parsed and organized in blocks
-        kkfiles_directory           (str): input .kk files folder
-        report_tsv_directory        (str): output folder path
-        file_report_tsv             (str): output file name
-        as_kegg                    (bool): option to report KEGG Modules completeness as KEGG mapper (see README for details)
-        cutoff            (int, optional): Minimum obtained KEGG Module completeness percentage to be included in report file.
-                                            Defaults to 0.
+        modules                (dict): Python-dictionary object: {".kk file name" : output of "parse_kk_file()"}
+
+    Returns:
+        ko_index               (dict): Python-dictionary object:
+                                        keys: KO
+                                        values: list of (".kk file name", block number, complex number) entries;
+                                                complex number is None for KOs outside complexes,
+                                                block number is None for KOs only listed in the Module
     """
-    os.chdir(kkfiles_directory)
-    report = []
-    report_tsv = []
-    with open(kk_file) as f:
-        linenumber = 0
-        count_lines = 0
-        missing = 0
-        present = 0
-        KOmodule = []
-        Kmissing = []
-        Kpresent = []
-        complexes = []
-        optional = []
-        submodules = False
-        subAND_presence = False
-        subOR_presence = False
-        subOR_dict = {}
-        ko_list_optional = ko_list
-        extended_name = f.readline().strip().replace(".txt", "")
-        f.seek(0)
-        report.append(kk_file + "\t" + extended_name + "\t")
-        report_tsv.append(kk_file[:-3])
-        report_tsv.append(extended_name[7:])
-        v = f.readlines()
-        end = len(v)
-        f.seek(0)
-    # flags complexes/optionals/list-indications presence or absence
-
-        v_complex = v.index("COMPLEXES_LIST\n") if "COMPLEXES_LIST\n" in v else None
-        v_optional = v.index("OPTIONAL_LIST\n") if "OPTIONAL_LIST\n" in v else None
-
-        #COMPLEXES
-#         if "COMPLEXES_LIST\n" in v:
-#             v_complex = v.index("COMPLEXES_LIST\n")
-#         else:
-#             v_complex = -1
-# 
-#         #OPTIONALS
-#         if "OPTIONAL_LIST\n" in v:
-#             v_optional = v.index("OPTIONAL_LIST\n")
-#         else:
-#             v_optional = -1
-
-        #LIST-INDICATIONS
-        if "/\n" in v:
-            submodules = True
-            subAND_presence = True
-            submodule = 0
-            subAND = 0
-        if "//\n" in v:
-            submodules = True
-            subOR_presence = True
-            submodule = 0
-            subOR = -1
-
-    # list complexes
-        if v_complex is not None:
-            #KOs search stops at complex line
-            end = v_complex
-            c_list = v[v_complex+1].replace("\n", "").replace("\t", "").split(", ")
-            for el in c_list:
-                complexes.append(el)
-
-    # list optionals
-        if v_optional is not None:
-            o_list = v[v_optional+1].replace("\n", "").replace("\t", "").split(", ")
-            for el in o_list:
-                optional.append(el)
-            ko_list_optional = [ el for el in ko_list ]
-            for el in optional:
-                ko_list_optional.append(el)
-
-    # KOs presence/absence
-        for line in v[1:end]:
-            ko_line = line.strip().split(", ")
-            for single_ko in ko_line:
-                if single_ko == "/" or single_ko == "//":
-                    continue
-                KOmodule.append(single_ko)
+    ko_index = {}
+    for kk_file, kk_module in modules.items():
+        entries = []
+        for b, block in enumerate(kk_module["blocks"]):
+            for ko in block["free"]:
+                entries.append((ko, b, None))
+            for c, k_singlecomplex in enumerate(block["complexes"]):
+                for el in k_singlecomplex:
+                    entries.append((el, b, c))
+        referenced = { ko for ko, _, _ in entries }
+        for ko in kk_module["module_kos"]:
+            if ko not in referenced:
+                entries.append((ko, None, None))
+                referenced.add(ko)
+
+        for ko, b, c in dict.fromkeys(entries):
+            ko_index.setdefault(ko, []).append((kk_file, b, c))
+    return ko_index
+
+def compile_kk_database(kkfiles_directory):
+    """
+    Parses every .kk file once, generating the compiled KEGG Modules database
+    used by the completeness evaluation.
 
-        for KO in KOmodule:
-            if KO in ko_list:
-                if KO not in Kpresent:
-                    Kpresent.append(KO)
-            else:
-                Kmissing.append(KO)
-
-    # CHECKS for each line in .kk file: KOs, complexes, optionals and list-indication
-        for line in v[1:end]:
-            count_lines += 1
-            check = False
-            linenumber += 1
-
-            if submodules:
-                if line == "/\n":
-                    submodule += 1
-                    subAND += 1
-                    linenumber = 0
-                    continue
-                if subOR_presence:
-                    end_or = end - 1
-                    if line == "//\n" or count_lines == end_or:
-                        submodule += 1
-                        subOR += 1
-                        linenumber = 0
-                        if subOR != 0:
-                            if count_lines != end_or:
-                                tmp = str(present) + "__" + str(present + missing)
-                                subOR_infos += tmp
-                                subOR_dict.update({subOR:subOR_infos})
-                                present = 0
-                                missing = 0
-
-                        subOR_infos = ""
-                        if count_lines != end_or:
-                            continue
-                        else:
-                            pass
+    Args:
+        kkfiles_directory       (str): input .kk files folder
 
-            ko_line = line.strip().split(", ")
-            if len(complexes) != 0:
-                while check is False:
-                    for singlecomplex in complexes:
-                        k_singlecomplex = re.split("[+-]", singlecomplex.strip())
-                        if all(el in ko_line for el in k_singlecomplex):
-                            if all(el in ko_list_optional for el in k_singlecomplex):
-                            # this way: if EACH KO of complex is present in genome KOs, CHECK positive!
-                                check = True
-                                continue
-                    else:
-                        for ko in ko_line:
-                            if ko not in str(complexes):
-                                if ko in ko_list:
-                                    check = True
-                                else:
-                                    continue
-                        else:
-                            break
+    Returns:
+        kk_database            (dict): Python-dictionary object:
+                                        "version": compiled database format version
+                                        "signature": output of "_kk_signature()"
+                                        "digest": digest of every KEGG Module "digest" (i.e. of the .kk files content)
+                                        "ko_ids": {KO : integer ID}, output of "_intern_kk_modules()"
+                                        "ko_index": {KO : Modules entries}, output of "_kk_inverted_index()"
+                                        "modules": {".kk file name" : output of "parse_kk_file()"}
+    """
+    signature = _kk_signature(kkfiles_directory)
+    modules = { kk_file: parse_kk_file(kk_file, kkfiles_directory)
+                for kk_file, _, _ in signature }
+    for kk_file, kk_module in modules.items():
+        with open(path.join(kkfiles_directory, kk_file), "rb") as f:
+            kk_module["digest"] = hashlib.sha1(f.read() + str(_kkdb_version).encode()).hexdigest()
+    ko_ids = _intern_kk_modules(modules)
+
+    kk_database = {
+        "version": _kkdb_version,
+        "signature": signature,
+        "digest": hashlib.sha1("".join( kk_module["digest"] for kk_module in modules.values() ).encode()).hexdigest(),
+        "ko_ids": ko_ids,
+        "ko_index": _kk_inverted_index(modules),
+        "modules": modules,
+    }
+    return kk_database
+
+def _read_pickle_cache(cache_path, version, signature):
+    """
+    Helper function to read a compiled database from its cache file,
+    only if it was written by the same KEMET version from the same input files.
 
-                if check:
-                    present += 1
-                else:
-                    missing += 1
+    Args:
+        cache_path              (str): cache file path
+        version                 (int): expected compiled database format version
+        signature              (list): expected output of "_kk_signature()"
 
-            elif len(complexes) == 0:
-                for ko in ko_list:
-                    if ko in line:
-                        check = True
-                else:
-                    if check:
-                        present += 1
-                    else:
-                        missing += 1
-
-            total = present+missing
-            missing_blocks = str(present) + "__" + str(total)
-            percentage_round_tsv = round((present/(total))*100, 2)
-        else:
-            if subOR_presence and count_lines == end_or:
-                tmp = str(present) + "__" + str(present+missing)
-                subOR_infos += tmp
-                subOR_dict.update({subOR:subOR_infos})
-
-    # check better completeness from alternative sub-modules
-        if subOR_presence:
-            for value in subOR_dict.values():
-                tmp_present = int(value.split("__")[0])
-                tmp_total = int(value.split("__")[1])
-                tmp_percentage_round_tsv = round((tmp_present/(tmp_total))*100, 2)
-
-                if tmp_percentage_round_tsv > percentage_round_tsv:
-                    present = tmp_present
-                    total = tmp_total
-                    missing_blocks=str(present) + "__" + str(total)
-                    percentage_round_tsv = round((present/(total))*100, 2)
-
-        difference = total - present
-
-        if as_kegg:
-            if difference == 0:
-                completeness_tsv = "COMPLETE"
-            elif difference > 2 or total < 3:
-                completeness_tsv = "INCOMPLETE"
-            elif difference == 2:
-                completeness_tsv = "2 BLOCKS MISSING"
-            elif difference == 1:
-                completeness_tsv = "1 BLOCK MISSING"
-        else:
-            if difference == 0:
-                completeness_tsv = "COMPLETE"
-            elif difference > 2:
-                completeness_tsv = "INCOMPLETE"
-            elif difference == 2:
-                completeness_tsv = "2 BLOCKS MISSING"
-            elif difference == 1:
-                completeness_tsv = "1 BLOCK MISSING"
-
-
-        report_tsv.append(completeness_tsv)
-        report_tsv.append(missing_blocks)
-        report_tsv.append(Kmissing)
-        report_tsv.append(Kpresent)
-
-    # IO-files operations
-    if not path.isdir(report_tsv_directory):
-        os.mkdir(report_tsv_directory)
+    Returns:
+        database               (dict): cached compiled database (None if missing or outdated)
+    """
+    if path.isfile(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                database = pickle.load(f)
+            if database.get("version") == version and database.get("signature") == signature:
+                return database
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+            pass
+    return None
+
+def _write_pickle_cache(cache_path, database):
+    """
+    Helper function to write a compiled database to its cache file, atomically.
 
-    os.chdir(report_tsv_directory)
+    Args:
+        cache_path              (str): cache file path
+        database               (dict): compiled database
+    """
+    try:
+        with open(cache_path + ".tmp", "wb") as f:
+            pickle.dump(database, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_path + ".tmp", cache_path)
+    except OSError:
+        # e.g. read-only KEGG_MODULES folder: keep the database in memory only
+        pass
+
+def load_kk_database(kkfiles_directory, cache_file=_kkdb_cache):
+    """
+    Loads the compiled KEGG Modules database from its cache file.
+    The database is compiled (and the cache file rewritten) whenever the cache is missing,
+    was written by a different KEMET version or the .kk files changed.
 
-    if percentage_round_tsv >= cutoff:
-        with open(file_report_tsv, "a") as h:
-            for el in report_tsv:
-                if type(el) == str:
-                    h.write(el + "\t")
-                if type(el) == list:
-                    knums = ",".join(el)
-                    h.write(knums + "\t")
-            h.write("\n")
+    Args:
+        kkfiles_directory       (str): input .kk files folder
+        cache_file    (str, optional): cache file name, in the .kk files folder. Defaults to _kkdb_cache.
 
-def create_tuple_modules(fixed_module_file):
+    Returns:
+        kk_database            (dict): Python-dictionary output of "compile_kk_database()"
     """
-    Generates a tuple from the indication of Modules in which to look for incompleteness, for further use.
+    cache_path = path.join(kkfiles_directory, cache_file)
+    kk_database = _read_pickle_cache(cache_path, _kkdb_version, _kk_signature(kkfiles_directory))
+    if kk_database is None:
+        kk_database = compile_kk_database(kkfiles_directory)
+        _write_pickle_cache(cache_path, kk_database)
+    return kk_database
+
+def subset_kk_database(kk_database, modules):
+    """
+    Restricts the compiled KEGG Modules database to some KEGG Modules, so that only those are evaluated and reported.
+    KO integer IDs are kept, so KO bitsets are the same of the whole database.
 
     Args:
-        fixed_module_file   (str): file name of a ".instruction" file with indication of KEGG Modules of interest
+        kk_database            (dict): output of "load_kk_database()"
+        modules            (iterable): KEGG Module ids (e.g. "M00001"), e.g. output of "select_modules()"
 
     Returns:
-        tuple_modules     (tuple): Python tuple-object including all KEGG Modules of interest
+        kk_subset              (dict): Python-dictionary object, same format of "load_kk_database()" output
+    """
+    selected = { module + ".kk" for module in modules }
+    kk_modules = { kk_file: kk_module for kk_file, kk_module in kk_database["modules"].items()
+                   if kk_file in selected }
+    ko_index = {}
+    for ko, entries in kk_database["ko_index"].items():
+        entries = [ entry for entry in entries if entry[0] in kk_modules ]
+        if entries:
+            ko_index[ko] = entries
+
+    kk_subset = dict(kk_database, modules=kk_modules, ko_index=ko_index,
+                     digest=hashlib.sha1("".join( kk_module["digest"] for kk_module in kk_modules.values() ).encode()).hexdigest())
+    return kk_subset
+
+def _blocks_presence(ko_bits, kk_module):
     """
+    Helper function to check each block of a compiled KEGG Module for presence in the KO pre-annotation.
+    A block is present if any of its KOs outside complexes is annotated,
+    or if any of its complexes has each KO annotated (or optional).
 
-    with open(fixed_module_file) as f:
-        tuple_modules = tuple([ line.strip() for line in f ])
+    Args:
+        ko_bits                 (int): output of "ko_bitset()" for the KOs present in the pre-annotation
+        kk_module              (dict): output of "parse_kk_file()", interned via "_intern_kk_modules()"
 
-    return tuple_modules
+    Returns:
+        presence               (list): Python-list object with a boolean per block
+    """
+    ko_bits_optional = ko_bits | kk_module["optional_bits"]
+    presence = [ _block_check(ko_bits, ko_bits_optional, block) for block in kk_module["blocks"] ]
+    return presence
 
-def create_tuple_modules_1BM(fasta_id, fixed_module_file, oneBM_modules_dir, report_tsv_directory):
+def _block_check(ko_bits, ko_bits_optional, block):
     """
-    Generates a tuple including Modules missing 1 orthologs block, for further use.
+    Helper function to check a single block of a compiled KEGG Module for presence.
+    (Called in the "_blocks_presence()" function).
 
     Args:
-        fasta_id                (str): identificative FASTA name for a given MAG/Genome
-        fixed_module_file       (str): generic file name of a ".instruction" file with indication of KEGG Modules of interest
-        oneBM_modules_dir       (str): output folder of MAG/Genome specific ".instruction" file with KEGG Modules of interest
-        report_tsv_directory    (str): testcompleteness_tsv() output folder, to identify 1 block missing modules
+        ko_bits                 (int): output of "ko_bitset()" for the KOs present in the pre-annotation
+        ko_bits_optional        (int): same as "ko_bits", including the optionals of the Module
+        block                  (dict): block of the compiled KEGG Module
 
     Returns:
-        tuple_modules         (tuple): Python tuple-object including all KEGG Modules of interest
+        check                  (bool): block presence
     """
-    os.chdir(report_tsv_directory)
-    list_modules = []
-    for file in sorted(os.listdir()):
-        if file.endswith(".tsv") and fasta_id in file:
-            with open(file) as f:
-                for line in f.readlines():
-                    line = line.strip().split("\t")
-                    MOD = line[0]
-                    COMPLETENESS = line[2]
-                    if COMPLETENESS == "1 BLOCK MISSING":
-                        list_modules.append(MOD)
-
-    os.chdir(oneBM_modules_dir)
-    with open(fasta_id + "_" + fixed_module_file, "w") as m:
-        for module in list_modules:
-            print(module, file=m)
+    if ko_bits & block["free_bits"]:
+        return True
+    for complex_bits in block["complexes_bits"]:
+        if complex_bits & ko_bits_optional == complex_bits:
+            return True
+    return False
+
+def _subOR_counts(kk_module, presence):
+    """
+    Helper function to count present and total blocks of a KEGG Module,
+    separately for each "//" alternative sub-module (a single entry with key 0 if there are none).
 
-    tuple_modules = tuple(list_modules)
-    return tuple_modules
+    Args:
+        kk_module              (dict): output of "parse_kk_file()"
+        presence               (list): output of "_blocks_presence()"
 
-def write_KOs_from_modules(fasta_id, tuple_modules, report_txt_directory, klists_directory):
+    Returns:
+        subOR_dict             (dict): Python-dictionary object:
+                                        keys: alternative sub-module number
+                                        values: [present blocks, total blocks]
     """
-    Generates a non-redundant list of KOs to be checked via HMM for Modules of interest,
-    either fixed or related to missing annotated genomic content.
+    subOR_dict = {}
+    for block, check in zip(kk_module["blocks"], presence):
+        counts = subOR_dict.setdefault(block["subOR"], [0, 0])
+        counts[0] += check
+        counts[1] += 1
+    return subOR_dict
+
+def evaluate_module(ko_set, ko_bits, kk_module, presence=None):
+    """
+    Computes KEGG Module completeness from KO pre-annotation, checking each block only once.
+    The result includes what is needed for both the flat-file and the tab-separated reports.
 
     Args:
-        fasta_id                    (str): identificative FASTA name for a given MAG/Genome
-        tuple_modules             (tuple): output of "create_tuple_modules()" or "create_tuple_modules_1BM()"
-        report_txt_directory        (str): testcompleteness() output folder, to identify KOs missing from Modules of interest
-        klists_directory            (str): output ".klist" files folder path - in which to save MAG/Genome missing KOs of interest
+        ko_set                  (set): KOs present in the pre-annotation
+        ko_bits                 (int): output of "ko_bitset()" for the same KOs
+        kk_module              (dict): compiled KEGG Module definition, from "load_kk_database()"
+        presence     (list, optional): blocks presence, if already known. Defaults to None (computed via "_blocks_presence()").
+
+    Returns:
+        result                 (dict): Python-dictionary object:
+                                        "kk_module": input compiled KEGG Module definition
+                                        "presence": output of "_blocks_presence()"
+                                        "txt": (percentage, present blocks, total blocks, best "//" alternative) for the flat-file report
+                                        "tsv": (percentage, present blocks, total blocks) for the tab-separated report
+                                        "Kmissing", "Kpresent": KOs of the Module missing/present in the pre-annotation
     """
-    os.chdir(report_txt_directory)
-    for file in sorted(os.listdir()):
-        if fasta_id in file:
-            with open(file) as f:
-                klist = []
-                v = f.readlines()
-                f.seek(0)
-                i = 0
-                for line in v:
-                    i += 1
-                    if line.startswith(tuple_modules):
-                        start = i
-                        j = i
-                        for line in v[j:]:
-                            j += 1
-                            if line.startswith("M0"):
-                                end = j
-                                break
-                        for l in v[start+1:end-2]:
-                            l = l.strip().split("\t")[1].split(", ")
-                            for KO in l:
-                                if KO not in klist:
-                                    klist.append(KO)
+    if presence is None:
+        presence = _blocks_presence(ko_bits, kk_module)
+    subOR_dict = _subOR_counts(kk_module, presence)
+
+    # flat-file report: the first most complete alternative sub-module is kept
+    if kk_module["subOR_presence"]:
+        percentage_round = -1
+        for subOR, (tmp_present, tmp_total) in subOR_dict.items():
+            tmp_percentage_round = round((tmp_present/(tmp_total))*100, 2)
+            if tmp_percentage_round > percentage_round:
+                best_txt = (tmp_percentage_round, tmp_present, tmp_total, subOR)
+                percentage_round = tmp_percentage_round
+    else:
+        present, total = subOR_dict[0]
+        best_txt = (round((present/(total))*100, 2), present, total, None)
+
+    # tab-separated report: the last alternative sub-module is kept, unless another one is more complete
+    present, total = list(subOR_dict.values())[-1]
+    percentage_round_tsv = round((present/(total))*100, 2)
+    if kk_module["subOR_presence"]:
+        for tmp_present, tmp_total in subOR_dict.values():
+            tmp_percentage_round_tsv = round((tmp_present/(tmp_total))*100, 2)
+            if tmp_percentage_round_tsv > percentage_round_tsv:
+                present = tmp_present
+                total = tmp_total
+                percentage_round_tsv = tmp_percentage_round_tsv
+    best_tsv = (percentage_round_tsv, present, total)
+
+    Kmissing = []
+    Kpresent = []
+    for KO in kk_module["module_kos"]:
+        if KO in ko_set:
+            if KO not in Kpresent:
+                Kpresent.append(KO)
+        else:
+            Kmissing.append(KO)
+
+    result = {
+        "kk_module": kk_module,
+        "presence": presence,
+        "txt": best_txt,
+        "tsv": best_tsv,
+        "Kmissing": Kmissing,
+        "Kpresent": Kpresent,
+    }
+    return result
+
+def _kmc_cache_file(ko_set, cache_directory):
+    """
+    Helper function to name the completeness cache entry of a KO set, after the digest of its sorted KOs.
 
-                os.chdir(klists_directory)
-                with open(file[10:-4]+".klist", "w") as g:
-                    for KO in klist:
-                        print(KO, file=g)
-                os.chdir(report_txt_directory)
+    Args:
+        ko_set                  (set): KOs present in the pre-annotation
+        cache_directory         (str): completeness cache folder
 
-def write_KOs_from_fixed_list(fasta_id, fixed_ko_file, ktests_directory, klists_directory):
+    Returns:
+        cache_file              (str): cache entry file path
     """
-    Generates a non-redundant list of KOs to be checked via HMM starting from a fixed list.
+    ko_digest = hashlib.sha1("\n".join(sorted(ko_set)).encode()).hexdigest()
+    return path.join(cache_directory, ko_digest + ".pkl")
 
-    Args:
-        fasta_id            (str): identificative FASTA name for a given MAG/Genome
-        fixed_ko_file       (str): ".instruction" file generated by "setup.py" to be compiled manually with KOs of interest
-        ktests_directory    (str): ".ktest" files (KOs file as recovered in pre-annotations) folder path
-        klists_directory    (str): output ".klist" files folder path - in which to save MAG/Genome missing KOs of interest
+def _read_kmc_cache(cache_file):
     """
+    Helper function to read a completeness cache entry, marking it as recently used.
 
-    os.chdir(dir_base)
-    with open(fixed_ko_file) as h:
-        KO_to_check = [ line.strip() for line in h ]
+    Args:
+        cache_file              (str): output of "_kmc_cache_file()"
 
-    os.chdir(ktests_directory)
-    for file in sorted(os.listdir()):
-        if fasta_id in file:
-            with open(file) as f:
-                KO_present = []
-                klist = []
-                for line in f.readlines():
-                    KO = line.strip()
-                    KO_present.append(KO)
-            for KO in KO_to_check:
-                if KO not in KO_present:
-                    klist.append(KO)
-
-            os.chdir(klists_directory)
-            with open(file[:-6]+".klist", "w") as g:
-                for KO in klist:
-                    print(KO, file=g)
-    os.chdir(report_txt_directory)
+    Returns:
+        entry                  (dict): Python-dictionary object (empty if missing or unreadable):
+                                        "results": {".kk file name" : (KEGG Module "digest", compact "evaluate_module()" output)}
+    """
+    try:
+        with open(cache_file, "rb") as f:
+            entry = pickle.load(f)
+        os.utime(cache_file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        entry = {}
+    return entry
 
-def taxonomy_filter(taxonomy, dir_base, taxa_file, taxa_dir, update=False):
+_kmc_cache_sizes = {} # sizes of the completeness cache folders written by this process, by folder path
+_kmc_cache_lock = threading.Lock()
+
+def _kmc_cache_usage(cache_directory):
     """
-    Generates a file that includes KEGG Brite species codes (E-level)
-    for a given C-level (phylum, most of the times) taxonomy indication.
+    Helper function to measure the completeness cache folder, i.e. its entries from the least recently used.
 
     Args:
-        taxonomy            (str): KEGG Brite taxonomy for MAG/Genome of interest
-                                    as indicated in the "genomes.instruction" file.
-        dir_base            (str): folder path in which "kemet.py" was executed
-        taxa_file           (str): ".keg" output file, that contains each codes of species allowed for subsequent GENES download
-        taxa_dir            (str): output folder path
-        update   (bool, optional): flag to update KEGG Brite taxonomy - necessary e.g. for the first KEMET execution. Defaults to False.
+        cache_directory         (str): completeness cache folder
 
     Returns:
-        taxa_allow         (list): Python-list object including each codes of species allowed for subsequent GENES download
+        cached                 (list): Python-list object of (last use, size, path) of each entry, sorted
+        total                   (int): size of the cache folder, in bytes
     """
-    os.chdir(dir_base)
-    taxa_allow = []
-    with open("br08601.keg") as f:
-        v = f.readlines()
-        f.seek(0)
-        for i, line in enumerate(v):
-            if line.startswith("C") and taxonomy+" " in line:
-                i_start = i
-                break
-        for line in v[i_start+1:]:
-            i += 1
-            if line.startswith("C"):
-                i_stop = i-1
-                break
+    cached = []
+    for cached_file in os.scandir(cache_directory):
+        if cached_file.name.endswith(".pkl"):
+            try:
+                cached_stat = cached_file.stat()
+            except OSError:
+                continue
+            cached.append((cached_stat.st_mtime_ns, cached_stat.st_size, cached_file.path))
+    return sorted(cached), sum( size for _, size, _ in cached )
 
-        for line in v[i_start:i_stop]:
-            if line.startswith("E"):
-                taxa_allow.append(line.strip().replace("E        ", "").split("  ")[0])
+def _write_kmc_cache(cache_file, entry, cache_size):
+    """
+    Helper function to write a completeness cache entry.
+    The size of the cache folder is measured once per process, then kept up to date with the entries written here:
+    only when it exceeds its size bound the folder is measured again (e.g. for entries of other processes)
+    and the least recently used entries are evicted, down to "_kmc_cache_low_mark" of the bound.
 
-    if update:
-        os.chdir(taxa_dir)
-        with open(taxa_file, "w") as g:
-            for el in taxa_allow:
-                print(el, file=g)
+    Args:
+        cache_file              (str): output of "_kmc_cache_file()"
+        entry                  (dict): same format of "_read_kmc_cache()" output
+        cache_size              (int): maximum size of the cache folder, in bytes
+    """
+    cache_directory = path.dirname(cache_file)
+    os.makedirs(cache_directory, exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        replaced = os.stat(cache_file).st_size
+    except OSError:
+        replaced = 0
+    try:
+        with open(tmp_file, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        written = os.stat(tmp_file).st_size
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        return
 
-    return taxa_allow
+    with _kmc_cache_lock:
+        if cache_directory in _kmc_cache_sizes:
+            _kmc_cache_sizes[cache_directory] += written - replaced
+        else:
+            _kmc_cache_sizes[cache_directory] = _kmc_cache_usage(cache_directory)[1]
+        if _kmc_cache_sizes[cache_directory] <= cache_size:
+            return
+        cached, total = _kmc_cache_usage(cache_directory)
+        for _, size, cached_path in cached:
+            if total <= cache_size * _kmc_cache_low_mark:
+                break
+            try:
+                os.remove(cached_path)
+            except OSError:
+                pass
+            total -= size
+        _kmc_cache_sizes[cache_directory] = total
 
-def download_ntseq_of_KO(klist_file, dir_base_KO, dir_KO, klists_directory, taxa_dir, taxa_file, base_com_KEGGget):
+def evaluate_genome(ko_list, kk_database, cache_directory=None, cache_size=_def_kmc_cache_size*2**20):
     """
-    Using KEGG API, downloads KEGG flat-files with nt sequences of KOs of interest
-    from the allowed species (E-level), following filering of "taxonomy_filter()".
-
-    IF KEGG ACCESS IS AVAILABLE, it is possible to modify "Pool(processes=3)" with processes=N
-    and it is possible to download multiple files via API, in full compliance to KEGG license.
+    Computes KEGG Modules completeness of a genome from KO pre-annotation, for each compiled KEGG Module.
+    With a cache folder, results are kept per KO set: a genome with the same KOs of a previous run
+    is not evaluated again, except for KEGG Modules whose ".kk" file changed since then.
 
     Args:
-        klist_file          (str): ".klist" input file name, indicating missing KOs of interest from MAG/Genome
-        dir_base_KO         (str): base KEGG KO GENES sequences folder path
-        dir_KO              (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
-        klists_directory    (str): ".klist" input files folder path
-        taxa_dir            (str): "taxa_file" input file folder path
-        taxa_file           (str): ".keg" output file, that contains each codes of species allowed for subsequent GENES download
-        base_com_KEGGget    (str): base command of KEGG API "GET" function - which is modified for each entry of GENES
+        ko_list                (list): output from previous "create_KO_list" function
+        kk_database            (dict): output of "load_kk_database()"
+        cache_directory (str, optional): completeness cache folder. Defaults to None (no cache).
+        cache_size     (int, optional): maximum size of the cache folder, in bytes. Defaults to _def_kmc_cache_size MB.
+
+    Returns:
+        genome_state           (dict): Python-dictionary object:
+                                        "ko_set": KOs present in the pre-annotation
+                                        "ko_bits": output of "ko_bitset()" for the same KOs
+                                        "results": {".kk file name" : output of "evaluate_module()"}
     """
-    print(_timeinfo(), "START download nucleotidic sequences", sep="\t")
-    os.chdir(taxa_dir)
+    ko_set = set(ko_list)
+    ko_bits = ko_bitset(ko_set, kk_database["ko_ids"])
+    if cache_directory is None:
+        results = { kk_file: evaluate_module(ko_set, ko_bits, kk_module)
+                    for kk_file, kk_module in kk_database["modules"].items() }
+    else:
+        cache_file = _kmc_cache_file(ko_set, cache_directory)
+        cached = _read_kmc_cache(cache_file).get("results", {})
+        results, evaluated = {}, {}
+        for kk_file, kk_module in kk_database["modules"].items():
+            module_digest, compact = cached.get(kk_file, (None, None))
+            if module_digest == kk_module["digest"]:
+                presence, txt, tsv, Kmissing, Kpresent = compact
+                results[kk_file] = { "kk_module": kk_module, "presence": list(presence), "txt": txt, "tsv": tsv,
+                                     "Kmissing": list(Kmissing), "Kpresent": list(Kpresent) }
+            else:
+                results[kk_file] = evaluated[kk_file] = evaluate_module(ko_set, ko_bits, kk_module)
+        if evaluated:
+            # results of KEGG Modules not evaluated here (e.g. not selected) are kept
+            cached = dict(cached)
+            for kk_file, result in evaluated.items():
+                cached[kk_file] = (kk_database["modules"][kk_file]["digest"],
+                                   (tuple(result["presence"]), result["txt"], result["tsv"],
+                                    tuple(result["Kmissing"]), tuple(result["Kpresent"])))
+            _write_kmc_cache(cache_file, {"results": cached}, cache_size)
+
+    genome_state = {
+        "ko_set": ko_set,
+        "ko_bits": ko_bits,
+        "results": results,
+    }
+    return genome_state
+
+def update_genome(genome_state, kk_database, added=(), removed=()):
+    """
+    Incrementally updates KEGG Modules completeness of a genome after a change of its KOs
+    (e.g. KOs found via HMM, or what-if analyses).
+    Through the KO inverted index, only the blocks referencing the added/removed KOs are checked again,
+    and only the Modules including them are re-evaluated. The input state is not modified.
 
-    with open(taxa_file) as f:
-        taxa_allow = [ line.strip() for line in f ]
+    Args:
+        genome_state           (dict): output of "evaluate_genome()" or "update_genome()"
+        kk_database            (dict): output of "load_kk_database()"
+        added    (iterable, optional): KOs to be added to the genome. Defaults to ().
+        removed  (iterable, optional): KOs to be removed from the genome. Defaults to ().
 
-    os.chdir(klists_directory)
-    with open(klist_file) as f:
-        os.chdir(dir_base_KO)
-        if not path.isdir(dir_KO):
-            os.mkdir(dir_KO)
-        os.chdir(dir_KO)
-        for line in f:
-            line = line.strip()
-            flatfile = line+".keg"
-            os.chdir(dir_KO)
-            if not path.isdir(dir_KO+line):
-                os.mkdir(dir_KO+line)
-            else:
-                continue
-            os.chdir(line)
-            os.system(base_com_KEGGget+line+" > "+flatfile)
+    Returns:
+        new_state              (dict): updated genome state, same format of "evaluate_genome()" output
+        changed                (list): ".kk file names" of the KEGG Modules whose completeness or KO lists changed
+    """
+    ko_set = (genome_state["ko_set"] | set(added)) - set(removed)
+    ko_bits = ko_bitset(ko_set, kk_database["ko_ids"])
+
+    affected = {}
+    for ko in ko_set.symmetric_difference(genome_state["ko_set"]):
+        for kk_file, b, _ in kk_database["ko_index"].get(ko, ()):
+            affected.setdefault(kk_file, set())
+            if b is not None:
+                affected[kk_file].add(b)
+
+    results = dict(genome_state["results"])
+    changed = []
+    for kk_file, blocks in affected.items():
+        kk_module = kk_database["modules"][kk_file]
+        old_result = results[kk_file]
+        presence = list(old_result["presence"])
+        if blocks:
+            ko_bits_optional = ko_bits | kk_module["optional_bits"]
+            for b in blocks:
+                presence[b] = _block_check(ko_bits, ko_bits_optional, kk_module["blocks"][b])
+        result = evaluate_module(ko_set, ko_bits, kk_module, presence=presence)
+        results[kk_file] = result
+        if any(result[key] != old_result[key] for key in ("txt", "tsv", "Kmissing", "Kpresent", "presence")):
+            changed.append(kk_file)
+
+    new_state = {
+        "ko_set": ko_set,
+        "ko_bits": ko_bits,
+        "results": results,
+    }
+    return new_state, sorted(changed)
+
+def _completeness_tsv(present, total, as_kegg=False):
+    """
+    Helper function to classify KEGG Module completeness as in the tab-separated report.
 
-            genes = parsekoflat(flatfile)
-            os.remove(flatfile)
-
-            if __name__ == '__main__':
-                # requests to KEGG API without a granted access are limited (check KEGG LICENCE)
-                # POSSIBILITY: modify next line "(processes= n)" if access to KEGG is available
-                with Pool(processes=3) as p:
-                    p.map(getntseq, genes)
-                p.close()
-    print(_timeinfo(), "COMPLETE download nucleotidic sequences", sep="\t")
+    Args:
+        present                 (int): number of present blocks
+        total                   (int): number of total blocks
+        as_kegg      (bool, optional): option to report KEGG Modules completeness as KEGG mapper (see README for details)
 
-def parsekoflat(file):
+    Returns:
+        completeness_tsv        (str): "COMPLETE", "1 BLOCK MISSING", "2 BLOCKS MISSING" or "INCOMPLETE"
     """
-    Parses KO flatfiles obtained from KEGG API,
-    in order to generate the filtered list of sequences for a bulk download.
-    (Called within the "download_ntseq_of_KO()" function).
+    difference = total - present
+
+    if as_kegg:
+        if difference == 0:
+            completeness_tsv = "COMPLETE"
+        elif difference > 2 or total < 3:
+            completeness_tsv = "INCOMPLETE"
+        elif difference == 2:
+            completeness_tsv = "2 BLOCKS MISSING"
+        elif difference == 1:
+            completeness_tsv = "1 BLOCK MISSING"
+    else:
+        if difference == 0:
+            completeness_tsv = "COMPLETE"
+        elif difference > 2:
+            completeness_tsv = "INCOMPLETE"
+        elif difference == 2:
+            completeness_tsv = "2 BLOCKS MISSING"
+        elif difference == 1:
+            completeness_tsv = "1 BLOCK MISSING"
+
+    return completeness_tsv
+
+def report_txt_module(result):
+    """
+    Formats the flat-file report of a KEGG Module,
+    including single missing KOs and their position, relative to KEGG Modules blocks.
 
     Args:
-        file        (str): KEGG API KO flat-file file name
+        result                 (dict): output of "evaluate_module()"
 
     Returns:
-        genes      (list): Python-list object with genes connected to the KO,
-                            for each appropriate species within the specified BRITE taxonomy
+        report                  (str): report lines of the KEGG Module
     """
-    genes = []
-    with open(file) as f:
-        v = f.readlines()
-        for n, line in enumerate(v):
-            if line.startswith("GENES"):
-                break
-        f.seek(0)
-        for line in v[n:]:
-            if line.startswith("REFERENCE") or line.startswith("///"):
-                break
-            line = line.replace("GENES       ", "").strip()
-            m = line.index(":")
-            species = line[:m+1].casefold()
-            line_s = line.split()
-            for g_name in line_s[1:]:
-                gene = (species+g_name).casefold()
-                if "(" in gene:
-                    p = gene.index("(")
-                    gene = gene[:p]
-                if "draft" in gene:
-                    continue
-                genes.append(gene)
-    return genes
+    kk_module = result["kk_module"]
+    percentage_round, present, total, subOR_most = result["txt"]
+    completeness = "COMPLETE" if percentage_round == 100 else "INCOMPLETE"
+
+    report = [kk_module["kk_file"] + "\t" + kk_module["extended_name"] + "\n"]
+    report.append("%\t" + str(percentage_round) + "\t" + str(present) + "__" + str(total) + "\t" + completeness + "\n")
+    for block, check in zip(kk_module["blocks"], result["presence"]):
+        if check:
+            continue
+        # only missing blocks of the best alternative sub-module are reported
+        if kk_module["subOR_presence"] and block["submodule"] != subOR_most:
+            continue
+        report.append(block["label"] + "\t" + block["line"])
+    report.append("\n")
 
-def getntseq(gene):
+    return "".join(report)
+
+def report_tsv_module(result, as_kegg=False):
     """
-    Downloads nt sequence of a given gene, from the list of KO-related genes list.
-    (Called within the "download_ntseq_of_KO()" function).
+    Formats the tab-separated report line of a KEGG Module,
+    including missing and present KOs.
 
     Args:
-        gene        (str): element of "genes" input list, generated via "parsekoflat()"
+        result                 (dict): output of "evaluate_module()"
+        as_kegg      (bool, optional): option to report KEGG Modules completeness as KEGG mapper (see README for details)
 
     Returns:
-        True       (bool): only necessary for script continuation
+        report_tsv              (str): report line of the KEGG Module
     """
+    kk_module = result["kk_module"]
+    _, present, total = result["tsv"]
 
-    stop = gene.find(":")
-    gene_taxa = gene[:stop]
+    report_tsv = [kk_module["kk_file"][:-3], kk_module["extended_name"][7:],
+                  _completeness_tsv(present, total, as_kegg=as_kegg), str(present) + "__" + str(total),
+                  ",".join(result["Kmissing"]), ",".join(result["Kpresent"])]
 
-    if gene_taxa in taxa_allow:
-        cmd_get_ntseq = base_com_KEGGget+gene+"/ntseq"
-        os.system(cmd_get_ntseq+" > "+gene+".fna")
-        return 1
+    return "\t".join(report_tsv) + "\t\n"
 
-def filter_and_align(taxa_dir, taxa_file, fasta_id, klist_file, klists_directory, msa_dir, dir_KO):
+def testcompleteness(ko_list, kk_database, report_txt_directory, file_output, report_tsv_directory, file_report_tsv, as_kegg=False, cutoff=0,
+                     cache_directory=None, cache_size=_def_kmc_cache_size*2**20):
     """
-    Generates a nucleotidic multifasta with sequences from the given taxonomy range.
-    The output does NOT contain redundant sequences.
-    Keeps results in a folder organized by the FASTA id of MAG/Genome.
+    Computes KEGG Modules completeness from KO pre-annotation, for each compiled KEGG Module.
+    Reports that both in a flat-file and in a tab-separated file,
+    including single missing KOs and their position, relative to KEGG Modules blocks.
+    Each report file is opened only once.
 
     Args:
-        taxa_dir            (str): "taxa_file" input file folder path
-        taxa_file           (str): ".keg" file, contains each codes of species allowed for subsequent GENES download
-        fasta_id            (str): identificative FASTA name for a given MAG/Genome
-        klist_file          (str): ".klist" file name, indicating missing KOs of interest from MAG/Genome
-        klists_directory    (str): ".klist" input files folder path
-        msa_dir             (str): ".fna" nt multifasta (single representative sequences) output folder path
-        dir_KO              (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
+        ko_list                    (list): output from previous "create_KO_list" function
+        kk_database                (dict): output of "load_kk_database()"
+        report_txt_directory        (str): flat-file report output folder
+        file_output                 (str): flat-file report output file name
+        report_tsv_directory        (str): tab-separated report output folder path
+        file_report_tsv             (str): tab-separated report output file name
+        as_kegg          (bool, optional): option to report KEGG Modules completeness as KEGG mapper (see README for details)
+        cutoff            (int, optional): Minimum obtained KEGG Module completeness percentage to be included in report files.
+                                            Defaults to 0.
+        cache_directory   (str, optional): completeness cache folder, see "evaluate_genome()". Defaults to None (no cache).
+        cache_size        (int, optional): maximum size of the cache folder, in bytes. Defaults to _def_kmc_cache_size MB.
+
+    Returns:
+        genome_state               (dict): output of "evaluate_genome()", e.g. for incremental updates via "update_genome()"
     """
-    print(_timeinfo(), "START sequences filtering and alignment", sep="\t")
-    ### filter for taxa of interest
-    os.chdir(taxa_dir)
+    genome_state = evaluate_genome(ko_list, kk_database, cache_directory=cache_directory, cache_size=cache_size)
 
-    with open(taxa_file) as f:
-        taxa_allow = [ line.strip() for line in f ]
+    for report_directory in (report_txt_directory, report_tsv_directory):
+        if not path.isdir(report_directory):
+            os.mkdir(report_directory)
 
-    os.chdir(msa_dir)
-    if not path.isdir(fasta_id):
-        os.mkdir(fasta_id)
+    with open(path.join(report_txt_directory, file_output), "a") as g, \
+         open(path.join(report_tsv_directory, file_report_tsv), "a") as h:
+        for result in genome_state["results"].values():
+            if result["txt"][0] >= cutoff:
+                g.write(report_txt_module(result))
+            if result["tsv"][0] >= cutoff:
+                h.write(report_tsv_module(result, as_kegg=as_kegg))
 
-    os.chdir(klists_directory)
-    KO_to_align = []
-    with open(klist_file) as f:
-        for line in f.readlines():
-            KO = line.strip()
-            if KO not in KO_to_align:
-                KO_to_align.append(KO)
+    return genome_state
 
-    os.chdir(dir_KO)
-    for K in sorted(os.listdir()):
-        if K not in KO_to_align:
-            continue
-    # dictionary of non-redundant nt sequences (100% identity)
-    # in order not to overvalue species with different strains in KEGG taxonomy
-    # but only focusing on SEQUENCE DIVERSITY
-        os.chdir("./" + K)
-        sequniq = {} # {sequence : tax_code_of_identical_seqs}
-        for nt_file in sorted(os.listdir()):
-            code = nt_file.split(":")[0]
-            if code not in taxa_allow:
-                continue
-    ### exclude redundant nt sequences
-            with open(nt_file) as f:
-                seq = f.readlines()[1:]
-                seq1 = "".join(seq).replace("\n", "")
+def _import_numpy():
+    """
+    Helper function to import NumPy, only needed for batch completeness evaluation.
 
-                if not seq1 in sequniq.keys():
-                    vett = [nt_file]
-                    sequniq.update({seq1:vett})
-                else:
-                    vett = sequniq[seq1]
-                    vett.append(nt_file)
-                    sequniq.update({seq1:vett})
-    ### Write a multiple sequence fasta
-        os.chdir(msa_dir + fasta_id)
-        if not path.isdir(K):
-            os.mkdir(K)
-        os.chdir(msa_dir + fasta_id + "/" + K)
-        with open(f"MSA_{K}.fna", "a") as f:
-            for key, value in sequniq.items():
-                print(">" + str(value[0][:-4]), file=f)
-                print(key, file=f)
-
-        os.chdir(dir_KO)
-    print(_timeinfo(), "COMPLETE Filter and align", sep="\t")
+    Returns:
+        np                   (module): NumPy module
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("NumPy is required for batch KEGG Modules completeness evaluation (e.g. 'pip install numpy')")
+    return np
 
-def MSA_and_HMM(msa_dir_comm, base_com_mafft, base_com_hmmbuild, log=False):
+def _batch_kk_layout(kk_database, np):
     """
-    Runs MAFFT alignment and then build nt profile HMM from it.
-    Keeps results in a folder organized by the FASTA-header of MAG/Genome.
+    Helper function to lay out the compiled KEGG Modules database as index arrays,
+    so that blocks, complexes and "//" alternative sub-modules of every Module can be checked
+    for many genomes at once via NumPy reductions over KO columns.
 
     Args:
-        msa_dir_comm                    (str): nt multi-fasta folder path, as modified for the MAG/Genome of interest
-        base_com_mafft                  (str): base command for MAFFT execution - modified for each entry of GENES (KO)
-        base_com_hmmbuild               (str): base command for "hmmbuild" execution - modified for each entry of GENES (KO)
-        log                  (bool, optional): keep execution times in a log file (if specified in command-line args). Defaults to False.
-    """
-    print(_timeinfo(), "START MSA and HMMs creation", sep="\t")
-    if log:
-        logging.info('START MAFFT & hmmbuild execution')
-    os.chdir(msa_dir_comm)
-    for K in sorted(os.listdir()):
-        os.chdir(K)
-        ch_com_mafft = base_com_mafft.replace("K_NUMBER", K)
-        ch_com_hmmbuild = base_com_hmmbuild.replace("K_NUMBER", K)
-        os.system(ch_com_mafft)
-        os.system(ch_com_hmmbuild)
-        os.chdir(msa_dir_comm)
-    if log:
-        logging.info('COMPLETE MAFFT & hmmbuild execution')
-    print(_timeinfo(), "COMPLETE MSA and HMM creation", sep="\t")
+        kk_database            (dict): output of "load_kk_database()"
+        np                   (module): NumPy module
 
-def nhmmer_for_genome(fasta_genome, msa_dir_comm, base_com_nhmmer):
+    Returns:
+        layout                 (dict): Python-dictionary object with index arrays:
+                                        "free_idx", "free_off", "free_blocks": KO columns of blocks KOs outside complexes
+                                        "cplx_idx", "cplx_off": required KO columns of complexes
+                                        "cplx_blocks_unique", "cplx_blocks_off": blocks with complexes, first complex of each one
+                                        "always_blocks": blocks with a complex made only of optional KOs
+                                        "n_blocks", "group_off", "group_total": blocks of each Module alternative sub-module
+                                        "module_groups": Python-list of group indexes per Module (in ".kk" file order)
+                                        "module_kos_idx", "module_kos_off": KO columns of each Module KOs (as in "evaluate_module()")
     """
-    Runs a nHMMER search for newly generated HMM profiles against a given MAG/Genome.
-    Keeps results in a folder organized by the FASTA id of MAG/Genome.
+    ko_ids = kk_database["ko_ids"]
+    free_idx, free_off, free_blocks = [], [], []
+    cplx_idx, cplx_off, cplx_blocks = [], [], []
+    always_blocks = []
+    group_off, group_total, module_groups = [], [], []
+    module_kos_idx, module_kos_off = [], [0]
+
+    b = 0
+    for kk_module in kk_database["modules"].values():
+        module_kos_idx.extend( ko_ids[ko] for ko in kk_module["module_kos"] )
+        module_kos_off.append(len(module_kos_idx))
+        optional = set(kk_module["optional"])
+        groups = []
+        for block in kk_module["blocks"]:
+            if not groups or groups[-1][0] != block["subOR"]:
+                groups.append([block["subOR"], b, 0])
+            groups[-1][2] += 1
+
+            free = sorted({ ko_ids[ko] for ko in block["free"] })
+            if free:
+                free_off.append(len(free_idx))
+                free_idx.extend(free)
+                free_blocks.append(b)
+            for k_singlecomplex in block["complexes"]:
+                required = sorted({ ko_ids[el] for el in k_singlecomplex if el not in optional })
+                if not required:
+                    always_blocks.append(b)
+                    continue
+                cplx_off.append(len(cplx_idx))
+                cplx_idx.extend(required)
+                cplx_blocks.append(b)
+            b += 1
+
+        module_groups.append(list(range(len(group_off), len(group_off) + len(groups))))
+        for _, start, total in groups:
+            group_off.append(start)
+            group_total.append(total)
+
+    # complexes are listed in blocks order
+    cplx_blocks_off = [ i for i, b in enumerate(cplx_blocks) if i == 0 or cplx_blocks[i-1] != b ]
+
+    layout = {
+        "free_idx": np.array(free_idx, dtype=np.intp),
+        "free_off": np.array(free_off, dtype=np.intp),
+        "free_blocks": np.array(free_blocks, dtype=np.intp),
+        "cplx_idx": np.array(cplx_idx, dtype=np.intp),
+        "cplx_off": np.array(cplx_off, dtype=np.intp),
+        "cplx_blocks_unique": np.array([ cplx_blocks[i] for i in cplx_blocks_off ], dtype=np.intp),
+        "cplx_blocks_off": np.array(cplx_blocks_off, dtype=np.intp),
+        "always_blocks": np.array(sorted(set(always_blocks)), dtype=np.intp),
+        "n_blocks": b,
+        "group_off": np.array(group_off, dtype=np.intp),
+        "group_total": np.array(group_total, dtype=np.intp),
+        "module_groups": module_groups,
+        "module_kos_idx": np.array(module_kos_idx, dtype=np.intp),
+        "module_kos_off": np.array(module_kos_off, dtype=np.intp),
+    }
+    return layout
+
+def batch_completeness(genomes_kos, kk_database, chunk_size=2000, missing=False):
+    """
+    Computes KEGG Modules completeness for many genomes at once,
+    from a boolean genome x KO matrix, with NumPy matrix operations.
+    Results are the same of the tab-separated report of "testcompleteness()".
 
     Args:
-        fasta_genome        (str): identificative FASTA name (including path) for a given MAG/Genome
-        msa_dir_comm        (str): nt multi-fasta folder path, as modified for the MAG/Genome of interest
-        base_com_nhmmer     (str): base command for "nhmmer" execution - modified for each entry of GENES (KO)
-    """
-    print(_timeinfo(), "START nhmmer search", sep="\t")
-    os.chdir(msa_dir_comm)
-    for K in sorted(os.listdir()):
-        os.chdir(K)
-        ch_com_nhmmer = base_com_nhmmer.replace("K_NUMBER", K).replace("PATHFILE", fasta_genome)
-        os.system(ch_com_nhmmer)
-        os.chdir(msa_dir_comm)
-    print(_timeinfo(), "COMPLETE nhmmer", sep="\t")
+        genomes_kos            (dict): Python-dictionary object: {genome name : KOs present in the pre-annotation}
+        kk_database            (dict): output of "load_kk_database()"
+        chunk_size    (int, optional): number of genomes evaluated together, to bound memory usage. Defaults to 2000.
+        missing      (bool, optional): also list the missing KOs of each genome x Module. Defaults to False.
 
-def move_HMM_and_clean(hmm_dir_comm, msa_dir_comm):
+    Returns:
+        batch                  (dict): Python-dictionary object:
+                                        "genomes": genome names (rows)
+                                        "modules": KEGG Module ids (columns)
+                                        "present", "total": genome x Module arrays of present and total blocks
+                                        "percentage": genome x Module array of completeness percentages
+                                        with "missing", also:
+                                        "ko_ids": KOs, by KO code
+                                        "missing_kos": KO codes of the missing KOs, genome by genome and Module by Module
+                                        "missing_offsets": start of each genome x Module (row-major) in "missing_kos", plus the end
     """
-    Orders HMMs, moving them from MSA folder into a dedicated HMM folder.
-    Removes multi-fasta sequences (".fna") necessary for MAFFT proper alignment.
+    np = _import_numpy()
+    ko_ids = kk_database["ko_ids"]
+    layout = _batch_kk_layout(kk_database, np)
+    genomes = list(genomes_kos)
+    modules = [ kk_file[:-3] for kk_file in kk_database["modules"] ]
+    n_groups = len(layout["group_total"])
+
+    # exact percentages, as rounded by Python for each (present, total) couple
+    max_total = int(layout["group_total"].max())
+    percentage_table = np.zeros((max_total+1, max_total+1))
+    for total in range(1, max_total+1):
+        for present in range(total+1):
+            percentage_table[present, total] = round((present/(total))*100, 2)
+
+    group_present = np.zeros((len(genomes), n_groups), dtype=np.int32)
+    missing_kos, missing_counts = [], []
+    for start in range(0, len(genomes), chunk_size):
+        chunk = genomes[start:start+chunk_size]
+        G = np.zeros((len(chunk), len(ko_ids)), dtype=bool)
+        for row, genome in enumerate(chunk):
+            cols = [ ko_ids[ko] for ko in genomes_kos[genome] if ko in ko_ids ]
+            G[row, cols] = True
+
+        P = np.zeros((len(chunk), layout["n_blocks"]), dtype=bool)
+        if len(layout["free_off"]):
+            P[:, layout["free_blocks"]] = np.logical_or.reduceat(G[:, layout["free_idx"]], layout["free_off"], axis=1)
+        if len(layout["cplx_off"]):
+            complex_sat = np.logical_and.reduceat(G[:, layout["cplx_idx"]], layout["cplx_off"], axis=1)
+            # a block is present if at least one of its complexes is complete
+            P[:, layout["cplx_blocks_unique"]] |= np.logical_or.reduceat(complex_sat, layout["cplx_blocks_off"], axis=1)
+        P[:, layout["always_blocks"]] = True
+
+        group_present[start:start+len(chunk)] = np.add.reduceat(P.astype(np.int32), layout["group_off"], axis=1)
+
+        if missing:
+            # Module KOs absent from each genome, in Module order (as "Kmissing" of "evaluate_module()")
+            M = ~G[:, layout["module_kos_idx"]]
+            cumulative = np.zeros((len(chunk), M.shape[1]+1), dtype=np.int64)
+            np.cumsum(M, axis=1, out=cumulative[:, 1:])
+            off = layout["module_kos_off"]
+            missing_counts.append((cumulative[:, off[1:]] - cumulative[:, off[:-1]]).ravel())
+            missing_kos.append(layout["module_kos_idx"][np.nonzero(M)[1]])
+
+    group_total = layout["group_total"]
+    group_percentage = percentage_table[group_present, group_total]
+
+    present = np.zeros((len(genomes), len(modules)), dtype=np.int32)
+    total = np.zeros((len(genomes), len(modules)), dtype=np.int32)
+    rows = np.arange(len(genomes))
+    for m, groups in enumerate(layout["module_groups"]):
+        if len(groups) == 1:
+            choice = np.full(len(genomes), groups[0])
+        else:
+            # the last alternative sub-module is kept, unless another one is more complete (the first, if tied)
+            pct = group_percentage[:, groups]
+            best = pct.max(axis=1)
+            choice = np.where(pct[:, -1] == best, groups[-1], np.array(groups)[pct.argmax(axis=1)])
+        present[:, m] = group_present[rows, choice]
+        total[:, m] = group_total[choice]
+
+    batch = {
+        "genomes": genomes,
+        "modules": modules,
+        "present": present,
+        "total": total,
+        "percentage": percentage_table[present, total],
+    }
+    if missing:
+        batch["ko_ids"] = list(ko_ids)
+        ko_dtype = np.uint16 if len(ko_ids) < 2**16 else np.uint32
+        batch["missing_kos"] = np.concatenate(missing_kos).astype(ko_dtype) if missing_kos else np.zeros(0, dtype=ko_dtype)
+        batch["missing_offsets"] = np.zeros(len(genomes)*len(modules)+1, dtype=np.int64)
+        if missing_counts:
+            np.cumsum(np.concatenate(missing_counts), out=batch["missing_offsets"][1:])
+    return batch
+
+def batch_completeness_tsv(batch, as_kegg=False):
+    """
+    Classifies batch KEGG Modules completeness as in the tab-separated report of "testcompleteness()".
 
     Args:
-        hmm_dir_comm    (str): HMM folder path, as modified for the MAG/Genome of interest
-        msa_dir_comm    (str): nt multi-fasta folder path, as modified for the MAG/Genome of interest
-    """
-    os.chdir(hmm_dir)
-    if not path.isdir(hmm_dir_comm):
-        os.mkdir(hmm_dir_comm)
-    os.chdir(msa_dir_comm)
-    K_numbers = sorted(os.listdir())
-    for K in K_numbers:
-        os.chdir(hmm_dir_comm)
-        if not path.isdir(hmm_dir_comm + K):
-            os.mkdir(K)
-        os.chdir(msa_dir_comm + K)
-        for file in sorted(os.listdir()):
-            if file.endswith(".hmm") or file.endswith(".hits"):
-                hmm_file = file
-                os.replace(msa_dir_comm + K + "/" + hmm_file, hmm_dir_comm + K + "/" + hmm_file)
-            if file.endswith(".fna"):
-                os.remove(file)
-    print(_timeinfo(), "COMPLETE move HMM and clean", sep="\t")
+        batch                  (dict): output of "batch_completeness()"
+        as_kegg      (bool, optional): option to report KEGG Modules completeness as KEGG mapper (see README for details)
 
-def movebackHMM(hmm_dir_comm, msa_dir_comm):
+    Returns:
+        completeness_tsv    (ndarray): genome x Module array of "COMPLETE", "1 BLOCK MISSING", "2 BLOCKS MISSING" or "INCOMPLETE"
     """
-    Moves ".hmm" files back to multi-alignment folder,
-    e.g. in order to try different HMM-hits threshold.
-    WHEN TO USE THIS:
-    to unroll from a complete command-line run - called with the arg: "--retry_nhmmer"
+    np = _import_numpy()
+    present, total = batch["present"], batch["total"]
+    difference = total - present
+
+    incomplete = difference > 2
+    if as_kegg:
+        incomplete |= total < 3
+    completeness_tsv = np.select([difference == 0, incomplete, difference == 2, difference == 1],
+                                 ["COMPLETE", "INCOMPLETE", "2 BLOCKS MISSING", "1 BLOCK MISSING"],
+                                 default="INCOMPLETE").astype(object)
+    return completeness_tsv
+
+def write_batch_completeness(batch, report_tsv_directory, file_prefix, as_kegg=False):
+    """
+    Writes batch KEGG Modules completeness as genome x Module tab-separated tables:
+    completeness percentage, classification and present__total blocks.
 
     Args:
-        hmm_dir_comm    (str): HMM folder path, as modified for the MAG/Genome of interest
-        msa_dir_comm    (str): nt multi-fasta folder path, as modified for the MAG/Genome of interest
+        batch                  (dict): output of "batch_completeness()"
+        report_tsv_directory    (str): output folder path
+        file_prefix             (str): output files name prefix
+        as_kegg      (bool, optional): option to report KEGG Modules completeness as KEGG mapper (see README for details)
     """
-    os.chdir(hmm_dir_comm)
-    K_numbers = sorted(os.listdir())
-    for K in K_numbers:
-        os.chdir(hmm_dir_comm + K)
-        for file in sorted(os.listdir()):
-            if file.endswith(".hmm"):
-                os.replace(hmm_dir_comm + K + "/" + file, msa_dir_comm + K + "/" + file)
-    print(_timeinfo(), "COMPLETE move back HMM", sep="\t")
+    if not path.isdir(report_tsv_directory):
+        os.mkdir(report_tsv_directory)
 
-def nhmmer_significant_hits_corr(fasta_id, hmm_dir_comm, threshold=100, corr_threshold=_def_thr, evalue_threshold=float(1e-30)):
+    completeness_tsv = batch_completeness_tsv(batch, as_kegg=as_kegg)
+    tables = {
+        "percentage": batch["percentage"].tolist(),
+        "completeness": completeness_tsv.tolist(),
+        "blocks": [ [ str(p) + "__" + str(t) for p, t in zip(p_row, t_row) ]
+                    for p_row, t_row in zip(batch["present"].tolist(), batch["total"].tolist()) ],
+    }
+    for table, values in tables.items():
+        with open(path.join(report_tsv_directory, f"{file_prefix}_{table}.tsv"), "w") as f:
+            print("genome", *batch["modules"], sep="\t", file=f)
+            for genome, row in zip(batch["genomes"], values):
+                print(genome, *row, sep="\t", file=f)
+
+def write_columnar_completeness(batch, kk_database, report_tsv_directory, file_prefix, file_format="npz", as_kegg=False):
     """
-    Stores the nhmmer-derived HMM hits in a dedicated ".txt" file.
-    Detailed informations stored include the scoring, genomic context and
-    HMM positions of the hits found with nhmmer.
+    Writes batch KEGG Modules completeness of every genome x Module in a single columnar file:
+    completeness percentage, present and total blocks, classification and missing KOs (dictionary-encoded).
+    "npz": uncompressed NumPy arrays, genome x Module matrices (memory-mapped by "load_columnar_completeness()");
+    "arrow"/"parquet": 1 row per genome x Module (requires pyarrow).
 
     Args:
-        fasta_id                      (str): identificative FASTA name for a given MAG/Genome
-        hmm_dir_comm                  (str): HMM folder path, as modified for the MAG/Genome of interest
-        threshold           (int, optional): Minimum nhmmer score for a hit to be considered proper. Defaults to 100.
-        corr_threshold    (float, optional): Minimum nhmmer score, corrected by profile HMM lenght
-                                             for a hit to be considered proper. Defaults to _def_thr.
-        evalue_threshold  (float, optional): Minimum nhmmer e-value for a hit to be considered proper
-                                             (not in use in current form). Defaults to float(1e-30).
+        batch                  (dict): output of "batch_completeness()", with missing KOs
+        kk_database            (dict): output of "load_kk_database()"
+        report_tsv_directory    (str): output folder path
+        file_prefix             (str): output file name prefix
+        file_format   (str, optional): one of _columnar_formats. Defaults to "npz".
+        as_kegg      (bool, optional): option to report KEGG Modules completeness as KEGG mapper (see README for details)
 
     Returns:
-        sig_hits                     (dict): Python-dictionary object including HMM results
-                                             (not strictly necessary for script continuation).
+        columnar_file           (str): output file path
     """
-    os.chdir(hmm_dir_comm)
-    sig_hits = {}
+    np = _import_numpy()
+    if not path.isdir(report_tsv_directory):
+        os.mkdir(report_tsv_directory)
 
-    with open(f"{fasta_id}_HMM_hits.txt", "a") as g:
-        print("K", "corr_score,evalue", "fragment", "strand",
-              "l_bound", "r_bound", "p_lenght", "hmmfrom",
-              "hmmto", sep="\t", file=g)
+    completeness_tsv = batch_completeness_tsv(batch, as_kegg=as_kegg)
+    classification = np.zeros(completeness_tsv.shape, dtype=np.uint8)
+    for code, level in enumerate(_completeness_levels):
+        classification[completeness_tsv == level] = code
+    columns = {
+        "genomes": np.array(batch["genomes"], dtype=str),
+        "modules": np.array(batch["modules"], dtype=str),
+        "module_names": np.array([ kk_module["extended_name"][7:] for kk_module in kk_database["modules"].values() ], dtype=str),
+        "percentage": batch["percentage"],
+        "present": batch["present"].astype(np.uint16),
+        "total": batch["total"].astype(np.uint16),
+        "classification": classification,
+        "classification_levels": np.array(_completeness_levels, dtype=str),
+        "ko_ids": np.array(batch["ko_ids"], dtype=str),
+        "missing_kos": batch["missing_kos"],
+        "missing_offsets": batch["missing_offsets"],
+    }
+
+    columnar_file = path.join(report_tsv_directory, f"{file_prefix}.{file_format}")
+    if file_format == "npz":
+        # uncompressed, so that "load_columnar_completeness()" can memory-map each array
+        np.savez(columnar_file, **columns)
+        return columnar_file
 
-    for directory in sorted(os.listdir()):
-        if directory.startswith("K"):
-            K = directory
-            os.chdir("./" + K)
-            if K+".hits" not in os.listdir():
-                os.chdir(hmm_dir_comm)
-            else:
-                evalue = 100
-                score = 0
-                corr_score = 0
-                with open(K + ".hits") as f:
-                    v = f.readlines()[:-9]          # NOT INCLUDING lines w/ the nhmmer command as they rise an error
-                    add_ = int(v[1].index("-")-1)   # CORRECT for long contig names
-                    for line in v:
-                        # line positions based on HMMER table output result
-                        if K in line[32 + add_:38 + add_]:
-                            evalue = line[127 + add_:136 + add_].strip()
-                            score = line[137 + add_:143 + add_].strip()
-                            fragment = line[0:20 + add_].strip()
-                            strand = line[120 + add_:126 + add_].strip()
-                            left_bound = int(line[80 + add_:87 + add_].strip())
-                            right_bound = int(line[88 + add_:95 + add_].strip())
-                            bounds = [str(left_bound - 1), str(right_bound - 1)]
-                            hmmfrom = int(line[65 + add_:71 + add_].strip())
-                            hmmto = int(line[72 + add_:79 + add_].strip())
-                            profile_lenght = int(hmmto - hmmfrom)
-
-                            corr_score = round((float(score)/profile_lenght), 4)
-                            break
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError(f"pyarrow is required for the {file_format} completeness output (e.g. 'pip install pyarrow')")
+    n_genomes, n_modules = columns["percentage"].shape
+    ko_dictionary = pa.array(columns["ko_ids"])
+    missing_kos = pa.DictionaryArray.from_arrays(pa.array(columns["missing_kos"].astype(np.int32)), ko_dictionary)
+    missing_offsets = columns["missing_offsets"]
+    if missing_offsets[-1] < 2**31:
+        list_array, missing_offsets = pa.ListArray, missing_offsets.astype(np.int32)
+    else:
+        list_array = pa.LargeListArray
+    table = pa.table({
+        "genome": pa.DictionaryArray.from_arrays(pa.array(np.repeat(np.arange(n_genomes, dtype=np.int32), n_modules)),
+                                                 pa.array(columns["genomes"])),
+        "module": pa.DictionaryArray.from_arrays(pa.array(np.tile(np.arange(n_modules, dtype=np.int32), n_genomes)),
+                                                 pa.array(columns["modules"])),
+        "percentage": columns["percentage"].ravel(),
+        "present": columns["present"].ravel(),
+        "total": columns["total"].ravel(),
+        "classification": pa.DictionaryArray.from_arrays(pa.array(classification.ravel().astype(np.int8)),
+                                                         pa.array(_completeness_levels)),
+        "missing_KOs": list_array.from_arrays(pa.array(missing_offsets), missing_kos),
+    })
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, columnar_file)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, columnar_file, compression="uncompressed")
+    return columnar_file
 
-                    if corr_score > corr_threshold and float(score) > threshold: # could also be unified with evalue_threshold
-                        sig_hits.update({K:[fragment, strand, bounds]})
-                        os.chdir(hmm_dir_comm)
-                        with open(f"{fasta_id}_HMM_hits.txt", "a") as g:
-                            print(K, str(corr_score) + "," + str(evalue), fragment, strand,
-                            str(left_bound - 1), str(right_bound - 1), str(profile_lenght), str(hmmfrom - 1), str(hmmto - 1),
-                            sep="\t", file=g)
+def load_columnar_completeness(columnar_file):
+    """
+    Loads a ".npz" output of "write_columnar_completeness()" with a single memory-mapped read:
+    arrays are not copied in memory, but read from the file when accessed.
 
-                os.chdir(hmm_dir_comm)
+    Args:
+        columnar_file           (str): ".npz" file path
 
-    os.rename(hmm_dir_comm + fasta_id + "_HMM_hits.txt", hmm_hits_dir + fasta_id + "_HMM_hits.txt")
-    print(_timeinfo(), "COMPLETE nhmmer significant hits", sep="\t")
-    return sig_hits
+    Returns:
+        columns                (dict): Python-dictionary object: {array name : memory-mapped NumPy array}
+                                        (missing KOs of genome g, Module m: ko_ids[missing_kos[missing_offsets[i]:missing_offsets[i+1]]],
+                                        with i = g * number of Modules + m)
+    """
+    np = _import_numpy()
+    columns = {}
+    with zipfile.ZipFile(columnar_file) as z, open(columnar_file, "rb") as f:
+        for info in z.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                columns[info.filename[:-4]] = np.load(z.open(info))
+                continue
+            # ".npy" member: skip the zip local header, then read the ".npy" header
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = int.from_bytes(f.read(2), "little"), int.from_bytes(f.read(2), "little")
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject or 0 in shape:
+                f.seek(info.header_offset + 30 + name_len + extra_len)
+                columns[info.filename[:-4]] = np.lib.format.read_array(f)
+            else:
+                columns[info.filename[:-4]] = np.memmap(f, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                                        order="F" if fortran_order else "C")
+    return columns
 
-def HMM_hits_sequences(hmm_hits_dir, dir_genomes):
+def create_tuple_modules(fixed_module_file):
     """
-    Loads MAGs/Genomes HMM hits info, previously generated via "nhmmer_significant_hits_corr()".
-    Checks hits in genome content (contigs-scaffolds-chromosomes), both in FOR & REV directions.
-    Stores relevant hits in a dictionary-object.
+    Generates a tuple from the indication of Modules in which to look for incompleteness, for further use.
 
     Args:
-        hmm_hits_dir        (str): HMM hits folder path
-        dir_genomes         (str): command-line defined genomes folder path
+        fixed_module_file   (str): file name of a ".instruction" file with indication of KEGG Modules of interest
 
     Returns:
-        HMM_hits_dict      (dict): Python-dictionary object:
-                                    keys: ">MAG/Genome+KO"
-                                    values: "nt sequence"
+        tuple_modules     (tuple): Python tuple-object including all KEGG Modules of interest
     """
-    #### load all infos of different genomes' HMM-hits
-    MAG_Khit_dict = {}
-    HMM_hits_dict = {}
 
-    os.chdir(hmm_hits_dir)
-    for el in sorted(os.listdir()):
-        if not el.endswith(".txt"):
-            continue
-        MAG = el.replace("_HMM_hits.txt","")
-        v_Khits = []
-        with open(el) as f:
-            for line in f.readlines()[1:]:
-                line = line.strip().split("\t")
-                K = line[0]
-                fragment, strand, l_bound, r_bound = line[2:6]
-                v_Khits.append([K, fragment, strand, l_bound, r_bound])
+    with open(fixed_module_file) as f:
+        tuple_modules = tuple([ line.strip() for line in f ])
 
-        MAG_Khit_dict[MAG] = v_Khits
+    return tuple_modules
 
-    #### once all infos of the hits are loaded, check the contigs//genomes for hits sequences
-    for genome, val in MAG_Khit_dict.items():
-        for hits in MAG_Khit_dict[genome]:
-            strand_plus = False
-            K = hits[0]
-            fragment = hits[1]
-            strand = hits[2]
-            l_bound = int(hits[3])
-            r_bound = int(hits[4])
-
-            os.chdir(dir_genomes)
-            for genome_file in sorted(os.listdir()):
-                if genome_file.startswith(genome + "."):
-                    with open(genome_file) as f:
-                        v_lines = f.readlines()
-            for i, line in enumerate(v_lines):
-                line = line.strip()
-                if ">" and fragment in line:
-                    i_frag_start = i
-                    j = i
-                    for line in v_lines[i_frag_start+1:]:
-                        j += 1
-                        if ">" in line or j >= (len(v_lines)-1): # new contigs or file-end
-                            i_frag_stop = j
-                            break
-                    break
-    #### load contigs' "+" strand sequence
-            try:
-                fragment_w_hit = ""
-                for line in v_lines[i_frag_start+1:i_frag_stop]:
-                    fragment_w_hit += line.strip()
-    #### different treatment for hits in "+" & "-" strands
-    #### do not include hits with "N", resulting e.g. from scaffold placeholders
-                if strand == "+":
-                    SEQUENCE = fragment_w_hit[l_bound:r_bound]
-                    if "N" not in SEQUENCE and "n" not in SEQUENCE:
-                        HMM_hits_dict.update({">"+genome+"_"+K:SEQUENCE})
-                else:
-                    SEQUENCE_pre = fragment_w_hit[r_bound:l_bound]
-                    pre = "ACTG"
-                    post = "TGAC"
-                    compl = SEQUENCE_pre.maketrans(pre, post)
-                    seq_compl = SEQUENCE_pre.translate(compl)
-                    SEQUENCE = seq_compl[::-1]
-                    if "N" not in SEQUENCE and "n" not in SEQUENCE:
-                        HMM_hits_dict.update({">" + genome + "_" + K:SEQUENCE})
-            except:
-                pass
-    return HMM_hits_dict
-
-def HMM_hits_translated_sequences(HMM_hits_dict):
+def create_tuple_modules_1BM(fasta_id, fixed_module_file, oneBM_modules_dir, report_tsv_directory, genome_state=None, as_kegg=False,
+                             cutoff=0):
     """
-    Translates HMM hits in the 3 frames of the adequate sequence strand.
-    Stores them in a dictionary-object.
+    Generates a tuple including Modules missing 1 orthologs block, for further use.
 
     Args:
-        HMM_hits_dict               (dict): Python-dictionary object output of "HMM_hits_sequences()"
+        fasta_id                (str): identificative FASTA name for a given MAG/Genome
+        fixed_module_file       (str): generic file name of a ".instruction" file with indication of KEGG Modules of interest
+        oneBM_modules_dir       (str): output folder of MAG/Genome specific ".instruction" file with KEGG Modules of interest
+        report_tsv_directory    (str): testcompleteness_tsv() output folder, to identify 1 block missing modules
+        genome_state (dict, optional): output of "evaluate_genome()", used instead of the tab-separated report. Defaults to None.
+        as_kegg       (bool, optional): completeness classification as KEGG mapper, with "genome_state". Defaults to False.
+        cutoff         (int, optional): minimum KEGG Module completeness percentage, with "genome_state",
+                                        as for the tab-separated report of "testcompleteness()". Defaults to 0.
 
     Returns:
-        HMM_hits_TRANSLATED_dict    (dict): Python-dictionary object:
-                                            keys: ">MAG/Genome+KO+frame_indication"
-                                            values: "aa sequence"
+        tuple_modules         (tuple): Python tuple-object including all KEGG Modules of interest
     """
-    #POSSIBILITY: NOT ONLY t11 table, but also others
-    t11 = {"TTT":"F", "TTC":"F", "TTA":"L", "TTG":"L",
-           "TCT":"S", "TCC":"S", "TCA":"S", "TCG":"S",
-           "TAT":"Y", "TAC":"Y", "TAA":"*", "TAG":"*",
-           "TGT":"C", "TGC":"C", "TGA":"*", "TGG":"W",
-           "CTT":"L", "CTC":"L", "CTA":"L", "CTG":"L",
-           "CCT":"P", "CCC":"P", "CCA":"P", "CCG":"P",
-           "CAT":"H", "CAC":"H", "CAA":"Q", "CAG":"Q",
-           "CGT":"R", "CGC":"R", "CGA":"R", "CGG":"R",
-           "ATT":"I", "ATC":"I", "ATA":"I", "ATG":"M",
-           "ACT":"T", "ACC":"T", "ACA":"T", "ACG":"T",
-           "AAT":"N", "AAC":"N", "AAA":"K", "AAG":"K",
-           "AGT":"S", "AGC":"S", "AGA":"R", "AGG":"R",
-           "GTT":"V", "GTC":"V", "GTA":"V", "GTG":"V",
-           "GCT":"A", "GCC":"A", "GCA":"A", "GCG":"A",
-           "GAT":"D", "GAC":"D", "GAA":"E", "GAG":"E",
-           "GGT":"G", "GGC":"G", "GGA":"G", "GGG":"G",}
-
-    HMM_hits_TRANSLATED_dict = {}
+    list_modules = []
+    if genome_state is not None:
+        for kk_file, result in genome_state["results"].items():
+            completeness, present, total = result["tsv"]
+            if completeness >= cutoff and _completeness_tsv(present, total, as_kegg=as_kegg) == "1 BLOCK MISSING":
+                list_modules.append(kk_file[:-3])
+    else:
+        with open(path.join(report_tsv_directory, "reportKMC_"+fasta_id+".tsv")) as f:
+            for line in f:
+                line = line.strip().split("\t")
+                MOD = line[0]
+                COMPLETENESS = line[2]
+                if COMPLETENESS == "1 BLOCK MISSING":
+                    list_modules.append(MOD)
 
-    for fasta_id, seq in HMM_hits_dict.items():
+    with open(path.join(oneBM_modules_dir, fasta_id + "_" + fixed_module_file), "w") as m:
+        for module in list_modules:
+            print(module, file=m)
 
-        frame_ids = [ fasta_id + "__f1",
-                      fasta_id + "__f2",
-                      fasta_id + "__f3" ]
+    tuple_modules = tuple(list_modules)
+    return tuple_modules
 
-        ntseqs = [ seq.upper(),
-                   seq[1:].upper(),
-                   seq[2:].upper() ]
+def ko_reference_costs(KOs, dir_KO):
+    """
+    Expected compute cost of the HMM stage for each KO, as its number of KEGG GENES reference sequences
+    already downloaded in the taxonomy folder (the more sequences, the longer MSA, hmmbuild and download).
 
-        for frame_id, ntseq in zip(frame_ids, ntseqs):
-            codons = [ ntseq[i:i+3] for i in range(0, len(ntseq), 3) ]
-            if len(codons[-1]) < 3:
-                codons.pop()
-            aaseq = "".join(( t11[codon] for codon in codons ))
-            HMM_hits_TRANSLATED_dict[frame_id] = aaseq
+    Args:
+        KOs                (iterable): KOs of interest
+        dir_KO                  (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
 
-    return HMM_hits_TRANSLATED_dict
+    Returns:
+        ko_costs               (dict): Python-dictionary object {KO : number of reference sequences},
+                                        only for KOs already downloaded
+    """
+    ko_costs = {}
+    for KO in KOs:
+        dir_K = path.join(dir_KO, KO)
+        if path.isdir(dir_K):
+            ko_costs[KO] = sum(1 for file in os.listdir(dir_K) if file.endswith(".fna"))
+    return ko_costs
+
+def _block_candidates(block, ko_set, optional, ko_costs, default_cost):
+    """
+    Helper function to list the KO sets completing a missing block of a compiled KEGG Module, ranked by cost.
+    A KO outside complexes completes the block alone, a complex needs each of its missing (not optional) KOs.
+    (Called in the "completion_candidates()" function).
 
+    Args:
+        block                  (dict): block of the compiled KEGG Module
+        ko_set                  (set): KOs present in the pre-annotation
+        optional              (tuple): optional KOs of the compiled KEGG Module
+        ko_costs               (dict): output of "ko_reference_costs()"
+        default_cost            (int): cost of KOs not in "ko_costs"
 
-def HMM_hits_longest_translated_sequences(HMM_hits_dict, HMM_hits_TRANSLATED_dict):
+    Returns:
+        candidates             (list): Python-list object of (cost, KOs tuple), cheapest first
     """
-    Compares the HMM translated hits and keep the longest hit without a stop codon.
-    Stores them in a dictionary-object.
+    options = [ (KO,) for KO in block["free"] ]
+    for singlecomplex in block["complexes"]:
+        options.append(tuple(KO for KO in singlecomplex if KO not in ko_set and KO not in optional))
+
+    candidates = []
+    for option in dict.fromkeys(options):
+        if option:
+            candidates.append((sum(ko_costs.get(KO, default_cost) for KO in option), option))
+    # stable sort: same cost options keep the order of the KEGG Module definition
+    candidates.sort(key=lambda candidate: (candidate[0], len(candidate[1])))
+    return candidates
+
+def completion_candidates(genome_state, modules=None, ko_costs=None, max_candidates=None):
+    """
+    Computes, for each KEGG Module of interest, the missing blocks of a MAG/Genome
+    and the ranked KO sets that would complete each of them, from the compiled KEGG Modules definitions.
+    For Modules with "//" alternatives, only the alternative with the fewest (then cheapest) missing blocks is kept.
 
     Args:
-        HMM_hits_dict                   (dict): Python-dictionary object output of "HMM_hits_sequences()"
-        HMM_hits_TRANSLATED_dict        (dict): Python-dictionary object output of "HMM_hits_translated_sequences()"
+        genome_state           (dict): output of "evaluate_genome()" or "update_genome()"
+        modules      (iterable, optional): KEGG Modules of interest (e.g. "M00001"). Defaults to None (each Module).
+        ko_costs     (dict, optional): output of "ko_reference_costs()". Defaults to None (same cost for each KO).
+        max_candidates (int, optional): maximum number of ranked KO sets kept per block. Defaults to None (all).
 
     Returns:
-        HMM_hits_TRANSLATED_MAXLEN_dict (dict): Python-dictionary object:
-                                                keys: ">MAG/Genome+KO+frame_indication"
-                                                values: "aa sequence" - only the longest without stop codons (*)
+        completion             (dict): Python-dictionary object:
+                                        keys: ".kk file name" of incomplete KEGG Modules of interest
+                                        values: Python-list object of missing blocks, each a dict with
+                                                "label", "line" and "candidates" (output of "_block_candidates()")
     """
-    max_len_dict = { fasta_nf: [] for fasta_nf in HMM_hits_dict }
+    ko_costs = ko_costs or {}
+    default_cost = max(ko_costs.values(), default=1)
+    if modules is not None:
+        modules = set(modules)
+    ko_set = genome_state["ko_set"]
+
+    completion = {}
+    for kk_file, result in genome_state["results"].items():
+        if modules is not None and kk_file[:-3] not in modules:
+            continue
+        kk_module = result["kk_module"]
+        alternatives = {}
+        for block, check in zip(kk_module["blocks"], result["presence"]):
+            if check:
+                continue
+            candidates = _block_candidates(block, ko_set, kk_module["optional"], ko_costs, default_cost)
+            alternatives.setdefault(block["subOR"], []).append(
+                {"label": block["label"], "line": block["line"], "candidates": candidates[:max_candidates]})
+        if not alternatives:
+            continue
+        if kk_module["subOR_presence"]:
+            # alternatives with a present block only are already complete
+            if len(alternatives) < len({ block["subOR"] for block in kk_module["blocks"] }):
+                continue
+            completion[kk_file] = min(alternatives.values(), key=lambda missing: (
+                len(missing), sum(block["candidates"][0][0] for block in missing if block["candidates"])))
+        else:
+            completion[kk_file] = alternatives[0]
 
-    HMM_hits_TRANSLATED_MAXLEN_dict = {}
+    return completion
 
-    for fasta_id, seq in HMM_hits_TRANSLATED_dict.items():
-        fasta_nf = fasta_id.split("__")[0]
-        seq = seq.split("*")                   # divided by stop codons
-        seq_max = max(seq, key=len)            # longer for single reading frame
-        max_len_dict[fasta_nf].append(seq_max) # add the longest to list
+def write_KOs_from_candidates(fasta_id, completion, klists_directory):
+    """
+    Generates a non-redundant list of KOs to be checked via HMM from the output of "completion_candidates()",
+    ordered by KEGG Module, block and candidate rank.
 
-    for fasta_nf in max_len_dict:
-        seq_max_allframes = max(max_len_dict[fasta_nf], key=len)
-        frame = "__f"+str(max_len_dict[fasta_nf].index(seq_max_allframes)+1)
-        HMM_hits_TRANSLATED_MAXLEN_dict.update({fasta_nf+frame:seq_max_allframes})
+    Args:
+        fasta_id                    (str): identificative FASTA name for a given MAG/Genome
+        completion                 (dict): output of "completion_candidates()"
+        klists_directory            (str): output ".klist" files folder path - in which to save MAG/Genome missing KOs of interest
 
-    return HMM_hits_TRANSLATED_MAXLEN_dict
+    Returns:
+        klist                      (list): Python-list object with the KOs written in the ".klist" file
+    """
+    klist = list(dict.fromkeys( KO for missing in completion.values() for block in missing
+                                for _, option in block["candidates"] for KO in option ))
 
-def recap_hits_corr(fasta_id, hmm_hits_dir, HMM_hits_dict, HMM_hits_longestTRANSLATED_dict, run_start):
+    with open(path.join(klists_directory, fasta_id+".klist"), "w") as g:
+        for KO in klist:
+            print(KO, file=g)
+
+    return klist
+
+def write_KOs_from_modules(fasta_id, tuple_modules, report_txt_directory, klists_directory):
     """
-    Stores informations from the HMM-hits dictionaries, alongside identified sequences.
-    It gives the final tabular output of the entire HMM procedure.
+    Generates a non-redundant list of KOs to be checked via HMM for Modules of interest,
+    either fixed or related to missing annotated genomic content.
 
     Args:
-        fasta_id                            (str): identificative FASTA name for a given MAG/Genome
-        hmm_hits_dir                        (str): HMM hits folder path
-        HMM_hits_dict                      (dict): Python-dictionary object output of "HMM_hits_sequences()"
-        HMM_hits_longestTRANSLATED_dict    (dict): Python-dictionary object output of "HMM_hits_longest_translated_sequences()"
-        run_start                           (str): indication of the date in which the "kemet.py" process started
+        fasta_id                    (str): identificative FASTA name for a given MAG/Genome
+        tuple_modules             (tuple): output of "create_tuple_modules()" or "create_tuple_modules_1BM()"
+        report_txt_directory        (str): testcompleteness() output folder, to identify KOs missing from Modules of interest
+        klists_directory            (str): output ".klist" files folder path - in which to save MAG/Genome missing KOs of interest
     """
-    os.chdir(hmm_hits_dir)
-    current_run = "KEMET_run_" + run_start
-    if not path.isdir(current_run):
-        os.mkdir(current_run)
-    os.chdir(current_run)
-    with open(f"file_recap_{run_start}.tsv", "a") as f:
-        if f.tell() == 0:
-            print("MAG", "KO", "corr_score,evalue", "fragment", "strand",
-                  "l_bound", "r_bound", "p_lenght", "hmmfrom", "hmmto",
-                  "frame", "seq", "xseq", sep="\t", file=f)
-
-        os.chdir(hmm_hits_dir)
-        for file in sorted(os.listdir()):
-            if file.endswith(".txt") and fasta_id in file:
-                with open(file) as g:
-                    for line in g.readlines()[1:]:
-                        KO = line.strip().split("\t")[0]
-                        for hit in HMM_hits_dict.keys():
-                            if hit.startswith(">"+file[:-13]+"_"+KO): ###
-                                seq = HMM_hits_dict[hit].upper()
-                                break
-                        for hit in HMM_hits_longestTRANSLATED_dict.keys():
-                            if hit.startswith(">"+file[:-13]+"_"+KO): ###
-                                frame = hit[-1]
-                                xseq = HMM_hits_longestTRANSLATED_dict[hit]
+    for file in sorted(os.listdir(report_txt_directory)):
+        if fasta_id in file:
+            with open(path.join(report_txt_directory, file)) as f:
+                klist = []
+                v = f.readlines()
+                f.seek(0)
+                i = 0
+                for line in v:
+                    i += 1
+                    if line.startswith(tuple_modules):
+                        start = i
+                        j = i
+                        for line in v[j:]:
+                            j += 1
+                            if line.startswith("M0"):
+                                end = j
                                 break
-                        os.chdir(current_run)
-                        print(file[:-13], line.strip(), frame, seq, xseq, sep="\t", file=f)
-                        os.chdir(hmm_hits_dir)
+                        for l in v[start+1:end-2]:
+                            l = l.strip().split("\t")[1].split(", ")
+                            for KO in l:
+                                if KO not in klist:
+                                    klist.append(KO)
 
+                with open(path.join(klists_directory, file[10:-4]+".klist"), "w") as g:
+                    for KO in klist:
+                        print(KO, file=g)
 
-def build_de_novo_GSMM(FASTA, fasta_genome, de_novo_model_directory, current_run, log=False):
+def write_KOs_from_fixed_list(fasta_id, fixed_ko_file, ktests_directory, klists_directory):
     """
-    Generates de-novo GSMM from a contextual Prodigal gene calling,
-    adding HMM-hits derived translated hits to the predicted proteome (".faa").
+    Generates a non-redundant list of KOs to be checked via HMM starting from a fixed list.
 
     Args:
-        FASTA                           (str): identificative FASTA name for a given MAG/Genome - with extension
-        fasta_genome                    (str): identificative FASTA name (including path) for a given MAG/Genome
-        de_novo_model_directory         (str): output files folder path
-        current_run                     (str): indication of the date in which the "kemet.py" process started
-        log                  (bool, optional): keep execution times in a log file (if specified in command-line args). Defaults to False.
+        fasta_id            (str): identificative FASTA name for a given MAG/Genome
+        fixed_ko_file       (str): ".instruction" file generated by "setup.py" to be compiled manually with KOs of interest
+        ktests_directory    (str): KO store (KOs as recovered in pre-annotations) folder path
+        klists_directory    (str): output ".klist" files folder path - in which to save MAG/Genome missing KOs of interest
     """
-    fasta_id = FASTA.replace(".fasta", "").replace(".fna", "").replace(".fa", "")
-    HMM_HITS = {}
-    os.chdir(hmm_hits_dir + current_run)
-    for file in os.listdir():
-        if not file.startswith("file_recap_") and file.endswith(".tsv"):
-            continue
-        with open(file) as f:
-            for line in f.readlines()[1:]:
-                line = line.strip().split("\t")
-                MAG = line[0]
-                KO = line[1]
-                xseq = line[12]
-                if MAG != fasta_id:
-                    continue
-                HMM_HITS.update({">"+KO:xseq})
-
-    # launch prodigal gene calling - default:QUIET
-    os.chdir(de_novo_model_directory)
-    if not path.isdir("proteins"):
-        os.mkdir("proteins")
-    prodigal_cmd = f"prodigal -i {fasta_genome} -a ./proteins/{fasta_id}.faa -q -m > /dev/null"
-    os.system(prodigal_cmd)
-    print(_timeinfo(), f"COMPLETE Prodigal command for {FASTA}", sep="\t")
-    if log:
-        logging.info(f"COMPLETE Prodigal command for {FASTA}")
 
-    # ADD HMM-hits
-    os.chdir(de_novo_model_directory+"proteins")
-    with open(fasta_id+".faa", "a") as f:
-        for ko, xseq in HMM_HITS.items():
-            print(ko, file=f)
-            # pretty print 60 chr per line
-            for i in range(0, len(xseq), 60):
-                print(xseq[i:i+60], file=f)
-    os.chdir(de_novo_model_directory)
+    with open(path.join(dir_base, fixed_ko_file)) as h:
+        KO_to_check = [ line.strip() for line in h ]
 
-    # GENERATE CARVEME MODEL - default:QUIET
-    if not path.isdir("dmnd_intermediates"):
-        os.mkdir("dmnd_intermediates")
-    carveme_cmd = f"carve ./proteins/{fasta_id}.faa --fbc2 -u {metabolic_universe} -o {fasta_id}.xml 2> /dev/null"
-    print(_timeinfo(), f"START CarveMe command for {FASTA}", sep="\t")
-    if log:
-        logging.info(f"START CarveMe command for {FASTA}")
-    os.system(carveme_cmd)
-    print(_timeinfo(), f"COMPLETE CarveMe command for {FASTA}", sep="\t")
-    if log:
-        logging.info(f'COMPLETE CarveMe command for {FASTA}')
+    KO_present = set(create_KO_list(fasta_id, ktests_directory))
+    klist = [ KO for KO in KO_to_check if KO not in KO_present ]
 
-    os.chdir(de_novo_model_directory+"/proteins/")
-    move_dmnd_cmd = f"mv {fasta_id}.tsv ../dmnd_intermediates"
-    os.system(move_dmnd_cmd)
+    with open(path.join(klists_directory, fasta_id+".klist"), "w") as g:
+        for KO in klist:
+            print(KO, file=g)
 
-def list_all_modules(Modules_directory):
+def _brite_signature(brite_file):
     """
-    Helper function to list all KEGG Modules available
-    for KEMET Genome-scale models procedures.
+    Helper function to fingerprint the KEGG Organisms hierarchy file (name, size and modification time),
+    used to check whether a compiled taxonomy index is still valid.
 
     Args:
-        Modules_directory   (str): KEGG Modules flat-files folder path
+        brite_file              (str): "br08601.keg" file path
 
     Returns:
-        list_all_mod       (list): Python-list object including all KEGG Modules available for further use
+        signature              (list): Python-list object with a (name, size, mtime) entry
     """
-    os.chdir(Modules_directory)
-    list_all_mod = []
-    all_mod = sorted(os.listdir())
-    for module in all_mod:
-        if module.endswith(".txt"):
-            list_all_mod.append(module)
-    return list_all_mod
+    brite_stat = os.stat(brite_file)
+    return [(path.basename(brite_file), brite_stat.st_size, brite_stat.st_mtime_ns)]
 
-def searchKeggShort(list_all_mod, Modules_directory, knumber):
+def _brite_name(text):
     """
-    Returns a list-object of Module ids
-    format: [Mxxxxx], in which a given input KO is found.
+    Helper function to clean the name of a KEGG BRITE entry: HTML tags and "[...]" annotations are removed.
 
     Args:
-        list_all_mod           (list): output of "list_all_modules()" function
-        Modules_directory       (str): KEGG Modules flat-files folder path
-        knumber                 (str): input KO to be searched in all KEGG Modules definitions
-
-    Returns:
-        hits                   (list): Python-list object including all KEGG Modules in which input KO is present
-    """
-    os.chdir(Modules_directory)
-    hits = []
-    for element in list_all_mod:
-        name = element
-        with open(name) as f:
-            n = 0
-            manydefinitions = []
-            for line in f.readlines()[2:]:
-                n += 1
-                if not line.startswith("ORTHOLOGY") and n == 1:
-                    definition = line.replace("-- ", "").strip().split("  ", 1)[1]
-                    continue
-                if line.startswith("ORTHOLOGY"):
-                    if len(manydefinitions) != 0:
-                        definition = manydefinitions
-                    break
-                if not line.startswith("ORTHOLOGY") and n > 1:
-                    manydefinitions.append(definition)
-                    definition = line.strip()
-                    manydefinitions.append(definition)
-                    continue
+        text                    (str): KEGG BRITE line, without its level letter
 
-        if len(manydefinitions) > 0:
-            for singledef in manydefinitions:
-                if knumber in singledef:
-                    hits.append(name[:6])
-                    break
-            else:
-                continue
-        elif len(manydefinitions) == 0:
-            if knumber in definition:
-                hits.append(name[:6])
-                continue
-            else:
-                continue
-    if len(hits) == 0:
-        raise
-    else:
-        return hits
+    Returns:
+        name                    (str): KEGG BRITE entry name
+    """
+    return re.sub(r"\s*\[[^\]]*\]$", "", re.sub(r"<[^>]+>", "", text)).strip()
 
-def knum4reac_mod(file):
+def compile_taxonomy_index(brite_file):
     """
-    Returns a dictionary-object that connects KOs to the reactions (R),
-    as identified from KEGG Module flat-files as keys and reactions (R) as values, as per Module file.
-    (Called in the "total_R_from_KOhits()" function).
+    Parses the KEGG Organisms hierarchy ("br08601.keg") once, generating the taxonomy index
+    used to select the species allowed for GENES download.
+    Organisms are the hierarchy leaves (e.g. "E        eco  Escherichia coli K-12 MG1655"); each other entry,
+    at any level (A, B, C, D...), collects the codes of the organisms below it.
 
     Args:
-        file                        (str): input KEGG Module flat-file path
+        brite_file              (str): "br08601.keg" file path
 
     Returns:
-        dictionary_knumber_reac    (dict): Python-dictionary object:
-                                            keys: "KO" entry
-                                            values: "R" entry
+        taxonomy_index         (dict): Python-dictionary object:
+                                        "version": taxonomy index format version
+                                        "signature": output of "_brite_signature()"
+                                        "levels": {level : {name : frozenset of organism codes}}
+                                        "names": {casefolded name : [(level, name)]}, in hierarchy order
+                                        "lineage": {organism code : ((level, name), ...) from the A-level}
     """
-    dictionary_knumber_reac = {}
-
-    with open(file) as f:
-        for l_count, line in enumerate(f):
-            if line.startswith("ORTHOLOGY"):
-                break
-
-        f.seek(0)
-        for line in f.readlines()[l_count:]:
-            if line.startswith("CLASS"):
-                break
-            if line.startswith("ORTHOLOGY"):
-                line = line.replace("ORTHOLOGY", "")
-            if "[RN:" not in line:
-                continue
-            knumber_a = line.strip().split("  ")[0]
-            knumber = re.split("[+-,]", knumber_a)
-            reaction = line.strip().split("[RN:")[1].replace("]", "").replace(" ", ",")
-            for knum_element in knumber:
-                if knum_element not in dictionary_knumber_reac.keys():
-                    dictionary_knumber_reac.update({knum_element:reaction})
-                else:
-                    prior_reaction = str(dictionary_knumber_reac[knum_element])
-                    new_reaction = prior_reaction + "," + reaction
-                    dictionary_knumber_reac.update({knum_element:new_reaction})
+    entries = []
+    with open(brite_file) as f:
+        for line in f:
+            if line[:1].isalpha() and line[:1].isupper() and line[1:].strip():
+                entries.append((line[0], line[1:].strip()))
+
+    levels, names, lineage = {}, {}, {}
+    ancestors = []
+    for i, (level, text) in enumerate(entries):
+        while ancestors and ancestors[-1][0] >= level:
+            ancestors.pop()
+        if i+1 < len(entries) and entries[i+1][0] > level:
+            name = _brite_name(text)
+            ancestors.append((level, name))
+            if name not in levels.setdefault(level, {}):
+                levels[level][name] = set()
+                names.setdefault(name.casefold(), []).append((level, name))
+            continue
+        fields = text.split()
+        if len(fields) > 1 and re.match("T[0-9]{5}$", fields[0]):
+            fields = fields[1:]
+        organism = fields[0]
+        lineage[organism] = tuple(ancestors)
+        for ancestor_level, ancestor_name in ancestors:
+            levels[ancestor_level][ancestor_name].add(organism)
+    levels = { level: { name: frozenset(organisms) for name, organisms in level_names.items() }
+               for level, level_names in levels.items() }
+
+    taxonomy_index = {
+        "version": _taxonomy_index_version,
+        "signature": _brite_signature(brite_file),
+        "levels": levels,
+        "names": names,
+        "lineage": lineage,
+    }
+    return taxonomy_index
+
+def load_taxonomy_index(dir_base, cache_file=_taxonomy_index_cache):
+    """
+    Loads the KEGG Organisms taxonomy index from its cache file.
+    The index is compiled (and the cache file rewritten) whenever the cache is missing,
+    was written by a different KEMET version or "br08601.keg" changed (e.g. by "set_kemet_working-directory.py").
 
-    return dictionary_knumber_reac
+    Args:
+        dir_base                (str): folder path in which "kemet.py" was executed, with "br08601.keg"
+        cache_file    (str, optional): cache file name, in the same folder. Defaults to _taxonomy_index_cache.
 
-def KEGG_BiGG_SEED_RN_dict(reactions_DB, DB_directory, ontology="BiGG"):
+    Returns:
+        taxonomy_index         (dict): Python-dictionary output of "compile_taxonomy_index()"
     """
-    Connects KEGG RN to BiGG IDs or KEGG RN to ModelSEED IDs
-    starting from a tabular data file which connects ModelSEED reactions
-    to other GSMM reaction onthologies.
+    brite_file = path.join(dir_base, "br08601.keg")
+    cache_path = path.join(dir_base, cache_file)
+    taxonomy_index = _read_pickle_cache(cache_path, _taxonomy_index_version, _brite_signature(brite_file))
+    if taxonomy_index is None:
+        taxonomy_index = compile_taxonomy_index(brite_file)
+        _write_pickle_cache(cache_path, taxonomy_index)
+    return taxonomy_index
+
+def taxonomy_organisms(taxonomy_index, taxonomy):
+    """
+    Resolves a KEGG BRITE taxonomy, at any level of the KEGG Organisms hierarchy, into its organism codes.
+    Names are matched case-insensitively; a name present at more levels is resolved at the C-level
+    (phylum, most of the times), otherwise at the highest one.
+    A taxonomy matching no name is resolved as in previous KEMET versions, i.e. at the first C-level entry
+    including it followed by a space (e.g. "Gammaproteobacteria" for "Gammaproteobacteria - Enterobacteria"), with a warning.
 
     Args:
-        reactions_DB                (str): input ".tsv" reaction file path
-        DB_directory                (str): input file folder path
-        ontology          (str, optional): Genome-scale models ontology indication. Defaults to "BiGG".
+        taxonomy_index         (dict): output of "load_taxonomy_index()"
+        taxonomy                (str): KEGG BRITE taxonomy (e.g. "Gammaproteobacteria - Enterobacteria", "Escherichia")
 
     Returns:
-        dict_kegg_x_dict           (dict): Python-dictionary object with manyXmany relations of KEGG Rs and BiGG IDs
-        dict_kegg_x_seed           (dict): (Unsupported in current version)
+        taxa_allow              (set): Python-set object including each codes of species of the taxonomy
     """
-    dict_kegg_x_dict = {}
-    dict_kegg_x_seed = {}
-    os.chdir(DB_directory)
-    with open(reactions_DB) as g:
-        for line in g.readlines()[1:]:
-            x = line.split("\t")
+    matches = taxonomy_index["names"].get(taxonomy.strip().casefold())
+    if not matches:
+        partial = [ name for name in taxonomy_index["levels"].get("C", {}) if taxonomy.casefold()+" " in name.casefold() ]
+        if not partial:
+            raise ValueError(f'"{taxonomy}" is not a KEGG Organisms taxonomy (br08601.keg)')
+        print(_timeinfo(), f'WARNING: "{taxonomy}" is not a KEGG Organisms taxonomy name, using "{partial[0]}"'
+              + (f" (first of {len(partial)} C-level matches)" if len(partial) > 1 else ""), sep="\t")
+        matches = [("C", partial[0])]
+    level, name = next(( match for match in matches if match[0] == "C" ), matches[0])
+    return taxonomy_index["levels"][level][name]
 
-            rxn = x[0]
-            bigg_ids = x[2:24]
-            kegg_ids = x[25:34]
+def taxonomy_filter(taxonomy, dir_base, taxa_file, taxa_dir, update=False):
+    """
+    Generates a file that includes KEGG Brite species codes
+    for a given taxonomy indication, at any level of the KEGG Organisms hierarchy (see "taxonomy_organisms()").
 
-            non_empty_bigg_ids = list(filter(None, bigg_ids))
-            non_empty_kegg_ids = list(filter(None, kegg_ids))
+    Args:
+        taxonomy            (str): KEGG Brite taxonomy for MAG/Genome of interest
+                                    as indicated in the "genomes.instruction" file.
+        dir_base            (str): folder path in which "kemet.py" was executed
+        taxa_file           (str): ".keg" output file, that contains each codes of species allowed for subsequent GENES download
+        taxa_dir            (str): output folder path
+        update   (bool, optional): flag to update KEGG Brite taxonomy - necessary e.g. for the first KEMET execution. Defaults to False.
 
-            unique_kegg_ids = []
-            unique_bigg_ids = []
+    Returns:
+        taxa_allow          (set): Python-set object including each codes of species allowed for subsequent GENES download
+    """
+    if dir_base not in _taxonomy_indexes:
+        _taxonomy_indexes[dir_base] = load_taxonomy_index(dir_base)
+    taxa_allow = taxonomy_organisms(_taxonomy_indexes[dir_base], taxonomy)
 
-            dict_rxn_x_bigg = {}
-            #only non-redundant KEGG RN entry x reaction/line
-            for k_id in non_empty_kegg_ids:
-                if k_id not in unique_kegg_ids:
-                    unique_kegg_ids.append(k_id)
+    if update:
+        # replaced at once, as it may be read by concurrent batch workers
+        tmp_file = path.join(taxa_dir, f"{taxa_file}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_file, "w") as g:
+            for el in sorted(taxa_allow):
+                print(el, file=g)
+        os.replace(tmp_file, path.join(taxa_dir, taxa_file))
 
-            #only non-redundant BiGG entry x reaction/line
-            for b_id in non_empty_bigg_ids:
-                if b_id not in unique_bigg_ids:
-                    unique_bigg_ids.append(b_id)
+    return taxa_allow
 
-        # {KEGG : [{rxns:[BiGGs]}]}
-            #for each KEGG RN, create-update a non-redundant dict-entry
-            for Kegg in unique_kegg_ids:
-                if Kegg not in dict_kegg_x_dict.keys():
-                    vett_dict_rxn_bigg=[]
-                    dict_rxn_x_bigg.update({rxn:unique_bigg_ids})
-                    vett_dict_rxn_bigg.append(dict_rxn_x_bigg)
-                    dict_kegg_x_dict.update({Kegg:vett_dict_rxn_bigg})
-                else:
-                    vett_dict_rxn_bigg=dict_kegg_x_dict[Kegg]
-                    dict_rxn_x_bigg.update({rxn:unique_bigg_ids})
-                    vett_dict_rxn_bigg.append(dict_rxn_x_bigg)
-                    dict_kegg_x_dict.update({Kegg:vett_dict_rxn_bigg})
+def _token_bucket(rate):
+    """
+    Helper function to create the token bucket shared by KEGG API requests of a "kegg_get()" call,
+    allowing on average "rate" requests per second (with bursts of at most "rate" requests).
 
-        # {KEGG : [rxns]}
-            #for each KEGG RN, create-update a non-redundant dict-entry
-            for Kegg in unique_kegg_ids:
-                if Kegg not in dict_kegg_x_seed:
-                    vett_dict_rxn_seed=[]
-                    vett_dict_rxn_seed.append(rxn)
-                    dict_kegg_x_seed.update({Kegg:vett_dict_rxn_seed})
-                else:
-                    vett_dict_rxn_seed=dict_kegg_x_seed[Kegg]
-                    vett_dict_rxn_seed.append(rxn)
-                    dict_kegg_x_seed.update({Kegg:vett_dict_rxn_seed})
+    Args:
+        rate                (float): requests per second
 
-    if ontology == "BiGG":
-        return dict_kegg_x_dict
-    elif ontology == "SEED":
-        return dict_kegg_x_seed
+    Returns:
+        bucket               (dict): token bucket state, for "_take_token()"
+    """
+    return {"rate": rate, "tokens": min(rate, 1.0), "last": time.monotonic(), "lock": asyncio.Lock()}
 
-def keggR_in_DB(list_of_unique_Rnumbers, DB_Kegg_reactions):
+async def _take_token(bucket):
     """
-    Helper function to search for unique KEGG REACTIONS (R) in
-    the reaction database file provided in the KEMET GitHub.
+    Helper function to wait for a token of the token bucket, before a request.
 
     Args:
-        list_of_unique_Rnumbers     (list): Python-list output of "total_R_from_KOhits()" function
-        DB_Kegg_reactions           (dict): Python-dictionary output of "KEGG_BiGG_SEED_RN_dict()" function
+        bucket               (dict): output of "_token_bucket()"
+    """
+    async with bucket["lock"]:
+        while True:
+            now = time.monotonic()
+            bucket["tokens"] = min(max(bucket["rate"], 1.0), bucket["tokens"] + (now - bucket["last"]) * bucket["rate"])
+            bucket["last"] = now
+            if bucket["tokens"] >= 1:
+                bucket["tokens"] -= 1
+                return
+            await asyncio.sleep((1 - bucket["tokens"]) / bucket["rate"])
+
+async def _http_get(connection, url):
+    """
+    Helper function to send a HTTP/1.1 GET request on a keep-alive connection, (re)opening it if needed.
+
+    Args:
+        connection           (dict): connection state of the worker ("reader"/"writer" are None when closed)
+        url                   (str): requested URL
 
     Returns:
-        v_KeggR_unique_in_DB        (list): Python-list object including all different and unique KEGG R
-                                            as recovered from the reaction_DB file
+        status                (int): HTTP status code
+        body                (bytes): response body
     """
-    v_KeggR_unique = []
-    v_KeggR_unique_in_DB = []
-    for Rnumber in list_of_unique_Rnumbers:
-        v_KeggR_unique.append(Rnumber)
-        if Rnumber in DB_Kegg_reactions.keys():
-            v_KeggR_unique_in_DB.append(Rnumber)
+    parts = urllib.parse.urlsplit(url)
+    if connection["writer"] is None:
+        use_ssl = parts.scheme == "https"
+        port = parts.port or (443 if use_ssl else 80)
+        connection["reader"], connection["writer"] = await asyncio.open_connection(
+            parts.hostname, port, ssl=ssl.create_default_context() if use_ssl else None)
+    reader, writer = connection["reader"], connection["writer"]
+
+    target = parts.path + ("?" + parts.query if parts.query else "")
+    writer.write((f"GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\nUser-Agent: KEMET\r\n"
+                  "Accept-Encoding: identity\r\nConnection: keep-alive\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed by the server")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    keep_alive = headers.get("connection", "").lower() != "close"
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if not size:
+                await reader.readline()
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        keep_alive = False
 
-    return v_KeggR_unique_in_DB
+    if not keep_alive:
+        _close_connection(connection)
+    return status, body
 
-def bigg_nonredundant(v_KeggR_unique_in_DB, DB_Kegg_reactions):
+def _close_connection(connection):
     """
-    Helper function to search for unique BiGG REACTIONS in
-    the reaction database file provided in the KEMET GitHub.
+    Helper function to close the connection of a KEGG API worker, if open.
 
     Args:
-        v_KeggR_unique_in_DB    (list): Python-list output of "keggR_in_DB()" function
-        DB_Kegg_reactions       (dict): Python-dictionary output of "KEGG_BiGG_SEED_RN_dict()" function
+        connection           (dict): connection state of the worker
+    """
+    if connection["writer"] is not None:
+        connection["writer"].close()
+    connection["reader"] = connection["writer"] = None
 
-    Returns:
-        v_bigg_nonredundant     (list): Python-list object including unique BiGG reaction,
-                                        as linked to KEGG R via BiGG database
+async def _kegg_worker(queue, results, bucket, base_url, validate, retries, callback=None):
     """
-    v_bigg_nonredundant = []
-    for Rnumber in v_KeggR_unique_in_DB:
-        for subdict in DB_Kegg_reactions[Rnumber]:
-            for v_bigg in subdict.values():
-                for single_bigg in v_bigg:
-                    if single_bigg not in v_bigg_nonredundant:
-                        v_bigg_nonredundant.append(single_bigg)
+    Helper function to run KEGG API "GET" requests from a queue on a single keep-alive connection.
+    Failed requests (connection errors, HTTP errors other than 400/404, responses not passing "validate")
+    are retried with exponential backoff, then reported as None.
+    (Called in the "_kegg_get_all()" function).
 
-    return v_bigg_nonredundant
+    Args:
+        queue       (asyncio.Queue): KEGG API entries to request
+        results              (dict): output dictionary {entry : response text, or None}
+        bucket               (dict): output of "_token_bucket()"
+        base_url              (str): KEGG API base URL
+        validate         (callable): function checking a response text
+        retries               (int): further requests after a failure
+        callback (callable, optional): function called with (entry, response text or None) once each entry is done
+    """
+    connection = {"reader": None, "writer": None}
+    while not queue.empty():
+        entry = queue.get_nowait()
+        results[entry] = None
+        for attempt in range(retries+1):
+            if attempt:
+                await asyncio.sleep(_kegg_backoff * 2**(attempt-1))
+            await _take_token(bucket)
+            try:
+                status, body = await asyncio.wait_for(_http_get(connection, base_url+"get/"+entry), _kegg_timeout)
+            except (OSError, EOFError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                _close_connection(connection)
+                continue
+            # KEGG API: 400 (bad request) and 404 (not found) would not change by asking again
+            if status in (400, 404):
+                break
+            text = body.decode("utf-8", "replace")
+            if status == 200 and (validate is None or validate(text)):
+                results[entry] = text
+                break
+        if callback is not None:
+            callback(entry, results[entry])
+    _close_connection(connection)
 
-def modelseed_nonredundant(v_KeggR_unique_in_DB, DB_Kegg_reactions):
+async def _kegg_get_all(entries, base_url, validate, rate, connections, retries, callback=None):
     """
-    Helper function to search for unique ModelSEED REACTIONS in
-    the reaction database file provided in the KEMET GitHub.
+    Helper function to run KEGG API "GET" requests concurrently, on at most "connections" keep-alive connections
+    and at most "rate" requests per second overall.
+    (Called in the "kegg_get()" function).
 
     Args:
-        v_KeggR_unique_in_DB        (list): Python-list output of "keggR_in_DB()" function
-        DB_Kegg_reactions           (dict): Python-dictionary output of "KEGG_BiGG_SEED_RN_dict()" function
+        entries              (list): KEGG API "GET" entries, without duplicates
+        base_url              (str): KEGG API base URL
+        validate         (callable): function checking a response text (or None)
+        rate                (float): maximum requests per second
+        connections           (int): maximum concurrent connections
+        retries               (int): further requests after a failure
+        callback (callable, optional): function called with (entry, response text or None) once each entry is done
 
     Returns:
-        v_modelseed_nonredundant    (list): Python-list object including unique BiGG reaction,
-                                            as linked to ModelSEED reactions via BiGG database
+        results              (dict): Python-dictionary object {entry : response text, or None}
     """
-    v_modelseed_nonredundant = []
-    for Rnumber in v_KeggR_unique_in_DB:
-        for single_rxn in DB_Kegg_reactions[Rnumber]:
-            if single_rxn not in v_modelseed_nonredundant:
-                v_modelseed_nonredundant.append(single_rxn)
+    queue = asyncio.Queue()
+    for entry in entries:
+        queue.put_nowait(entry)
+    results = {}
+    bucket = _token_bucket(rate)
+    await asyncio.gather(*[ _kegg_worker(queue, results, bucket, base_url, validate, retries, callback)
+                            for _ in range(max(1, min(connections, len(entries)))) ])
+    return results
+
+def kegg_get(entries, base_url=None, validate=None, rate=None, connections=None, retries=_kegg_retries, callback=None):
+    """
+    Downloads KEGG API "GET" entries (e.g. "K00001", "eco:b0001+eco:b0002/ntseq", "br:br08601")
+    with an in-process HTTP client: keep-alive connections, a token bucket limiting requests per second
+    over every connection, retries with backoff and validation of responses.
+    Requests to KEGG API without a granted access are limited (check KEGG LICENCE).
+    Called from a running event loop (e.g. in a notebook), requests run on an event loop of their own in another thread.
 
-    return v_modelseed_nonredundant
+    Args:
+        entries              (list): KEGG API "GET" entries
+        base_url    (str, optional): KEGG API base URL. Defaults to "kegg_url" (e.g. a local server, for testing).
+        validate (callable, optional): function checking a response text, failed checks are retried. Defaults to None.
+        rate      (float, optional): maximum requests per second. Defaults to "kegg_rate".
+        connections (int, optional): maximum concurrent connections. Defaults to "kegg_connections".
+        retries     (int, optional): further requests after a failure. Defaults to _kegg_retries.
+        callback (callable, optional): function called with (entry, response text or None) as soon as each entry is done,
+                                       e.g. to save partial results. Defaults to None.
 
-def bigg_gapfill_absent_in_model(bigg_nonredundant_file, model):
+    Returns:
+        results              (dict): Python-dictionary object {entry : response text, or None if it failed}
     """
-    Helper function to identify putative gap-fill reactions
-    missing in the input existing ".xml" model.
-    (Called in the "reframed_reaction_addition()" function).
+    entries = list(dict.fromkeys(entries))
+    if not entries:
+        return {}
+    requests = _kegg_get_all(entries, base_url or kegg_url, validate,
+                             rate or kegg_rate, connections or kegg_connections, retries, callback)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(requests)
+    from concurrent.futures import ThreadPoolExecutor # imports "logging" as well, only needed here
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, requests).result()
+
+_file_locks = {} # locks of this process on shared files, by file path, see "_file_lock()"
+_file_locks_lock = threading.Lock()
+
+@contextmanager
+def _file_lock(lock_file):
+    """
+    Helper context manager to work alone on a shared folder, e.g. the downloads of a KO or a taxonomy profile HMM:
+    concurrent KEMET processes are serialized via a file lock (where available), concurrent threads via a lock of this process.
 
     Args:
-        bigg_nonredundant_file              (str): log ".txt" file generated via "log_bigg_nr()"
-        model                           (CBModel): Python-object of an existing ".xml" model, as loaded via Reframed
+        lock_file           (str): lock file path
+    """
+    with _file_locks_lock:
+        lock = _file_locks.setdefault(lock_file, threading.Lock())
+    os.makedirs(path.dirname(lock_file), exist_ok=True)
+    with lock, open(lock_file, "a") as f:
+        try:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX) # released when closing the file
+        except ImportError:
+            pass
+        yield
+
+def download_ntseq_of_KO(klist_file, dir_base_KO, dir_KO, klists_directory, taxa_dir, taxa_file, kegg_url, io=None):
+    """
+    Using KEGG API, downloads KEGG flat-files with nt sequences of KOs of interest
+    from the allowed species, following filering of "taxonomy_filter()".
 
-    Returns:
-        bigg_gapfill_absent_in_model       (list): Python-list object including unique BiGG reaction,
-                                                    not present in the input ".xml" genome-scale model
+    IF KEGG ACCESS IS AVAILABLE, it is possible to raise requests per second and connections of "kegg_get()"
+    (see "--kegg_rate" and "--kegg_connections"), in full compliance to KEGG license.
+
+    Args:
+        klist_file          (str): ".klist" input file name, indicating missing KOs of interest from MAG/Genome
+        dir_base_KO         (str): base KEGG KO GENES sequences folder path
+        dir_KO              (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
+        klists_directory    (str): ".klist" input files folder path
+        taxa_dir            (str): "taxa_file" input file folder path
+        taxa_file           (str): ".keg" output file, that contains each codes of species allowed for subsequent GENES download
+        kegg_url            (str): KEGG API base URL
+        io       (dict, optional): output of "io_directories()", for the sequence cache and KEGG API settings.
+                                    Defaults to None (set via "set_io_directories()").
     """
+    print(_timeinfo(), "START download nucleotidic sequences", sep="\t")
+    with open(path.join(taxa_dir, taxa_file)) as f:
+        taxa_allow = { line.strip() for line in f if line.strip() }
 
-    biggreactions_names = [ reaction[2:] for reaction in model.reactions.keys()
-                            if reaction not in ("Growth", "R_ATPM") ]
+    with open(path.join(klists_directory, klist_file)) as f:
+        os.makedirs(dir_KO, exist_ok=True)
+        for line in f:
+            if line.strip():
+                _download_KO(line.strip(), dir_KO, taxa_allow, kegg_url, io=io)
+    print(_timeinfo(), "COMPLETE download nucleotidic sequences", sep="\t")
 
-    with open(bigg_nonredundant_file) as f:
-        putative_gapfill = [ line.strip() for line in f ]
+def _download_KO(K, dir_KO, taxa_allow, kegg_url, io=None):
+    """
+    Helper function to get nt sequences of a single KO for a taxonomy.
+    Sequences are kept in the shared sequence cache, by KEGG gene (see "_gene_file()"): only genes
+    missing there, not valid or older than "seq_cache_ttl" are downloaded, as recorded in the KO manifest
+    (see "read_ko_manifest()"), so that an interrupted download is resumed where it stopped.
+    The KO folder of the taxonomy is then a view of the cache, with a link per gene of the allowed species.
+    Downloads of the same KO by concurrent KEMET runs or batch workers are done one at a time (see "_file_lock()").
+    (Called in the "download_ntseq_of_KO()" and "hmm_by_blocks()" functions).
 
-    bigg_gapfill_absent_in_model = [ bigg1 for bigg1 in putative_gapfill
-                                     if bigg1 not in biggreactions_names ]
+    Args:
+        K                   (str): KO of interest
+        dir_KO              (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
+        taxa_allow          (set): codes of species allowed for GENES download, output of "taxonomy_filter()"
+        kegg_url            (str): KEGG API base URL
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+    """
+    if io is None:
+        io = _current_io_directories()
+    with _file_lock(path.join(io["ko_genes_dir"], K+".lock")):
+        _download_KO_view(K, dir_KO, taxa_allow, kegg_url, io)
 
-    return bigg_gapfill_absent_in_model
+def _download_KO_view(K, dir_KO, taxa_allow, kegg_url, io):
+    """
+    Helper function to download the nt sequences of a single KO and link them in the KO folder of a taxonomy,
+    holding the KO lock. (Called in the "_download_KO()" function).
 
-def curl_bigg_reaction(single_reac):
+    Args:
+        K                   (str): KO of interest
+        dir_KO              (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
+        taxa_allow          (set): codes of species allowed for GENES download, output of "taxonomy_filter()"
+        kegg_url            (str): KEGG API base URL
+        io                 (dict): output of "io_directories()"
     """
-    Helper function to download a file that contains BiGG reaction,
-    stores it in an intermediate file (".ift").
-    (Called in the "reframed_reaction_addition()" function).
+    dir_K = path.join(dir_KO, K)
+    os.makedirs(dir_K, exist_ok=True)
+    _adopt_sequences(dir_K, io=io)
+
+    genes = [ gene for gene in ko_genes(K, kegg_url, io=io) if gene[:gene.find(":")] in taxa_allow ]
+    state = read_ko_manifest(K, io=io)["state"]
+    seq_cache_ttl = io["seq_cache_ttl"]
+    now = time.time()
+    to_download = []
+    for gene in genes:
+        status, status_time = state.get(gene, (None, 0))
+        gene_file = _gene_file(gene, io=io)
+        if status == "unavailable" and (seq_cache_ttl is None or now - status_time < seq_cache_ttl):
+            continue
+        if _fresh_file(gene_file, now, seq_cache_ttl):
+            if status == "valid":
+                continue
+            # sequences of previous KEMET versions or recorded by other KOs are checked once
+            if status is None:
+                with open(gene_file) as f:
+                    valid = _valid_ntseq(f.read(), gene)
+                _journal_ko(K, gene, "valid" if valid else "invalid", io=io)
+                if valid:
+                    continue
+        to_download.append(gene)
+    if to_download:
+        get_ntseqs(to_download, kegg_url, store=lambda gene, record: _store_ntseq(K, gene, record, io=io),
+                   rate=io["kegg_rate"], connections=io["kegg_connections"])
+    _write_ko_manifest(K, read_ko_manifest(K, io=io), io=io)
+
+    view = set()
+    for gene in genes:
+        gene_file = _gene_file(gene, io=io)
+        try:
+            gene_stat = os.stat(gene_file)
+        except OSError:
+            continue
+        if not gene_stat.st_size:
+            continue
+        # last use of the gene, for the least recently used eviction of "evict_sequence_cache()"
+        os.utime(gene_file, (now, gene_stat.st_mtime))
+        link = path.join(dir_K, gene+".fna")
+        view.add(link)
+        if not path.lexists(link):
+            os.symlink(gene_file, link)
+    for file in os.listdir(dir_K):
+        if path.join(dir_K, file) not in view:
+            os.remove(path.join(dir_K, file))
+
+def _gene_file(gene, io=None):
+    """
+    Helper function to point out the nt sequence of a KEGG gene in the shared sequence cache,
+    i.e. "_genes/<species code>/<gene>.fna" in the KEGG KO GENES sequences folder.
 
     Args:
-        single_reac     (str): name of a single reaction, taken from the list-output of "bigg_gapfill_absent_in_model()"
+        gene                (str): KEGG gene (e.g. "eco:b0001")
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
 
     Returns:
-        file_ift        (str): name of intermediate flat file (".ift") including a reaction string
+        gene_file           (str): nt sequence file path
     """
-    cmd_line = "curl --silent 'http://bigg.ucsd.edu/api/v2/universal/reactions/"
-    el = single_reac
-    command = cmd_line + el + "'"
-    file_ift = str(el) + ".ift"
-    os.system(command + " > " + file_ift)
-
-    return file_ift
+    seq_cache = (io or _current_io_directories())["seq_cache_dir"]
+    return path.join(seq_cache, gene[:gene.find(":")], gene+".fna")
 
-def api_file_reorder(file_ift, verbose=False):
+def _fresh_file(file, now, seq_cache_ttl):
     """
-    Helper function to clean and reorganize info from
-    intermediate files, containing reaction strings.
-    (Called in the "reframed_reaction_addition()" function).
+    Helper function to check that a sequence cache file exists, is not empty and is not older than "seq_cache_ttl".
 
     Args:
-        file_ift            (str): name of intermediate flat file (".ift") including a reaction string
-        verbose  (bool, optional): print more info regarding process status. Defaults to False.
+        file                (str): sequence cache file path
+        now               (float): current time, in seconds since the epoch
+        seq_cache_ttl     (float): sequence cache time to live, in seconds (None: no expiry)
+
+    Returns:
+        fresh              (bool): True if the file can be used as it is
     """
-    with open(file_ift) as f:
-        for line in f:
-        #text cleaning
-            text2 = line.replace(",", ",\n").replace(":", ":\t").replace("&#8652;", "<->")
-            file_txt = str(file_ift).replace(".ift", ".txt")
-            #files_txt.append(file_txt)
-            with open(file_txt, "w") as g:
-                g.write(text2)
-            os.remove(file_ift)
+    try:
+        file_stat = os.stat(file)
+    except OSError:
+        return False
+    return file_stat.st_size > 0 and (seq_cache_ttl is None or now - file_stat.st_mtime < seq_cache_ttl)
 
-            if verbose:
-                print(f"Info from file {file_ift} reordered")
+def _adopt_sequences(dir_K, io=None):
+    """
+    Helper function to move nt sequences downloaded by previous KEMET versions in a taxonomy KO folder
+    into the shared sequence cache, so that they are reused by every taxonomy.
 
-def api_file_reorder2(file_ift, verbose=False):
+    Args:
+        dir_K               (str): KO folder of a taxonomy
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
     """
-    Helper function #2 to clean and reorganize info from
-    intermediate files, containing reaction strings.
+    for file in os.listdir(dir_K):
+        old_file = path.join(dir_K, file)
+        if not file.endswith(".fna") or path.islink(old_file):
+            continue
+        gene_file = _gene_file(file[:-4], io=io)
+        os.makedirs(path.dirname(gene_file), exist_ok=True)
+        if path.isfile(gene_file):
+            os.remove(old_file)
+        else:
+            os.replace(old_file, gene_file)
+
+def ko_genes(K, kegg_url, io=None):
+    """
+    KEGG genes of a KO, as in its KEGG API flat-file ("parsekoflat()").
+    The list is kept in the KO manifest (see "read_ko_manifest()") and downloaded again after "seq_cache_ttl".
 
     Args:
-        file_ift            (str): name of intermediate flat file (".ift") including a reaction string
-        verbose  (bool, optional): print more info regarding process status. Defaults to False.
+        K                   (str): KO of interest
+        kegg_url            (str): KEGG API base URL
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
 
     Returns:
-        file_txt            (str): name of a modified intermediate flat file (".txt") including a reaction string
+        genes              (list): Python-list object with genes connected to the KO
     """
-    with open(file_ift) as f:
-        for line in f:
-        #text cleaning
-            text2 = line.replace(",", ",\n").replace(":", ":\t").replace("&#8652;", "<->")
-            file_txt = str(file_ift).replace(".ift", ".txt")
-            with open(file_txt, "w") as g:
-                g.write(text2)
-            os.remove(file_ift)
+    if io is None:
+        io = _current_io_directories()
+    manifest = read_ko_manifest(K, io=io)
+    now = time.time()
+    seq_cache_ttl = io["seq_cache_ttl"]
+    if manifest["genes"] is None or (seq_cache_ttl is not None and now - manifest["listed"] >= seq_cache_ttl):
+        flat = kegg_get([K], base_url=kegg_url, validate=lambda text: text.startswith("ENTRY"),
+                        rate=io["kegg_rate"], connections=io["kegg_connections"])[K]
+        if flat is None:
+            # no flat-file: the KO is not listed, and checked again at the next run
+            return manifest["genes"] or []
+        os.makedirs(io["ko_genes_dir"], exist_ok=True)
+        flatfile = path.join(io["ko_genes_dir"], f"{K}.{os.getpid()}.{threading.get_ident()}.keg")
+        with open(flatfile, "w") as f:
+            f.write(flat)
+        try:
+            genes = parsekoflat(flatfile)
+        except ValueError:
+            genes = []
+        os.remove(flatfile)
+        manifest["genes"] = genes
+        manifest["listed"] = now
+        _write_ko_manifest(K, manifest, io=io)
+    return manifest["genes"]
+
+def _ko_manifest_files(K, io=None):
+    """
+    Helper function to point out the manifest and the journal of a KO, in the KO index of the shared sequence cache.
 
-            if verbose:
-                print(f"Info from file {file_ift} reordered")
+    Args:
+        K                   (str): KO of interest
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
 
-    return file_txt
+    Returns:
+        manifest_file       (str): ".json" KO manifest file path
+        journal_file        (str): ".journal" KO journal file path
+    """
+    ko_index = (io or _current_io_directories())["ko_genes_dir"]
+    return path.join(ko_index, K+".json"), path.join(ko_index, K+".journal")
 
-def get_string(file_txt, total_strings, verbose=False):
+def read_ko_manifest(K, io=None):
     """
-    Helper function to extract reaction string and
-    add to a reaction list in Reframed format.
-    (Called in the "reframed_reaction_addition()" function).
+    Reads the download manifest of a KO: the genes expected from its KEGG API flat-file, and the state of each
+    download ("valid", "invalid" or "unavailable" in KEGG, with its time). Downloads recorded in the KO journal
+    since the last manifest (e.g. by an interrupted run) are included.
 
     Args:
-        file_txt                       (str): name of a modified intermediate flat file (".txt") including a reaction string
-        total_strings                 (list): Python-list object including all reaction strings extracted from BiGG API processes
-        verbose             (bool, optional): print more info regarding process status. Defaults to False.
-        remove_intermediate (bool, optional): flag to remove intermediate ".ift" files. Defaults to True.
+        K                   (str): KO of interest
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+
+    Returns:
+        manifest           (dict): Python-dictionary object:
+                                    "version": _ko_manifest_version
+                                    "genes": KEGG genes of the KO (None if never listed)
+                                    "listed": time of the KO flat-file download
+                                    "state": {gene : [state, time]}
     """
-    with open(file_txt) as asd:
-        forbidden = ["+", "<->", "<--", "-->"]
-        for line in asd.readlines():
-            line = line.strip()
-            if line.startswith('"reaction_string"'):
-                st = line.split("\t")[1]
-                st1 = st.replace('"', "").replace("}", "").replace(',', '').strip()
-                st2 = st1.split(" ")
+    manifest_file, journal_file = _ko_manifest_files(K, io=io)
+    manifest = {"version": _ko_manifest_version, "genes": None, "listed": 0, "state": {}}
+    try:
+        with open(manifest_file) as f:
+            recorded = json.load(f)
+        if recorded.get("version") == _ko_manifest_version:
+            manifest = recorded
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(journal_file) as f:
+            for line in f:
+                line = line.rstrip("\n").split("\t")
+                # the last line may be truncated by an interruption
+                if len(line) == 3:
+                    try:
+                        manifest["state"][line[0]] = [line[1], float(line[2])]
+                    except ValueError:
+                        continue
+    except OSError:
+        pass
+    return manifest
+
+def _write_ko_manifest(K, manifest, io=None):
+    """
+    Helper function to write the manifest of a KO, merging its journal, which is then removed.
 
-                metabs = []
-                for el in st2:
-                    if el not in forbidden and "." not in el:
-                        el = "M_" + el
-                    metabs.append(el)
+    Args:
+        K                   (str): KO of interest
+        manifest           (dict): output of "read_ko_manifest()"
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+    """
+    manifest_file, journal_file = _ko_manifest_files(K, io=io)
+    if manifest["genes"] is not None:
+        genes = set(manifest["genes"])
+        manifest["state"] = { gene: state for gene, state in manifest["state"].items() if gene in genes }
+    os.makedirs(path.dirname(manifest_file), exist_ok=True)
+    tmp_file = f"{manifest_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+    if path.isfile(journal_file):
+        os.remove(journal_file)
+
+def _journal_ko(K, gene, state, io=None):
+    """
+    Helper function to record the download state of a gene in the journal of a KO, as soon as it is known.
 
-    #add Reframed name
-    with open(file_txt) as asd:
-        dsa = reversed(list(asd))
-        for line in dsa:
-            line = line.strip().replace("{", "")
-            if line.startswith('"bigg_id"'):
-                name = line.split("\t")[1]
+    Args:
+        K                   (str): KO of interest
+        gene                (str): KEGG gene
+        state               (str): "valid", "invalid" or "unavailable"
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+    """
+    journal_file = _ko_manifest_files(K, io=io)[1]
+    os.makedirs(path.dirname(journal_file), exist_ok=True)
+    with open(journal_file, "a") as f:
+        f.write(f"{gene}\t{state}\t{time.time()}\n")
+
+def _valid_ntseq(record, gene):
+    """
+    Helper function to validate the nt sequence FASTA record of a KEGG gene.
+
+    Args:
+        record              (str): FASTA record
+        gene                (str): KEGG gene
+
+    Returns:
+        valid              (bool): True if the record is the gene nt sequence
+    """
+    lines = record.strip().split("\n")
+    if len(lines) < 2 or not lines[0].startswith(">") or not lines[0][1:].split() or lines[0][1:].split()[0].casefold() != gene:
+        return False
+    return all( _nt_sequence.match(line.strip()) for line in lines[1:] )
+
+def _store_ntseq(K, gene, record, io=None):
+    """
+    Helper function to save a downloaded nt sequence into the shared sequence cache and record it in the KO journal.
+    (Called by "get_ntseqs()" for each gene, as soon as its request is complete,
+    or once every request is done for genes KEGG did not return).
+
+    Args:
+        K                   (str): KO of interest
+        gene                (str): KEGG gene
+        record              (str): FASTA record, None if KEGG did not return the gene after every retry
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+    """
+    if record is None:
+        _journal_ko(K, gene, "unavailable", io=io)
+        return
+    if not _valid_ntseq(record, gene):
+        _journal_ko(K, gene, "invalid", io=io)
+        return
+    gene_file = _gene_file(gene, io=io)
+    os.makedirs(path.dirname(gene_file), exist_ok=True)
+    part_file = f"{gene_file}.{os.getpid()}.{threading.get_ident()}.part"
+    with open(part_file, "w") as f:
+        f.write(record)
+    os.replace(part_file, gene_file)
+    _journal_ko(K, gene, "valid", io=io)
+
+def evict_sequence_cache(cache_size, keep_since=None, io=None):
+    """
+    Evicts the least recently used nt sequences from the shared sequence cache while it exceeds its size bound.
+    Taxonomy KO folders linking them are fixed at their next use, via "_download_KO()".
+
+    Args:
+        cache_size                (int): maximum size of the sequence cache, in bytes
+        keep_since    (float, optional): sequences used since this time (in seconds since the epoch) are kept anyway,
+                                          e.g. the start of the current run. Defaults to None.
+        io             (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+
+    Returns:
+        evicted                   (int): number of evicted sequences
+    """
+    seq_cache = (io or _current_io_directories())["seq_cache_dir"]
+    if not path.isdir(seq_cache):
+        return 0
+    cached = []
+    for gene_taxa in os.scandir(seq_cache):
+        for gene_file in os.scandir(gene_taxa.path):
+            try:
+                gene_stat = gene_file.stat()
+            except OSError:
+                continue
+            cached.append((gene_stat.st_atime, gene_stat.st_size, gene_file.path))
+    total = sum( size for _, size, _ in cached )
+    evicted = 0
+    for last_use, size, gene_file in sorted(cached):
+        if total <= cache_size or (keep_since is not None and last_use >= keep_since):
+            break
+        try:
+            os.remove(gene_file)
+        except OSError:
+            pass
+        total -= size
+        evicted += 1
+    return evicted
+
+def parsekoflat(file):
+    """
+    Parses KO flatfiles obtained from KEGG API,
+    in order to generate the filtered list of sequences for a bulk download.
+    (Called within the "download_ntseq_of_KO()" function).
+
+    Args:
+        file        (str): KEGG API KO flat-file file name
+
+    Returns:
+        genes      (list): Python-list object with genes connected to the KO,
+                            for each appropriate species within the specified BRITE taxonomy
+    """
+    genes = []
+    with open(file) as f:
+        v = f.readlines()
+        for n, line in enumerate(v):
+            if line.startswith("GENES"):
                 break
-        right_name = "R_" + name.replace('"', "").replace(",", "").strip() + ":"
-        right_string = " ".join(metabs)
-        reac_string = right_name + " " + right_string
-        total_strings.append(reac_string)
+        f.seek(0)
+        for line in v[n:]:
+            if line.startswith("REFERENCE") or line.startswith("///"):
+                break
+            line = line.replace("GENES       ", "").strip()
+            m = line.index(":")
+            species = line[:m+1].casefold()
+            line_s = line.split()
+            for g_name in line_s[1:]:
+                gene = (species+g_name).casefold()
+                if "(" in gene:
+                    p = gene.index("(")
+                    gene = gene[:p]
+                if "draft" in gene:
+                    continue
+                genes.append(gene)
+    return genes
 
-        if verbose:
-            print(f"{file_txt} string PASSED") #debug
+def split_multifasta(text):
+    """
+    Splits a multi-FASTA KEGG API response into single records, by KEGG gene.
 
-    os.remove(file_txt)
+    Args:
+        text                (str): KEGG API "GET" response, e.g. of "<gene>+<gene>/ntseq"
 
-def get_string_error(file_txt, error_strings, verbose=False):
+    Returns:
+        records            (dict): Python-dictionary object {gene (casefolded, as in "parsekoflat()") : FASTA record}
     """
-    Helper function to extract reaction strings that lead to
-    reaction addition errors (i.e. not found in BiGG).
-    (Called in the "reframed_reaction_addition()" function).
+    records = {}
+    for record in text.split("\n>"):
+        record = record.strip()
+        if not record:
+            continue
+        if not record.startswith(">"):
+            record = ">" + record
+        header = record.split("\n", 1)[0][1:].split()
+        if header and "\n" in record:
+            records[header[0].casefold()] = record + "\n"
+    return records
+
+def _store_batch(entry, text, records, store):
+    """
+    Helper function to split a "get/<gene>+<gene>+.../ntseq" KEGG API response by requested gene.
+    Genes missing from the response are left to the next requests of "get_ntseqs()".
+    (Called by "kegg_get()" within "get_ntseqs()", as soon as each request is complete).
 
     Args:
-        file_txt                (str): name of a modified intermediate flat file (".txt") including a reaction string
-        error_strings          (list): Python-list object including reaction strings that rose errors
-        verbose      (bool, optional): print more info regarding process status. Defaults to False.
+        entry               (str): KEGG API "GET" entry
+        text                (str): KEGG API response (None if the request failed or KEGG found none of the genes)
+        records            (dict): output dictionary of "get_ntseqs()", updated in place
+        store          (callable): function called with (gene, FASTA record) for each gene of the response, or None
     """
-    error_strings.append(file_txt)
-    if verbose:
-        print(f"{file_txt} string NOT PASSED") #debug
+    if text is None:
+        return
+    batch_records = split_multifasta(text)
+    for gene in entry[:-len("/ntseq")].split("+"):
+        if gene in batch_records:
+            records[gene] = batch_records[gene]
+            if store is not None:
+                store(gene, batch_records[gene])
+
+def get_ntseqs(genes, kegg_url, retries=2, store=None, rate=None, connections=None):
+    """
+    Downloads nt sequences of many KEGG genes, grouped by "_kegg_get_batch" in each KEGG API request
+    (i.e. "get/<gene>+<gene>+.../ntseq") through "kegg_get()", splitting back the multi-FASTA responses by gene.
+    Genes missing from a response (e.g. a partial batch, a failed request or a 404) are requested again,
+    up to "retries" times.
+
+    Args:
+        genes              (list): KEGG genes, e.g. from "parsekoflat()"
+        kegg_url            (str): KEGG API base URL
+        retries  (int, optional): further requests for missing genes. Defaults to 2.
+        store (callable, optional): function called with (gene, FASTA record) as soon as each request is complete,
+                                    e.g. to save downloads of an interrupted run, and with (gene, None)
+                                    for genes still missing after the last retry. Defaults to None.
+        rate      (float, optional): maximum requests per second. Defaults to None ("kegg_rate", see "kegg_get()").
+        connections (int, optional): maximum concurrent connections. Defaults to None ("kegg_connections").
+
+    Returns:
+        records            (dict): Python-dictionary object {gene : FASTA record}, for each downloaded gene
+    """
+    records = {}
+    to_download = list(dict.fromkeys(genes))
+    for _ in range(retries+1):
+        if not to_download:
+            break
+        batches = [ to_download[i:i+_kegg_get_batch] for i in range(0, len(to_download), _kegg_get_batch) ]
+        kegg_get([ "+".join(batch)+"/ntseq" for batch in batches ], base_url=kegg_url, rate=rate, connections=connections,
+                 validate=lambda text: not text.strip() or text.startswith(">"),
+                 callback=lambda entry, text: _store_batch(entry, text, records, store))
+        to_download = [ gene for gene in to_download if gene not in records ]
+    if store is not None:
+        for gene in to_download:
+            store(gene, None)
+    return records
+
+def filter_and_align(taxa_dir, taxa_file, fasta_id, klist_file, klists_directory, msa_dir, dir_KO, download=False, io=None):
+    """
+    Generates a nucleotidic multifasta with sequences from the given taxonomy range.
+    The output does NOT contain redundant sequences.
+    Keeps results in a folder organized by the FASTA id of MAG/Genome.
+
+    Args:
+        taxa_dir            (str): "taxa_file" input file folder path
+        taxa_file           (str): ".keg" file, contains each codes of species allowed for subsequent GENES download
+        fasta_id            (str): identificative FASTA name for a given MAG/Genome
+        klist_file          (str): ".klist" file name, indicating missing KOs of interest from MAG/Genome
+        klists_directory    (str): ".klist" input files folder path
+        msa_dir             (str): ".fna" nt multifasta (single representative sequences) output folder path
+        dir_KO              (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
+        download (bool, optional): download again sequences evicted from the sequence cache (see "_write_KO_multifasta()").
+                                    Defaults to False.
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+    """
+    print(_timeinfo(), "START sequences filtering and alignment", sep="\t")
+    ### filter for taxa of interest
+    with open(path.join(taxa_dir, taxa_file)) as f:
+        taxa_allow = { line.strip() for line in f if line.strip() }
+
+    if not path.isdir(path.join(msa_dir, fasta_id)):
+        os.mkdir(path.join(msa_dir, fasta_id))
+
+    KO_to_align = []
+    with open(path.join(klists_directory, klist_file)) as f:
+        for line in f.readlines():
+            KO = line.strip()
+            if KO not in KO_to_align:
+                KO_to_align.append(KO)
+
+    for K in sorted(os.listdir(dir_KO)):
+        if K not in KO_to_align:
+            continue
+        _write_KO_multifasta(K, taxa_allow, fasta_id, msa_dir, dir_KO, download=download, io=io)
+    print(_timeinfo(), "COMPLETE Filter and align", sep="\t")
+
+def _write_KO_multifasta(K, taxa_allow, fasta_id, msa_dir, dir_KO, download=False, io=None):
+    """
+    Helper function to write the non-redundant nt multifasta of a single KO, from the given taxonomy range.
+    Links to sequences evicted from the sequence cache meanwhile (e.g. by another KEMET run, see "evict_sequence_cache()")
+    are downloaded again, or reported if they cannot be.
+    (Called in the "filter_and_align()", "taxonomy_profile()" and "hmm_by_blocks()" functions).
+
+    Args:
+        K                   (str): KO of interest
+        taxa_allow          (set): codes of species allowed, output of "taxonomy_filter()"
+        fasta_id            (str): identificative FASTA name for a given MAG/Genome
+        msa_dir             (str): ".fna" nt multifasta (single representative sequences) output folder path
+        dir_KO              (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
+        download (bool, optional): download again evicted sequences (see "_download_KO()"). Defaults to False.
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+    """
+    # dictionary of non-redundant nt sequences (100% identity)
+    # in order not to overvalue species with different strains in KEGG taxonomy
+    # but only focusing on SEQUENCE DIVERSITY
+    sequniq = {} # {sequence : tax_code_of_identical_seqs}
+    for attempt in range(2):
+        dangling = []
+        for nt_file in sorted(os.listdir(path.join(dir_KO, K))):
+            code = nt_file.split(":")[0]
+            if code not in taxa_allow:
+                continue
+    ### exclude redundant nt sequences
+            try:
+                with open(path.join(dir_KO, K, nt_file)) as f:
+                    seq = f.readlines()[1:]
+            except OSError:
+                dangling.append(nt_file)
+                continue
+            seq1 = "".join(seq).replace("\n", "")
+            sequniq.setdefault(seq1, [])
+            if nt_file not in sequniq[seq1]:
+                sequniq[seq1].append(nt_file)
+        if not dangling or not download or attempt:
+            break
+        if io is None:
+            io = _current_io_directories()
+        _download_KO(K, dir_KO, taxa_allow, io["kegg_url"], io=io)
+    if dangling:
+        print(_timeinfo(), f"{len(dangling)} sequences of {K} missing from the sequence cache", sep="\t")
+    ### Write a multiple sequence fasta
+    if not path.isdir(path.join(msa_dir, fasta_id, K)):
+        os.mkdir(path.join(msa_dir, fasta_id, K))
+    with open(path.join(msa_dir, fasta_id, K, f"MSA_{K}.fna"), "a") as f:
+        for key, value in sequniq.items():
+            print(">" + str(value[0][:-4]), file=f)
+            print(key, file=f)
+
+def MSA_and_HMM(msa_dir_comm, base_com_mafft, base_com_hmmbuild, log=False):
+    """
+    Runs MAFFT alignment and then build nt profile HMM from it.
+    Keeps results in a folder organized by the FASTA-header of MAG/Genome.
+
+    Args:
+        msa_dir_comm                    (str): nt multi-fasta folder path, as modified for the MAG/Genome of interest
+        base_com_mafft                  (str): base command for MAFFT execution - modified for each entry of GENES (KO)
+        base_com_hmmbuild               (str): base command for "hmmbuild" execution - modified for each entry of GENES (KO)
+        log                  (bool, optional): keep execution times in a log file (if specified in command-line args). Defaults to False.
+    """
+    print(_timeinfo(), "START MSA and HMMs creation", sep="\t")
+    if log:
+        logging.info('START MAFFT & hmmbuild execution')
+    for K in sorted(os.listdir(msa_dir_comm)):
+        _build_KO_profile(K, msa_dir_comm, base_com_mafft, base_com_hmmbuild)
+    if log:
+        logging.info('COMPLETE MAFFT & hmmbuild execution')
+    print(_timeinfo(), "COMPLETE MSA and HMM creation", sep="\t")
+
+def nhmmer_for_genome(fasta_genome, msa_dir_comm, base_com_nhmmer):
+    """
+    Runs a nHMMER search for newly generated HMM profiles against a given MAG/Genome.
+    Keeps results in a folder organized by the FASTA id of MAG/Genome.
+
+    Args:
+        fasta_genome        (str): identificative FASTA name (including path) for a given MAG/Genome
+        msa_dir_comm        (str): nt multi-fasta folder path, as modified for the MAG/Genome of interest
+        base_com_nhmmer     (str): base command for "nhmmer" execution - modified for each entry of GENES (KO)
+    """
+    print(_timeinfo(), "START nhmmer search", sep="\t")
+    for K in sorted(os.listdir(msa_dir_comm)):
+        _run_KO_nhmmer(K, fasta_genome, msa_dir_comm, base_com_nhmmer)
+    print(_timeinfo(), "COMPLETE nhmmer", sep="\t")
+
+def _build_KO_profile(K, msa_dir_comm, base_com_mafft, base_com_hmmbuild):
+    """
+    Helper function to run MAFFT alignment and "hmmbuild" for a single KO.
+    (Called in the "MSA_and_HMM()" and "hmm_by_blocks()" functions).
+
+    Args:
+        K                   (str): KO of interest
+        msa_dir_comm        (str): nt multi-fasta folder path, as modified for the MAG/Genome of interest
+        base_com_mafft      (str): base command for MAFFT execution
+        base_com_hmmbuild   (str): base command for "hmmbuild" execution
+    """
+    ch_com_mafft = base_com_mafft.replace("K_NUMBER", K)
+    ch_com_hmmbuild = base_com_hmmbuild.replace("K_NUMBER", K)
+    _run_command(ch_com_mafft, path.join(msa_dir_comm, K))
+    _run_command(ch_com_hmmbuild, path.join(msa_dir_comm, K))
+
+def _run_KO_nhmmer(K, fasta_genome, msa_dir_comm, base_com_nhmmer, profile=None):
+    """
+    Helper function to run a nHMMER search of a single KO profile HMM against a given MAG/Genome.
+    Hits are written in the MAG/Genome folder, also when searching a shared profile HMM.
+    (Called in the "nhmmer_for_genome()", "nhmmer_with_taxonomy_profiles()" and "hmm_by_blocks()" functions).
+
+    Args:
+        K                   (str): KO of interest
+        fasta_genome        (str): identificative FASTA name (including path) for a given MAG/Genome
+        msa_dir_comm        (str): nt multi-fasta folder path, as modified for the MAG/Genome of interest
+        base_com_nhmmer     (str): base command for "nhmmer" execution
+        profile  (str, optional): profile HMM file path, e.g. from "taxonomy_profile()". Defaults to None (in the MAG/Genome folder).
+    """
+    if profile is not None:
+        base_com_nhmmer = base_com_nhmmer.replace("K_NUMBER.hmm", profile)
+        if not path.isdir(path.join(msa_dir_comm, K)):
+            os.mkdir(path.join(msa_dir_comm, K))
+    ch_com_nhmmer = base_com_nhmmer.replace("K_NUMBER", K).replace("PATHFILE", fasta_genome)
+    _run_command(ch_com_nhmmer, path.join(msa_dir_comm, K))
+
+def taxonomy_profile(K, taxonomy, taxa_allow, dir_KO, build=True, download=False, io=None):
+    """
+    Gives the profile HMM of a KO for a KEGG taxonomy, shared by each MAG/Genome of that taxonomy.
+    It is aligned and built (in the "HMM_profiles" folder) the first time it is needed by this KEMET process,
+    and then searched as it is by the following MAGs/Genomes. Concurrent KEMET runs or batch workers build it one at a time
+    (see "_file_lock()"), and a profile HMM being searched is replaced only once the new one is complete.
+
+    Args:
+        K                   (str): KO of interest
+        taxonomy            (str): KEGG Brite taxonomy, from the "genomes.instruction" file
+        taxa_allow          (set): codes of species allowed, output of "taxonomy_filter()"
+        dir_KO              (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
+        build    (bool, optional): run MAFFT and "hmmbuild" if not done yet (otherwise an existing profile is used). Defaults to True.
+        download (bool, optional): download again sequences evicted from the sequence cache. Defaults to False.
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+
+    Returns:
+        profile             (str): profile HMM file path (None if not available)
+    """
+    if io is None:
+        io = _current_io_directories()
+    taxonomy_dir = taxonomy.replace(" ", "_")
+    profile_dir = path.join(io["profiles_dir"], taxonomy_dir)
+    profile = path.join(profile_dir, K, K+".hmm")
+    if build and profile not in _taxonomy_profiles and path.isdir(path.join(dir_KO, K)):
+        with _file_lock(path.join(profile_dir, K+".lock")):
+            if profile not in _taxonomy_profiles:
+                # aligned and built aside, then moved in place
+                build_dir = path.join(profile_dir, ".build")
+                os.makedirs(path.join(build_dir, K), exist_ok=True)
+                for file in os.listdir(path.join(build_dir, K)):
+                    os.remove(path.join(build_dir, K, file))
+                _write_KO_multifasta(K, taxa_allow, ".build", profile_dir, dir_KO, download=download, io=io)
+                _build_KO_profile(K, build_dir, io["base_com_mafft"], io["base_com_hmmbuild"])
+                if path.isfile(path.join(build_dir, K, K+".hmm")):
+                    os.makedirs(path.dirname(profile), exist_ok=True)
+                    os.replace(path.join(build_dir, K, K+".hmm"), profile)
+                for file in os.listdir(path.join(build_dir, K)):
+                    os.remove(path.join(build_dir, K, file))
+                _taxonomy_profiles.add(profile)
+
+    if not path.isfile(profile):
+        return None
+    return profile
+
+def nhmmer_with_taxonomy_profiles(klist_file, klists_directory, fasta_genome, msa_dir_comm, taxonomy, taxa_allow, dir_KO,
+                                  build=True, download=False, log=False, io=None):
+    """
+    Runs a nHMMER search against a given MAG/Genome for each KO of its ".klist" file,
+    using the profile HMMs shared within its KEGG taxonomy (see "taxonomy_profile()").
+    Replaces "filter_and_align()", "MSA_and_HMM()" and "nhmmer_for_genome()" for MAGs/Genomes of the same taxonomy.
+
+    Args:
+        klist_file          (str): ".klist" file name, indicating missing KOs of interest from MAG/Genome
+        klists_directory    (str): ".klist" input files folder path
+        fasta_genome        (str): identificative FASTA name (including path) for a given MAG/Genome
+        msa_dir_comm        (str): nt multi-fasta folder path, as modified for the MAG/Genome of interest
+        taxonomy            (str): KEGG Brite taxonomy, from the "genomes.instruction" file
+        taxa_allow          (set): codes of species allowed, output of "taxonomy_filter()"
+        dir_KO              (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
+        build    (bool, optional): align and build profile HMMs not built yet. Defaults to True.
+        download (bool, optional): download again sequences evicted from the sequence cache. Defaults to False.
+        log      (bool, optional): keep execution times in a log file (if specified in command-line args). Defaults to False.
+        io       (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+    """
+    if io is None:
+        io = _current_io_directories()
+    print(_timeinfo(), "START nhmmer search with taxonomy profiles", sep="\t")
+    if log:
+        logging.info('START nhmmer search with taxonomy profiles')
+    with open(path.join(klists_directory, klist_file)) as f:
+        KO_to_search = list(dict.fromkeys( line.strip() for line in f if line.strip() ))
+
+    if not path.isdir(msa_dir_comm):
+        os.mkdir(msa_dir_comm)
+    built = len(_taxonomy_profiles)
+    for K in KO_to_search:
+        profile = taxonomy_profile(K, taxonomy, taxa_allow, dir_KO, build=build, download=download, io=io)
+        if profile is not None:
+            _run_KO_nhmmer(K, fasta_genome, msa_dir_comm, io["base_com_nhmmer"], profile=profile)
+    print(_timeinfo(), f"COMPLETE nhmmer with taxonomy profiles ({len(_taxonomy_profiles) - built} profiles built)", sep="\t")
+
+def move_HMM_and_clean(hmm_dir_comm, msa_dir_comm):
+    """
+    Orders HMMs, moving them from MSA folder into a dedicated HMM folder.
+    Removes multi-fasta sequences (".fna") necessary for MAFFT proper alignment.
+
+    Args:
+        hmm_dir_comm    (str): HMM folder path, as modified for the MAG/Genome of interest
+        msa_dir_comm    (str): nt multi-fasta folder path, as modified for the MAG/Genome of interest
+    """
+    if not path.isdir(hmm_dir_comm):
+        os.mkdir(hmm_dir_comm)
+    K_numbers = sorted(os.listdir(msa_dir_comm))
+    for K in K_numbers:
+        if not path.isdir(hmm_dir_comm + K):
+            os.mkdir(hmm_dir_comm + K)
+        for file in sorted(os.listdir(msa_dir_comm + K)):
+            if file.endswith(".hmm") or file.endswith(".hits"):
+                hmm_file = file
+                os.replace(msa_dir_comm + K + "/" + hmm_file, hmm_dir_comm + K + "/" + hmm_file)
+            if file.endswith(".fna"):
+                os.remove(msa_dir_comm + K + "/" + file)
+    print(_timeinfo(), "COMPLETE move HMM and clean", sep="\t")
+
+def movebackHMM(hmm_dir_comm, msa_dir_comm):
+    """
+    Moves ".hmm" files back to multi-alignment folder,
+    e.g. in order to try different HMM-hits threshold.
+    WHEN TO USE THIS:
+    to unroll from a complete command-line run - called with the arg: "--retry_nhmmer"
+
+    Args:
+        hmm_dir_comm    (str): HMM folder path, as modified for the MAG/Genome of interest
+        msa_dir_comm    (str): nt multi-fasta folder path, as modified for the MAG/Genome of interest
+    """
+    K_numbers = sorted(os.listdir(hmm_dir_comm))
+    for K in K_numbers:
+        for file in sorted(os.listdir(hmm_dir_comm + K)):
+            if file.endswith(".hmm"):
+                os.replace(hmm_dir_comm + K + "/" + file, msa_dir_comm + K + "/" + file)
+    print(_timeinfo(), "COMPLETE move back HMM", sep="\t")
+
+def nhmmer_significant_hits_corr(fasta_id, hmm_dir_comm, threshold=100, corr_threshold=_def_thr, evalue_threshold=float(1e-30),
+                                hmm_hits_dir=None):
+    """
+    Stores the nhmmer-derived HMM hits in a dedicated ".txt" file.
+    Detailed informations stored include the scoring, genomic context and
+    HMM positions of the hits found with nhmmer.
+
+    Args:
+        fasta_id                      (str): identificative FASTA name for a given MAG/Genome
+        hmm_dir_comm                  (str): HMM folder path, as modified for the MAG/Genome of interest
+        threshold           (int, optional): Minimum nhmmer score for a hit to be considered proper. Defaults to 100.
+        corr_threshold    (float, optional): Minimum nhmmer score, corrected by profile HMM lenght
+                                             for a hit to be considered proper. Defaults to _def_thr.
+        evalue_threshold  (float, optional): Minimum nhmmer e-value for a hit to be considered proper
+                                             (not in use in current form). Defaults to float(1e-30).
+        hmm_hits_dir        (str, optional): HMM hits folder path. Defaults to None (set via "set_io_directories()").
+
+    Returns:
+        sig_hits                     (dict): Python-dictionary object including HMM results
+                                             (not strictly necessary for script continuation).
+    """
+    sig_hits = {}
+    hits_file = hmm_dir_comm + fasta_id + "_HMM_hits.txt"
+
+    with open(hits_file, "a") as g:
+        print("K", "corr_score,evalue", "fragment", "strand",
+              "l_bound", "r_bound", "p_lenght", "hmmfrom",
+              "hmmto", sep="\t", file=g)
+
+    for directory in sorted(os.listdir(hmm_dir_comm)):
+        if directory.startswith("K"):
+            K = directory
+            if K+".hits" in os.listdir(hmm_dir_comm + K):
+                hit = _nhmmer_top_hit(hmm_dir_comm + K + "/" + K + ".hits", K)
+                if _significant_hit(hit, threshold=threshold, corr_threshold=corr_threshold):
+                    sig_hits.update({K:[hit["fragment"], hit["strand"], [str(hit["left_bound"] - 1), str(hit["right_bound"] - 1)]]})
+                    with open(hits_file, "a") as g:
+                        print(K, str(hit["corr_score"]) + "," + str(hit["evalue"]), hit["fragment"], hit["strand"],
+                        str(hit["left_bound"] - 1), str(hit["right_bound"] - 1), str(hit["profile_lenght"]),
+                        str(hit["hmmfrom"] - 1), str(hit["hmmto"] - 1), sep="\t", file=g)
+
+    if hmm_hits_dir is None:
+        hmm_hits_dir = _current_io_directories()["hmm_hits_dir"]
+    os.rename(hits_file, path.join(hmm_hits_dir, fasta_id + "_HMM_hits.txt"))
+    print(_timeinfo(), "COMPLETE nhmmer significant hits", sep="\t")
+    return sig_hits
+
+def _nhmmer_top_hit(hits_path, K):
+    """
+    Helper function to parse the first hit of a KO profile HMM from a nhmmer table output.
+    (Called in the "nhmmer_significant_hits_corr()" and "hmm_by_blocks()" functions).
+
+    Args:
+        hits_path           (str): nhmmer ".hits" table output file path
+        K                   (str): KO of the profile HMM
+
+    Returns:
+        hit                (dict): Python-dictionary object with scoring, genomic context and
+                                    HMM positions of the hit (None if there are no hits)
+    """
+    with open(hits_path) as f:
+        v = f.readlines()[:-9]          # NOT INCLUDING lines w/ the nhmmer command as they rise an error
+        add_ = int(v[1].index("-")-1)   # CORRECT for long contig names
+        for line in v:
+            # line positions based on HMMER table output result
+            if K in line[32 + add_:38 + add_]:
+                score = line[137 + add_:143 + add_].strip()
+                hmmfrom = int(line[65 + add_:71 + add_].strip())
+                hmmto = int(line[72 + add_:79 + add_].strip())
+                profile_lenght = int(hmmto - hmmfrom)
+                hit = {
+                    "evalue": line[127 + add_:136 + add_].strip(),
+                    "score": score,
+                    "fragment": line[0:20 + add_].strip(),
+                    "strand": line[120 + add_:126 + add_].strip(),
+                    "left_bound": int(line[80 + add_:87 + add_].strip()),
+                    "right_bound": int(line[88 + add_:95 + add_].strip()),
+                    "hmmfrom": hmmfrom,
+                    "hmmto": hmmto,
+                    "profile_lenght": profile_lenght,
+                    "corr_score": round((float(score)/profile_lenght), 4),
+                }
+                return hit
+    return None
+
+def _significant_hit(hit, threshold=100, corr_threshold=_def_thr):
+    """
+    Helper function to check a nhmmer hit against the score thresholds of "nhmmer_significant_hits_corr()".
+
+    Args:
+        hit                        (dict): output of "_nhmmer_top_hit()"
+        threshold        (int, optional): Minimum nhmmer score. Defaults to 100.
+        corr_threshold (float, optional): Minimum nhmmer score, corrected by profile HMM lenght. Defaults to _def_thr.
+
+    Returns:
+        significant                (bool): True if the hit passes both thresholds
+    """
+    if hit is None:
+        return False
+    return hit["corr_score"] > corr_threshold and float(hit["score"]) > threshold # could also be unified with evalue_threshold
+
+def _hmm_check_KO(K, fasta_id, fasta_genome, taxa_allow, dir_KO, download=True, build=True, threshold=100, corr_threshold=_def_thr,
+                  taxonomy=None, io=None):
+    """
+    Helper function to run the whole HMM stage for a single KO and check its hits.
+    (Called in the "hmm_by_blocks()" function).
+
+    Args:
+        K                       (str): KO of interest
+        fasta_id                (str): identificative FASTA name for a given MAG/Genome
+        fasta_genome            (str): identificative FASTA name (including path) for the MAG/Genome
+        taxa_allow              (set): codes of species allowed for GENES download, output of "taxonomy_filter()"
+        dir_KO                  (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
+        download     (bool, optional): download nt sequences if not already available. Defaults to True.
+        build        (bool, optional): run MAFFT and "hmmbuild". Defaults to True.
+        threshold     (int, optional): Minimum nhmmer score. Defaults to 100.
+        corr_threshold (float, optional): Minimum nhmmer score, corrected by profile HMM lenght. Defaults to _def_thr.
+        taxonomy      (str, optional): KEGG Brite taxonomy, to search its shared profile HMM (see "taxonomy_profile()").
+                                        Defaults to None (profile HMM built for the MAG/Genome).
+        io           (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+
+    Returns:
+        significant            (bool): True if the KO profile HMM has significant hits in the MAG/Genome
+    """
+    if io is None:
+        io = _current_io_directories()
+    msa_dir_comm = path.join(io["msa_dir"], fasta_id) + "/"
+    if download:
+        _download_KO(K, dir_KO, taxa_allow, io["kegg_url"], io=io)
+    if taxonomy is not None:
+        profile = taxonomy_profile(K, taxonomy, taxa_allow, dir_KO, build=build, download=download, io=io)
+        if profile is None:
+            return False
+        _run_KO_nhmmer(K, fasta_genome, msa_dir_comm, io["base_com_nhmmer"], profile=profile)
+    else:
+        if build and path.isdir(path.join(dir_KO, K)):
+            _write_KO_multifasta(K, taxa_allow, fasta_id, io["msa_dir"], dir_KO, download=download, io=io)
+            _build_KO_profile(K, msa_dir_comm, io["base_com_mafft"], io["base_com_hmmbuild"])
+        if not path.isdir(path.join(msa_dir_comm, K)):
+            return False
+        _run_KO_nhmmer(K, fasta_genome, msa_dir_comm, io["base_com_nhmmer"])
+
+    hits_path = path.join(msa_dir_comm, K, K+".hits")
+    if not path.isfile(hits_path):
+        return False
+    return _significant_hit(_nhmmer_top_hit(hits_path, K), threshold=threshold, corr_threshold=corr_threshold)
+
+def hmm_by_blocks(completion, fasta_id, fasta_genome, taxa_allow, dir_KO, download=True, build=True,
+                  threshold=100, corr_threshold=_def_thr, log=False, taxonomy=None, io=None):
+    """
+    Runs the HMM stage block by block, following the output of "completion_candidates()":
+    for each missing block, the ranked KO sets are downloaded, aligned, built and searched in turn,
+    and the remaining ones are skipped as soon as one of them has significant hits
+    (same thresholds of "nhmmer_significant_hits_corr()"), as they could not change the block completeness.
+    KOs already checked for a previous block are not processed again.
+
+    Args:
+        completion             (dict): output of "completion_candidates()"
+        fasta_id                (str): identificative FASTA name for a given MAG/Genome
+        fasta_genome            (str): identificative FASTA name (including path) for the MAG/Genome
+        taxa_allow              (set): codes of species allowed for GENES download, output of "taxonomy_filter()"
+        dir_KO                  (str): KEGG KO GENES sequences folder path, with taxonomic scope indicated in the command-line input
+        download     (bool, optional): download nt sequences of KOs not already available. Defaults to True.
+        build        (bool, optional): run MAFFT and "hmmbuild" (otherwise profile HMMs are expected in place). Defaults to True.
+        threshold     (int, optional): Minimum nhmmer score for a hit to be considered proper. Defaults to 100.
+        corr_threshold (float, optional): Minimum nhmmer score, corrected by profile HMM lenght. Defaults to _def_thr.
+        log          (bool, optional): keep execution times in a log file (if specified in command-line args). Defaults to False.
+        taxonomy      (str, optional): KEGG Brite taxonomy, to search shared profile HMMs (see "taxonomy_profile()"). Defaults to None.
+        io           (dict, optional): output of "io_directories()". Defaults to None (set via "set_io_directories()").
+
+    Returns:
+        checked                (dict): Python-dictionary object {KO : significant hits found}, for each KO searched
+        skipped                (list): Python-list object with the KOs not searched, thanks to early stopping
+    """
+    if io is None:
+        io = _current_io_directories()
+    print(_timeinfo(), "START HMM search by blocks", sep="\t")
+    if log:
+        logging.info('START HMM search by blocks')
+    msa_dir_comm = path.join(io["msa_dir"], fasta_id) + "/"
+    for directory in (dir_KO, msa_dir_comm):
+        os.makedirs(directory, exist_ok=True)
+
+    checked = {}
+    for missing in completion.values():
+        for block in missing:
+            for _, option in block["candidates"]:
+                # KOs of a complex are searched until the first one without hits
+                found = True
+                for K in option:
+                    if K not in checked:
+                        checked[K] = _hmm_check_KO(K, fasta_id, fasta_genome, taxa_allow, dir_KO, download=download, build=build,
+                                                   threshold=threshold, corr_threshold=corr_threshold, taxonomy=taxonomy, io=io)
+                    if not checked[K]:
+                        found = False
+                        break
+                if found:
+                    break
+
+    candidates = dict.fromkeys( K for missing in completion.values() for block in missing
+                                for _, option in block["candidates"] for K in option )
+    skipped = [ K for K in candidates if K not in checked ]
+    print(_timeinfo(), f"COMPLETE HMM search by blocks ({len(checked)} KOs searched, {len(skipped)} skipped)", sep="\t")
+    if log:
+        logging.info(f'COMPLETE HMM search by blocks ({len(checked)} KOs searched, {len(skipped)} skipped)')
+    return checked, skipped
+
+def HMM_hits_sequences(hmm_hits_dir, dir_genomes):
+    """
+    Loads MAGs/Genomes HMM hits info, previously generated via "nhmmer_significant_hits_corr()".
+    Checks hits in genome content (contigs-scaffolds-chromosomes), both in FOR & REV directions.
+    Stores relevant hits in a dictionary-object.
+
+    Args:
+        hmm_hits_dir        (str): HMM hits folder path
+        dir_genomes         (str): command-line defined genomes folder path
+
+    Returns:
+        HMM_hits_dict      (dict): Python-dictionary object:
+                                    keys: ">MAG/Genome+KO"
+                                    values: "nt sequence"
+    """
+    #### load all infos of different genomes' HMM-hits
+    MAG_Khit_dict = {}
+    HMM_hits_dict = {}
+
+    for el in sorted(os.listdir(hmm_hits_dir)):
+        if not el.endswith(".txt"):
+            continue
+        MAG = el.replace("_HMM_hits.txt","")
+        v_Khits = []
+        with open(path.join(hmm_hits_dir, el)) as f:
+            for line in f.readlines()[1:]:
+                line = line.strip().split("\t")
+                K = line[0]
+                fragment, strand, l_bound, r_bound = line[2:6]
+                v_Khits.append([K, fragment, strand, l_bound, r_bound])
+
+        MAG_Khit_dict[MAG] = v_Khits
+
+    #### once all infos of the hits are loaded, check the contigs//genomes for hits sequences
+    for genome, val in MAG_Khit_dict.items():
+        for hits in MAG_Khit_dict[genome]:
+            strand_plus = False
+            K = hits[0]
+            fragment = hits[1]
+            strand = hits[2]
+            l_bound = int(hits[3])
+            r_bound = int(hits[4])
+
+            for genome_file in sorted(os.listdir(dir_genomes)):
+                if genome_file.startswith(genome + "."):
+                    with open(path.join(dir_genomes, genome_file)) as f:
+                        v_lines = f.readlines()
+            for i, line in enumerate(v_lines):
+                line = line.strip()
+                if ">" and fragment in line:
+                    i_frag_start = i
+                    j = i
+                    for line in v_lines[i_frag_start+1:]:
+                        j += 1
+                        if ">" in line or j >= (len(v_lines)-1): # new contigs or file-end
+                            i_frag_stop = j
+                            break
+                    break
+    #### load contigs' "+" strand sequence
+            try:
+                fragment_w_hit = ""
+                for line in v_lines[i_frag_start+1:i_frag_stop]:
+                    fragment_w_hit += line.strip()
+    #### different treatment for hits in "+" & "-" strands
+    #### do not include hits with "N", resulting e.g. from scaffold placeholders
+                if strand == "+":
+                    SEQUENCE = fragment_w_hit[l_bound:r_bound]
+                    if "N" not in SEQUENCE and "n" not in SEQUENCE:
+                        HMM_hits_dict.update({">"+genome+"_"+K:SEQUENCE})
+                else:
+                    SEQUENCE_pre = fragment_w_hit[r_bound:l_bound]
+                    pre = "ACTG"
+                    post = "TGAC"
+                    compl = SEQUENCE_pre.maketrans(pre, post)
+                    seq_compl = SEQUENCE_pre.translate(compl)
+                    SEQUENCE = seq_compl[::-1]
+                    if "N" not in SEQUENCE and "n" not in SEQUENCE:
+                        HMM_hits_dict.update({">" + genome + "_" + K:SEQUENCE})
+            except:
+                pass
+    return HMM_hits_dict
+
+def HMM_hits_translated_sequences(HMM_hits_dict):
+    """
+    Translates HMM hits in the 3 frames of the adequate sequence strand.
+    Stores them in a dictionary-object.
+
+    Args:
+        HMM_hits_dict               (dict): Python-dictionary object output of "HMM_hits_sequences()"
+
+    Returns:
+        HMM_hits_TRANSLATED_dict    (dict): Python-dictionary object:
+                                            keys: ">MAG/Genome+KO+frame_indication"
+                                            values: "aa sequence"
+    """
+    #POSSIBILITY: NOT ONLY t11 table, but also others
+    t11 = {"TTT":"F", "TTC":"F", "TTA":"L", "TTG":"L",
+           "TCT":"S", "TCC":"S", "TCA":"S", "TCG":"S",
+           "TAT":"Y", "TAC":"Y", "TAA":"*", "TAG":"*",
+           "TGT":"C", "TGC":"C", "TGA":"*", "TGG":"W",
+           "CTT":"L", "CTC":"L", "CTA":"L", "CTG":"L",
+           "CCT":"P", "CCC":"P", "CCA":"P", "CCG":"P",
+           "CAT":"H", "CAC":"H", "CAA":"Q", "CAG":"Q",
+           "CGT":"R", "CGC":"R", "CGA":"R", "CGG":"R",
+           "ATT":"I", "ATC":"I", "ATA":"I", "ATG":"M",
+           "ACT":"T", "ACC":"T", "ACA":"T", "ACG":"T",
+           "AAT":"N", "AAC":"N", "AAA":"K", "AAG":"K",
+           "AGT":"S", "AGC":"S", "AGA":"R", "AGG":"R",
+           "GTT":"V", "GTC":"V", "GTA":"V", "GTG":"V",
+           "GCT":"A", "GCC":"A", "GCA":"A", "GCG":"A",
+           "GAT":"D", "GAC":"D", "GAA":"E", "GAG":"E",
+           "GGT":"G", "GGC":"G", "GGA":"G", "GGG":"G",}
+
+    HMM_hits_TRANSLATED_dict = {}
+
+    for fasta_id, seq in HMM_hits_dict.items():
+
+        frame_ids = [ fasta_id + "__f1",
+                      fasta_id + "__f2",
+                      fasta_id + "__f3" ]
+
+        ntseqs = [ seq.upper(),
+                   seq[1:].upper(),
+                   seq[2:].upper() ]
+
+        for frame_id, ntseq in zip(frame_ids, ntseqs):
+            codons = [ ntseq[i:i+3] for i in range(0, len(ntseq), 3) ]
+            if len(codons[-1]) < 3:
+                codons.pop()
+            aaseq = "".join(( t11[codon] for codon in codons ))
+            HMM_hits_TRANSLATED_dict[frame_id] = aaseq
+
+    return HMM_hits_TRANSLATED_dict
+
+
+def HMM_hits_longest_translated_sequences(HMM_hits_dict, HMM_hits_TRANSLATED_dict):
+    """
+    Compares the HMM translated hits and keep the longest hit without a stop codon.
+    Stores them in a dictionary-object.
+
+    Args:
+        HMM_hits_dict                   (dict): Python-dictionary object output of "HMM_hits_sequences()"
+        HMM_hits_TRANSLATED_dict        (dict): Python-dictionary object output of "HMM_hits_translated_sequences()"
+
+    Returns:
+        HMM_hits_TRANSLATED_MAXLEN_dict (dict): Python-dictionary object:
+                                                keys: ">MAG/Genome+KO+frame_indication"
+                                                values: "aa sequence" - only the longest without stop codons (*)
+    """
+    max_len_dict = { fasta_nf: [] for fasta_nf in HMM_hits_dict }
+
+    HMM_hits_TRANSLATED_MAXLEN_dict = {}
+
+    for fasta_id, seq in HMM_hits_TRANSLATED_dict.items():
+        fasta_nf = fasta_id.split("__")[0]
+        seq = seq.split("*")                   # divided by stop codons
+        seq_max = max(seq, key=len)            # longer for single reading frame
+        max_len_dict[fasta_nf].append(seq_max) # add the longest to list
+
+    for fasta_nf in max_len_dict:
+        seq_max_allframes = max(max_len_dict[fasta_nf], key=len)
+        frame = "__f"+str(max_len_dict[fasta_nf].index(seq_max_allframes)+1)
+        HMM_hits_TRANSLATED_MAXLEN_dict.update({fasta_nf+frame:seq_max_allframes})
+
+    return HMM_hits_TRANSLATED_MAXLEN_dict
+
+def recap_hits_corr(fasta_id, hmm_hits_dir, HMM_hits_dict, HMM_hits_longestTRANSLATED_dict, run_start):
+    """
+    Stores informations from the HMM-hits dictionaries, alongside identified sequences.
+    It gives the final tabular output of the entire HMM procedure.
+
+    Args:
+        fasta_id                            (str): identificative FASTA name for a given MAG/Genome
+        hmm_hits_dir                        (str): HMM hits folder path
+        HMM_hits_dict                      (dict): Python-dictionary object output of "HMM_hits_sequences()"
+        HMM_hits_longestTRANSLATED_dict    (dict): Python-dictionary object output of "HMM_hits_longest_translated_sequences()"
+        run_start                           (str): indication of the date in which the "kemet.py" process started
+    """
+    current_run = "KEMET_run_" + run_start
+    if not path.isdir(path.join(hmm_hits_dir, current_run)):
+        os.mkdir(path.join(hmm_hits_dir, current_run))
+    with open(path.join(hmm_hits_dir, current_run, f"file_recap_{run_start}.tsv"), "a") as f:
+        if f.tell() == 0:
+            print("MAG", "KO", "corr_score,evalue", "fragment", "strand",
+                  "l_bound", "r_bound", "p_lenght", "hmmfrom", "hmmto",
+                  "frame", "seq", "xseq", sep="\t", file=f)
+
+        for file in sorted(os.listdir(hmm_hits_dir)):
+            if file.endswith(".txt") and fasta_id in file:
+                with open(path.join(hmm_hits_dir, file)) as g:
+                    for line in g.readlines()[1:]:
+                        KO = line.strip().split("\t")[0]
+                        for hit in HMM_hits_dict.keys():
+                            if hit.startswith(">"+file[:-13]+"_"+KO): ###
+                                seq = HMM_hits_dict[hit].upper()
+                                break
+                        for hit in HMM_hits_longestTRANSLATED_dict.keys():
+                            if hit.startswith(">"+file[:-13]+"_"+KO): ###
+                                frame = hit[-1]
+                                xseq = HMM_hits_longestTRANSLATED_dict[hit]
+                                break
+                        print(file[:-13], line.strip(), frame, seq, xseq, sep="\t", file=f)
+
+
+def build_de_novo_GSMM(FASTA, fasta_genome, de_novo_model_directory, current_run, log=False, hmm_hits_dir=None):
+    """
+    Generates de-novo GSMM from a contextual Prodigal gene calling,
+    adding HMM-hits derived translated hits to the predicted proteome (".faa").
+
+    Args:
+        FASTA                           (str): identificative FASTA name for a given MAG/Genome - with extension
+        fasta_genome                    (str): identificative FASTA name (including path) for a given MAG/Genome
+        de_novo_model_directory         (str): output files folder path
+        current_run                     (str): indication of the date in which the "kemet.py" process started
+        log                  (bool, optional): keep execution times in a log file (if specified in command-line args). Defaults to False.
+        hmm_hits_dir          (str, optional): HMM hits folder path. Defaults to None (set via "set_io_directories()").
+    """
+    if hmm_hits_dir is None:
+        hmm_hits_dir = _current_io_directories()["hmm_hits_dir"]
+    fasta_id = FASTA.replace(".fasta", "").replace(".fna", "").replace(".fa", "")
+    HMM_HITS = {}
+    for file in os.listdir(path.join(hmm_hits_dir, current_run)):
+        if not file.startswith("file_recap_") and file.endswith(".tsv"):
+            continue
+        with open(path.join(hmm_hits_dir, current_run, file)) as f:
+            for line in f.readlines()[1:]:
+                line = line.strip().split("\t")
+                MAG = line[0]
+                KO = line[1]
+                xseq = line[12]
+                if MAG != fasta_id:
+                    continue
+                HMM_HITS.update({">"+KO:xseq})
+
+    # launch prodigal gene calling - default:QUIET
+    if not path.isdir(path.join(de_novo_model_directory, "proteins")):
+        os.mkdir(path.join(de_novo_model_directory, "proteins"))
+    prodigal_cmd = f"prodigal -i {fasta_genome} -a ./proteins/{fasta_id}.faa -q -m > /dev/null"
+    _run_command(prodigal_cmd, de_novo_model_directory)
+    print(_timeinfo(), f"COMPLETE Prodigal command for {FASTA}", sep="\t")
+    if log:
+        logging.info(f"COMPLETE Prodigal command for {FASTA}")
+
+    # ADD HMM-hits
+    with open(path.join(de_novo_model_directory, "proteins", fasta_id+".faa"), "a") as f:
+        for ko, xseq in HMM_HITS.items():
+            print(ko, file=f)
+            # pretty print 60 chr per line
+            for i in range(0, len(xseq), 60):
+                print(xseq[i:i+60], file=f)
+
+    # GENERATE CARVEME MODEL - default:QUIET
+    if not path.isdir(path.join(de_novo_model_directory, "dmnd_intermediates")):
+        os.mkdir(path.join(de_novo_model_directory, "dmnd_intermediates"))
+    carveme_cmd = f"carve ./proteins/{fasta_id}.faa --fbc2 -u {metabolic_universe} -o {fasta_id}.xml 2> /dev/null"
+    print(_timeinfo(), f"START CarveMe command for {FASTA}", sep="\t")
+    if log:
+        logging.info(f"START CarveMe command for {FASTA}")
+    _run_command(carveme_cmd, de_novo_model_directory)
+    print(_timeinfo(), f"COMPLETE CarveMe command for {FASTA}", sep="\t")
+    if log:
+        logging.info(f'COMPLETE CarveMe command for {FASTA}')
+
+    move_dmnd_cmd = f"mv {fasta_id}.tsv ../dmnd_intermediates"
+    _run_command(move_dmnd_cmd, de_novo_model_directory+"/proteins/")
+
+def parse_module_flat_file(file):
+    """
+    Parses the ENTRY, NAME, DEFINITION, ORTHOLOGY, CLASS, PATHWAY, REACTION and COMPOUND sections of a KEGG Module flat-file.
+
+    Args:
+        file                    (str): input KEGG Module flat-file path
+
+    Returns:
+        module_record          (dict): Python-dictionary object:
+                                        "entry", "name", "class": section values
+                                        "definition": definition lines
+                                        "orthology": list of (KOs, description) entries
+                                        "pathway", "reaction", "compound": list of (id(s), description) entries
+    """
+    module_record = {"entry": "", "name": "", "definition": [], "orthology": [],
+                     "class": "", "pathway": [], "reaction": [], "compound": []}
+
+    section = None
+    with open(file) as f:
+        for line in f:
+            if line.startswith("///"):
+                break
+            if not line[:1].isspace():
+                section = line[:12].strip().lower()
+            value = line[12:].strip()
+            if section not in module_record or not value:
+                continue
+            if section == "entry":
+                module_record["entry"] = value.split()[0]
+            elif section in ("name", "class"):
+                module_record[section] = value
+            elif section == "definition":
+                module_record["definition"].append(value)
+            else:
+                entry = value.split(None, 1)
+                module_record[section].append((entry[0], entry[1].strip() if len(entry) > 1 else ""))
+
+    return module_record
+
+def compile_module_catalog(Modules_directory):
+    """
+    Parses every KEGG Module flat-file once, generating the KEGG Modules catalog,
+    with the indexes used by the Genome-scale models procedures and for Modules selection.
+
+    Args:
+        Modules_directory       (str): KEGG Modules flat-files folder path
+
+    Returns:
+        module_catalog         (dict): Python-dictionary object:
+                                        "version": catalog format version
+                                        "signature": output of "_kk_signature()" for the flat-files
+                                        "modules": {KEGG Module id : output of "parse_module_flat_file()", with flat-file name as "file"}
+                                        "ko_modules": {KO : KEGG Module ids whose definition includes it}
+                                        "ko_reactions": {(KEGG Module id, KO) : reactions (R) of its ORTHOLOGY entries, comma-separated}
+                                        "class_modules": {CLASS level, lowercase : KEGG Module ids}
+                                        "pathway_modules": {PATHWAY map id or name, lowercase : KEGG Module ids}
+    """
+    signature = _kk_signature(Modules_directory, suffix=".txt")
+    modules, ko_modules, ko_reactions, class_modules, pathway_modules = {}, {}, {}, {}, {}
+    for module_txt, _, _ in signature:
+        module = module_txt[:6]
+        module_record = parse_module_flat_file(path.join(Modules_directory, module_txt))
+        module_record["file"] = module_txt
+        modules[module] = module_record
+
+        for KO in sorted(set(re.findall("K[0-9]{5}", " ".join(module_record["definition"])))):
+            ko_modules.setdefault(KO, []).append(module)
+        for knumber_a, description in module_record["orthology"]:
+            if "[RN:" not in description:
+                continue
+            reaction = description.split("[RN:")[1].replace("]", "").replace(" ", ",")
+            for knum_element in re.split("[+,-]", knumber_a):
+                if (module, knum_element) in ko_reactions:
+                    ko_reactions[(module, knum_element)] += "," + reaction
+                else:
+                    ko_reactions[(module, knum_element)] = reaction
+        for level in module_record["class"].split("; "):
+            class_modules.setdefault(level.lower(), []).append(module)
+        for map_id, pathway_name in module_record["pathway"]:
+            for key in dict.fromkeys((map_id.lower(), pathway_name.lower())):
+                pathway_modules.setdefault(key, []).append(module)
+
+    module_catalog = {
+        "version": _module_catalog_version,
+        "signature": signature,
+        "modules": modules,
+        "ko_modules": ko_modules,
+        "ko_reactions": ko_reactions,
+        "class_modules": class_modules,
+        "pathway_modules": pathway_modules,
+    }
+    return module_catalog
+
+def load_module_catalog(Modules_directory, cache_file=_module_catalog_cache):
+    """
+    Loads the KEGG Modules catalog from its cache file, with a single read.
+    The catalog is compiled (and the cache file rewritten) whenever the cache is missing,
+    was written by a different KEMET version or the flat-files changed.
+
+    Args:
+        Modules_directory       (str): KEGG Modules flat-files folder path
+        cache_file    (str, optional): cache file name, in the flat-files folder. Defaults to _module_catalog_cache.
+
+    Returns:
+        module_catalog         (dict): Python-dictionary output of "compile_module_catalog()"
+    """
+    cache_path = path.join(Modules_directory, cache_file)
+    module_catalog = _read_pickle_cache(cache_path, _module_catalog_version, _kk_signature(Modules_directory, suffix=".txt"))
+    if module_catalog is None:
+        module_catalog = compile_module_catalog(Modules_directory)
+        _write_pickle_cache(cache_path, module_catalog)
+    return module_catalog
+
+def select_modules(module_catalog, modules=(), module_class=(), pathway=()):
+    """
+    Selects KEGG Modules by id, CLASS or PATHWAY, via the KEGG Modules catalog.
+    A CLASS matches any of its levels (e.g. "Carbohydrate metabolism"), a PATHWAY either its map id (e.g. "map00010") or name.
+    Matching is case-insensitive; Modules matching any of the given selectors are returned.
+
+    Args:
+        module_catalog         (dict): output of "load_module_catalog()"
+        modules    (iterable, optional): KEGG Module ids (e.g. "M00001"). Defaults to ().
+        module_class (iterable, optional): CLASS levels. Defaults to ().
+        pathway    (iterable, optional): PATHWAY map ids or names. Defaults to ().
+
+    Returns:
+        selected               (list): KEGG Module ids, sorted
+        unknown                (list): selectors not matching any KEGG Module
+    """
+    selected, unknown = set(), []
+    for module in modules:
+        if module.upper() in module_catalog["modules"]:
+            selected.add(module.upper())
+        else:
+            unknown.append(module)
+    for selectors, index in ((module_class, module_catalog["class_modules"]), (pathway, module_catalog["pathway_modules"])):
+        for selector in selectors:
+            if selector.lower() in index:
+                selected.update(index[selector.lower()])
+            else:
+                unknown.append(selector)
+    return sorted(selected), unknown
+
+def KEGG_BiGG_SEED_RN_dict(reactions_DB, DB_directory, ontology="BiGG"):
+    """
+    Connects KEGG RN to BiGG IDs or KEGG RN to ModelSEED IDs
+    starting from a tabular data file which connects ModelSEED reactions
+    to other GSMM reaction onthologies.
+
+    Args:
+        reactions_DB                (str): input ".tsv" reaction file path
+        DB_directory                (str): input file folder path
+        ontology          (str, optional): Genome-scale models ontology indication. Defaults to "BiGG".
+
+    Returns:
+        dict_kegg_x_dict           (dict): Python-dictionary object with manyXmany relations of KEGG Rs and BiGG IDs
+        dict_kegg_x_seed           (dict): (Unsupported in current version)
+    """
+    dict_kegg_x_dict = {}
+    dict_kegg_x_seed = {}
+    with open(path.join(DB_directory, reactions_DB)) as g:
+        for line in g.readlines()[1:]:
+            x = line.split("\t")
+
+            rxn = x[0]
+            bigg_ids = x[2:24]
+            kegg_ids = x[25:34]
+
+            non_empty_bigg_ids = list(filter(None, bigg_ids))
+            non_empty_kegg_ids = list(filter(None, kegg_ids))
+
+            unique_kegg_ids = []
+            unique_bigg_ids = []
+
+            dict_rxn_x_bigg = {}
+            #only non-redundant KEGG RN entry x reaction/line
+            for k_id in non_empty_kegg_ids:
+                if k_id not in unique_kegg_ids:
+                    unique_kegg_ids.append(k_id)
+
+            #only non-redundant BiGG entry x reaction/line
+            for b_id in non_empty_bigg_ids:
+                if b_id not in unique_bigg_ids:
+                    unique_bigg_ids.append(b_id)
+
+        # {KEGG : [{rxns:[BiGGs]}]}
+            #for each KEGG RN, create-update a non-redundant dict-entry
+            for Kegg in unique_kegg_ids:
+                if Kegg not in dict_kegg_x_dict.keys():
+                    vett_dict_rxn_bigg=[]
+                    dict_rxn_x_bigg.update({rxn:unique_bigg_ids})
+                    vett_dict_rxn_bigg.append(dict_rxn_x_bigg)
+                    dict_kegg_x_dict.update({Kegg:vett_dict_rxn_bigg})
+                else:
+                    vett_dict_rxn_bigg=dict_kegg_x_dict[Kegg]
+                    dict_rxn_x_bigg.update({rxn:unique_bigg_ids})
+                    vett_dict_rxn_bigg.append(dict_rxn_x_bigg)
+                    dict_kegg_x_dict.update({Kegg:vett_dict_rxn_bigg})
+
+        # {KEGG : [rxns]}
+            #for each KEGG RN, create-update a non-redundant dict-entry
+            for Kegg in unique_kegg_ids:
+                if Kegg not in dict_kegg_x_seed:
+                    vett_dict_rxn_seed=[]
+                    vett_dict_rxn_seed.append(rxn)
+                    dict_kegg_x_seed.update({Kegg:vett_dict_rxn_seed})
+                else:
+                    vett_dict_rxn_seed=dict_kegg_x_seed[Kegg]
+                    vett_dict_rxn_seed.append(rxn)
+                    dict_kegg_x_seed.update({Kegg:vett_dict_rxn_seed})
+
+    if ontology == "BiGG":
+        return dict_kegg_x_dict
+    elif ontology == "SEED":
+        return dict_kegg_x_seed
+
+def keggR_in_DB(list_of_unique_Rnumbers, DB_Kegg_reactions):
+    """
+    Helper function to search for unique KEGG REACTIONS (R) in
+    the reaction database file provided in the KEMET GitHub.
+
+    Args:
+        list_of_unique_Rnumbers     (list): Python-list output of "total_R_from_KOhits()" function
+        DB_Kegg_reactions           (dict): Python-dictionary output of "KEGG_BiGG_SEED_RN_dict()" function
+
+    Returns:
+        v_KeggR_unique_in_DB        (list): Python-list object including all different and unique KEGG R
+                                            as recovered from the reaction_DB file
+    """
+    v_KeggR_unique = []
+    v_KeggR_unique_in_DB = []
+    for Rnumber in list_of_unique_Rnumbers:
+        v_KeggR_unique.append(Rnumber)
+        if Rnumber in DB_Kegg_reactions.keys():
+            v_KeggR_unique_in_DB.append(Rnumber)
+
+    return v_KeggR_unique_in_DB
+
+def bigg_nonredundant(v_KeggR_unique_in_DB, DB_Kegg_reactions):
+    """
+    Helper function to search for unique BiGG REACTIONS in
+    the reaction database file provided in the KEMET GitHub.
+
+    Args:
+        v_KeggR_unique_in_DB    (list): Python-list output of "keggR_in_DB()" function
+        DB_Kegg_reactions       (dict): Python-dictionary output of "KEGG_BiGG_SEED_RN_dict()" function
+
+    Returns:
+        v_bigg_nonredundant     (list): Python-list object including unique BiGG reaction,
+                                        as linked to KEGG R via BiGG database
+    """
+    v_bigg_nonredundant = []
+    for Rnumber in v_KeggR_unique_in_DB:
+        for subdict in DB_Kegg_reactions[Rnumber]:
+            for v_bigg in subdict.values():
+                for single_bigg in v_bigg:
+                    if single_bigg not in v_bigg_nonredundant:
+                        v_bigg_nonredundant.append(single_bigg)
+
+    return v_bigg_nonredundant
+
+def modelseed_nonredundant(v_KeggR_unique_in_DB, DB_Kegg_reactions):
+    """
+    Helper function to search for unique ModelSEED REACTIONS in
+    the reaction database file provided in the KEMET GitHub.
+
+    Args:
+        v_KeggR_unique_in_DB        (list): Python-list output of "keggR_in_DB()" function
+        DB_Kegg_reactions           (dict): Python-dictionary output of "KEGG_BiGG_SEED_RN_dict()" function
+
+    Returns:
+        v_modelseed_nonredundant    (list): Python-list object including unique BiGG reaction,
+                                            as linked to ModelSEED reactions via BiGG database
+    """
+    v_modelseed_nonredundant = []
+    for Rnumber in v_KeggR_unique_in_DB:
+        for single_rxn in DB_Kegg_reactions[Rnumber]:
+            if single_rxn not in v_modelseed_nonredundant:
+                v_modelseed_nonredundant.append(single_rxn)
+
+    return v_modelseed_nonredundant
+
+def bigg_gapfill_absent_in_model(bigg_nonredundant_file, model):
+    """
+    Helper function to identify putative gap-fill reactions
+    missing in the input existing ".xml" model.
+    (Called in the "reframed_reaction_addition()" function).
+
+    Args:
+        bigg_nonredundant_file              (str): log ".txt" file generated via "log_bigg_nr()"
+        model                           (CBModel): Python-object of an existing ".xml" model, as loaded via Reframed
+
+    Returns:
+        bigg_gapfill_absent_in_model       (list): Python-list object including unique BiGG reaction,
+                                                    not present in the input ".xml" genome-scale model
+    """
+
+    biggreactions_names = [ reaction[2:] for reaction in model.reactions.keys()
+                            if reaction not in ("Growth", "R_ATPM") ]
+
+    with open(bigg_nonredundant_file) as f:
+        putative_gapfill = [ line.strip() for line in f ]
+
+    bigg_gapfill_absent_in_model = [ bigg1 for bigg1 in putative_gapfill
+                                     if bigg1 not in biggreactions_names ]
+
+    return bigg_gapfill_absent_in_model
+
+def curl_bigg_reaction(single_reac, modelgapfill_directory):
+    """
+    Helper function to download a file that contains BiGG reaction,
+    stores it in an intermediate file (".ift").
+    (Called in the "reframed_reaction_addition()" function).
+
+    Args:
+        single_reac                 (str): name of a single reaction, taken from the list-output of "bigg_gapfill_absent_in_model()"
+        modelgapfill_directory      (str): folder path in which to store the intermediate file
+
+    Returns:
+        file_ift                    (str): path of intermediate flat file (".ift") including a reaction string
+    """
+    cmd_line = "curl --silent 'http://bigg.ucsd.edu/api/v2/universal/reactions/"
+    el = single_reac
+    command = cmd_line + el + "'"
+    file_ift = path.join(modelgapfill_directory, str(el) + ".ift")
+    os.system(command + " > " + file_ift)
+
+    return file_ift
+
+def api_file_reorder(file_ift, verbose=False):
+    """
+    Helper function to clean and reorganize info from
+    intermediate files, containing reaction strings.
+    (Called in the "reframed_reaction_addition()" function).
+
+    Args:
+        file_ift            (str): name of intermediate flat file (".ift") including a reaction string
+        verbose  (bool, optional): print more info regarding process status. Defaults to False.
+    """
+    with open(file_ift) as f:
+        for line in f:
+        #text cleaning
+            text2 = line.replace(",", ",\n").replace(":", ":\t").replace("&#8652;", "<->")
+            file_txt = str(file_ift).replace(".ift", ".txt")
+            #files_txt.append(file_txt)
+            with open(file_txt, "w") as g:
+                g.write(text2)
+            os.remove(file_ift)
+
+            if verbose:
+                print(f"Info from file {file_ift} reordered")
+
+def api_file_reorder2(file_ift, verbose=False):
+    """
+    Helper function #2 to clean and reorganize info from
+    intermediate files, containing reaction strings.
+
+    Args:
+        file_ift            (str): name of intermediate flat file (".ift") including a reaction string
+        verbose  (bool, optional): print more info regarding process status. Defaults to False.
+
+    Returns:
+        file_txt            (str): name of a modified intermediate flat file (".txt") including a reaction string
+    """
+    with open(file_ift) as f:
+        for line in f:
+        #text cleaning
+            text2 = line.replace(",", ",\n").replace(":", ":\t").replace("&#8652;", "<->")
+            file_txt = str(file_ift).replace(".ift", ".txt")
+            with open(file_txt, "w") as g:
+                g.write(text2)
+            os.remove(file_ift)
+
+            if verbose:
+                print(f"Info from file {file_ift} reordered")
+
+    return file_txt
+
+def get_string(file_txt, total_strings, verbose=False):
+    """
+    Helper function to extract reaction string and
+    add to a reaction list in Reframed format.
+    (Called in the "reframed_reaction_addition()" function).
+
+    Args:
+        file_txt                       (str): name of a modified intermediate flat file (".txt") including a reaction string
+        total_strings                 (list): Python-list object including all reaction strings extracted from BiGG API processes
+        verbose             (bool, optional): print more info regarding process status. Defaults to False.
+        remove_intermediate (bool, optional): flag to remove intermediate ".ift" files. Defaults to True.
+    """
+    with open(file_txt) as asd:
+        forbidden = ["+", "<->", "<--", "-->"]
+        for line in asd.readlines():
+            line = line.strip()
+            if line.startswith('"reaction_string"'):
+                st = line.split("\t")[1]
+                st1 = st.replace('"', "").replace("}", "").replace(',', '').strip()
+                st2 = st1.split(" ")
+
+                metabs = []
+                for el in st2:
+                    if el not in forbidden and "." not in el:
+                        el = "M_" + el
+                    metabs.append(el)
+
+    #add Reframed name
+    with open(file_txt) as asd:
+        dsa = reversed(list(asd))
+        for line in dsa:
+            line = line.strip().replace("{", "")
+            if line.startswith('"bigg_id"'):
+                name = line.split("\t")[1]
+                break
+        right_name = "R_" + name.replace('"', "").replace(",", "").strip() + ":"
+        right_string = " ".join(metabs)
+        reac_string = right_name + " " + right_string
+        total_strings.append(reac_string)
+
+        if verbose:
+            print(f"{file_txt} string PASSED") #debug
+
+    os.remove(file_txt)
+
+def get_string_error(file_txt, error_strings, verbose=False):
+    """
+    Helper function to extract reaction strings that lead to
+    reaction addition errors (i.e. not found in BiGG).
+    (Called in the "reframed_reaction_addition()" function).
+
+    Args:
+        file_txt                (str): name of a modified intermediate flat file (".txt") including a reaction string
+        error_strings          (list): Python-list object including reaction strings that rose errors
+        verbose      (bool, optional): print more info regarding process status. Defaults to False.
+    """
+    error_strings.append(file_txt)
+    if verbose:
+        print(f"{file_txt} string NOT PASSED") #debug
+
+def retry_genes(file_txt, modelgapfill_directory, verbose=False):
+    """
+    Helper function to try a different BiGG API request to
+    extract reaction strings.
+    (Called in the "reframed_reaction_addition()" function).
+
+    Args:
+        file_txt                    (str): name of a modified intermediate flat file (".txt") including a reaction string
+        modelgapfill_directory      (str): folder path in which to store the intermediate files
+        verbose          (bool, optional): print more info regarding process status. Defaults to False.
+    """
+    cmd_line = "curl --silent 'http://bigg.ucsd.edu/api/v2/search?query=GENE&search_type=genes'"
+    el = file_txt
+    command2 = cmd_line.replace("GENE", el)
+    file_ift2 = path.join(modelgapfill_directory, str(el) + ".ift2")
+    os.system(command2 + " > " + file_ift2)
+    if verbose:
+        print(str(el) + " phase .ift2")
+
+    with open(file_ift2) as f:
+        v = f.readline()
+        v1 = v.split("}")[0].split("[")[1].replace("{", "").split(", ")
+        bigg_id = v1[0].replace('"', "").split(": ")[1]
+        name = v1[1].replace('"', "").split(": ")[1]
+        model_bigg_id = v1[3].replace('"', "").split(": ")[1]
+        if name != el:
+            if verbose:
+                print(str(el)+" string NOT PASSED AGAIN")
+
+            os.remove(file_ift2)
+            return
+        else:
+            cmd_line2 = "curl --silent 'http://bigg.ucsd.edu/api/v2/models/MODEL/genes/BIGG'"
+            command3 = cmd_line2.replace("MODEL", model_bigg_id).replace("BIGG", bigg_id)
+            file_ift3 = path.join(modelgapfill_directory, str(el) + ".ift3")
+            os.system(command3 + " > " + file_ift3)
+    os.remove(file_ift2)
+
+    with open(file_ift3) as f:
+        v = f.readline().replace(",", "\n")
+        new_single_reac = v.split('reactions": [{"bigg_id": "')[1].split('"\n')[0]
+    new_ift = curl_bigg_reaction(new_single_reac, modelgapfill_directory)
+    new_txt = api_file_reorder2(new_ift, verbose=verbose)
+    try:
+        get_string(new_txt, total_strings, verbose=verbose)
+        error_strings.remove(file_txt)
+        os.remove(file_ift3)
+    except:
+        return
+
+def metab_change_names(model_new, verbose=False):
+    """
+    Helper function to find exact metabolites names
+    and replacing the ones added via "get_string()".
+    (Called in the "reframed_reaction_addition()" function).
+
+    Args:
+        model_new               (CBModel): Python-object copy of an existing ".xml" model, as generated via Reframed
+        verbose          (bool, optional): print more info regarding process status. Defaults to False.
+    """
+    comm_list = []
+    for metab in model_new.metabolites.values():
+        metab_mod = str(metab).replace("M_", "", 1).replace("_c", "").replace("_e", "").replace("_p", "").replace("_m", "").replace("_n", "").replace("_x", "").replace("_h", "").replace("_g", "")
+        if metab_mod in old_new_names.keys():
+            command = "model_new.metabolites." + str(metab) + ".name " + "=" + ' "' + old_new_names[metab_mod]+'"'
+            comm_list.append(command)
+            exec(command)
+
+    if verbose:
+        print(str(len(comm_list))+" commands used for METABOLITES name updates") #debug
+
+
+def check_name_changes(model_new):
+    """
+    Helper function to state the status of reactions included in the gap-filled model,
+    i.e. wheter or not they've been renamed according to their proper name.
+    (Called in the "reframed_reaction_addition()" function).
+
+    Args:
+        model_new   (CBModel): Python-object copy of an existing ".xml" model, as generated via Reframed
+    """
+
+    for x in model_new.metabolites.values():
+        if str(x).startswith("M_"):
+            print("ATTENTION Not all METABOLITES names were updated")
+            return
+    print("All METABOLITES names were updated")
+
+
+def reac_change_names(model_new, verbose=False):
+    """
+    Helper function to find the exact reaction names
+    and replace the ones added in the new model via "get_string()".
+    (Called in the "reframed_reaction_addition()" function).
+
+    Args:
+        model_new           (CBModel): Python-object copy of an existing ".xml" model, as generated via Reframed
+        verbose     (bool, optional): print more info regarding process status. Defaults to False.
+    """
+    comm_list = []
+    for reaz in model_new.reactions.values():
+        reaz_mod = str(reaz.name).replace("R_", "", 1)
+        if reaz_mod in old_new_names_R.keys():
+            command = "model_new.reactions."+str(reaz.name)+".name "+"="+' "'+old_new_names_R[reaz_mod]+'"'
+            try:
+                exec(command)
+                comm_list.append(command)
+            except:
+                command2 = "model_new.reactions."+str("R_"+reaz.name)+".name "+"="+' "'+old_new_names_R[reaz_mod]+'"'
+                try:
+                    exec(command2)
+                    comm_list.append(command2)
+                except:
+                    pass
+    if verbose:
+        print(str(len(comm_list))+" commands used for REACTIONS name updates") #debug
+    return
+
+def old_new_names_dict(file):
+    """
+    Helper function to load info regarding correct names
+    for BiGG metabolites.
+
+    Args:
+        file            (str): input ".tsv" file path
+
+    Returns:
+        old_new_names  (dict): Python-dictionary object:
+                                keys: "uncorrected metabolite names"
+                                values: "corrected metabolite names"
+    """
+    old_new_names = {}
+    with open(file) as f:
+        for line in f:
+            line = line.strip().split("\t")
+            try:
+                old, new = line[0], line[1]
+                old_new_names.update({old:new})
+            except:
+                continue
+    return old_new_names
+
+def old_new_names_reac_dict(file):
+    """
+    Helper function to load info regarding correct names
+    for BiGG reactions.
+
+    Args:
+        file                (str): input ".tsv" file path
+
+    Returns:
+        old_new_names_R    (dict): Python-dictionary object:
+                                    keys: "uncorrected reaction names"
+                                    values: "corrected reaction names"
+    """
+    old_new_names_R = {}
+
+    with open(file) as f:
+        for line in f:
+            line = line.strip().split("\t")
+            try:
+                old, new = line[0], line[1]
+                old_new_names_R[old] = new
+            except:
+                continue
+
+    return old_new_names_R
+
+
+def fixed_modules_of_interest(dir_base, fixed_module_file):
+    """
+    Helper function to point out MODULES from a fixed list as in
+    the command-line utilized instructions (".instruction" file).
+
+    Args:
+        dir_base            (str): folder path in which "kemet.py" was executed
+        fixed_module_file   (str): file name of a ".instruction" file with indication of KEGG Modules of interest
+
+    Returns:
+        MODofinterest      (list): Python-list object including Modules of interest
+    """
+
+    with open(path.join(dir_base, fixed_module_file)) as f:
+        MODofinterest = [ line.strip() for line in f ]
+
+    return MODofinterest
+
+
+def onbm_modules_of_interest(fasta_id, oneBM_modules_dir):
+    """
+    Helper function to points out MODULES with 1 block missing as in
+    the command-line utilized instructions (".instruction" file).
+
+    Args:
+        fasta_id            (str): identificative FASTA name for a given MAG/Genome
+        oneBM_modules_dir   (str): output folder of MAG/Genome specific ".instruction" file with KEGG Modules of interest
+
+    Returns:
+        MODofinterest      (list): Python-list object including Modules of interest
+    """
+
+    if fasta_id + "_" + fixed_module_file in os.listdir(oneBM_modules_dir):
+        with open(path.join(oneBM_modules_dir, fasta_id + "_" + fixed_module_file)) as f:
+            MODofinterest = [ line.strip() for line in f ]
+
+    return MODofinterest
+
+
+def KOs_with_HMM_hits(hmm_hits_dir, fastakohits):
+    """
+    Helper function to point out KOs from modules identified with HMM HITS.
+
+    Args:
+        hmm_hits_dir    (str): HMM hits folder path
+        fastakohits     (str): output file from "nhmmer_significant_hits_corr()"
+
+    Returns:
+        KOhits         (list): Python-list object including KOs identified from HMM procedures
+    """
+
+    with open(path.join(hmm_hits_dir, fastakohits)) as f:
+        KOhits = [ line.strip().split("\t")[0]
+                   for line in f.readlines()[1:] ]
+
+    return KOhits
+
+def Modules_KOhits_connection(KOhits, MODofinterest, module_catalog):
+    """
+    Helper function to connect Modules with KOs missing, via dictionary.
+
+    Args:
+        KOhits                  (list): output of "KOs_with_HMM_hits()"
+        MODofinterest           (list): Python-list object including Modules of interest
+        module_catalog          (dict): output of "load_module_catalog()"
+
+    Returns:
+        MODofinterestXKOhits    (dict): Python-dictionary object:
+                                        keys: "Modules of interest"
+                                        values: "KOs missing in the Module"
+    """
+    MODofinterestXKOhits = {}
+
+    for KO in KOhits:
+        if KO == "":
+            continue
+        for module in module_catalog["ko_modules"].get(KO, ()):
+            if module not in MODofinterest:
+                continue
+            MODofinterestXKOhits.setdefault(module, [])
+            MODofinterestXKOhits[module].append(KO)
+
+    return MODofinterestXKOhits
+
+def total_R_from_KOhits(MODofinterestXKOhits, module_catalog):
+    """
+    Point out RN from KOs, via the KEGG Modules catalog.
+
+    Args:
+        MODofinterestXKOhits    (dict): Python-dictionary output of "Modules_KOhits_connection()"
+        module_catalog          (dict): output of "load_module_catalog()"
+
+    Returns:
+        Rtotali_KOhits          (list): Python-list object including KEGG REACTIONS (R) defined by every KO identified from input dicts
+    """
+    Rtotali_KOhits = []
+    KOhits_without_reaction = []
+
+    for module in sorted(MODofinterestXKOhits):
+        if module not in module_catalog["modules"]:
+            continue
+        missingKO = str(MODofinterestXKOhits[module]).replace("[", "").replace("]", "").replace("'", "").split(", ")
+        for KO in missingKO:
+            KO_s = KO.replace("(", "").replace(")", "")
+            KO_split = re.split("[+-]", KO_s)
+            for single_KO in KO_split:
+                reactions = module_catalog["ko_reactions"].get((module, single_KO))
+                if reactions is None:
+                    KOhits_without_reaction.append(single_KO)
+                    continue
+                for single_reac in reactions.split(","):
+                    if single_reac not in Rtotali_KOhits:
+                        Rtotali_KOhits.append(single_reac)
+    return Rtotali_KOhits
+
+def log_bigg_nr(bigg_nonredundant, fasta_id, gapfill_report_directory):
+    """
+    Helper function to save a log file of the output - FORMAT: 1 BiGG per line.
+
+    Args:
+        bigg_nonredundant          (list): Python-list output of "bigg_nonredundant()" function
+        fasta_id                    (str): identificative FASTA name for a given MAG/Genome
+        gapfill_report_directory    (str): output folder path
+    """
+    with open(path.join(gapfill_report_directory, f"bigg_log_{fasta_id}.txt"), "w") as f:
+        for single_bigg in bigg_nonredundant:
+            print(single_bigg, file=f)
+    print("COMPLETE BiGG logging "+fasta_id) #debug
+
+def log_modelseed_nr(modelseed_nonredundant, fasta_id, gapfill_report_directory):
+    """
+    Helper function to save a log file of the output - FORMAT: 1 SEED per line.
+
+    Args:
+        modelseed_nonredundant     (list): Python-list output of "modelseed_nonredundant()" function
+        fasta_id                    (str): identificative FASTA name for a given MAG/Genome
+        gapfill_report_directory    (str): output folder path
+    """
+    with open(path.join(gapfill_report_directory, f"seed_log_{fasta_id}.txt"), "w") as f:
+        for single_rxn in modelseed_nonredundant:
+            print(single_rxn, file=f)
+    print(f"COMPLETE ModelSEED logging {fasta_id}")
+
+def reframed_reaction_addition(fasta_id, model_directory, gapfill_report_directory, bigg_api, verbose=False):
+    """
+    Main function to add reactions linked to HMM-derived genomic evidence
+    obtained from prior KEMET processes.
+    Makes large use of BiGG API to recover info regarding reaction strings.
+    Include said reaction strings in a copy of an existing genome-scale model
+    through the use of Reframed package functions.
+
+    Args:
+        fasta_id                        (str): identificative FASTA name for a given MAG/Genome
+        model_directory                 (str): existing CarveMe model folder path
+        gapfill_report_directory        (str): report output folder path
+        bigg_api                        (str): folder path in which to store files with reaction strings (via BiGG API)
+        verbose              (bool, optional): print more info regarding process status. Defaults to False.
+    """
+    from reframed import load_cbmodel, save_cbmodel # only needed for GSMM gapfill
+
+    datetoday = str(datetime.now())[:10]
+    # MODEL IO VIA REFRAMED
+    for file in sorted(os.listdir(model_directory)):
+        if file.endswith(".xml") and file.startswith(fasta_id):
+            model = load_cbmodel(path.join(model_directory, file))
+
+    # Task: saves reaction to add (from "bigg_nonredundant()") in a list
+            bigg_gapfill = bigg_gapfill_absent_in_model(path.join(gapfill_report_directory, f"bigg_log_{fasta_id}.txt"), model)
+
+    # Task: create a directory to store downloaded reaction from BiGG API
+            new_modelgapfill_directory = model.id + "_gapfill_directory"
+            modelgapfill_directory = bigg_api + new_modelgapfill_directory
+            if not path.isdir(modelgapfill_directory):
+                os.mkdir(modelgapfill_directory)
+
+    # ACTUAL REACTION RESOURCE DOWNLOAD
+            total_strings = []
+            error_strings = []
+
+            with Pool(processes=6) as p: # POSSIBILITY: change number of processes/threads (default = 6)
+                p.starmap(curl_bigg_reaction, [ (reac, modelgapfill_directory) for reac in bigg_gapfill ])
+
+            lista = os.listdir(modelgapfill_directory)
+            for file in lista:
+                if file.endswith(".ift"):
+                    api_file_reorder(path.join(modelgapfill_directory, file), verbose=verbose)
+            lista = sorted(os.listdir(modelgapfill_directory))
+            for file in lista:
+                if file.endswith(".txt"):
+                    try:
+                        get_string(path.join(modelgapfill_directory, file), total_strings, verbose=verbose)
+                    except:
+                        get_string_error(file, error_strings, verbose=verbose)
+                        try:
+                            retry_genes(file.replace(".txt", ""), modelgapfill_directory, verbose=verbose)
+                        except:
+                            pass
+    # Task: adds the reactions to a copy of the model, without those having any non-prokaryotic compartments
+            model_new = model.copy()
+            exo_comp_reacs = []
+            added_reacs = []
+
+            for reac in total_strings:
+                reacs = reac.strip().split(" ")
+                for element in reacs:
+                    if element.endswith("_n") or element.endswith("_g") or element.endswith("_h") or element.endswith("_x") or element.endswith("_m") or element.endswith("_r") or element.endswith("_v"):
+                        exo_comp_reacs.append(reac)
+                        break
+
+            for reac in total_strings:
+                if reac in exo_comp_reacs:
+                    continue
+                model_new.add_reaction_from_str(reac)
+                added_reacs.append(reac)
+
+                if verbose:
+                    print(f"ADDED {reac}") #debug
+
+    # Task:  saves a LOGfile with the reactions ACTUALLY ADDED to the model
+            with open(path.join(gapfill_report_directory, f"{model.id}_added_reactions.txt"), "w") as f:
+                for reac in added_reacs:
+                    print(reac, file=f)
 
-def retry_genes(file_txt, verbose=False):
+    # Task:  checks namespace quality for metabolites and saves the new gap-filled model
+            if verbose:
+                metab_change_names(model_new, verbose=verbose)
+                reac_change_names(model_new, verbose=verbose)
+                check_name_changes(model_new)
+
+            save_cbmodel(model_new, path.join(gapfilled_model_directory, f"{model_new.id}_KEGGadd_{datetoday}.xml"), flavor='bigg')
+
+def recap_addition(fasta_id, gapfill_report_directory, old_new_names_R):
     """
-    Helper function to try a different BiGG API request to
-    extract reaction strings.
-    (Called in the "reframed_reaction_addition()" function).
+    Stores RECAP informations for reaction addition
+    (via "existing" GSMM procedures, specified in command-line args) as performed in each model.
+    This function generates a final tabular output of the GSMM process.
 
     Args:
-        file_txt                (str): name of a modified intermediate flat file (".txt") including a reaction string
-        verbose      (bool, optional): print more info regarding process status. Defaults to False.
+        fasta_id                    (str): identificative FASTA name for a given MAG/Genome
+        gapfill_report_directory    (str): output folder path
+        old_new_names_R            (dict): Python-dictionary output of "old_new_names_reac_dict()" function
     """
-    cmd_line = "curl --silent 'http://bigg.ucsd.edu/api/v2/search?query=GENE&search_type=genes'"
-    el = file_txt
-    command2 = cmd_line.replace("GENE", el)
-    file_ift2 = str(el) + ".ift2"
-    os.system(command2 + " > " + file_ift2)
-    if verbose:
-        print(str(el) + " phase .ift2")
+    datetoday = str(datetime.now())[:10]
 
-    with open(file_ift2) as f:
-        v = f.readline()
-        v1 = v.split("}")[0].split("[")[1].replace("{", "").split(", ")
-        bigg_id = v1[0].replace('"', "").split(": ")[1]
-        name = v1[1].replace('"', "").split(": ")[1]
-        model_bigg_id = v1[3].replace('"', "").split(": ")[1]
-        if name != el:
-            if verbose:
-                print(str(el)+" string NOT PASSED AGAIN")
+    with open(path.join(gapfill_report_directory, f"recap_gapfill_{datetoday}.tsv"), "a") as f:
+        if f.tell() == 0:
+            print("MAG", "STRING", "NAME", sep="\t", file=f)
 
-            os.remove(file_ift2)
-            return
-        else:
-            cmd_line2 = "curl --silent 'http://bigg.ucsd.edu/api/v2/models/MODEL/genes/BIGG'"
-            command3 = cmd_line2.replace("MODEL", model_bigg_id).replace("BIGG", bigg_id)
-            file_ift3 = str(el) + ".ift3"
-            os.system(command3 + " > " + file_ift3)
-    os.remove(file_ift2)
+        for file in sorted(os.listdir(gapfill_report_directory)):
+            if file.endswith("_added_reactions.txt") and fasta_id in file:
+                with open(path.join(gapfill_report_directory, file)) as g:
+                    MAG = file[:-20]
+                    for line in g:
+                        STRING = line.strip()
+                        if STRING == "":
+                            continue
+                        reac_id = STRING.split(": ")[0].replace("R_", "")
+                        NAME = old_new_names_R[reac_id]
+                        print(MAG, STRING, NAME, sep="\t", file=f)
 
-    with open(file_ift3) as f:
-        v = f.readline().replace(",", "\n")
-        new_single_reac = v.split('reactions": [{"bigg_id": "')[1].split('"\n')[0]
-    new_ift = curl_bigg_reaction(new_single_reac)
-    new_txt = api_file_reorder2(new_ift, verbose=verbose)
-    try:
-        get_string(new_txt, total_strings, verbose=verbose)
-        error_strings.remove(file_txt)
-        os.remove(file_ift3)
-    except:
-        return
 
-def metab_change_names(model_new, verbose=False):
+def read_genomes_instruction(dir_base, instruction_file):
     """
-    Helper function to find exact metabolites names
-    and replacing the ones added via "get_string()".
-    (Called in the "reframed_reaction_addition()" function).
+    Reads the "genomes.instruction" file once, i.e. the KEGG taxonomy and GSMM metabolic universe
+    of each MAG/Genome of interest.
 
     Args:
-        model_new               (CBModel): Python-object copy of an existing ".xml" model, as generated via Reframed
-        verbose          (bool, optional): print more info regarding process status. Defaults to False.
-    """
-    comm_list = []
-    for metab in model_new.metabolites.values():
-        metab_mod = str(metab).replace("M_", "", 1).replace("_c", "").replace("_e", "").replace("_p", "").replace("_m", "").replace("_n", "").replace("_x", "").replace("_h", "").replace("_g", "")
-        if metab_mod in old_new_names.keys():
-            command = "model_new.metabolites." + str(metab) + ".name " + "=" + ' "' + old_new_names[metab_mod]+'"'
-            comm_list.append(command)
-            exec(command)
+        dir_base            (str): folder path in which "kemet.py" was executed
+        instruction_file    (str): ".instruction" file name with MAGs/Genomes indications
 
-    if verbose:
-        print(str(len(comm_list))+" commands used for METABOLITES name updates") #debug
+    Returns:
+        genomes_instruction (dict): Python-dictionary object:
+                                    keys: "FASTA file name"
+                                    values: (KEGG taxonomy, metabolic universe)
+    """
+    genomes_instruction = {}
+    with open(path.join(dir_base, instruction_file)) as f:
+        for line in f.readlines()[1:]:
+            line = line.strip().split("\t")
+            if len(line) < 2:
+                continue
+            metabolic_universe = line[2] if len(line) == 3 else "bacteria"
+            genomes_instruction[line[0]] = (line[1], metabolic_universe)
 
+    return genomes_instruction
 
-def check_name_changes(model_new):
+def annotation_files(annotation_directory, annotation_format):
     """
-    Helper function to state the status of reactions included in the gap-filled model,
-    i.e. wheter or not they've been renamed according to their proper name.
-    (Called in the "reframed_reaction_addition()" function).
+    Lists the KO pre-annotation files of a folder by MAG/Genome, i.e. files named after the MAG/Genome
+    with the default extension of the annotation format (possibly compressed).
 
     Args:
-        model_new   (CBModel): Python-object copy of an existing ".xml" model, as generated via Reframed
-    """
-
-    for x in model_new.metabolites.values():
-        if str(x).startswith("M_"):
-            print("ATTENTION Not all METABOLITES names were updated")
-            return
-    print("All METABOLITES names were updated")
+        annotation_directory    (str): KO pre-annotation files folder path
+        annotation_format       (str): KO pre-annotation format (either "eggnog", "kaas" or "kofamkoala")
 
+    Returns:
+        annotation_index       (dict): Python-dictionary object {MAG/Genome name : pre-annotation file name}
+    """
+    annotation_index = {}
+    for file in sorted(os.listdir(annotation_directory)):
+        for compression in _compression_suffixes:
+            if file.endswith(compression):
+                uncompressed = file[:-len(compression)]
+                break
+        else:
+            uncompressed = file
+        for suffix in _annotation_suffixes[annotation_format]:
+            if uncompressed.endswith(suffix) and len(uncompressed) > len(suffix):
+                annotation_index.setdefault(uncompressed[:-len(suffix)], file)
+    return annotation_index
 
-def reac_change_names(model_new, verbose=False):
+def kmc_for_genome(FASTA_file, args, kk_database, annotation_index=None, io=None):
     """
-    Helper function to find the exact reaction names
-    and replace the ones added in the new model via "get_string()".
-    (Called in the "reframed_reaction_addition()" function).
+    KEGG Modules completeness stage for a single MAG/Genome:
+    converts its KO pre-annotation into a ".ktest" file, then writes the completeness reports.
 
     Args:
-        model_new           (CBModel): Python-object copy of an existing ".xml" model, as generated via Reframed
-        verbose     (bool, optional): print more info regarding process status. Defaults to False.
+        FASTA_file              (str): MAG/Genome FASTA file, with or without path indication
+        args              (Namespace): command-line arguments
+        kk_database            (dict): output of "load_kk_database()"
+        annotation_index (dict, optional): output of "annotation_files()", e.g. listed once for a batch.
+                                           Defaults to None (the pre-annotation folder is listed).
+        io           (dict, optional): output of "io_directories()". Defaults to None (folders set via "set_io_directories()").
+
+    Returns:
+        genome_state           (dict): output of "testcompleteness()" (None if no pre-annotation was found)
     """
-    comm_list = []
-    for reaz in model_new.reactions.values():
-        reaz_mod = str(reaz.name).replace("R_", "", 1)
-        if reaz_mod in old_new_names_R.keys():
-            command = "model_new.reactions."+str(reaz.name)+".name "+"="+' "'+old_new_names_R[reaz_mod]+'"'
-            try:
-                exec(command)
-                comm_list.append(command)
-            except:
-                command2 = "model_new.reactions."+str("R_"+reaz.name)+".name "+"="+' "'+old_new_names_R[reaz_mod]+'"'
-                try:
-                    exec(command2)
-                    comm_list.append(command2)
-                except:
-                    pass
-    if verbose:
-        print(str(len(comm_list))+" commands used for REACTIONS name updates") #debug
-    return
+    if io is None:
+        io = _current_io_directories()
+    # from path indication of a contig file maintain file_name
+    file_name = str(FASTA_file).rsplit("/", 1)[-1].replace(".fasta", "").replace(".fna", "").replace(".fa", "")
+    if LOGflag:
+        logging.info(f'+++ \tSTART {file_name}')
+        logging.info('++ START KEGG Modules completeness')
+
+    converters = {"kaas": KAASXktest, "eggnog": eggnogXktest, "kofamkoala": kofamXktest}
+    annotation_file = getattr(args, "annotation_file", None)
+    if annotation_file is None:
+        # pre-annotation named after the MAG/Genome, possibly compressed
+        if annotation_index is None:
+            annotation_index = annotation_files(io["KAnnotation_directory"], args.annotation_format)
+        annotation_file = annotation_index.get(file_name)
+
+    ktest = None
+    if annotation_file is not None:
+        if args.verbose:
+            print(f"converting {args.annotation_format} file {annotation_file}")
+        ktest, KOs = converters[args.annotation_format](annotation_file, file_name+".ktest", io["KAnnotation_directory"], io["ktests_directory"])
+
+    if ktest is None:
+        print(_timeinfo(), f"NO KO annotation found for {file_name}", sep="\t")
+        return None
+
+    ko_list = list(KOs)
+    kmc_cache = getattr(args, "kmc_cache", None)
+    genome_state = testcompleteness(ko_list, kk_database, io["report_txt_directory"], "reportKMC_"+ktest[:-6]+".txt",
+                                    io["report_tsv_directory"], "reportKMC_"+ktest[:-6]+".tsv", as_kegg=args.as_kegg,
+                                    cache_directory=io["kmc_cache_directory"] if kmc_cache else None,
+                                    cache_size=(kmc_cache or 0)*2**20)
+    if LOGflag:
+        logging.info('COMPLETE KEGG Modules completeness')
 
-def old_new_names_dict(file):
+    return genome_state
+
+def hmm_kos_for_genome(FASTA, taxonomy, args, genome_state=None, io=None):
     """
-    Helper function to load info regarding correct names
-    for BiGG metabolites.
+    Selects the KOs of interest of a single MAG/Genome for the HMM stage, in its ".klist" file.
+    With the KEGG Modules completeness of the same run, KOs of interest are the ranked candidates
+    completing the missing blocks (see "completion_candidates()"), otherwise they are read from report files.
 
     Args:
-        file            (str): input ".tsv" file path
+        FASTA                   (str): identificative FASTA name for a given MAG/Genome - with extension
+        taxonomy                (str): KEGG Brite taxonomy for MAG/Genome of interest, from the "genomes.instruction" file
+        args              (Namespace): command-line arguments
+        genome_state (dict, optional): output of "kmc_for_genome()". Defaults to None.
+        io           (dict, optional): output of "io_directories()". Defaults to None (folders set via "set_io_directories()").
 
     Returns:
-        old_new_names  (dict): Python-dictionary object:
-                                keys: "uncorrected metabolite names"
-                                values: "corrected metabolite names"
+        completion             (dict): output of "completion_candidates()" (None if not computed)
     """
-    old_new_names = {}
-    with open(file) as f:
-        for line in f:
-            line = line.strip().split("\t")
-            try:
-                old, new = line[0], line[1]
-                old_new_names.update({old:new})
-            except:
-                continue
-    return old_new_names
+    if io is None:
+        io = _current_io_directories()
+    os.makedirs(io["oneBM_modules_dir"], exist_ok=True)
+    fasta_id = FASTA.replace(".fasta", "").replace(".fna", "").replace(".fa", "")
+    dir_KO = path.join(io["dir_base_KO"], taxonomy.replace(" ", "_")) + "/"
+    completion = None
+    if args.hmm_mode == "modules":
+        tuple_modules = create_tuple_modules(path.join(io["dir_base"], fixed_module_file))
+    if args.hmm_mode == "onebm":
+        tuple_modules = create_tuple_modules_1BM(fasta_id, fixed_module_file, io["oneBM_modules_dir"], io["report_tsv_directory"],
+                                                 genome_state=genome_state, as_kegg=args.as_kegg)
+    if args.hmm_mode in ("modules", "onebm"):
+        if genome_state is not None:
+            Kmissing = { KO for kk_file, result in genome_state["results"].items()
+                         if kk_file[:-3] in tuple_modules for KO in result["Kmissing"] }
+            ko_costs = ko_reference_costs(Kmissing, dir_KO)
+            completion = completion_candidates(genome_state, modules=tuple_modules, ko_costs=ko_costs,
+                                               max_candidates=getattr(args, "max_candidates", None))
+            write_KOs_from_candidates(fasta_id, completion, io["klists_directory"])
+        else:
+            write_KOs_from_modules(fasta_id, tuple_modules, io["report_txt_directory"], io["klists_directory"])
+    if args.hmm_mode == "kos":
+        write_KOs_from_fixed_list(fasta_id, path.join(io["dir_base"], fixed_ko_file), io["ktests_directory"], io["klists_directory"])
 
-def old_new_names_reac_dict(file):
+    return completion
+
+def hmm_for_genome(FASTA, taxonomy, args, genome_state=None, io=None, planned=False):
     """
-    Helper function to load info regarding correct names
-    for BiGG reactions.
+    HMM stage for a single MAG/Genome: selects KOs of interest (see "hmm_kos_for_genome()"), downloads and aligns
+    KEGG GENES nt sequences, builds profile HMMs and searches them against the MAG/Genome.
 
     Args:
-        file                (str): input ".tsv" file path
+        FASTA                   (str): identificative FASTA name for a given MAG/Genome - with extension
+        taxonomy                (str): KEGG Brite taxonomy for MAG/Genome of interest, from the "genomes.instruction" file
+        args              (Namespace): command-line arguments
+        genome_state (dict, optional): output of "kmc_for_genome()". Defaults to None.
+        io           (dict, optional): output of "io_directories()". Defaults to None (folders set via "set_io_directories()").
+        planned      (bool, optional): KOs of interest already selected, and their taxonomy profile HMMs built
+                                       by the plan of a batch ("--shared_profiles", see "run_batch()"). Defaults to False.
 
     Returns:
-        old_new_names_R    (dict): Python-dictionary object:
-                                    keys: "uncorrected reaction names"
-                                    values: "corrected reaction names"
+        fasta_genome            (str): identificative FASTA name (including path) for the MAG/Genome
     """
-    old_new_names_R = {}
+    if io is None:
+        io = _current_io_directories()
+    for folder in ("msa_dir", "hmm_dir", "hmm_hits_dir"):
+        os.makedirs(io[folder], exist_ok=True)
+    for file in sorted(os.listdir(io["dir_genomes"])):
+        if file == FASTA:
+            fasta_genome = path.join(io["dir_genomes"], FASTA)
 
-    with open(file) as f:
-        for line in f:
-            line = line.strip().split("\t")
-            try:
-                old, new = line[0], line[1]
-                old_new_names_R[old] = new
-            except:
-                continue
+    fasta_id = FASTA.replace(".fasta", "").replace(".fna", "").replace(".fa", "")
+    klist_file = fasta_id+".klist"
+    taxa_file = taxonomy+".keg"
+    dir_KO = path.join(io["dir_base_KO"], taxonomy.replace(" ", "_")) + "/"     # KO folder for taxonomy,    save time!
+    completion = None
+    if not planned:
+        completion = hmm_kos_for_genome(FASTA, taxonomy, args, genome_state=genome_state, io=io)
 
-    return old_new_names_R
+    msa_dir_comm = path.join(io["msa_dir"], fasta_id) + "/"                      # MSA folder for MAG/Genome, more ordered!
+    hmm_dir_comm = path.join(io["hmm_dir"], fasta_id) + "/"                      # HMM folder for MAG/Genome, more ordered!
+    CORR_THRESHOLD = float(args.threshold_value)
 
+#### HMM - OPERATE SINGLE FUNCTIONS
+    print(_timeinfo(), f"++ START HMM operations {fasta_id}", sep="\t")
+    if LOGflag:
+        logging.info(f'++ START HMM operations {fasta_id}')
+    update_taxa = not planned and (args.update_taxonomy_codes or taxa_file not in os.listdir(io["taxa_dir"]))
+    taxa_allow = taxonomy_filter(taxonomy, io["dir_base"], taxa_file, io["taxa_dir"], update=update_taxa)
+
+    early_stop = getattr(args, "early_stop", False)
+    if early_stop and completion is None:
+        print(_timeinfo(), "early stopping needs the KEGG Modules completeness of this run (\"--hmm_mode onebm/modules\"): each KO is searched", sep="\t")
+        early_stop = False
+    if not args.skip_nt_download and not early_stop and not planned:
+        if LOGflag:
+            logging.info('START download nucleotidic sequences')
+        download_ntseq_of_KO(klist_file, io["dir_base_KO"], dir_KO, io["klists_directory"], io["taxa_dir"], taxa_file, io["kegg_url"], io=io)
+        if LOGflag:
+            logging.info('COMPLETE download nucleotidic sequences')
+    if args.retry_nhmmer:
+        # POSSIBILITY: after a whole KEMET run, to try other parameters
+        movebackHMM(hmm_dir_comm, msa_dir_comm)
+    shared_taxonomy = taxonomy if getattr(args, "shared_profiles", False) else None
+    if early_stop:
+        hmm_by_blocks(completion, fasta_id, fasta_genome, taxa_allow, dir_KO, download=not args.skip_nt_download,
+                      build=not args.skip_msa_and_hmmbuild, corr_threshold=CORR_THRESHOLD, log=LOGflag, taxonomy=shared_taxonomy, io=io)
+    elif shared_taxonomy is not None:
+        nhmmer_with_taxonomy_profiles(klist_file, io["klists_directory"], fasta_genome, msa_dir_comm, taxonomy, taxa_allow, dir_KO,
+                                      build=not args.skip_msa_and_hmmbuild and not planned, download=not args.skip_nt_download,
+                                      log=LOGflag, io=io)
+    else:
+        if not args.skip_msa_and_hmmbuild:
+            if LOGflag:
+                logging.info('START sequences filtering and alignment')
+            filter_and_align(io["taxa_dir"], taxa_file, fasta_id, klist_file, io["klists_directory"], io["msa_dir"], dir_KO,
+                             download=not args.skip_nt_download, io=io)
+            if LOGflag:
+                logging.info('COMPLETE Filter and align')
+            MSA_and_HMM(msa_dir_comm, io["base_com_mafft"], io["base_com_hmmbuild"], log=LOGflag)
+        nhmmer_for_genome(fasta_genome, msa_dir_comm, io["base_com_nhmmer"])
+    if LOGflag:
+        logging.info('COMPLETE nhmmer')
+    move_HMM_and_clean(hmm_dir_comm, msa_dir_comm)
 
-def fixed_modules_of_interest(dir_base, fixed_module_file):
+#### HMM - FIRST REPORT FILE
+    nhmmer_significant_hits_corr(fasta_id, hmm_dir_comm, corr_threshold=CORR_THRESHOLD, hmm_hits_dir=io["hmm_hits_dir"])
+    if LOGflag:
+        logging.info('COMPLETE nhmmer significant hits')
+    HMM_hits_dict = HMM_hits_sequences(io["hmm_hits_dir"], io["dir_genomes"])
+    HMM_hits_TRANSLATED_dict = HMM_hits_translated_sequences(HMM_hits_dict)
+    HMM_hits_longestTRANSLATED_dict = HMM_hits_longest_translated_sequences(HMM_hits_dict, HMM_hits_TRANSLATED_dict)
+
+#### HMM - WHOLE RUN REPORT FILE
+    recap_hits_corr(fasta_id, io["hmm_hits_dir"], HMM_hits_dict, HMM_hits_longestTRANSLATED_dict, run_start)
+
+    return fasta_genome
+
+def gsmm_for_genome(FASTA, fasta_genome, universe, args, io=None):
     """
-    Helper function to point out MODULES from a fixed list as in
-    the command-line utilized instructions (".instruction" file).
+    GSMM stage for a single MAG/Genome: de-novo model reconstruction or
+    gapfill of an existing model, with reactions connected to HMM-derived KOs.
 
     Args:
-        dir_base            (str): folder path in which "kemet.py" was executed
-        fixed_module_file   (str): file name of a ".instruction" file with indication of KEGG Modules of interest
-
-    Returns:
-        MODofinterest      (list): Python-list object including Modules of interest
+        FASTA                   (str): identificative FASTA name for a given MAG/Genome - with extension
+        fasta_genome            (str): identificative FASTA name (including path) for the MAG/Genome
+        universe                (str): CarveMe metabolic universe, from the "genomes.instruction" file
+        args              (Namespace): command-line arguments
+        io           (dict, optional): output of "io_directories()". Defaults to None (folders set via "set_io_directories()").
     """
+    # needed by "build_de_novo_GSMM()" and names updates
+    global metabolic_universe, old_new_names, old_new_names_R, _module_catalog
 
-    os.chdir(dir_base)
+    if io is None:
+        io = _current_io_directories()
+    fasta_id = FASTA.replace(".fasta", "").replace(".fna", "").replace(".fa", "")
+    metabolic_universe = universe
 
-    with open(fixed_module_file) as f:
-        MODofinterest = [ line.strip() for line in f ]
+    if args.hmm_mode == "kos" and args.gsmm_mode == "existing":
+        print('''
+        The GSMM operations chosen are not compatible with the HMM mode, therefore no gapfilling would be performed.
+        ''')
+        return
 
-    return MODofinterest
+#### GSMM - OPERATE SINGLE FUNCTIONS
+    if args.gsmm_mode == "denovo" or args.gsmm_mode == "existing":
+        if LOGflag:
+            logging.info('++ START GSMM operations '+fasta_id)
 
+        fastakohits = fasta_id+"_HMM_hits.txt"
+        current_run = "KEMET_run_"+run_start
 
-def onbm_modules_of_interest(fasta_id, oneBM_modules_dir):
+        if args.gsmm_mode == "denovo":
+            build_de_novo_GSMM(FASTA, fasta_genome, de_novo_model_directory, current_run, log=LOGflag, hmm_hits_dir=io["hmm_hits_dir"])
+
+        elif args.gsmm_mode == "existing":
+            if _module_catalog is None:
+                _module_catalog = load_module_catalog(Modules_directory)
+            DB_KEGG_RN = KEGG_BiGG_SEED_RN_dict("reactions_DB.tsv", DB_directory, ontology="BiGG")
+            old_new_names = old_new_names_dict(path.join(DB_directory, "metabolites_names_from_id_bigg.tsv"))
+            old_new_names_R = old_new_names_reac_dict(path.join(DB_directory, "reactions_names_from_id_bigg.tsv"))
+
+            if args.hmm_mode == "modules":
+                MODofinterest = fixed_modules_of_interest(io["dir_base"], fixed_module_file)
+            if args.hmm_mode == "onebm":
+                MODofinterest = onbm_modules_of_interest(fasta_id, io["oneBM_modules_dir"])
+
+            KOhits = KOs_with_HMM_hits(io["hmm_hits_dir"], fastakohits)
+            MODofinterestXKOhits = Modules_KOhits_connection(KOhits, MODofinterest, _module_catalog)
+            Rtotali_KOhits = total_R_from_KOhits(MODofinterestXKOhits, _module_catalog)
+
+            KEGG_R_to_add = keggR_in_DB(Rtotali_KOhits, DB_KEGG_RN)
+#### GSMM - REACTION ADDITION + RECAP
+            v_bigg_nonredundant = bigg_nonredundant(KEGG_R_to_add, DB_KEGG_RN)
+            log_bigg_nr(v_bigg_nonredundant, fasta_id, gapfill_report_directory)
+            reframed_reaction_addition(fasta_id, model_directory, gapfill_report_directory, bigg_api, verbose=args.verbose)
+            recap_addition(fasta_id, gapfill_report_directory, old_new_names_R)
+
+def run_genome(FASTA_file, args, kk_database, genomes_instruction, annotation_index=None, io=None, planned=False):
     """
-    Helper function to points out MODULES with 1 block missing as in
-    the command-line utilized instructions (".instruction" file).
+    Runs the command-line selected KEMET stages (KEGG Modules completeness, HMM, GSMM) for a single MAG/Genome.
+    The shared sequence cache is not bounded here, see "evict_after_run()".
 
     Args:
-        fasta_id            (str): identificative FASTA name for a given MAG/Genome
-        oneBM_modules_dir   (str): output folder of MAG/Genome specific ".instruction" file with KEGG Modules of interest
-
-    Returns:
-        MODofinterest      (list): Python-list object including Modules of interest
+        FASTA_file              (str): MAG/Genome FASTA file, with or without path indication
+        args              (Namespace): command-line arguments
+        kk_database            (dict): output of "load_kk_database()"
+        genomes_instruction    (dict): output of "read_genomes_instruction()"
+        annotation_index (dict, optional): output of "annotation_files()". Defaults to None.
+        io           (dict, optional): output of "io_directories()". Defaults to None (folders set via "set_io_directories()").
+        planned      (bool, optional): KEGG Modules completeness and KOs of interest already done by the plan of a batch
+                                       (see "run_batch()"). Defaults to False.
     """
+    genome_state = None
+    if not planned:
+        genome_state = kmc_for_genome(FASTA_file, args, kk_database, annotation_index=annotation_index, io=io)
+    if args.skip_hmm:
+        return
 
-    os.chdir(oneBM_modules_dir)
+    FASTA = str(FASTA_file).rsplit("/", 1)[-1]
+    if FASTA not in genomes_instruction:
+        return
+    taxonomy, universe = genomes_instruction[FASTA]
+    fasta_id = FASTA.replace(".fasta", "").replace(".fna", "").replace(".fa", "")
 
-    if fasta_id + "_" + fixed_module_file in os.listdir():
-        with open(fasta_id + "_" + fixed_module_file) as f:
-            MODofinterest = [ line.strip() for line in f ]
+    fasta_genome = hmm_for_genome(FASTA, taxonomy, args, genome_state=genome_state, io=io, planned=planned)
+    if args.skip_gsmm:
+        return
 
-    return MODofinterest
+    gsmm_for_genome(FASTA, fasta_genome, universe, args, io=io)
 
+    print(_timeinfo(), f"END {fasta_id}\n", sep="\t")
+    if LOGflag:
+        logging.info(f"END {fasta_id}\n")
 
-def KOs_with_HMM_hits(hmm_hits_dir, fastakohits):
+def evict_after_run(args, run_time, io=None):
     """
-    Helper function to point out KOs from modules identified with HMM HITS.
+    Bounds the shared sequence cache once a KEMET run is complete (see "evict_sequence_cache()"),
+    keeping the sequences used since the run started. It is not done after each MAG/Genome,
+    as sequences of the run (e.g. of other MAGs/Genomes of the same taxonomy in a batch) are still needed.
 
     Args:
-        hmm_hits_dir    (str): HMM hits folder path
-        fastakohits     (str): output file from "nhmmer_significant_hits_corr()"
+        args              (Namespace): command-line arguments
+        run_time              (float): start of the run, in seconds since the epoch
+        io           (dict, optional): output of "io_directories()". Defaults to None (folders set via "set_io_directories()").
 
     Returns:
-        KOhits         (list): Python-list object including KOs identified from HMM procedures
+        evicted                 (int): number of evicted sequences
+    """
+    if args.skip_hmm or args.skip_nt_download:
+        return 0
+    evicted = evict_sequence_cache(getattr(args, "seq_cache_size", _def_seq_cache_size)*2**20, keep_since=run_time, io=io)
+    if evicted and args.verbose:
+        print(_timeinfo(), f"{evicted} sequences evicted from the sequence cache", sep="\t")
+    return evicted
+
+def batch_genomes(batch, dir_base, dir_genomes):
+    """
+    Lists the MAGs/Genomes of a batch run, either from an ".instruction" file (1st column)
+    or from a glob pattern of FASTA files (also searched in the genomes folder).
+
+    Args:
+        batch               (str): ".instruction" file path or FASTA files glob pattern
+        dir_base            (str): folder path in which "kemet.py" was executed
+        dir_genomes         (str): genomes folder path
+
+    Returns:
+        genomes            (list): Python-list object including the FASTA file names of the batch
     """
+    if path.isfile(path.join(dir_base, batch)):
+        with open(path.join(dir_base, batch)) as f:
+            genomes = [ line.split("\t")[0].strip() for line in f.readlines()[1:] if line.strip() ]
+    else:
+        matches = glob.glob(path.join(dir_base, batch)) or glob.glob(path.join(dir_genomes, batch))
+        genomes = [ match.rsplit("/", 1)[-1] for match in sorted(matches) ]
 
-    os.chdir(hmm_hits_dir)
+    return list(dict.fromkeys(genomes))
 
-    with open(fastakohits) as f:
-        KOhits = [ line.strip().split("\t")[0]
-                   for line in f.readlines()[1:] ]
+def _run_config():
+    """
+    Helper function to collect the run settings set by "main()" as module variables
+    (IO folders, KEGG API and HMM commands settings, log), to be applied in batch worker processes.
 
-    return KOhits
+    Returns:
+        config                 (dict): Python-dictionary object {variable name : value}, see _run_config_names
+    """
+    return { name: globals()[name] for name in _run_config_names }
 
-def Modules_KOhits_connection(KOhits, MODofinterest):
+def _apply_run_config(config):
     """
-    Helper function to connect Modules with KOs missing, via dictionary.
+    Helper function to apply the run settings of "_run_config()" in this process.
 
     Args:
-        KOhits                  (list): output of "KOs_with_HMM_hits()"
-        MODofinterest           (list): Python-list object including Modules of interest
+        config                 (dict): output of "_run_config()"
+    """
+    globals().update(config)
+    if LOGflag:
+        _start_log()
 
-    Returns:
-        MODofinterestXKOhits    (dict): Python-dictionary object:
-                                        keys: "Modules of interest"
-                                        values: "KOs missing in the Module"
+def _start_log(KEMET_args=None):
     """
-    MODofinterestXKOhits = {}
+    Helper function to store KEMET commands and progress in the log file of the run.
 
-    for KO in KOhits:
-        if KO == "":
-            continue
-        Modules = searchKeggShort(list_all_mod, Modules_directory, KO)
-        for module in Modules:
-            if module not in MODofinterest:
-                continue
-            MODofinterestXKOhits.setdefault(module, [])
-            MODofinterestXKOhits[module].append(KO)
+    Args:
+        KEMET_args    (str, optional): command-line arguments, to be logged. Defaults to None.
+    """
+    global LOGflag, logging
+    import logging
+    LOGflag = True
+    logging.basicConfig(filename=run_start+'_KEMET_execution.log',
+                        level=logging.INFO, format='%(asctime)s %(message)s')
+    if KEMET_args is not None:
+        logging.info('KEMET arguments: ' + KEMET_args)
 
-    return MODofinterestXKOhits
+def _batch_worker_init(kk_database, config, annotation_index=None):
+    """
+    Helper function to set each batch worker process: the shared compiled KEGG Modules database,
+    the pre-annotation files index and the run settings, since worker processes may not inherit them
+    (e.g. "spawn" start method).
+
+    Args:
+        kk_database            (dict): output of "load_kk_database()"
+        config                 (dict): output of "_run_config()"
+        annotation_index (dict, optional): output of "annotation_files()". Defaults to None.
+    """
+    global _worker_kk_database, _worker_annotation_index
+    _worker_kk_database = kk_database
+    _worker_annotation_index = annotation_index
+    _apply_run_config(config)
 
-def modules_flat_files_connection(list_all_mod, MODofinterestXKOhits):
+def _run_batch_genome(FASTA, args, genomes_instruction, kk_database=None, annotation_index=None, io=None, planned=False):
     """
-    Connect Modules' names with the Modules flatfiles, via dictionary.
+    Helper function to run a MAG/Genome of a batch, within a batch worker.
+    (Called in the "run_batch()" function).
 
     Args:
-        list_all_mod            (list): output of "list_all_modules()" function
-        MODofinterestXKOhits    (dict): Python-dictionary output of "Modules_KOhits_connection()"
+        FASTA                   (str): FASTA file name
+        args              (Namespace): command-line arguments
+        genomes_instruction    (dict): output of "read_genomes_instruction()"
+        kk_database  (dict, optional): output of "load_kk_database()". Defaults to the one set via "_batch_worker_init()".
+        annotation_index (dict, optional): output of "annotation_files()". Defaults to the one set via "_batch_worker_init()".
+        io           (dict, optional): output of "io_directories()". Defaults to None (folders set via "set_io_directories()").
+        planned      (bool, optional): see "run_genome()". Defaults to False.
 
     Returns:
-        modulesXflat            (dict): Python-dictionary object:
-                                        keys: "KEGG Module id" - format: [Mxxxxx]
-                                        values: "KEGG Module name"
+        failed                 (list): Python-list object of (FASTA file name, error message), empty if the MAG/Genome did not fail
     """
-    modulesXflat = {}
-
-    for module_txt in list_all_mod:
-        for module in MODofinterestXKOhits.keys():
-            if module_txt.startswith(module):
-                modulesXflat.update({module:module_txt})
-    return modulesXflat
+    if kk_database is None:
+        kk_database = _worker_kk_database
+        annotation_index = _worker_annotation_index
+    try:
+        run_genome(FASTA, args, kk_database, genomes_instruction, annotation_index=annotation_index, io=io, planned=planned)
+    except Exception as e:
+        return [(FASTA, f"{type(e).__name__}: {e}")]
+    return []
 
-def total_R_from_KOhits(MODofinterestXKOhits, modulesXflat, Modules_directory):
+def _plan_batch_genome(FASTA, args, genomes_instruction, kk_database=None, annotation_index=None, io=None):
     """
-    Point out RN from KOs, scanning in Modules flatfiles.
+    Helper function to run the KEGG Modules completeness of a MAG/Genome of a batch and select its KOs of interest,
+    before the taxonomy profile HMMs of the batch are built. (Called in the "run_batch()" function).
 
     Args:
-        MODofinterestXKOhits    (dict): Python-dictionary output of "Modules_KOhits_connection()"
-        modulesXflat            (dict): Python-dictionary output of "modules_flat_files_connection()"
-        Modules_directory        (str): KEGG Modules flat-files folder path
+        FASTA                   (str): FASTA file name
+        args              (Namespace): command-line arguments
+        genomes_instruction    (dict): output of "read_genomes_instruction()"
+        kk_database  (dict, optional): output of "load_kk_database()". Defaults to the one set via "_batch_worker_init()".
+        annotation_index (dict, optional): output of "annotation_files()". Defaults to the one set via "_batch_worker_init()".
+        io           (dict, optional): output of "io_directories()". Defaults to None (folders set via "set_io_directories()").
 
     Returns:
-        Rtotali_KOhits          (list): Python-list object including KEGG REACTIONS (R) defined by every KO identified from input dicts
+        failed                 (list): Python-list object of (FASTA file name, error message), empty if the MAG/Genome did not fail
     """
-    Rtotali_KOhits = []
-    KOhits_without_reaction = []
-
-    os.chdir(Modules_directory)
-    for module, module_txt in modulesXflat.items():
-        missingKO = str(MODofinterestXKOhits[module]).replace("[", "").replace("]", "").replace("'", "").split(", ")
-        KOreac_module = knum4reac_mod(module_txt)
-        for KO in missingKO:
-            KO_s = KO.replace("(", "").replace(")", "")
-            KO_split = re.split("[+-]", KO_s)
-            for single_KO in KO_split:
-                try:
-                    reac_missing = KOreac_module[single_KO].split(",")
-                    for single_reac in reac_missing:
-                        if single_reac not in Rtotali_KOhits:
-                            Rtotali_KOhits.append(single_reac)
-                except:
-                    KOhits_without_reaction.append(single_KO)
-    return Rtotali_KOhits
-
-def log_bigg_nr(bigg_nonredundant, fasta_id, gapfill_report_directory):
+    if kk_database is None:
+        kk_database = _worker_kk_database
+        annotation_index = _worker_annotation_index
+    try:
+        genome_state = kmc_for_genome(FASTA, args, kk_database, annotation_index=annotation_index, io=io)
+        FASTA = str(FASTA).rsplit("/", 1)[-1]
+        if FASTA in genomes_instruction:
+            hmm_kos_for_genome(FASTA, genomes_instruction[FASTA][0], args, genome_state=genome_state, io=io)
+    except Exception as e:
+        return [(FASTA, f"{type(e).__name__}: {e}")]
+    return []
+
+def _plan_taxonomy_profiles(genomes, genomes_instruction, io):
     """
-    Helper function to save a log file of the output - FORMAT: 1 BiGG per line.
+    Helper function to plan the taxonomy profile HMMs of a batch, i.e. the union of the ".klist" files
+    of the MAGs/Genomes of each KEGG taxonomy. (Called in the "run_batch()" function).
 
     Args:
-        bigg_nonredundant          (list): Python-list output of "bigg_nonredundant()" function
-        fasta_id                    (str): identificative FASTA name for a given MAG/Genome
-        gapfill_report_directory    (str): output folder path
+        genomes                (list): FASTA file names
+        genomes_instruction    (dict): output of "read_genomes_instruction()"
+        io                     (dict): output of "io_directories()"
+
+    Returns:
+        plan                   (dict): Python-dictionary object {KEGG taxonomy : KOs of interest}
     """
-    os.chdir(gapfill_report_directory)
-    with open(f"bigg_log_{fasta_id}.txt", "w") as f:
-        for single_bigg in bigg_nonredundant:
-            print(single_bigg, file=f)
-    print("COMPLETE BiGG logging "+fasta_id) #debug
+    plan = {}
+    for FASTA in genomes:
+        FASTA = str(FASTA).rsplit("/", 1)[-1]
+        fasta_id = FASTA.replace(".fasta", "").replace(".fna", "").replace(".fa", "")
+        klist = path.join(io["klists_directory"], fasta_id+".klist")
+        if FASTA not in genomes_instruction or not path.isfile(klist):
+            continue
+        KOs = plan.setdefault(genomes_instruction[FASTA][0], {})
+        with open(klist) as f:
+            KOs.update(dict.fromkeys( line.strip() for line in f if line.strip() ))
+    return { taxonomy: list(KOs) for taxonomy, KOs in plan.items() }
 
-def log_modelseed_nr(modelseed_nonredundant, fasta_id, gapfill_report_directory):
+def _build_planned_profile(K, taxonomy, taxa_allow, args, io):
     """
-    Helper function to save a log file of the output - FORMAT: 1 SEED per line.
+    Helper function to download the nt sequences of a KO and build its taxonomy profile HMM, as a task of a batch plan.
+    (Called in the "run_batch()" function).
 
     Args:
-        modelseed_nonredundant     (list): Python-list output of "modelseed_nonredundant()" function
-        fasta_id                    (str): identificative FASTA name for a given MAG/Genome
-        gapfill_report_directory    (str): output folder path
-    """
-    os.chdir(gapfill_report_directory)
-    with open(f"seed_log_{fasta_id}.txt", "w") as f:
-        for single_rxn in modelseed_nonredundant:
-            print(single_rxn, file=f)
-    print(f"COMPLETE ModelSEED logging {fasta_id}")
+        K                       (str): KO of interest
+        taxonomy                (str): KEGG Brite taxonomy, from the "genomes.instruction" file
+        taxa_allow              (set): codes of species allowed, output of "taxonomy_filter()"
+        args              (Namespace): command-line arguments
+        io                     (dict): output of "io_directories()"
 
-def reframed_reaction_addition(fasta_id, model_directory, gapfill_report_directory, bigg_api, verbose=False):
+    Returns:
+        failed                 (list): Python-list object of (task name, error message), empty if the task did not fail
     """
-    Main function to add reactions linked to HMM-derived genomic evidence
-    obtained from prior KEMET processes.
-    Makes large use of BiGG API to recover info regarding reaction strings.
-    Include said reaction strings in a copy of an existing genome-scale model
-    through the use of Reframed package functions.
+    dir_KO = path.join(io["dir_base_KO"], taxonomy.replace(" ", "_")) + "/"
+    try:
+        os.makedirs(dir_KO, exist_ok=True)
+        if not args.skip_nt_download:
+            _download_KO(K, dir_KO, taxa_allow, io["kegg_url"], io=io)
+        if not args.skip_msa_and_hmmbuild:
+            taxonomy_profile(K, taxonomy, taxa_allow, dir_KO, build=True, download=not args.skip_nt_download, io=io)
+    except Exception as e:
+        return [(f"{K} profile HMM of {taxonomy}", f"{type(e).__name__}: {e}")]
+    return []
+
+def _batch_tasks(ex, function, tasks):
+    """
+    Helper function to run the tasks of a batch phase in the pool of worker processes, or one after the other.
+    (Called in the "run_batch()" function).
 
     Args:
-        fasta_id                        (str): identificative FASTA name for a given MAG/Genome
-        model_directory                 (str): existing CarveMe model folder path
-        gapfill_report_directory        (str): report output folder path
-        bigg_api                        (str): folder path in which to store files with reaction strings (via BiGG API)
-        verbose              (bool, optional): print more info regarding process status. Defaults to False.
-    """
-    datetoday = str(datetime.now())[:10]
-    # MODEL IO VIA REFRAMED
-    os.chdir(model_directory)
-    for file in sorted(os.listdir()):
-        if file.endswith(".xml") and file.startswith(fasta_id):
-            os.chdir(model_directory)
-            model = load_cbmodel(file)
+        ex                 (Executor): pool of worker processes (None: tasks are run in this process)
+        function           (callable): task function, returning a list of failures
+        tasks                  (list): Python-list object of task arguments tuples
 
-    # Task: saves reaction to add (from "bigg_nonredundant()") in a list
-            os.chdir(gapfill_report_directory)
-            bigg_gapfill = bigg_gapfill_absent_in_model(f"bigg_log_{fasta_id}.txt", model)
+    Returns:
+        failed                 (list): Python-list object of the failures of every task
+    """
+    if ex is None:
+        results = [ function(*task) for task in tasks ]
+    else:
+        results = [ future.result() for future in [ ex.submit(function, *task) for task in tasks ] ]
+    return [ failure for result in results for failure in result ]
 
-    # Task: create a directory to store downloaded reaction from BiGG API
-            os.chdir(bigg_api)
-            new_modelgapfill_directory = model.id + "_gapfill_directory"
-            if not path.isdir(new_modelgapfill_directory):
-                os.mkdir(new_modelgapfill_directory)
+def run_batch(genomes, args, kk_database, genomes_instruction, workers=1, io=None):
+    """
+    Runs many MAGs/Genomes through the command-line selected KEMET stages,
+    loading shared data once and using a pool of worker processes.
+    Each MAG/Genome is a task of its own, also within a KEGG taxonomy: KEGG GENES downloads (and profile HMMs,
+    with "--shared_profiles") shared by concurrent workers are done one at a time by KO (see "_file_lock()").
+    With "--shared_profiles" (without "--early_stop"), the batch is planned: KOs of interest of every MAG/Genome are selected first,
+    then each (taxonomy, KO) profile HMM of their union is built once, as a task of its own,
+    and finally each MAG/Genome is searched with the profile HMMs of its taxonomy.
+    The shared sequence cache is bounded once every MAG/Genome is done (see "evict_after_run()").
 
-            modelgapfill_directory = bigg_api + new_modelgapfill_directory
+    Args:
+        genomes                (list): output of "batch_genomes()"
+        args              (Namespace): command-line arguments
+        kk_database            (dict): output of "load_kk_database()"
+        genomes_instruction    (dict): output of "read_genomes_instruction()"
+        workers       (int, optional): number of worker processes. Defaults to 1.
+        io           (dict, optional): output of "io_directories()". Defaults to None (folders set via "set_io_directories()").
 
-    # ACTUAL REACTION RESOURCE DOWNLOAD
-            os.chdir(modelgapfill_directory)
+    Returns:
+        failed                 (list): Python-list object of (FASTA file name, error message) for failed MAGs/Genomes
+    """
+    from concurrent.futures import ProcessPoolExecutor # imports "logging" as well, only needed here
+
+    run_time = time.time()
+    # pre-annotation files are listed once for the whole batch
+    if io is None:
+        io = _current_io_directories()
+    annotation_index = None
+    if getattr(args, "annotation_file", None) is None:
+        annotation_index = annotation_files(io["KAnnotation_directory"], args.annotation_format)
+
+    planned = not args.skip_hmm and getattr(args, "shared_profiles", False) and not getattr(args, "early_stop", False)
+    # worker processes have their own shared data, see "_batch_worker_init()"
+    shared = (kk_database, annotation_index) if workers <= 1 else (None, None)
+    failed = []
+    with (ProcessPoolExecutor(max_workers=workers, initializer=_batch_worker_init,
+                              initargs=(kk_database, _run_config(), annotation_index)) if workers > 1 else nullcontext()) as ex:
+        if planned:
+            failed += _batch_tasks(ex, _plan_batch_genome, [ (FASTA, args, genomes_instruction, *shared, io) for FASTA in genomes ])
+            genomes = [ FASTA for FASTA in genomes if FASTA not in { failure for failure, _ in failed } ]
+            tasks = []
+            for taxonomy, KOs in _plan_taxonomy_profiles(genomes, genomes_instruction, io).items():
+                taxa_file = taxonomy+".keg"
+                update_taxa = args.update_taxonomy_codes or not path.isfile(path.join(io["taxa_dir"], taxa_file))
+                taxa_allow = taxonomy_filter(taxonomy, io["dir_base"], taxa_file, io["taxa_dir"], update=update_taxa)
+                tasks += [ (K, taxonomy, taxa_allow, args, io) for K in KOs ]
+            print(_timeinfo(), f"START {len(tasks)} taxonomy profile HMMs", sep="\t")
+            failed += _batch_tasks(ex, _build_planned_profile, tasks)
+            print(_timeinfo(), f"COMPLETE {len(tasks)} taxonomy profile HMMs", sep="\t")
+        failed += _batch_tasks(ex, _run_batch_genome, [ (FASTA, args, genomes_instruction, *shared, io, planned) for FASTA in genomes ])
+
+    evict_after_run(args, run_time, io=io)
+    return failed
+
+def io_directories(path_input, path_output, dir_base=None, settings=None):
+    """
+    Generates the input (KO pre-annotation) and output folders of a KEMET run, with its HMM stage settings.
+    HMM stage outputs (MSAs, profile HMMs, hits) are kept in the output folder, while the KEGG taxonomies,
+    KEGG GENES sequences and taxonomy profile HMMs are shared by the runs of the same KEMET folder.
+    Runs with their own folders can share a process (e.g. in threads), passing them to the KEMET stages
+    ("run_genome()", "run_batch()"...) instead of setting them via "set_io_directories()".
 
-            total_strings = []
-            error_strings = []
+    Args:
+        path_input              (str): KO pre-annotation files folder path
+        path_output             (str): output files folder path
+        dir_base      (str, optional): KEMET folder, with genomes, taxonomies and KEGG GENES sequences.
+                                       Defaults to None (folder in which "kemet.py" was executed).
+        settings     (dict, optional): KEGG API and HMM commands settings, see _io_setting_names.
+                                       Defaults to None (as set by "main()").
 
-            if __name__ == '__main__':
-                with Pool(processes=6) as p: # POSSIBILITY: change number of processes/threads (default = 6)
-                    p.map(curl_bigg_reaction, bigg_gapfill)
+    Returns:
+        io                     (dict): Python-dictionary object {folder or setting variable name : value},
+                                       see _io_directory_names and _io_setting_names
+    """
+    if dir_base is None:
+        dir_base = globals()["dir_base"]
+    dir_base_KO = dir_base+"/Knumber_ntsequences/"
+    io = {
+        "KAnnotation_directory": path_input,
+        "output_directory": path_output,
+        "report_txt_directory": path_output+"/reports_txt/",
+        "report_tsv_directory": path_output+"/reports_tsv/",
+        "ktests_directory": path_output+"/ktests/",
+        "klists_directory": path_output+"/klists/",
+        "kmc_cache_directory": path_output+"/kmc_cache/",
+        "dir_base": dir_base,
+        "dir_genomes": dir_base+"/genomes/",
+        "taxa_dir": dir_base+"/taxonomies/",
+        "dir_base_KO": dir_base_KO,
+        "seq_cache_dir": dir_base_KO+"_genes/",
+        "ko_genes_dir": dir_base_KO+"_ko_genes/",
+        "profiles_dir": dir_base+"/HMM_profiles/",
+        "msa_dir": path_output+"/multiple_fasta/",
+        "hmm_dir": path_output+"/HMM/",
+        "hmm_hits_dir": path_output+"/HMM_HITS/",
+        "oneBM_modules_dir": path_output+"/oneBM_modules/",
+    }
+    io.update({ name: globals()[name] for name in _io_setting_names })
+    io.update(settings or {})
+    return io
+
+def _current_io_directories():
+    """
+    Helper function to collect the input and output folders set via "set_io_directories()" (or the default ones),
+    with the HMM stage settings set by "main()".
 
-            lista = os.listdir()
-            for file in lista:
-                if file.endswith(".ift"):
-                    api_file_reorder(file, verbose=verbose)
-            lista = sorted(os.listdir())
-            for file in lista:
-                if file.endswith(".txt"):
-                    try:
-                        get_string(file, total_strings, verbose=verbose)
-                    except:
-                        get_string_error(file, error_strings, verbose=verbose)
-                        try:
-                            retry_genes(file.replace(".txt", ""), verbose=verbose)
-                        except:
-                            pass
-    # Task: adds the reactions to a copy of the model, without those having any non-prokaryotic compartments
-            model_new = model.copy()
-            exo_comp_reacs = []
-            added_reacs = []
+    Returns:
+        io                     (dict): same format of "io_directories()" output
+    """
+    return { name: globals()[name] for name in _io_directory_names + _io_setting_names }
 
-            for reac in total_strings:
-                reacs = reac.strip().split(" ")
-                for element in reacs:
-                    if element.endswith("_n") or element.endswith("_g") or element.endswith("_h") or element.endswith("_x") or element.endswith("_m") or element.endswith("_r") or element.endswith("_v"):
-                        exo_comp_reacs.append(reac)
-                        break
+def set_io_directories(path_input, path_output):
+    """
+    Sets the input (KO pre-annotation) and output folders used by default by KEMET functions.
 
-            for reac in total_strings:
-                if reac in exo_comp_reacs:
-                    continue
-                model_new.add_reaction_from_str(reac)
-                added_reacs.append(reac)
+    Args:
+        path_input              (str): KO pre-annotation files folder path
+        path_output             (str): output files folder path
+    """
+    io = io_directories(path_input, path_output)
+    globals().update({ name: io[name] for name in _io_directory_names })
 
-                if verbose:
-                    print(f"ADDED {reac}") #debug
+def evaluate(ko_set, kk_database=None, as_kegg=False, modules=None):
+    """
+    Library entry point: computes KEGG Modules completeness of a KO set in memory, without writing reports.
+    Completeness values are the same as in the tab-separated report.
 
-    # Task:  saves a LOGfile with the reactions ACTUALLY ADDED to the model
-            os.chdir(gapfill_report_directory)
-            with open(f"{model.id}_added_reactions.txt", "w") as f:
-                for reac in added_reacs:
-                    print(reac, file=f)
+    Args:
+        ko_set               (iterable): KOs present in the pre-annotation (e.g. {"K00001", "K00002"})
+        kk_database  (dict, optional): output of "load_kk_database()".
+                                       Defaults to None (KEGG Modules in "kkfiles_directory", loaded once).
+        as_kegg      (bool, optional): option to report KEGG Modules completeness as KEGG mapper (see README for details)
+        modules  (iterable, optional): KEGG Module ids to be evaluated (e.g. output of "select_modules()"). Defaults to None (every KEGG Module).
 
-    # Task:  checks namespace quality for metabolites and saves the new gap-filled model
-            if verbose:
-                metab_change_names(model_new, verbose=verbose)
-                reac_change_names(model_new, verbose=verbose)
-                check_name_changes(model_new)
+    Returns:
+        completeness           (dict): Python-dictionary object:
+                                        keys: "KEGG Module ID" (e.g. "M00001")
+                                        values: {"name", "completeness", "present_blocks", "total_blocks",
+                                                 "classification", "missing_KOs", "present_KOs"}
+    """
+    global _kk_database
+
+    if kk_database is None:
+        if _kk_database is None:
+            _kk_database = load_kk_database(kkfiles_directory)
+        kk_database = _kk_database
+    if modules is not None:
+        kk_database = subset_kk_database(kk_database, modules)
+
+    genome_state = evaluate_genome(ko_set, kk_database)
+    completeness = {}
+    for kk_file, result in genome_state["results"].items():
+        percentage, present, total = result["tsv"]
+        completeness[kk_file[:-3]] = {
+            "name": result["kk_module"]["extended_name"][7:],
+            "completeness": percentage,
+            "present_blocks": present,
+            "total_blocks": total,
+            "classification": _completeness_tsv(present, total, as_kegg=as_kegg),
+            "missing_KOs": list(result["Kmissing"]),
+            "present_KOs": list(result["Kpresent"]),
+        }
+    return completeness
+
+def _selected_kk_database(args):
+    """
+    Helper function to load the compiled KEGG Modules database,
+    restricted to the KEGG Modules selected via "--modules", "--module_class" and "--pathway" (if any).
 
-            os.chdir(gapfilled_model_directory)
-            save_cbmodel(model_new, f"{model_new.id}_KEGGadd_{datetoday}.xml", flavor='bigg')
+    Args:
+        args              (Namespace): command-line arguments
 
-def recap_addition(fasta_id, gapfill_report_directory, old_new_names_R):
+    Returns:
+        kk_database            (dict): output of "load_kk_database()" or "subset_kk_database()"
     """
-    Stores RECAP informations for reaction addition
-    (via "existing" GSMM procedures, specified in command-line args) as performed in each model.
-    This function generates a final tabular output of the GSMM process.
+    kk_database = load_kk_database(kkfiles_directory)
+    if not (args.modules or args.module_class or args.pathway):
+        return kk_database
+
+    selected, unknown = select_modules(load_module_catalog(Modules_directory), modules=args.modules or (),
+                                       module_class=args.module_class or (), pathway=args.pathway or ())
+    for selector in unknown:
+        print(_timeinfo(), f"NO KEGG Module matching {selector}", sep="\t")
+    kk_database = subset_kk_database(kk_database, selected)
+    if not kk_database["modules"]:
+        sys.exit("NO KEGG Module selected: check --modules, --module_class and --pathway")
+    print(_timeinfo(), f"{len(kk_database['modules'])} KEGG Modules selected", sep="\t")
+    return kk_database
+
+def build_parser():
+    """
+    Builds the KEMET command-line arguments parser.
 
-    Args:
-        fasta_id                    (str): identificative FASTA name for a given MAG/Genome
-        gapfill_report_directory    (str): output folder path
-        old_new_names_R            (dict): Python-dictionary output of "old_new_names_reac_dict()" function
+    Returns:
+        parser  (ArgumentParser): KEMET command-line arguments parser
     """
-    datetoday = str(datetime.now())[:10]
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter,
+    description =
+    '''
+KEMET - KEGG Module Evaluation Tool:
+1) Evaluate KEGG Modules Completeness for given genomes.
+2) HMM-based check for ortholog genes (KO) of interest after KEGG Module Completeness evaluation.
+3) Genome-scale model gapfill with nucleotidic HMM-derived evidence, for KOs of interest.
+''')
 
-    os.chdir(gapfill_report_directory)
-    with open(f"recap_gapfill_{datetoday}.tsv", "a") as f:
-        if f.tell() == 0:
-            print("MAG", "STRING", "NAME", sep="\t", file=f)
+    parser.add_argument('FASTA_file', nargs='?',
+                        help=
+    '''Genome/MAG FASTA file as indicated in the "genomes.instruction" -
+points to files (in "KEGG_annotations") comprising KO annotations, associated with each gene.''')
+    parser.add_argument('-a', '--annotation_format',
+                        choices=_ktest_formats,
+                        help=
+    '''
+Format of KO_list.
 
-        for file in sorted(os.listdir()):
-            if file.endswith("_added_reactions.txt") and fasta_id in file:
-                with open(file) as g:
-                    MAG = file[:-20]
-                    for line in g:
-                        STRING = line.strip()
-                        if STRING == "":
-                            continue
-                        reac_id = STRING.split(": ")[0].replace("R_", "")
-                        NAME = old_new_names_R[reac_id]
-                        print(MAG, STRING, NAME, sep="\t", file=f)
+eggnog: 1 gene | many possible annotations;
+kaas: 1 gene | 1 annotation at most;
+kofamkoala: 1 gene | many possible annotations
+''')
+    parser.add_argument('--update_taxonomy_codes', action ="store_true",
+                        help='''Update taxonomy filter codes - WHEN TO USE: after downloading a new BRITE taxonomy with "set_kemet_working-directory.py".''')
+    parser.add_argument('-i', '--annotation_file',
+                        help='''KO pre-annotation file of the Genome/MAG (path, or "-" for standard input),
+instead of the one named after it in the input FOLDER. ".gz" and ".zst" files are read as well.''')
+    parser.add_argument('-I', '--path_input',
+                        help='''Absolute path to input file(s) FOLDER.''', default = KAnnotation_directory)
+    parser.add_argument('-k', '--as_kegg', action ="store_true",
+                        help='''Return KEGG-Mapper output for the Module Completeness evaluation.''')
+    parser.add_argument('--modules', nargs='+', action='extend', metavar='MODULE',
+                        help='''Evaluate and report only these KEGG Modules (e.g. "M00001 M00002"),
+together with those selected via "--module_class" and "--pathway".''')
+    parser.add_argument('--module_class', nargs='+', action='extend', metavar='CLASS',
+                        help='''Evaluate and report only KEGG Modules of these CLASS levels, case-insensitive
+(e.g. "Nitrogen metabolism" "Methane metabolism").''')
+    parser.add_argument('--pathway', nargs='+', action='extend', metavar='PATHWAY',
+                        help='''Evaluate and report only KEGG Modules of these KEGG PATHWAY maps, by id or name, case-insensitive
+(e.g. "map00910").''')
+    parser.add_argument('--kmc_cache', nargs='?', const=_def_kmc_cache_size, type=int, metavar='MAX_MB',
+                        help='''Cache KEGG Modules Completeness results in the "kmc_cache" output folder, by KO set:
+Genomes/MAGs with unchanged KOs are not evaluated again, except for updated KEGG Modules.
+Least recently used results are removed above MAX_MB megabytes (default: %(const)s).
+Not supported with "--batch_completeness"/"--combined_annotation".''')
+    parser.add_argument('--batch_completeness', action ="store_true",
+                        help='''Evaluate KEGG Modules Completeness at once for every ".ktest" file in the "ktests" folder,
+writing genome x Module tables in "reports_tsv" (requires NumPy).''')
+    parser.add_argument('--combined_annotation', metavar='FILE',
+                        help='''KO pre-annotation file covering many Genomes/MAGs (path, or "-" for standard input),
+read once and split by gene IDs (see "--genome_pattern"), then evaluated as in "--batch_completeness".''')
+    parser.add_argument('--genome_pattern', default=_def_genome_pattern,
+                        help='''Regular expression matching gene IDs of "--combined_annotation", whose first group
+(or "genome" named group) is the Genome/MAG name (default: "^([^|]+)\\|", i.e. "genome|gene" IDs).''')
+    parser.add_argument('--columnar', choices=_columnar_formats,
+                        help='''With "--batch_completeness"/"--combined_annotation", also write every genome x Module completeness,
+blocks, classification and missing KOs in a single columnar file of "reports_tsv" ("arrow" and "parquet" require pyarrow).''')
+    parser.add_argument('--batch', nargs='?', const=instruction_file, metavar='INSTRUCTION_OR_GLOB',
+                        help='''Run every Genome/MAG of the "genomes.instruction" file (default), of another ".instruction" file
+or of a FASTA files glob pattern (e.g. "genomes/*.fa") through the selected steps, loading shared data once.''')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='''Number of worker processes used with "--batch" (default: 1).''')
+    parser.add_argument('--skip_hmm', action ="store_true",
+                        help='''Skip HMM-driven search for KOs & stop after KEGG Modules Completeness evaluation.''')
+    parser.add_argument('--hmm_mode',
+                        choices=_hmm_modes,
+                        help=
+    '''
+Choose the subset of KOs of interest for HMM-based check.
+By default, the KOs already present in the functional annotation are not checked further.
+
+onebm: search for KOs from KEGG Modules missing 1 block;
+modules: search for KOs from the KEGG Modules indicated in the "module_file.instruction" file, 1 per line
+    (e.g. Mxxxxx);
+kos: search for KOs indicated in the "ko_file.instruction" file, 1 per line
+    (e.g. Kxxxxx)
+''')
+    parser.add_argument('--max_candidates', type=int, metavar='N',
+                        help='''With "--hmm_mode onebm/modules", check via HMM at most N KOs (or complexes) per missing block,
+cheapest first as by already downloaded reference sequences (default: every KO completing the block).''')
+    parser.add_argument('--early_stop', action="store_true",
+                        help='''With "--hmm_mode onebm/modules", search KOs block by block, cheapest first, skipping the remaining KOs
+of a missing block as soon as one of them has significant HMM-hits.''')
+    parser.add_argument('--kegg_rate', type=float, default=_def_kegg_rate, metavar='REQ_PER_S',
+                        help='''Maximum KEGG API requests per second, for KEGG GENES downloads (default: %(default)s).
+Requests to KEGG API without a granted access are limited (check KEGG LICENCE).''')
+    parser.add_argument('--kegg_connections', type=int, default=_def_kegg_connections, metavar='N',
+                        help='''Maximum concurrent keep-alive connections to KEGG API (default: %(default)s).''')
+    parser.add_argument('--seq_cache_ttl', type=float, default=_def_seq_cache_ttl, metavar='DAYS',
+                        help='''Download again KEGG GENES nt sequences and KO genes lists older than DAYS days,
+from the shared sequence cache of "Knumber_ntsequences" (default: %(default)s; 0 to never refresh them).''')
+    parser.add_argument('--seq_cache_size', type=int, default=_def_seq_cache_size, metavar='MAX_MB',
+                        help='''Remove least recently used nt sequences above MAX_MB megabytes from the shared sequence cache,
+once the run is complete, keeping those used by the run (default: %(default)s).''')
+    parser.add_argument('--shared_profiles', action="store_true",
+                        help='''Align and build each KO profile HMM once per KEGG taxonomy (in the "HMM_profiles" folder),
+then search it in every Genome/MAG of that taxonomy (e.g. with "--batch").''')
+    parser.add_argument('--threshold_value', default=_def_thr,
+                        help='''Define a threshold for the corrected score resulting from HMM-hits, which is indicative of good quality.''')
+    parser.add_argument('--skip_nt_download', action="store_true",
+                        help='''Skip downloading KEGG KOs nt sequences.''')
+    parser.add_argument('--skip_msa_and_hmmbuild', action ="store_true",
+                        help='''Skip MAFFT and HMMER hmmbuild commands.''')
+    parser.add_argument('--retry_nhmmer', action="store_true",
+                        help='''Move HMM-files and re-run nHMMER command.''')
+
+    parser.add_argument('--skip_gsmm', action="store_true",
+                        help='''Skip GSMM operations, gapfill or de-novo model creation, & stop after HMM-driven search for KOs.''')
+    parser.add_argument('--gsmm_mode',
+                        choices=_gapfill_modes,
+                        help=
+    '''
+Choose the methods of GSMM operation.
+(This method won't be performed if "--hmm_mode kos" was chosen)
+existing: use pre-existing CarveMe GSMM to add reactions content connected to HMM-derived KOs;
+denovo: generate a new CarveMe GSMM, performing gene prediction and adding HMM-derived hits from the chosen HMM-mode.
+''')
+    parser.add_argument('-O', '--path_output',
+                        help='''Absolute path to ouput file(s) FOLDER.''', default = dir_base)
+    parser.add_argument('-v', '--verbose', action="store_true",
+                        help='''Print more informations - for debug and progress.''')
+    parser.add_argument('-q', '--quiet', action="store_true",
+                        help='''Silence soft-errors (for MAFFT and HMMER commands).''')
+    parser.add_argument('--log', action="store_true",
+                    help='''Store KEMET commands and progress during the execution in a log file.''')
 
+    return parser
 
 ########################################################################################
 
@@ -2300,6 +5235,10 @@ run_start = datetime.now().strftime("%Y-%m-%d")
 ###############
 dir_base = os.getcwd() #script folder
 LOGflag = False
+_kk_database = None # compiled KEGG Modules, loaded once by "evaluate()"
+_module_catalog = None # KEGG Modules catalog, loaded once by "gsmm_for_genome()"
+_taxonomy_indexes = {} # KEGG Organisms taxonomy index by folder, loaded once by "taxonomy_filter()"
+_taxonomy_profiles = set() # profile HMMs files built by this process, see "taxonomy_profile()"
 
 Modules_directory = dir_base+"/KEGG_MODULES/"
 kkfiles_directory = Modules_directory+"/kk_files/"
@@ -2308,8 +5247,11 @@ output_directory = dir_base
 
 taxa_dir = dir_base+"/taxonomies/"
 dir_base_KO = dir_base+"/Knumber_ntsequences/"
+seq_cache_dir = dir_base_KO+"_genes/"
+ko_genes_dir = dir_base_KO+"_ko_genes/"
 msa_dir = dir_base+"/multiple_fasta/"
 hmm_dir = dir_base+"/HMM/"
+profiles_dir = dir_base+"/HMM_profiles/"
 hmm_hits_dir = dir_base+"/HMM_HITS/"
 dir_genomes = dir_base+"/genomes/"
 oneBM_modules_dir = dir_base+"/oneBM_modules/"
@@ -2330,105 +5272,37 @@ fixed_ko_file = "ko_file.instruction"
 #################
 # BASE COMMANDS #
 #################
-base_com_KEGGget = _base_com_KEGGget
+kegg_url = _kegg_rest_url
+kegg_rate = _def_kegg_rate
+kegg_connections = _def_kegg_connections
 base_com_mafft = _base_com_mafft
 base_com_hmmbuild = _base_com_hmmbuild
 base_com_nhmmer = _base_com_nhmmer
+seq_cache_ttl = _def_seq_cache_ttl*86400
 
-#############################################
-
-parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter,
-description =
-'''
-KEMET - KEGG Module Evaluation Tool:
-1) Evaluate KEGG Modules Completeness for given genomes.
-2) HMM-based check for ortholog genes (KO) of interest after KEGG Module Completeness evaluation.
-3) Genome-scale model gapfill with nucleotidic HMM-derived evidence, for KOs of interest.
-''')
-
-parser.add_argument('FASTA_file',
-                    help=
-'''Genome/MAG FASTA file as indicated in the "genomes.instruction" -
-points to files (in "KEGG_annotations") comprising KO annotations, associated with each gene.''')
-parser.add_argument('-a', '--annotation_format', required=True,
-                    choices=_ktest_formats,
-                    help=
-'''
-Format of KO_list.
-
-eggnog: 1 gene | many possible annotations;
-kaas: 1 gene | 1 annotation at most;
-kofamkoala: 1 gene | many possible annotations
-''')
-parser.add_argument('--update_taxonomy_codes', action ="store_true",
-                    help='''Update taxonomy filter codes - WHEN TO USE: after downloading a new BRITE taxonomy with "set_kemet_working-directory.py".''')
-parser.add_argument('-I', '--path_input',
-                    help='''Absolute path to input file(s) FOLDER.''', default = KAnnotation_directory)
-parser.add_argument('-k', '--as_kegg', action ="store_true",
-                    help='''Return KEGG-Mapper output for the Module Completeness evaluation.''')
-parser.add_argument('--skip_hmm', action ="store_true",
-                    help='''Skip HMM-driven search for KOs & stop after KEGG Modules Completeness evaluation.''')
-parser.add_argument('--hmm_mode',
-                    choices=_hmm_modes,
-                    help=
-'''
-Choose the subset of KOs of interest for HMM-based check.
-By default, the KOs already present in the functional annotation are not checked further.
-
-onebm: search for KOs from KEGG Modules missing 1 block;
-modules: search for KOs from the KEGG Modules indicated in the "module_file.instruction" file, 1 per line
-    (e.g. Mxxxxx);
-kos: search for KOs indicated in the "ko_file.instruction" file, 1 per line
-    (e.g. Kxxxxx)
-''')
-parser.add_argument('--threshold_value', default=_def_thr,
-                    help='''Define a threshold for the corrected score resulting from HMM-hits, which is indicative of good quality.''')
-parser.add_argument('--skip_nt_download', action="store_true",
-                    help='''Skip downloading KEGG KOs nt sequences.''')
-parser.add_argument('--skip_msa_and_hmmbuild', action ="store_true",
-                    help='''Skip MAFFT and HMMER hmmbuild commands.''')
-parser.add_argument('--retry_nhmmer', action="store_true",
-                    help='''Move HMM-files and re-run nHMMER command.''')
-
-parser.add_argument('--skip_gsmm', action="store_true",
-                    help='''Skip GSMM operations, gapfill or de-novo model creation, & stop after HMM-driven search for KOs.''')
-parser.add_argument('--gsmm_mode',
-                    choices=_gapfill_modes,
-                    help=
-'''
-Choose the methods of GSMM operation.
-(This method won't be performed if "--hmm_mode kos" was chosen)
-existing: use pre-existing CarveMe GSMM to add reactions content connected to HMM-derived KOs;
-denovo: generate a new CarveMe GSMM, performing gene prediction and adding HMM-derived hits from the chosen HMM-mode.
-''')
-parser.add_argument('-O', '--path_output',
-                    help='''Absolute path to ouput file(s) FOLDER.''', default = dir_base)
-parser.add_argument('-v', '--verbose', action="store_true",
-                    help='''Print more informations - for debug and progress.''')
-parser.add_argument('-q', '--quiet', action="store_true",
-                    help='''Silence soft-errors (for MAFFT and HMMER commands).''')
-parser.add_argument('--log', action="store_true",
-                help='''Store KEMET commands and progress during the execution in a log file.''')
-args = parser.parse_args()
-
-if args.log:
-    import logging
-    LOGflag = True
-    KEMET_args = str(args).replace('Namespace(', '').replace(')', '')
-
-    logging.basicConfig(filename=run_start+'_KEMET_execution.log',
-                        level=logging.INFO, format='%(asctime)s %(message)s')
-    logging.info('KEMET arguments: ' + KEMET_args)
-
-#### SET NEW IO FOLDERS
-KAnnotation_directory = args.path_input
-output_directory = args.path_output
+##############
+# IO FOLDERS #
+##############
 report_txt_directory = output_directory+"/reports_txt/"
 report_tsv_directory = output_directory+"/reports_tsv/"
 ktests_directory = output_directory+"/ktests/"
 klists_directory = output_directory+"/klists/"
-
-#### MANUSCRIPT INFO
+kmc_cache_directory = output_directory+"/kmc_cache/"
+
+# module variables set by "set_io_directories()" (see "io_directories()")
+_io_directory_names = ("KAnnotation_directory", "output_directory", "report_txt_directory", "report_tsv_directory",
+                       "ktests_directory", "klists_directory", "kmc_cache_directory", "dir_base", "dir_genomes",
+                       "taxa_dir", "dir_base_KO", "seq_cache_dir", "ko_genes_dir", "profiles_dir",
+                       "msa_dir", "hmm_dir", "hmm_hits_dir", "oneBM_modules_dir")
+# module variables set by "main()", carried by "io_directories()" for the HMM stage
+_io_setting_names = ("kegg_url", "kegg_rate", "kegg_connections", "seq_cache_ttl",
+                     "base_com_mafft", "base_com_hmmbuild", "base_com_nhmmer")
+# module variables applied in batch worker processes (see "_run_config()")
+_run_config_names = _io_directory_names + _io_setting_names + ("LOGflag", "run_start")
+
+###################
+# MANUSCRIPT INFO #
+###################
 manuscript_info = '''
 
 If KEMET provides useful insight, please consider citing the manuscript accompaining this code:
@@ -2441,183 +5315,110 @@ Palù, M., Basile, A., Zampieri, G., Treu, L., Rossi, A., Morlino, M. S., & Camp
 
 '''
 
-#### KMC - PRODUCE KTEST FILE
-os.chdir(KAnnotation_directory)
-file_name = str(args.FASTA_file).rsplit("/", 1)[-1].replace(".fasta", "").replace(".fna", "").replace(".fa", "") # from path indication of a contig file maintain file_name
-if LOGflag:
-    logging.info(f'+++ \tSTART {file_name}')
-    logging.info('++ START KEGG Modules completeness')
-for file in sorted(os.listdir()):
-    if args.annotation_format == "kaas":
-        if file == (f'{file_name}.ko') or file == (f'{file_name}.txt'):
-            if args.verbose:
-                print(f"converting kaas-like file {file}")
-            ktest, KOs = KAASXktest(file, file.rsplit(".", 1)[0]+".ktest", KAnnotation_directory, ktests_directory)
-            break
-    elif args.annotation_format == "eggnog":
-        if file == (f'{file_name}.emapper.annotations'):
-            if args.verbose:
-                print(f"converting eggnog file {file}")
-            ktest, KOs = eggnogXktest(file, file.rsplit(".", 2)[0]+".ktest", KAnnotation_directory, ktests_directory)
-            break
-    elif args.annotation_format == "kofamkoala":
-        if file == (f'{file_name}.tsv') or file == (f'{file_name}.txt'):
-            if args.verbose:
-                print(f"converting kofamkoala file {file}")
-            ktest, KOs = kofamXktest(file, file.rsplit(".", 1)[0]+".ktest", KAnnotation_directory, ktests_directory)
-            break
+########################################################################################
 
-os.chdir(ktests_directory)
-if ktest in sorted(os.listdir()):
-    ko_list = create_KO_list(ktest, ktests_directory)
-    os.chdir(kkfiles_directory)
-    for file in sorted(os.listdir()):
-        if file.endswith(".kk"):
-            testcompleteness(ko_list, file, kkfiles_directory, report_txt_directory, "reportKMC_"+ktest[:-6]+".txt")
-            testcompleteness_tsv(ko_list, file, kkfiles_directory, report_tsv_directory, "reportKMC_"+ktest[:-6]+".tsv", as_kegg=args.as_kegg)
+def main(argv=None):
+    """
+    KEMET command-line entry point.
 
-    if LOGflag:
-        logging.info('COMPLETE KEGG Modules completeness')
+    Args:
+        argv           (list, optional): command-line arguments. Defaults to None (i.e. sys.argv).
+    """
+    global base_com_mafft, base_com_hmmbuild, base_com_nhmmer, seq_cache_ttl, kegg_rate, kegg_connections
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.combined_annotation:
+        args.batch_completeness = True
+        if args.annotation_format is None:
+            parser.error("the -a/--annotation_format argument is required with --combined_annotation")
+    if args.batch_completeness and args.kmc_cache is not None:
+        parser.error("--kmc_cache is not supported with --batch_completeness/--combined_annotation, "
+                     "which evaluate every genome at once")
+    if args.columnar is not None and not args.batch_completeness:
+        parser.error("--columnar is only supported with --batch_completeness/--combined_annotation")
+    if args.batch and args.annotation_format is None:
+        parser.error("the -a/--annotation_format argument is required with --batch")
+    if not args.batch_completeness and not args.batch:
+        if args.FASTA_file is None:
+            parser.error("the FASTA_file argument is required")
+        if args.annotation_format is None:
+            parser.error("the -a/--annotation_format argument is required")
+
+    if args.log:
+        _start_log(str(args).replace('Namespace(', '').replace(')', ''))
+
+    #### SET NEW IO FOLDERS
+    set_io_directories(args.path_input, args.path_output)
+
+    #### KMC - BATCH MODE
+    if args.batch_completeness:
+        if LOGflag:
+            logging.info('++ START batch KEGG Modules completeness')
+        genomes_kos = {}
+        if args.combined_annotation:
+            genomes_kos, unassigned = demultiplex_annotation(args.combined_annotation, args.annotation_format,
+                                                             KAnnotation_directory, genome_pattern=args.genome_pattern)
+            if unassigned:
+                print(_timeinfo(), f"{unassigned} annotated genes not assigned to any genome (--genome_pattern)", sep="\t")
+        else:
+            for genome in stored_genomes(ktests_directory):
+                genomes_kos[genome] = create_KO_list(genome, ktests_directory)
+        kk_database = _selected_kk_database(args)
+        batch = batch_completeness(genomes_kos, kk_database, missing=bool(args.columnar))
+        write_batch_completeness(batch, report_tsv_directory, "KMC_batch_"+run_start, as_kegg=args.as_kegg)
+        if args.columnar:
+            write_columnar_completeness(batch, kk_database, report_tsv_directory, "KMC_batch_"+run_start,
+                                        file_format=args.columnar, as_kegg=args.as_kegg)
+        print(_timeinfo(), f"COMPLETE batch KEGG Modules completeness ({len(genomes_kos)} genomes)", sep="\t")
+        if LOGflag:
+            logging.info('COMPLETE batch KEGG Modules completeness')
+        if not args.quiet:
+            print(manuscript_info)
+        sys.exit(0)
+
+    #### HMM - SEQUENCE CACHE SETTINGS
+    seq_cache_ttl = args.seq_cache_ttl*86400 if args.seq_cache_ttl > 0 else None
+    kegg_rate = args.kegg_rate
+    kegg_connections = args.kegg_connections
+
+    #### HMM - VERBOSITY SETTINGS
+    if args.verbose:
+        base_com_mafft = base_com_mafft.replace("--quiet", "")
+        base_com_hmmbuild = base_com_hmmbuild.replace(" > /dev/null", "")
+        base_com_nhmmer = base_com_nhmmer.replace(" > /dev/null", "")
+    if args.quiet:
+        base_com_mafft += " 2>/dev/null"
+        base_com_hmmbuild += " 2>&1"
+        base_com_nhmmer += " 2>&1"
+
+    #### KMC/HMM/GSMM - BATCH OF GENOMES
+    if args.batch:
+        genomes = batch_genomes(args.batch, dir_base, dir_genomes)
+        genomes_instruction = read_genomes_instruction(dir_base, instruction_file) if not args.skip_hmm else {}
+        kk_database = _selected_kk_database(args)
+        print(_timeinfo(), f"START batch of {len(genomes)} genomes", sep="\t")
+        failed = run_batch(genomes, args, kk_database, genomes_instruction, workers=args.workers)
+        for FASTA, error in failed:
+            print(_timeinfo(), f"FAILED {FASTA}", error, sep="\t")
+            if LOGflag:
+                logging.info(f"FAILED {FASTA}\t{error}")
+        print(_timeinfo(), f"COMPLETE batch of {len(genomes)} genomes ({len(failed)} failed)", sep="\t")
+        if not args.quiet:
+            print(manuscript_info)
+        sys.exit(1 if failed else 0)
+
+    #### KMC/HMM/GSMM - SINGLE GENOME
+    kk_database = _selected_kk_database(args)
+    genomes_instruction = read_genomes_instruction(dir_base, instruction_file) if not args.skip_hmm else {}
+    run_time = time.time()
+    run_genome(args.FASTA_file, args, kk_database, genomes_instruction)
+    evict_after_run(args, run_time)
 
-if args.skip_hmm:
     if not args.quiet:
         print(manuscript_info)
-    sys.exit(1)
-
-#### HMM - VERBOSITY SETTINGS
-if args.verbose:
-    base_com_mafft = base_com_mafft.replace("--quiet", "")
-    base_com_hmmbuild = base_com_hmmbuild.replace(" > /dev/null", "")
-    base_com_nhmmer = base_com_nhmmer.replace(" > /dev/null", "")
-if args.quiet:
-    base_com_mafft += " 2>/dev/null"
-    base_com_hmmbuild += " 2>&1"
-    base_com_nhmmer += " 2>&1"
-
-#### HMM - READ AND WRITE INSTRUCTIONS
-os.chdir(dir_base)
-FASTA = str(args.FASTA_file).rsplit("/", 1)[-1]
-with open(instruction_file) as f:
-    for line in f.readlines()[1:]:
-        if line.split("\t")[0] == FASTA:
-            line = line.strip().split("\t")
-            if len(line) == 3:
-                metabolic_universe = line[2]
-            else:
-                metabolic_universe = "bacteria"
-            for file in sorted(os.listdir(dir_genomes)):
-                if file == FASTA:
-                    fasta_genome = dir_genomes+FASTA
-
-            fasta_id = FASTA.replace(".fasta", "").replace(".fna", "").replace(".fa", "")
-            klist_file = fasta_id+".klist"
-            taxonomy = line[1]
-            taxa_file = taxonomy+".keg"
-            if args.hmm_mode == "modules":
-                os.chdir(dir_base)
-                tuple_modules = create_tuple_modules(fixed_module_file)
-                write_KOs_from_modules(fasta_id, tuple_modules, report_txt_directory, klists_directory)
-            if args.hmm_mode == "onebm":
-                tuple_modules = create_tuple_modules_1BM(fasta_id, fixed_module_file, oneBM_modules_dir, report_tsv_directory)
-                write_KOs_from_modules(fasta_id, tuple_modules, report_txt_directory, klists_directory)
-            if args.hmm_mode == "kos":
-                write_KOs_from_fixed_list(fasta_id, fixed_ko_file, ktests_directory, klists_directory)
-
-            dir_KO = dir_base_KO+taxonomy.replace(" ", "_") + "/"                        # KO folder for taxonomy,    save time!
-            msa_dir_comm = msa_dir+fasta_id + "/"                                        # MSA folder for MAG/Genome, more ordered!
-            hmm_dir_comm = hmm_dir+fasta_id + "/"                                        # HMM folder for MAG/Genome, more ordered!
-            CORR_THRESHOLD = float(args.threshold_value)
-
-#### HMM - OPERATE SINGLE FUNCTIONS
-            print(_timeinfo(), f"++ START HMM operations {fasta_id}", sep="\t")
-            if LOGflag:
-                logging.info(f'++ START HMM operations {fasta_id}')
-            update_taxa = args.update_taxonomy_codes or taxa_file not in os.listdir(taxa_dir)
-            taxa_allow = taxonomy_filter(taxonomy, dir_base, taxa_file, taxa_dir, update=update_taxa)
-
-            if not args.skip_nt_download:
-                if LOGflag:
-                    logging.info('START download nucleotidic sequences')
-                download_ntseq_of_KO(klist_file, dir_base_KO, dir_KO, klists_directory, taxa_dir, taxa_file, base_com_KEGGget)
-                if LOGflag:
-                    logging.info('COMPLETE download nucleotidic sequences')
-            if args.retry_nhmmer:
-                # POSSIBILITY: after a whole KEMET run, to try other parameters
-                movebackHMM(hmm_dir_comm, msa_dir_comm)
-            if not args.skip_msa_and_hmmbuild:
-                if LOGflag:
-                    logging.info('START sequences filtering and alignment')
-                filter_and_align(taxa_dir, taxa_file, fasta_id, klist_file, klists_directory, msa_dir, dir_KO)
-                if LOGflag:
-                    logging.info('COMPLETE Filter and align')
-                if LOGflag:
-                    MSA_and_HMM(msa_dir_comm, base_com_mafft, base_com_hmmbuild, log=True)
-                else:
-                    MSA_and_HMM(msa_dir_comm, base_com_mafft, base_com_hmmbuild, log=False)
-            nhmmer_for_genome(fasta_genome, msa_dir_comm, base_com_nhmmer)
-            if LOGflag:
-                logging.info('COMPLETE nhmmer')
-            move_HMM_and_clean(hmm_dir_comm, msa_dir_comm)
-
-#### HMM - FIRST REPORT FILE
-            nhmmer_significant_hits_corr(fasta_id, hmm_dir_comm, corr_threshold=CORR_THRESHOLD)
-            if LOGflag:
-                logging.info('COMPLETE nhmmer significant hits')
-            HMM_hits_dict = HMM_hits_sequences(hmm_hits_dir, dir_genomes)
-            HMM_hits_TRANSLATED_dict = HMM_hits_translated_sequences(HMM_hits_dict)
-            HMM_hits_longestTRANSLATED_dict = HMM_hits_longest_translated_sequences(HMM_hits_dict, HMM_hits_TRANSLATED_dict)
-
-#### HMM - WHOLE RUN REPORT FILE
-            recap_hits_corr(fasta_id, hmm_hits_dir, HMM_hits_dict, HMM_hits_longestTRANSLATED_dict, run_start)
-
-            if args.skip_gsmm:
-                if not args.quiet:
-                    print(manuscript_info)
-                sys.exit(1)
-            else:
-                if args.hmm_mode == "kos" and args.gsmm_mode == "existing":
-                    print('''
-                    The GSMM operations chosen are not compatible with the HMM mode, therefore no gapfilling would be performed.
-                    ''')
-                else:
-#### GSMM - OPERATE SINGLE FUNCTIONS
-                    if args.gsmm_mode == "denovo" or args.gsmm_mode == "existing":
-                        if LOGflag:
-                            logging.info('++ START GSMM operations '+fasta_id)
-
-                        fastakohits = fasta_id+"_HMM_hits.txt"
-                        current_run = "KEMET_run_"+run_start
+    if args.skip_hmm or args.skip_gsmm:
+        sys.exit(1)
 
-                        if args.gsmm_mode == "denovo":
-                            build_de_novo_GSMM(FASTA, fasta_genome, de_novo_model_directory, current_run, log=LOGflag)
-
-                        elif args.gsmm_mode == "existing":
-                            list_all_mod = list_all_modules(Modules_directory)
-                            os.chdir(DB_directory)
-                            DB_KEGG_RN = KEGG_BiGG_SEED_RN_dict("reactions_DB.tsv", DB_directory, ontology="BiGG")
-                            old_new_names = old_new_names_dict("metabolites_names_from_id_bigg.tsv")
-                            old_new_names_R = old_new_names_reac_dict("reactions_names_from_id_bigg.tsv")
-
-                            if args.hmm_mode == "modules":
-                                MODofinterest = fixed_modules_of_interest(dir_base, fixed_module_file)
-                            if args.hmm_mode == "onebm":
-                                MODofinterest = onbm_modules_of_interest(fasta_id, oneBM_modules_dir)
-
-                            KOhits = KOs_with_HMM_hits(hmm_hits_dir, fastakohits)
-                            MODofinterestXKOhits = Modules_KOhits_connection(KOhits, MODofinterest)
-                            modulesXflat = modules_flat_files_connection(list_all_mod, MODofinterestXKOhits)
-
-                            Rtotali_KOhits = total_R_from_KOhits(MODofinterestXKOhits, modulesXflat, Modules_directory)
-
-                            KEGG_R_to_add = keggR_in_DB(Rtotali_KOhits, DB_KEGG_RN)
-#### GSMM - REACTION ADDITION + RECAP
-                            bigg_nonredundant = bigg_nonredundant(KEGG_R_to_add, DB_KEGG_RN)
-                            log_bigg_nr(bigg_nonredundant, fasta_id, gapfill_report_directory)
-                            reframed_reaction_addition(fasta_id, model_directory, gapfill_report_directory, bigg_api, verbose=args.verbose)
-                            recap_addition(fasta_id, gapfill_report_directory, old_new_names_R)
-
-            print(_timeinfo(), f"END {fasta_id}\n", sep="\t")
-            if LOGflag:
-                logging.info(f"END {fasta_id}\n")
-            if not args.quiet:
-                print(manuscript_info)
+if __name__ == "__main__":
+    main()
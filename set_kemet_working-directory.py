@@ -3,10 +3,20 @@
 
 import os
 from os import path
+import re
+import json
+import hashlib
 import argparse
 #import shutil
 #from kemet_data import project_dir
 
+import kemet
+
+_kk_manifest = "kk_manifest.json"
+_kk_manifest_version = 1
+_kk_compiler_version = 2
+_definition_tokens = re.compile(r"K[0-9]{5}|M[0-9]{5}|--|[()+, -]")
+
 def set_directories(dir_base, gapfill_usage=False):
     """
     Setup function to generate folders and instruction files for
@@ -28,6 +38,7 @@ def set_directories(dir_base, gapfill_usage=False):
         "Knumber_ntsequences",
         "multiple_fasta",
         "HMM",
+        "HMM_profiles",
         "HMM_HITS",
         "genomes",
         "oneBM_modules",
@@ -47,8 +58,16 @@ def set_directories(dir_base, gapfill_usage=False):
     ko_file = path.join(dir_base, "ko_file.instruction")
     kegg_brite_organisms = path.join(dir_base, "br08601.keg")
 
-    os.system(f"curl --silent https://rest.kegg.jp/get/br:br08601 > {kegg_brite_organisms}")
-    print("KEGG Organisms hierarchy DOWNLOADED")
+    brite = kemet.kegg_get(["br:br08601"], validate=lambda text: "\nA" in text)["br:br08601"]
+    if brite is None:
+        print("KEGG Organisms hierarchy NOT DOWNLOADED (KEGG API not reachable)")
+    else:
+        with open(kegg_brite_organisms, "w") as f:
+            f.write(brite)
+        print("KEGG Organisms hierarchy DOWNLOADED")
+    if path.isfile(kegg_brite_organisms):
+        taxonomy_index = kemet.load_taxonomy_index(dir_base)
+        print(f"KEGG Organisms taxonomy index COMPILED ({len(taxonomy_index['lineage'])} organisms)")
 
     if path.isfile(genome_instruction_file):
         print("Instruction file ALREADY EXISTS")
@@ -83,11 +102,426 @@ def set_directories(dir_base, gapfill_usage=False):
 #        os.chdir("kemet_data")
 #        shutil.copytree(project_dir, path.join(dir_base, "kemet_data"))
 
-def set_kk_database():
-    pass
+def _tokenize_definition(definition):
+    """
+    Helper function to split a KEGG Module definition into tokens:
+    KOs, Module ids, "--" (undefined steps) and the "(", ")", ",", " ", "+", "-" operators.
+
+    Args:
+        definition              (str): KEGG Module definition
+
+    Returns:
+        tokens                 (list): Python-list object of tokens (repeated spaces are merged)
+    """
+    tokens = []
+    for token in _definition_tokens.findall(re.sub(r"\s+", " ", definition.strip())):
+        if token == " " and tokens and tokens[-1] in (" ", "(", ",", "+", "-"):
+            continue
+        if token in (")", ",", "+") and tokens and tokens[-1] == " ":
+            tokens.pop()
+        tokens.append(token)
+    return tokens
+
+def _parse_definition(tokens, definitions, pos=0):
+    """
+    Helper function to parse the tokens of a KEGG Module definition into a tree,
+    as KEGG Module definitions are written: the definition is a list of " "-separated steps, each one a list
+    of ","-separated alternatives (e.g. "K00001,K00002 K00003" is "(K00001,K00002) K00003"); within parentheses
+    "," (alternatives) binds looser than " " (steps), e.g. "((K00134,K00150) K00927,K11389)".
+    Both bind looser than "+"/"-" (complex components).
+    Referenced KEGG Modules are replaced by their own definition.
+
+    Args:
+        tokens                 (list): output of "_tokenize_definition()"
+        definitions            (dict): Python-dictionary object: {KEGG Module id : definition lines}
+        pos           (int, optional): position of the first token to parse. Defaults to 0.
+
+    Returns:
+        node                  (tuple): ("seq", steps), ("alt", options), ("cplx", [(operator, node)]), ("module", node), ("ko", KO) or ("none",)
+        pos                     (int): position of the first token not parsed
+    """
+    def parse_item(pos):
+        token = tokens[pos]
+        if token == "(":
+            node, pos = parse_alt(pos+1, False)
+            return node, pos+1
+        if token.startswith("M"):
+            lines = definitions.get(token, [])
+            if not lines:
+                return ("none",), pos+1
+            node, _ = _parse_definition(_tokenize_definition(" ".join(lines)), definitions)
+            return ("module", node), pos+1
+        if token == "--":
+            return ("none",), pos+1
+        return ("ko", token), pos+1
+
+    def parse_cplx(pos):
+        components = []
+        operator = "+"
+        if tokens[pos] == "-":
+            operator, pos = "-", pos+1
+        while True:
+            node, pos = parse_item(pos)
+            components.append((operator, node))
+            if pos < len(tokens) and tokens[pos] in ("+", "-"):
+                operator, pos = tokens[pos], pos+1
+                continue
+            break
+        if len(components) == 1 and components[0][0] == "+":
+            return components[0][1], pos
+        return ("cplx", components), pos
+
+    def parse_seq(pos, top):
+        steps = []
+        while True:
+            node, pos = parse_alt(pos, top) if top else parse_cplx(pos)
+            steps.append(node)
+            if pos < len(tokens) and tokens[pos] == " ":
+                pos += 1
+                continue
+            break
+        return (("seq", steps) if len(steps) > 1 else steps[0]), pos
+
+    def parse_alt(pos, top):
+        options = []
+        while True:
+            node, pos = parse_cplx(pos) if top else parse_seq(pos, top)
+            options.append(node)
+            if pos < len(tokens) and tokens[pos] == ",":
+                pos += 1
+                continue
+            break
+        return (("alt", options) if len(options) > 1 else options[0]), pos
+
+    return parse_seq(pos, True)
 
-def update_kk_database():
-    pass
+def _node_kos(node):
+    """
+    Helper function to list the KOs of a parsed KEGG Module definition (sub-)tree, in definition order.
+
+    Args:
+        node                  (tuple): output of "_parse_definition()"
+
+    Returns:
+        kos                    (list): Python-list object of KOs
+    """
+    if node[0] == "ko":
+        return [node[1]]
+    if node[0] == "none":
+        return []
+    if node[0] == "module":
+        return _node_kos(node[1])
+    children = [ child for _, child in node[1] ] if node[0] == "cplx" else node[1]
+    return [ ko for child in children for ko in _node_kos(child) ]
+
+def _optional_kos(node):
+    """
+    Helper function to list the optional KOs (i.e. "-" components) of a complex (sub-)tree.
+
+    Args:
+        node                  (tuple): output of "_parse_definition()"
+
+    Returns:
+        optional               (list): Python-list object of optional KOs
+    """
+    if node[0] == "cplx":
+        return [ ko for operator, child in node[1]
+                 for ko in (_node_kos(child) if operator == "-" else _optional_kos(child)) ]
+    if node[0] in ("alt", "seq"):
+        return [ ko for child in node[1] for ko in _optional_kos(child) ]
+    if node[0] == "module":
+        return _optional_kos(node[1])
+    return []
+
+def _complex_strings(node):
+    """
+    Helper function to expand a complex (sub-)tree into every combination of its components,
+    formatted as in the COMPLEXES_LIST of .kk files (e.g. "K00239+K00240+K00241-K00242").
+
+    Args:
+        node                  (tuple): output of "_parse_definition()"
+
+    Returns:
+        complexes              (list): Python-list object of complex strings
+    """
+    if node[0] == "cplx":
+        complexes = [""]
+        for operator, child in node[1]:
+            complexes = [ prefix + operator + suffix for suffix in _complex_strings(child) for prefix in complexes ]
+        return [ singlecomplex[1:] if singlecomplex.startswith("+") else singlecomplex for singlecomplex in complexes ]
+    if node[0] == "alt":
+        return [ singlecomplex for child in node[1] for singlecomplex in _complex_strings(child) ]
+    if node[0] == "seq":
+        return ["+".join(_node_kos(node))]
+    if node[0] == "module":
+        return _complex_strings(node[1])
+    if node[0] == "ko":
+        return [node[1]]
+    return [""]
+
+def _definition_paths(node, complexes, optional):
+    """
+    Helper function to expand a parsed KEGG Module definition into blocks.
+    Alternatives of a single step are merged in a single block. Each multiple-steps alternative
+    (or referenced KEGG Module) gives its own paths, i.e. "//" alternative sub-modules, so that steps
+    of different alternatives are never mixed; single-step alternatives are added to each step of the first one.
+
+    Args:
+        node                  (tuple): output of "_parse_definition()"
+        complexes              (list): Python-list object, extended with the complexes found
+        optional               (list): Python-list object, extended with the optional KOs found
+
+    Returns:
+        paths                  (list): Python-list object of paths, each one a list of blocks (lists of KOs)
+    """
+    if node[0] == "ko":
+        return [[[node[1]]]]
+    if node[0] == "none":
+        return [[]]
+    if node[0] == "cplx":
+        optional.extend(_optional_kos(node))
+        if len(node[1]) > 1:
+            complexes.extend(_complex_strings(node))
+        return [[_node_kos(node)]]
+    if node[0] == "module":
+        return _definition_paths(node[1], complexes, optional)
+    if node[0] == "seq":
+        paths = [[]]
+        for child in node[1]:
+            paths = [ path_a + path_b for path_a in paths for path_b in _definition_paths(child, complexes, optional) ]
+        return paths
+
+    options = [ _definition_paths(child, complexes, optional) for child in node[1] ]
+    single = [ child[0] != "module" and len(option) == 1 and len(option[0]) <= 1
+               for child, option in zip(node[1], options) ]
+    if all(single):
+        return [[[ ko for option in options for block in option[0] for ko in block ]]]
+    # single-step alternatives are kept in the paths of the first multiple-steps alternative
+    first = single.index(False)
+    paths = []
+    for i, option in enumerate(options):
+        if single[i]:
+            continue
+        for path_i in option:
+            paths.append([ [ ko for j, other in enumerate(options)
+                             for ko in (block if j == i else other[0][0] if i == first and single[j] and other[0] else []) ]
+                           for block in path_i ])
+    return paths
+
+def compile_kk_file(module, name, definition_lines, definitions):
+    """
+    Compiles the DEFINITION of a KEGG Module into the content of its .kk file:
+    blocks (1 per line, KOs comma-separated), "/" sub-modules for multiple-lines definitions,
+    "//" alternative sub-modules, COMPLEXES_LIST and OPTIONAL_LIST.
+
+    Args:
+        module                  (str): KEGG Module id (e.g. "M00001")
+        name                    (str): KEGG Module NAME
+        definition_lines       (list): KEGG Module DEFINITION lines
+        definitions            (dict): Python-dictionary object: {KEGG Module id : definition lines}, for referenced Modules
+
+    Returns:
+        kk_content              (str): .kk file content (empty if the definition has no KOs)
+    """
+    complexes, optional = [], []
+    lines_paths = []
+    for line in definition_lines:
+        tokens = _tokenize_definition(line)
+        if not tokens:
+            continue
+        node, _ = _parse_definition(tokens, definitions)
+        lines_paths.append([ [ block for block in path_i if block ]
+                             for path_i in _definition_paths(node, complexes, optional) ])
+
+    kk_lines = [f"{module}_{name}"]
+    if all( len(line_paths) == 1 for line_paths in lines_paths ):
+        for line_paths in lines_paths:
+            if len(lines_paths) > 1:
+                kk_lines.append("/")
+            kk_lines.extend( ", ".join(block) for block in line_paths[0] )
+    else:
+        paths = [[]]
+        for line_paths in lines_paths:
+            paths = [ path_a + path_b for path_a in paths for path_b in line_paths ]
+        for path_i in paths:
+            kk_lines.append("//")
+            kk_lines.extend( ", ".join(block) for block in path_i )
+    if len(kk_lines) == 1 or all( line in ("/", "//") for line in kk_lines[1:] ):
+        return ""
+
+    complexes = list(dict.fromkeys( singlecomplex for singlecomplex in complexes if singlecomplex ))
+    if complexes:
+        kk_lines += ["COMPLEXES_LIST", ", ".join(complexes)]
+        if optional:
+            kk_lines += ["OPTIONAL_LIST", ", ".join(dict.fromkeys(optional))]
+    return "\n".join(kk_lines) + "\n"
+
+
+def _source_digests(Modules_directory, module_files, definitions):
+    """
+    Helper function to fingerprint the KEGG Modules flat-files by content.
+    The digest of a Module also covers the KEGG Modules referenced in its definition (e.g. M00611).
+
+    Args:
+        Modules_directory       (str): KEGG Modules flat-files folder path
+        module_files           (dict): Python-dictionary object: {KEGG Module id : flat-file name}
+        definitions            (dict): Python-dictionary object: {KEGG Module id : definition lines}
+
+    Returns:
+        digests                (dict): Python-dictionary object: {KEGG Module id : SHA-1 digest}
+    """
+    file_digests = {}
+    for module, module_txt in module_files.items():
+        with open(path.join(Modules_directory, module_txt), "rb") as f:
+            file_digests[module] = hashlib.sha1(f.read()).hexdigest()
+
+    digests = {}
+    for module in module_files:
+        referenced, to_visit = [], [module]
+        while to_visit:
+            for reference in re.findall("M[0-9]{5}", " ".join(definitions.get(to_visit.pop(), []))):
+                if reference not in referenced and reference != module:
+                    referenced.append(reference)
+                    to_visit.append(reference)
+        digests[module] = hashlib.sha1(" ".join( file_digests.get(reference, "")
+                                                 for reference in [module] + sorted(referenced) ).encode()).hexdigest()
+    return digests
+
+def read_kk_manifest(kkfiles_directory):
+    """
+    Reads the manifest of the .kk files folder, written by "compile_kk_database()".
+
+    Args:
+        kkfiles_directory       (str): .kk files folder path
+
+    Returns:
+        manifest               (dict): Python-dictionary object (empty if missing or unreadable):
+                                        "version": manifest format version
+                                        "compiler_version": .kk files compiler version
+                                        "kkdb_version": compiled KEGG Modules database format version (see "kemet.py")
+                                        "kk_database_digest": "digest" of the compiled KEGG Modules database, for downstream caches
+                                        "modules": {KEGG Module id : {"source": flat-file name, "source_sha1": digest, "kk_sha1": .kk file digest,
+                                                    "curated": why the .kk file differs from its compiled flat-file, if it does}}
+    """
+    try:
+        with open(path.join(kkfiles_directory, _kk_manifest)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    return manifest
+
+def compile_kk_database(dir_base, incremental=True, force=False):
+    """
+    Compiles the DEFINITION of each KEGG Module flat-file into its .kk file,
+    then the compiled KEGG Modules database and the KEGG Modules catalog (KO indexes) used by "kemet.py".
+    Incrementally, only Modules whose flat-file content changed since the last manifest are compiled again.
+    Curated .kk files, i.e. differing from their compiled flat-file (as shipped, recorded in the manifest,
+    or edited after their compilation), are kept unless their own flat-file changed.
+    A .kk file without manifest entry is kept as curated as well. A new manifest is written at the end.
+
+    Args:
+        dir_base                   (str): folder path in which "kemet.py" is going to be executed
+        incremental     (bool, optional): compile only changed KEGG Modules. Defaults to True.
+        force           (bool, optional): compile every KEGG Module, replacing curated .kk files too. Defaults to False.
+
+    Returns:
+        manifest                  (dict): output of "read_kk_manifest()" for the new manifest
+    """
+    Modules_directory = path.join(dir_base, "KEGG_MODULES")
+    kkfiles_directory = path.join(Modules_directory, "kk_files")
+    if not path.isdir(kkfiles_directory):
+        os.mkdir(kkfiles_directory)
+
+    previous = read_kk_manifest(kkfiles_directory)
+    if previous.get("version") != _kk_manifest_version:
+        previous = {}
+    # .kk files of another compiler version are compiled again, curated ones excepted
+    same_compiler = incremental and previous.get("compiler_version") == _kk_compiler_version
+    previous_modules = previous.get("modules", {})
+
+    module_files = { module_txt[:6]: module_txt for module_txt in sorted(os.listdir(Modules_directory))
+                     if module_txt.endswith(".txt") and re.match("M[0-9]{5}", module_txt) }
+    records = { module: kemet.parse_module_flat_file(path.join(Modules_directory, module_txt))
+                for module, module_txt in module_files.items() }
+    definitions = { module: module_record["definition"] for module, module_record in records.items() }
+    digests = _source_digests(Modules_directory, module_files, definitions)
+
+    modules, compiled, unchanged, curated = {}, [], [], []
+    for module, module_txt in module_files.items():
+        kk_path = path.join(kkfiles_directory, module + ".kk")
+        entry = previous_modules.get(module)
+        if path.isfile(kk_path) and not force and (entry is None or entry.get("source_sha1") == digests[module]):
+            with open(kk_path, "rb") as f:
+                kk_sha1 = hashlib.sha1(f.read()).hexdigest()
+            if entry is None:
+                entry = {"curated": "no manifest entry, kept as found"}
+            elif kk_sha1 != entry.get("kk_sha1") and "curated" not in entry:
+                entry = dict(entry, curated="edited after compilation")
+            if "curated" in entry or same_compiler:
+                modules[module] = dict(entry, source=module_txt, source_sha1=digests[module], kk_sha1=kk_sha1)
+                (curated if "curated" in entry else unchanged).append(module)
+                continue
+
+        kk_content = compile_kk_file(module, records[module]["name"], records[module]["definition"], definitions)
+        if entry is not None and "curated" in entry and path.isfile(kk_path):
+            print(f"{module} curated .kk file REPLACED ({entry['curated']})")
+        if not kk_content:
+            print(f"{module} definition without KOs: SKIPPED")
+            if path.isfile(kk_path):
+                os.remove(kk_path)
+            continue
+        with open(kk_path, "w") as f:
+            f.write(kk_content)
+        modules[module] = {"source": module_txt, "source_sha1": digests[module],
+                           "kk_sha1": hashlib.sha1(kk_content.encode()).hexdigest()}
+        compiled.append(module)
+
+    removed = [ module for module in previous_modules if module not in module_files ]
+    for module in removed:
+        kk_path = path.join(kkfiles_directory, module + ".kk")
+        if path.isfile(kk_path):
+            os.remove(kk_path)
+
+    kk_database = kemet.load_kk_database(kkfiles_directory)
+    kemet.load_module_catalog(Modules_directory)
+
+    manifest = {
+        "version": _kk_manifest_version,
+        "compiler_version": _kk_compiler_version,
+        "kkdb_version": kk_database["version"],
+        "kk_database_digest": kk_database["digest"],
+        "modules": modules,
+    }
+    manifest_path = path.join(kkfiles_directory, _kk_manifest)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    print(f"KEGG Module DB: {len(compiled)} .kk files COMPILED, {len(unchanged)} UNCHANGED, {len(curated)} CURATED KEPT, "
+          f"{len(removed)} REMOVED")
+    return manifest
+
+def set_kk_database(dir_base, force=False):
+    """
+    Generates the KEGG Module DB (.kk files, compiled database and KO indexes) from every KEGG Module flat-file,
+    curated .kk files excepted (see "compile_kk_database()").
+
+    Args:
+        dir_base                   (str): folder path in which "kemet.py" is going to be executed
+        force           (bool, optional): replace curated .kk files too. Defaults to False.
+    """
+    compile_kk_database(dir_base, incremental=False, force=force)
+
+def update_kk_database(dir_base, force=False):
+    """
+    Updates the KEGG Module DB (.kk files, compiled database and KO indexes),
+    compiling only KEGG Module flat-files changed since the last generation/update.
+
+    Args:
+        dir_base                   (str): folder path in which "kemet.py" is going to be executed
+        force           (bool, optional): compile every KEGG Module, replacing curated .kk files too. Defaults to False.
+    """
+    compile_kk_database(dir_base, incremental=True, force=force)
 
 ###############################################################################
 
@@ -108,6 +542,10 @@ def main():
     parser.add_argument('-u','--update_kk_DB', action="store_true",
                         help='''
                         Choose this option to update already existing KEGG Module DB (.kk files).''')
+    parser.add_argument('-f','--force_kk_DB', action="store_true",
+                        help='''
+                        With -k/-u, compile every KEGG Module flat-file, replacing curated .kk files
+                        (e.g. shipped ones, differing from their flat-file as listed in kk_files/kk_manifest.json).''')
     parser.add_argument('-G','--gapfill_usage', action="store_true",
                         help='''
                         Choose this option to create required folders for the GSMM Gapfilling,
@@ -122,10 +560,10 @@ def main():
 
     #POSSIBILITY: ALLOW DYNAMIC kk-files DATABASE UPDATES
     if args.set_kk_DB:
-        set_kk_database()
+        set_kk_database(dir_base, force=args.force_kk_DB)
 
     elif args.update_kk_DB:
-        update_kk_database()
+        update_kk_database(dir_base, force=args.force_kk_DB)
 
     #if not "kemet_data" in os.listdir() and not "KEGG_MODULES" in os.listdir():
     #    copy_ref_kegg_modules_and_DB(project_dir, dir_base)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Tests of the KO pre-annotation inputs ("_open_annotation()" and the streaming record parsers), on the toy files:
+plain, ".gz" and ".zst" compressed files and standard input ("-") give the same genes and KOs.
+"""
+
+import gzip
+import io
+from os import path
+import shutil
+import sys
+
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+import kemet
+
+toy_dir = path.join(repo_dir, "toy")
+
+# toy file, pre-annotation format, conversion function, KOs and number of genes annotated with them
+_toy_files = [
+    ("bin1.emapper.annotations", "eggnog", kemet.eggnogXktest, {"K03785": 1, "K13832": 1, "K01129": 1}),
+    ("bin1.ko", "kaas", kemet.KAASXktest, {"K03785": 1, "K01129": 1}),
+    ("bin1_ko.txt", "kaas", kemet.KAASXktest, {"K01129": 1, "K02316": 1}),
+    ("bin1.txt", "kofamkoala", kemet.kofamXktest, {"K01129": 1, "K02316": 1, "K00812": 1}),
+    ("bin1.tsv", "kofamkoala", kemet.kofamXktest, {"K01129": 1, "K02316": 1, "K00812": 1}),
+]
+
+@pytest.fixture(params=["plain", "gz", "zst", "stdin"])
+def toy_input(request, tmp_path, monkeypatch):
+    """
+    Returns a function placing a toy file in the pre-annotation folder as the given input,
+    returning the pre-annotation file name to be read.
+    """
+    def place(toy_file):
+        toy_path = path.join(toy_dir, toy_file)
+        if request.param == "plain":
+            shutil.copy(toy_path, tmp_path / toy_file)
+            return toy_file
+        if request.param == "gz":
+            with open(toy_path, "rb") as f, gzip.open(tmp_path / (toy_file+".gz"), "wb") as g:
+                g.write(f.read())
+            return toy_file+".gz"
+        if request.param == "zst":
+            zstandard = pytest.importorskip("zstandard")
+            with open(toy_path, "rb") as f, open(tmp_path / (toy_file+".zst"), "wb") as g:
+                g.write(zstandard.ZstdCompressor().compress(f.read()))
+            return toy_file+".zst"
+        with open(toy_path) as f:
+            monkeypatch.setattr(sys, "stdin", io.StringIO(f.read()))
+        return "-"
+    return place
+
+@pytest.mark.parametrize("toy_file, annotation_format, converter, KOs", _toy_files)
+def test_records_of_compressed_and_standard_inputs(toy_input, tmp_path, toy_file, annotation_format, converter, KOs):
+    with kemet._open_annotation(toy_file, toy_dir) as f:
+        expected = list(kemet._annotation_records[annotation_format](f))
+    annotation_file = toy_input(toy_file)
+    with kemet._open_annotation(annotation_file, str(tmp_path)) as f:
+        assert list(kemet._annotation_records[annotation_format](f)) == expected
+    assert sum( len(gene_kos) for _, gene_kos in expected ) == sum(KOs.values())
+
+@pytest.mark.parametrize("toy_file, annotation_format, converter, KOs", _toy_files)
+def test_KOs_of_compressed_and_standard_inputs(toy_input, tmp_path, toy_file, annotation_format, converter, KOs):
+    annotation_file = toy_input(toy_file)
+    _, converted_KOs = converter(annotation_file, "bin1.ktest", str(tmp_path), str(tmp_path / "ktests"))
+    assert converted_KOs == KOs
+    assert kemet.ko_store_genome(kemet.open_ko_store(str(tmp_path / "ktests")), "bin1") == list(KOs)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Tests of the "--batch" mode of kemet.py, on the toy eggNOG pre-annotation.
+"""
+
+import os
+from os import path
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+
+_start_method_main = """
+import sys, multiprocessing
+sys.path.insert(0, {repo_dir!r})
+import kemet
+if __name__ == "__main__":
+    multiprocessing.set_start_method(sys.argv[1])
+    kemet.main(sys.argv[2:])
+"""
+
+@pytest.fixture
+def workspace(tmp_path):
+    """
+    KEMET working directory with 3 MAGs/Genomes sharing the toy pre-annotation.
+    """
+    os.mkdir(tmp_path / "KEGG_MODULES")
+    shutil.copytree(path.join(repo_dir, "KEGG_MODULES", "kk_files"), tmp_path / "KEGG_MODULES" / "kk_files",
+                    ignore=shutil.ignore_patterns("*.pkl"))
+    for folder in ("KEGG_annotations", "genomes", "output", "output/reports_txt", "output/reports_tsv", "output/ktests"):
+        os.mkdir(tmp_path / folder)
+    for genome in ("bin1", "bin2", "bin3"):
+        shutil.copy(path.join(repo_dir, "toy", "bin1.emapper.annotations"),
+                    tmp_path / "KEGG_annotations" / f"{genome}.emapper.annotations")
+        with open(tmp_path / "genomes" / f"{genome}.fa", "w") as f:
+            f.write(">contig\nACGT\n")
+    return tmp_path
+
+@pytest.mark.parametrize("start_method", ["spawn", "forkserver"])
+def test_batch_workers_use_run_settings(workspace, start_method):
+    # worker processes not forked from "main()" still write into the "-O" folder
+    with open(workspace / "start_method_main.py", "w") as f:
+        f.write(_start_method_main.format(repo_dir=repo_dir))
+    completed = subprocess.run([sys.executable, "start_method_main.py", start_method, "--batch", "*.fa", "-a", "eggnog",
+                                "--skip_hmm", "-q", "--workers", "2", "-O", str(workspace / "output"),
+                                "-I", str(workspace / "KEGG_annotations")],
+                               cwd=workspace, capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+    assert sorted(os.listdir(workspace / "output" / "reports_tsv")) == ["reportKMC_bin1.tsv", "reportKMC_bin2.tsv", "reportKMC_bin3.tsv"]
+    assert not path.exists(workspace / "reports_tsv")
+
+def test_batch_requires_annotation_format(workspace):
+    completed = subprocess.run([sys.executable, path.join(repo_dir, "kemet.py"), "--batch", "*.fa", "--skip_hmm"],
+                               cwd=workspace, capture_output=True, text=True)
+    assert completed.returncode == 2
+    assert "-a/--annotation_format argument is required with --batch" in completed.stderr
+
+def test_batch_lists_annotations_once(workspace, monkeypatch):
+    sys.path.insert(0, repo_dir)
+    import kemet
+
+    listed = []
+    listdir = os.listdir
+    def counting_listdir(folder):
+        listed.append(str(folder))
+        return listdir(folder)
+
+    config = kemet._run_config()
+    kemet.set_io_directories(str(workspace / "KEGG_annotations"), str(workspace / "output"))
+    try:
+        args = kemet.build_parser().parse_args(["--batch", "*.fa", "-a", "eggnog", "--skip_hmm", "-q"])
+        kk_database = kemet.compile_kk_database(str(workspace / "KEGG_MODULES" / "kk_files"))
+        monkeypatch.setattr(kemet.os, "listdir", counting_listdir)
+        failed = kemet.run_batch(["bin1.fa", "bin2.fa", "bin3.fa"], args, kk_database, {})
+    finally:
+        kemet._apply_run_config(config)
+    assert failed == []
+    assert listed.count(str(workspace / "KEGG_annotations")) == 1
+    assert sorted(listdir(workspace / "output" / "reports_tsv")) == ["reportKMC_bin1.tsv", "reportKMC_bin2.tsv", "reportKMC_bin3.tsv"]
+
+def test_annotation_files(tmp_path):
+    sys.path.insert(0, repo_dir)
+    import kemet
+
+    for file in ("bin1.emapper.annotations.gz", "bin1.emapper.annotations", "bin10.emapper.annotations",
+                 "bin2.tsv", ".emapper.annotations", "notes.txt"):
+        open(tmp_path / file, "w").close()
+    assert kemet.annotation_files(str(tmp_path), "eggnog") == {"bin1": "bin1.emapper.annotations",
+                                                               "bin10": "bin10.emapper.annotations"}
+    assert kemet.annotation_files(str(tmp_path), "kofamkoala") == {"bin2": "bin2.tsv", "notes": "notes.txt"}
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Tests of the batch KEGG Modules completeness of kemet.py ("--batch_completeness", "--columnar"):
+on the shipped ".kk" files, NumPy results are the same of the single-genome reports of "testcompleteness()".
+"""
+
+from os import path
+import random
+import re
+import subprocess
+import sys
+
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+import kemet
+
+np = pytest.importorskip("numpy")
+
+@pytest.fixture(scope="module")
+def kk_database():
+    return kemet.compile_kk_database(path.join(repo_dir, "KEGG_MODULES", "kk_files"))
+
+@pytest.fixture(scope="module")
+def genomes_kos(kk_database):
+    """
+    MAGs/Genomes with none, some and all the KOs of the KEGG Modules, plus a KO of none of them.
+    """
+    ko_ids = sorted(kk_database["ko_ids"])
+    rng = random.Random(0)
+    genomes_kos = {"none": [], "all": ko_ids}
+    for n in range(1, 8):
+        genomes_kos[f"bin{n}"] = rng.sample(ko_ids, len(ko_ids) * n // 8) + ["K99999"]
+    return genomes_kos
+
+def _read_table(file):
+    with open(file) as f:
+        header = f.readline().rstrip("\n").split("\t")[1:]
+        return { line.split("\t")[0]: dict(zip(header, line.rstrip("\n").split("\t")[1:])) for line in f }
+
+@pytest.mark.parametrize("as_kegg", [False, True])
+def test_batch_matches_single_genome_reports(kk_database, genomes_kos, tmp_path, as_kegg):
+    # a small chunk size, for genomes evaluated in more chunks
+    batch = kemet.batch_completeness(genomes_kos, kk_database, chunk_size=3, missing=True)
+    kemet.write_batch_completeness(batch, str(tmp_path), "KMC_batch", as_kegg=as_kegg)
+    tables = { table: _read_table(path.join(tmp_path, f"KMC_batch_{table}.tsv"))
+               for table in ("percentage", "completeness", "blocks") }
+    n_modules = len(batch["modules"])
+
+    for g, (genome, ko_list) in enumerate(genomes_kos.items()):
+        genome_state = kemet.testcompleteness(ko_list, kk_database, str(tmp_path), f"{genome}.txt",
+                                              str(tmp_path), f"{genome}.tsv", as_kegg=as_kegg)
+        with open(path.join(tmp_path, f"{genome}.tsv")) as f:
+            report_tsv = { line.split("\t")[0]: line.split("\t") for line in f }
+        with open(path.join(tmp_path, f"{genome}.txt")) as f:
+            report_txt = re.findall(r"^(M\d{5})\.kk\t.*\n%\t(\S+)\t\d+__\d+\t(\w+)$", f.read(), re.M)
+        assert list(report_tsv) == batch["modules"]
+        assert [ module for module, _, _ in report_txt ] == batch["modules"]
+
+        for m, (module, percentage, completeness) in enumerate(report_txt):
+            _, _, classification, blocks = report_tsv[module][:4]
+            assert tables["blocks"][genome][module] == blocks
+            assert tables["completeness"][genome][module] == classification
+            # flat-file blocks are counted on the best sub-module, percentages are the same
+            assert float(tables["percentage"][genome][module]) == float(percentage)
+            assert (completeness == "COMPLETE") == (batch["percentage"][g, m] == 100)
+            i = g * n_modules + m
+            batch_missing = [ batch["ko_ids"][ko] for ko in batch["missing_kos"][batch["missing_offsets"][i]:batch["missing_offsets"][i+1]] ]
+            assert set(batch_missing) == set(genome_state["results"][module+".kk"]["Kmissing"])
+
+@pytest.mark.parametrize("as_kegg", [False, True])
+def test_columnar_round_trip(kk_database, genomes_kos, tmp_path, as_kegg):
+    batch = kemet.batch_completeness(genomes_kos, kk_database, missing=True)
+    columnar_file = kemet.write_columnar_completeness(batch, kk_database, str(tmp_path), "KMC_batch", as_kegg=as_kegg)
+    columns = kemet.load_columnar_completeness(columnar_file)
+
+    assert list(columns["genomes"]) == batch["genomes"]
+    assert list(columns["modules"]) == batch["modules"]
+    assert list(columns["ko_ids"]) == batch["ko_ids"]
+    for column in ("percentage", "present", "total", "missing_kos", "missing_offsets"):
+        assert isinstance(columns[column], np.memmap)
+        assert np.array_equal(columns[column], batch[column])
+    levels = np.array(columns["classification_levels"])
+    assert np.array_equal(levels[columns["classification"]], kemet.batch_completeness_tsv(batch, as_kegg=as_kegg).astype(str))
+
+@pytest.mark.parametrize("mode", [["bin1.fna", "-a", "eggnog"], ["--batch", "-a", "eggnog"]])
+def test_columnar_rejected_without_batch_completeness(tmp_path, mode):
+    completed = subprocess.run([sys.executable, path.join(repo_dir, "kemet.py"), *mode, "--columnar", "npz"],
+                               cwd=tmp_path, capture_output=True, text=True)
+    assert completed.returncode == 2
+    assert "--columnar is only supported with --batch_completeness" in completed.stderr
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Tests of the KO sets completing the missing blocks of KEGG Modules ("completion_candidates()"),
+ranked by the KEGG GENES reference sequences already downloaded ("ko_reference_costs()"), on the shipped .kk files.
+"""
+
+import os
+from os import path
+import sys
+
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+import kemet
+
+# TCA cycle (M00009): blocks 4 and 5 are partially present complexes, block 6 misses an optional KO only
+tca_kos = ["K01647", "K01681", "K00031", "K00164", "K00658", "K01902", "K00239", "K00240", "K00241", "K00026"]
+
+@pytest.fixture(scope="module")
+def kk_database():
+    return kemet.compile_kk_database(path.join(repo_dir, "KEGG_MODULES", "kk_files"))
+
+def test_ko_reference_costs(tmp_path):
+    for K, files in {"K00001": ["eco:b0001.fna", "eco:b0002.fna", "bsu:BSU00010.fna", "K00001.lock"], "K00002": []}.items():
+        os.makedirs(tmp_path / K)
+        for file in files:
+            open(tmp_path / K / file, "w").close()
+    # KOs not downloaded yet have no cost
+    assert kemet.ko_reference_costs(["K00001", "K00002", "K00003"], str(tmp_path)) == {"K00001": 3, "K00002": 0}
+
+def test_ranked_candidates(kk_database):
+    genome_state = kemet.evaluate_genome(tca_kos, kk_database)
+    # KOs without downloaded sequences cost as much as the most expensive one
+    ko_costs = {"K00382": 5, "K00174": 1, "K00175": 1}
+    completion = kemet.completion_candidates(genome_state, ko_costs=ko_costs)
+
+    missing = { block["label"]: block["candidates"] for block in completion["M00009.kk"] }
+    assert list(missing) == ["4.", "5.", "7."]
+    # missing KOs of complexes only, cheapest first; same cost options in the order of the definition
+    assert missing["4."] == [(2, ("K00174", "K00175")), (5, ("K00382",))]
+    assert missing["5."] == [(5, ("K18118",)), (5, ("K01903",)), (10, ("K01899", "K01900"))]
+    assert missing["7."] == [(5, ("K01676",)), (5, ("K01679",)), (10, ("K01677", "K01678"))]
+
+    completion = kemet.completion_candidates(genome_state, ko_costs=ko_costs, max_candidates=1)
+    assert [ block["candidates"] for block in completion["M00009.kk"] ] == [
+        [(2, ("K00174", "K00175"))], [(5, ("K18118",))], [(5, ("K01676",))]]
+
+def test_modules_of_interest(kk_database):
+    genome_state = kemet.evaluate_genome(tca_kos, kk_database)
+    assert list(kemet.completion_candidates(genome_state, modules=["M00009", "M00011"])) == ["M00009.kk", "M00011.kk"]
+    genome_state = kemet.evaluate_genome(kk_database["modules"]["M00009.kk"]["module_kos"], kk_database)
+    # complete KEGG Modules have nothing to be completed
+    assert kemet.completion_candidates(genome_state, modules=["M00009"]) == {}
+
+@pytest.mark.parametrize("ko_list, labels", [
+    # the alternative with the fewest missing blocks, even if more expensive
+    (["K00963", "K16150"], ["3.1"]),
+    # the same number of missing blocks: the cheapest first candidates
+    (["K00963", "K00975"], ["2.2", "1.3"]),
+    # an alternative is already complete
+    (["K00975", "K00703", "K00700"], None),
+])
+def test_alternatives_of_a_module(kk_database, ko_list, labels):
+    # glycogen biosynthesis (M00854): "1.1 2.1 3.1" or "1.2 2.2 1.3" blocks
+    genome_state = kemet.evaluate_genome(ko_list, kk_database)
+    completion = kemet.completion_candidates(genome_state, modules=["M00854"], ko_costs={"K00703": 1, "K00700": 1, "K16150": 9})
+    if labels is None:
+        assert completion == {}
+    else:
+        assert [ block["label"] for block in completion["M00854.kk"] ] == labels
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Tests of concurrent KEMET runs within one process: KO store appends/reads and
+genomes run in threads with their own IO folders.
+"""
+
+import os
+from os import path
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+import kemet
+
+def _kos(i):
+    # KOs shared by every genome, plus KOs first seen with genome i
+    return [ f"K{k:05d}" for k in range(10) ] + [ f"K{10000 + 3*i + k:05d}" for k in range(3) ]
+
+def test_ko_store_concurrent_appends_and_reads(tmp_path):
+    ktests_directory = str(tmp_path / "ktests")
+    genomes = 200
+    done = threading.Event()
+
+    def append(i):
+        kemet.ko_store_append(ktests_directory, f"genome{i}", _kos(i))
+
+    def read():
+        while not done.is_set():
+            kemet.open_ko_store(ktests_directory)
+
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        readers = [ ex.submit(read) for _ in range(4) ]
+        for future in [ ex.submit(append, i) for i in range(genomes) ]:
+            future.result()
+        done.set()
+        for future in readers:
+            future.result()
+
+    store = kemet.open_ko_store(ktests_directory)
+    with open(path.join(ktests_directory, "ko_store.kos")) as f:
+        assert store["ko_ids"] == f.read().splitlines()
+    assert len(store["ko_index"]) == len(store["ko_ids"]) == 10 + 3*genomes
+    for i in range(genomes):
+        assert kemet.ko_store_genome(store, f"genome{i}") == _kos(i)
+
+    # a process opening the store afterwards reads the same KOs
+    kemet._ko_stores.pop(ktests_directory)
+    store = kemet.open_ko_store(ktests_directory)
+    for i in range(genomes):
+        assert kemet.ko_store_genome(store, f"genome{i}") == _kos(i)
+
+def test_ko_store_recreated(tmp_path):
+    # a ".ktest" files folder removed and filled again is read from the beginning
+    ktests_directory = str(tmp_path / "ktests")
+    for i in range(3):
+        kemet.ko_store_append(ktests_directory, f"genome{i}", _kos(i))
+    shutil.rmtree(ktests_directory)
+    kemet.ko_store_append(ktests_directory, "genome9", _kos(9))
+
+    store = kemet.open_ko_store(ktests_directory)
+    assert sorted(store["genomes"]) == ["genome9"]
+    assert kemet.ko_store_genome(store, "genome9") == _kos(9)
+
+# KOs of the first steps of glycolysis (M00001) and of the TCA cycle (M00009)
+_glycolysis = ["K00844", "K01810", "K00850", "K01623", "K01803", "K00134", "K00927"]
+_tca = ["K01647", "K01681", "K00031", "K00164", "K00658", "K00382", "K01902", "K01903"]
+
+@pytest.fixture
+def workspaces(tmp_path):
+    """
+    Two KEMET runs sharing the compiled KEGG Modules, with their own pre-annotation and output folders:
+    MAGs/Genomes have the same names in both runs, but different KOs.
+    """
+    runs = {}
+    for run, kos in (("A", _glycolysis), ("B", _tca)):
+        os.makedirs(tmp_path / run / "KEGG_annotations")
+        for folder in ("reports_txt", "reports_tsv", "ktests", "klists"):
+            os.makedirs(tmp_path / run / "output" / folder)
+        for n, genome in enumerate(("bin1", "bin2", "bin3"), 1):
+            with open(tmp_path / run / "KEGG_annotations" / f"{genome}.emapper.annotations", "w") as f:
+                f.write("#query_name\tKEGG_ko\n")
+                for i, ko in enumerate(kos[:len(kos)-n+1]):
+                    f.write(f"{genome}_{i}\tko:{ko}\n")
+        runs[run] = kemet.io_directories(str(tmp_path / run / "KEGG_annotations"), str(tmp_path / run / "output"))
+    return runs
+
+def _reports(io):
+    reports = {}
+    for folder in ("report_txt_directory", "report_tsv_directory"):
+        for report in sorted(os.listdir(io[folder])):
+            with open(path.join(io[folder], report)) as f:
+                reports[report] = f.read()
+    return reports
+
+def test_concurrent_runs_keep_their_outputs(workspaces, tmp_path):
+    kk_database = kemet.load_kk_database(kemet.kkfiles_directory)
+    args = kemet.build_parser().parse_args(["--batch", "*.fa", "-a", "eggnog", "--skip_hmm", "-q"])
+    genomes = ["bin1.fa", "bin2.fa", "bin3.fa"]
+
+    # sequential runs first, as reference
+    expected = {}
+    for run, io in workspaces.items():
+        assert kemet.run_batch(genomes, args, kk_database, {}, io=io) == []
+        expected[run] = _reports(io)
+        for folder in ("report_txt_directory", "report_tsv_directory", "ktests_directory"):
+            shutil.rmtree(io[folder])
+            os.mkdir(io[folder])
+    assert expected["A"] != expected["B"]
+    assert len(set(expected["A"].values())) == len(expected["A"])
+
+    # the same runs, genome by genome in threads, interleaved
+    with ThreadPoolExecutor(max_workers=6) as ex:
+        futures = [ ex.submit(kemet.run_genome, genome, args, kk_database, {}, io=io)
+                    for genome in genomes for io in workspaces.values() ]
+        for future in futures:
+            future.result()
+    for run, io in workspaces.items():
+        assert _reports(io) == expected[run]
+        store = kemet.open_ko_store(io["ktests_directory"])
+        assert sorted(store["genomes"]) == ["bin1", "bin2", "bin3"]
+    assert not path.exists(path.join(kemet.output_directory, "reports_tsv", "reportKMC_bin1.tsv"))
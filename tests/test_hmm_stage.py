@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Tests of the HMM stage of concurrent KEMET runs within one process ("hmm_for_genome()"),
+with KEGG API, MAFFT, hmmbuild and nhmmer stubs: each run keeps MSAs, profile HMMs and hits in its own output folder,
+while KEGG taxonomies and GENES sequences are shared in the KEMET folder.
+"""
+
+import os
+from os import path
+import random
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+import kemet
+
+_br08601 = """+C\tOrganisms
+!
+A<b>Prokaryotes</b>
+B  Bacteria
+C    Gammaproteobacteria - Enterobacteria
+D      Escherichia
+E        T00007  eco  Escherichia coli K-12 MG1655
+C    Firmicutes - Bacilli
+D      Bacillus
+E        T00010  bsu  Bacillus subtilis subsp. subtilis 168
+!
+"""
+_taxonomy = "Gammaproteobacteria - Enterobacteria"
+_kos = ["K00844", "K01810"]
+
+def _nhmmer_hits(K, score):
+    """
+    nhmmer "--tblout" table with a single hit of K on "contig1" (positions 1-300, "+" strand).
+    """
+    header = ("# target name        accession  query name           accession  hmmfrom hmm to alifrom  ali to envfrom  env to"
+              "  sq len strand   E-value  score  bias  description of target\n"
+              "#------------------- ---------- -------------------- ---------- ------- ------- ------- ------- ------- -------"
+              " ------- ------ --------- ------ ----- ---------------------\n")
+    hit = f"{'contig1':<20} {'-':<10} {K:<20} {'-':<10} {1:>7} {300:>7} {1:>7} {300:>7} {1:>7} {300:>7} {1200:>7} {'+':>6} {'1e-50':>9} {score:>6} {'0.1':>5} -\n"
+    return header + hit + "#\n" * 9
+
+@pytest.fixture
+def kemet_folder(tmp_path, monkeypatch):
+    """
+    KEMET folder shared by two runs (with their own pre-annotation and output folders),
+    with KEGG API and HMMER/MAFFT stubs recording the working folder of each command.
+    """
+    base = tmp_path / "kemet"
+    for folder in ("genomes", "taxonomies", "Knumber_ntsequences"):
+        os.makedirs(base / folder)
+    with open(base / "br08601.keg", "w") as f:
+        f.write(_br08601)
+    with open(base / "ko_file.instruction", "w") as f:
+        f.write("\n".join(_kos) + "\n")
+    rng = random.Random(0)
+    with open(base / "genomes" / "bin1.fna", "w") as f:
+        f.write(">contig1\n")
+        for _ in range(20):
+            f.write("".join( rng.choice("ACGT") for _ in range(60) ) + "\n")
+
+    def kegg_get(entries, base_url=None, validate=None, rate=None, connections=None, retries=None, callback=None):
+        results = {}
+        for entry in entries:
+            if entry.endswith("/ntseq"):
+                results[entry] = "".join( f">{gene} stub\nACGT{'ACGT' * int(gene[-1])}\n"
+                                          for gene in entry[:-len("/ntseq")].split("+") )
+            else:
+                results[entry] = f"ENTRY       {entry}\nGENES       ECO: b0001 b0002\n            BSU: BSU00010\n///\n"
+            if callback is not None:
+                callback(entry, results[entry])
+        return results
+    monkeypatch.setattr(kemet, "kegg_get", kegg_get)
+
+    commands = []
+    barrier = threading.Barrier(2)
+    searching = set()
+    def run_command(command, cwd):
+        K = re.search(r"K\d{5}", command).group()
+        commands.append((command.split()[0], cwd))
+        if command.startswith("mafft"):
+            with open(path.join(cwd, f"MSA_{K}.fna")) as f, open(path.join(cwd, f"{K}.msa"), "w") as g:
+                g.write(f.read())
+        elif command.startswith("hmmbuild"):
+            with open(path.join(cwd, f"{K}.hmm"), "w") as f:
+                f.write(f"HMMER3/f\nNAME  {K}\n//\n")
+        elif command.startswith("nhmmer"):
+            # both runs are in their HMM stage at the same time
+            if threading.get_ident() not in searching:
+                searching.add(threading.get_ident())
+                barrier.wait(timeout=30)
+            with open(path.join(cwd, f"{K}.hits"), "w") as f:
+                f.write(_nhmmer_hits(K, "200.0"))
+    monkeypatch.setattr(kemet, "_run_command", run_command)
+
+    runs = {}
+    for run in ("A", "B"):
+        os.makedirs(tmp_path / run / "KEGG_annotations")
+        for folder in ("reports_txt", "reports_tsv", "ktests", "klists"):
+            os.makedirs(tmp_path / run / "output" / folder)
+        with open(tmp_path / run / "KEGG_annotations" / "bin1.emapper.annotations", "w") as f:
+            f.write("#query_name\tKEGG_ko\nbin1_1\tko:K00001\n")
+        runs[run] = kemet.io_directories(str(tmp_path / run / "KEGG_annotations"), str(tmp_path / run / "output"),
+                                         dir_base=str(base), settings={"kegg_url": "stub", "seq_cache_ttl": None})
+    return {"base": str(base), "runs": runs, "commands": commands}
+
+def test_concurrent_hmm_stages_keep_their_outputs(kemet_folder):
+    kk_database = kemet.load_kk_database(path.join(repo_dir, "KEGG_MODULES", "kk_files"))
+    genomes_instruction = {"bin1.fna": (_taxonomy, "bacteria")}
+    # the same MAG/Genome, with a threshold rejecting the hits in run "B"
+    thresholds = {"A": "0.43", "B": "0.9"}
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        futures = [ ex.submit(kemet.run_genome, "bin1.fna",
+                              kemet.build_parser().parse_args(["bin1.fna", "-a", "eggnog", "--hmm_mode", "kos", "--skip_gsmm",
+                                                               "-q", "--threshold_value", thresholds[run]]),
+                              kk_database, genomes_instruction, io=io)
+                    for run, io in kemet_folder["runs"].items() ]
+        for future in futures:
+            future.result()
+
+    hits = {}
+    for run, io in kemet_folder["runs"].items():
+        with open(path.join(io["hmm_hits_dir"], "bin1_HMM_hits.txt")) as f:
+            hits[run] = [ line.split("\t")[0] for line in f.readlines()[1:] ]
+        for K in _kos:
+            assert path.isfile(path.join(io["hmm_dir"], "bin1", K, K+".hmm"))
+            assert path.isfile(path.join(io["hmm_dir"], "bin1", K, K+".hits"))
+    assert hits == {"A": _kos, "B": []}
+
+    # MSAs and profile HMMs of each run are built and searched in its own output folder
+    outputs = { run: path.dirname(io["msa_dir"].rstrip("/")) for run, io in kemet_folder["runs"].items() }
+    for tool in ("mafft", "hmmbuild", "nhmmer"):
+        cwds = [ cwd for command, cwd in kemet_folder["commands"] if command == tool ]
+        assert len(cwds) == 2 * len(_kos)
+        for output in outputs.values():
+            assert sum( cwd.startswith(output + "/") for cwd in cwds ) == len(_kos)
+    assert not path.exists(path.join(kemet_folder["base"], "multiple_fasta"))
+    assert not path.exists(path.join(kemet_folder["base"], "HMM_HITS"))
+
+    # KEGG taxonomies and GENES sequences are shared: only genes of the allowed species
+    base = kemet_folder["base"]
+    assert path.isfile(path.join(base, "taxonomies", _taxonomy+".keg"))
+    assert sorted(os.listdir(path.join(base, "Knumber_ntsequences", "_genes"))) == ["eco"]
+    assert sorted(os.listdir(path.join(base, "Knumber_ntsequences", _taxonomy.replace(" ", "_"), "K00844"))) == [
+        "eco:b0001.fna", "eco:b0002.fna"]
+
+def test_taxonomy_index_by_folder(tmp_path):
+    # taxonomies of different KEMET folders are resolved with their own "br08601.keg"
+    organisms = {}
+    for folder, brite in (("first", _br08601), ("second", _br08601.replace("eco  Escherichia", "ecx  Escherichia"))):
+        os.makedirs(tmp_path / folder)
+        with open(tmp_path / folder / "br08601.keg", "w") as f:
+            f.write(brite)
+        organisms[folder] = kemet.taxonomy_filter(_taxonomy, str(tmp_path / folder), _taxonomy+".keg", str(tmp_path / folder))
+    assert organisms == {"first": {"eco"}, "second": {"ecx"}}
+
+@pytest.mark.parametrize("download", [True, False])
+def test_evicted_sequences_of_a_view(kemet_folder, capsys, download):
+    io = kemet_folder["runs"]["A"]
+    dir_KO = path.join(io["dir_base_KO"], "eco") + "/"
+    os.makedirs(dir_KO)
+    kemet._download_KO("K00844", dir_KO, {"eco"}, io["kegg_url"], io=io)
+    # another run evicts a sequence linked by the KO folder
+    os.remove(kemet._gene_file("eco:b0002", io=io))
+    os.makedirs(path.join(io["msa_dir"], "bin1"))
+    kemet._write_KO_multifasta("K00844", {"eco"}, "bin1", io["msa_dir"], dir_KO, download=download, io=io)
+
+    with open(path.join(io["msa_dir"], "bin1", "K00844", "MSA_K00844.fna")) as f:
+        msa = f.read()
+    if download:
+        assert msa == ">eco:b0001\nACGTACGT\n>eco:b0002\nACGTACGTACGT\n"
+        assert path.isfile(kemet._gene_file("eco:b0002", io=io))
+        assert "missing from the sequence cache" not in capsys.readouterr().out
+    else:
+        assert msa == ">eco:b0001\nACGTACGT\n"
+        assert "1 sequences of K00844 missing from the sequence cache" in capsys.readouterr().out
+
+def test_sequence_cache_evicted_once_per_batch(kemet_folder, monkeypatch):
+    io = kemet_folder["runs"]["A"]
+    events = []
+    monkeypatch.setattr(kemet, "run_genome", lambda FASTA, *args, **kwargs: events.append(FASTA))
+    monkeypatch.setattr(kemet, "evict_sequence_cache", lambda cache_size, keep_since=None, io=None: events.append("evict") or 0)
+    args = kemet.build_parser().parse_args(["--batch", "-a", "eggnog", "--skip_gsmm", "-q"])
+    genomes = ["bin1.fna", "bin2.fna", "bin3.fna"]
+    assert kemet.run_batch(genomes, args, {}, { genome: (_taxonomy, "bacteria") for genome in genomes }, io=io) == []
+    assert events == genomes + ["evict"]
+
+def test_batch_genomes_of_a_taxonomy_in_parallel(kemet_folder, monkeypatch):
+    import concurrent.futures
+    # worker threads instead of processes, to share the stubs
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", concurrent.futures.ThreadPoolExecutor)
+    barrier = threading.Barrier(3)
+    monkeypatch.setattr(kemet, "run_genome", lambda FASTA, *args, **kwargs: barrier.wait(timeout=30))
+    args = kemet.build_parser().parse_args(["--batch", "-a", "eggnog", "--skip_gsmm", "-q"])
+    genomes = ["bin1.fna", "bin2.fna", "bin3.fna"]
+    genomes_instruction = { genome: (_taxonomy, "bacteria") for genome in genomes }
+    # every MAG/Genome of the same taxonomy runs at the same time
+    assert kemet.run_batch(genomes, args, {}, genomes_instruction, workers=3, io=kemet_folder["runs"]["A"]) == []
+
+def test_concurrent_downloads_of_a_KO(kemet_folder, monkeypatch):
+    io = kemet_folder["runs"]["A"]
+    kegg_get = kemet.kegg_get
+    active, overlaps, requested = [], [], []
+    def slow_kegg_get(entries, **kwargs):
+        requested.extend(entries)
+        active.append(entries)
+        overlaps.append(len(active))
+        threading.Event().wait(0.05)
+        try:
+            return kegg_get(entries, **kwargs)
+        finally:
+            active.remove(entries)
+    monkeypatch.setattr(kemet, "kegg_get", slow_kegg_get)
+
+    # the same KO for two taxonomies, in threads
+    taxa = {"eco": {"eco"}, "all": {"eco", "bsu"}}
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        futures = [ ex.submit(kemet._download_KO, "K00844", path.join(io["dir_base_KO"], name), taxa_allow, io["kegg_url"], io=io)
+                    for name, taxa_allow in taxa.items() ]
+        for future in futures:
+            future.result()
+    assert max(overlaps) == 1
+    # the KO is listed and each gene downloaded once
+    genes = [ gene for entry in requested if entry.endswith("/ntseq") for gene in entry[:-len("/ntseq")].split("+") ]
+    assert requested.count("K00844") == 1
+    assert sorted(genes) == ["bsu:bsu00010", "eco:b0001", "eco:b0002"]
+    assert sorted(os.listdir(path.join(io["dir_base_KO"], "eco", "K00844"))) == ["eco:b0001.fna", "eco:b0002.fna"]
+    assert sorted(os.listdir(path.join(io["dir_base_KO"], "all", "K00844"))) == ["bsu:bsu00010.fna", "eco:b0001.fna", "eco:b0002.fna"]
+    state = kemet.read_ko_manifest("K00844", io=io)["state"]
+    assert { gene: status for gene, (status, _) in state.items() } == {
+        "eco:b0001": "valid", "eco:b0002": "valid", "bsu:bsu00010": "valid"}
+
+def test_concurrent_taxonomy_profiles(kemet_folder, monkeypatch):
+    io = kemet_folder["runs"]["A"]
+    monkeypatch.setattr(kemet, "_taxonomy_profiles", set())
+    dir_KO = path.join(io["dir_base_KO"], "eco") + "/"
+    kemet._download_KO("K00844", dir_KO, {"eco"}, io["kegg_url"], io=io)
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        profiles = list(ex.map(lambda _: kemet.taxonomy_profile("K00844", _taxonomy, {"eco"}, dir_KO, io=io), range(4)))
+    profile = path.join(io["profiles_dir"], _taxonomy.replace(" ", "_"), "K00844", "K00844.hmm")
+    assert profiles == [profile] * 4
+    assert [ command for command, _ in kemet_folder["commands"] ] == ["mafft", "hmmbuild"]
+    assert os.listdir(path.join(io["profiles_dir"], _taxonomy.replace(" ", "_"), ".build", "K00844")) == []
+
+def test_batch_plan_of_taxonomy_profiles(kemet_folder, monkeypatch):
+    import concurrent.futures
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", concurrent.futures.ThreadPoolExecutor)
+    monkeypatch.setattr(kemet, "_taxonomy_profiles", set())
+    io = kemet_folder["runs"]["A"]
+    genomes = ["bin1.fna", "bin2.fna"]
+    with open(path.join(io["dir_genomes"], "bin1.fna")) as f, open(path.join(io["dir_genomes"], "bin2.fna"), "w") as g:
+        g.write(f.read())
+    with open(path.join(io["KAnnotation_directory"], "bin2.emapper.annotations"), "w") as f:
+        f.write("#query_name\tKEGG_ko\nbin2_1\tko:K00001\n")
+    kk_database = kemet.load_kk_database(path.join(repo_dir, "KEGG_MODULES", "kk_files"))
+    args = kemet.build_parser().parse_args(["--batch", "-a", "eggnog", "--hmm_mode", "kos", "--shared_profiles",
+                                            "--skip_gsmm", "-q", "--threshold_value", "0.43"])
+    genomes_instruction = { genome: (_taxonomy, "bacteria") for genome in genomes }
+    assert kemet.run_batch(genomes, args, kk_database, genomes_instruction, workers=2, io=io) == []
+
+    # each (taxonomy, KO) profile HMM is built once, before the searches of every MAG/Genome
+    commands = [ command for command, _ in kemet_folder["commands"] ]
+    assert sorted(commands[:2 * len(_kos)]) == ["hmmbuild"] * len(_kos) + ["mafft"] * len(_kos)
+    assert commands[2 * len(_kos):] == ["nhmmer"] * (len(genomes) * len(_kos))
+    for genome in ("bin1", "bin2"):
+        with open(path.join(io["hmm_hits_dir"], f"{genome}_HMM_hits.txt")) as f:
+            assert [ line.split("\t")[0] for line in f.readlines()[1:] ] == _kos
+
+def test_hmm_by_blocks_early_stopping(kemet_folder, monkeypatch):
+    io = kemet_folder["runs"]["A"]
+    hits = {"K00001": False, "K00002": True, "K00003": True, "K00004": True, "K00005": False, "K00006": True, "K00007": True}
+    searched = []
+    monkeypatch.setattr(kemet, "_hmm_check_KO", lambda K, *args, **kwargs: searched.append(K) or hits[K])
+    completion = {
+        "M00001": [
+            {"candidates": [(1, ("K00001",)), (1, ("K00002",)), (2, ("K00003",))]},
+            {"candidates": [(2, ("K00004", "K00005", "K00006")), (2, ("K00002",))]},
+        ],
+        "M00002": [
+            {"candidates": [(1, ("K00001",)), (1, ("K00007",))]},
+        ],
+    }
+    checked, skipped = kemet.hmm_by_blocks(completion, "bin1", path.join(io["dir_genomes"], "bin1.fna"), {"eco"},
+                                           path.join(io["dir_base_KO"], "eco") + "/", io=io)
+    # options after a hit are skipped, complexes stop at their first KO without hits, shared KOs are searched once
+    assert searched == ["K00001", "K00002", "K00004", "K00005", "K00007"]
+    assert checked == { K: hits[K] for K in searched }
+    assert skipped == ["K00003", "K00006"]
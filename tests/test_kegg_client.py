@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Tests of the in-process KEGG API client of kemet.py ("kegg_get()"), against a local stub server:
+retries, rate limit, keep-alive connections, chunked and partial responses,
+and the nt sequences downloads built on it ("get_ntseqs()").
+"""
+
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import path
+import sys
+import threading
+import time
+
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+import kemet
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        stub = self.server.stub
+        entry = self.path[len("/get/"):]
+        with stub["lock"]:
+            stub["requests"].append((entry, self.client_address, time.monotonic()))
+            attempt = sum( requested == entry for requested, _, _ in stub["requests"] )
+        status, body, mode = stub["respond"](entry, attempt)
+        body = body.encode()
+        self.send_response(status)
+        if mode == "chunked":
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(body), 7):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(body[i:i+7]), body[i:i+7]))
+            self.wfile.write(b"0\r\n\r\n")
+        elif mode == "partial":
+            # the connection is closed before the announced body is complete
+            self.send_header("Content-Length", str(len(body) + 100))
+            self.end_headers()
+            self.wfile.write(body)
+            self.close_connection = True
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub(monkeypatch):
+    """
+    Local KEGG API stub: "respond" is called with (entry, attempt) and returns (status, body, mode),
+    mode being None, "chunked" or "partial"; "requests" records (entry, client address, time) of each request.
+    """
+    monkeypatch.setattr(kemet, "_kegg_backoff", 0.01)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    server.stub = {"lock": threading.Lock(), "requests": [], "respond": lambda entry, attempt: (200, f"ENTRY {entry}\n", None),
+                   "url": f"http://127.0.0.1:{server.server_address[1]}/"}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.stub
+    server.shutdown()
+    server.server_close()
+
+def _get(stub, entries, **kwargs):
+    kwargs.setdefault("rate", 100)
+    kwargs.setdefault("connections", 3)
+    return kemet.kegg_get(entries, base_url=stub["url"], **kwargs)
+
+def _attempts(stub, entry):
+    return sum( requested == entry for requested, _, _ in stub["requests"] )
+
+def test_server_errors_are_retried(stub):
+    stub["respond"] = lambda entry, attempt: (500, "error", None) if attempt < 3 else (200, f"ENTRY {entry}\n", None)
+    assert _get(stub, ["K00001"], retries=3) == {"K00001": "ENTRY K00001\n"}
+    assert _attempts(stub, "K00001") == 3
+
+def test_retries_are_bounded(stub):
+    stub["respond"] = lambda entry, attempt: (503, "unavailable", None)
+    assert _get(stub, ["K00001"], retries=2) == {"K00001": None}
+    assert _attempts(stub, "K00001") == 3
+
+def test_not_found_is_not_retried(stub):
+    stub["respond"] = lambda entry, attempt: (404, "", None) if entry == "K99999" else (200, f"ENTRY {entry}\n", None)
+    assert _get(stub, ["K99999", "K00001"], retries=3) == {"K99999": None, "K00001": "ENTRY K00001\n"}
+    assert _attempts(stub, "K99999") == 1
+
+def test_invalid_responses_are_retried(stub):
+    stub["respond"] = lambda entry, attempt: (200, "ENT" if attempt == 1 else f"ENTRY {entry}\n", None)
+    results = _get(stub, ["K00001"], validate=lambda text: text.startswith("ENTRY"))
+    assert results == {"K00001": "ENTRY K00001\n"}
+    assert _attempts(stub, "K00001") == 2
+
+def test_partial_responses_are_retried(stub):
+    stub["respond"] = lambda entry, attempt: (200, f"ENTRY {entry}\n", "partial" if attempt == 1 else None)
+    assert _get(stub, ["K00001", "K00002"]) == {"K00001": "ENTRY K00001\n", "K00002": "ENTRY K00002\n"}
+    assert _attempts(stub, "K00001") == _attempts(stub, "K00002") == 2
+
+def test_chunked_responses(stub):
+    body = "".join( f">eco:b{i:04d}\nACGTACGTACGT\n" for i in range(20) )
+    stub["respond"] = lambda entry, attempt: (200, body, "chunked")
+    assert _get(stub, ["eco:b0000/ntseq", "eco:b0001/ntseq"], connections=1) == {"eco:b0000/ntseq": body, "eco:b0001/ntseq": body}
+
+def test_connections_are_reused(stub):
+    entries = [ f"K{i:05d}" for i in range(12) ]
+    assert sorted(_get(stub, entries, connections=2)) == entries
+    assert len(stub["requests"]) == 12
+    assert len({ client for _, client, _ in stub["requests"] }) == 2
+
+def test_rate_limit(stub):
+    rate = 10
+    entries = [ f"K{i:05d}" for i in range(21) ]
+    start = time.monotonic()
+    assert all(_get(stub, entries, rate=rate, connections=3).values())
+    # the token bucket starts with a single token
+    assert time.monotonic() - start >= (len(entries) - 1) / rate * 0.95
+    times = sorted( request_time for _, _, request_time in stub["requests"] )
+    assert max( sum( t <= other < t + 1 for other in times ) for t in times ) <= rate + 1
+
+def test_callback_gets_each_entry(stub):
+    stub["respond"] = lambda entry, attempt: (404, "", None) if entry == "K99999" else (200, f"ENTRY {entry}\n", None)
+    done = []
+    _get(stub, ["K00001", "K99999", "K00001"], callback=lambda entry, text: done.append((entry, text)))
+    assert sorted(done) == [("K00001", "ENTRY K00001\n"), ("K99999", None)]
+
+def test_running_event_loop(stub):
+    async def notebook_cell():
+        return _get(stub, ["K00001"])
+    assert asyncio.run(notebook_cell()) == {"K00001": "ENTRY K00001\n"}
+
+def _ntseq_stub(stub, returned):
+    """
+    Nt sequences stub: "returned" lists, by request (i.e. by retry, for a single batch),
+    the genes returned for "get/<gene>+.../ntseq" (a 404 if none).
+    """
+    def respond(entry, attempt):
+        request = min(len(stub["requests"]), len(returned))
+        genes = [ gene for gene in entry[:-len("/ntseq")].split("+") if gene in returned[request - 1] ]
+        if not genes:
+            return 404, "", None
+        return 200, "".join( f">{gene} test\nACGT\n" for gene in genes ), None
+    stub["respond"] = respond
+
+def test_ntseqs_missing_after_every_retry(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(kemet, "kegg_rate", 100)
+    monkeypatch.setattr(kemet, "kegg_connections", 3)
+    genes = ["eco:b0001", "eco:b0002", "eco:b0003", "eco:b0004"]
+    # partial batch, then a second gene, then a 404
+    _ntseq_stub(stub, [{"eco:b0001"}, {"eco:b0002"}, set()])
+    stored = []
+    records = kemet.get_ntseqs(genes, stub["url"], retries=2,
+                               store=lambda gene, record: stored.append((gene, record, len(stub["requests"]))))
+    assert sorted(records) == ["eco:b0001", "eco:b0002"]
+    assert len(stub["requests"]) == 3
+    assert [ (gene, record is None, requests) for gene, record, requests in stored ] == [
+        ("eco:b0001", False, 1), ("eco:b0002", False, 2), ("eco:b0003", True, 3), ("eco:b0004", True, 3)]
+
+def test_unavailable_genes_are_journaled(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(kemet, "kegg_rate", 100)
+    monkeypatch.setattr(kemet, "kegg_connections", 3)
+    monkeypatch.setattr(kemet, "seq_cache_dir", str(tmp_path / "_genes"))
+    monkeypatch.setattr(kemet, "ko_genes_dir", str(tmp_path / "_ko_genes"))
+    genes = ["eco:b0001", "eco:b0002"]
+    # KEGG returns nothing: every request is a 404
+    _ntseq_stub(stub, [set()])
+    kemet.get_ntseqs(genes, stub["url"], retries=2, store=lambda gene, record: kemet._store_ntseq("K00001", gene, record))
+    assert len(stub["requests"]) == 3
+    state = kemet.read_ko_manifest("K00001")["state"]
+    assert { gene: status for gene, (status, _) in state.items() } == {"eco:b0001": "unavailable", "eco:b0002": "unavailable"}
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Regression tests of the .kk files compiler ("set_kemet_working-directory.py"):
+every KEGG Module flat-file shipped in KEGG_MODULES is compiled, and its KEGG Modules completeness
+over random KO sets is compared with the curated .kk file shipped in KEGG_MODULES/kk_files.
+Curated .kk files differing from their flat-file are listed, with the reason, in the shipped manifest.
+"""
+
+import hashlib
+import json
+import os
+from os import path
+import random
+import re
+import shutil
+import sys
+import importlib.util
+
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+import kemet
+
+_spec = importlib.util.spec_from_file_location("set_kemet_working_directory",
+                                               path.join(repo_dir, "set_kemet_working-directory.py"))
+setup = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(setup)
+
+Modules_directory = path.join(repo_dir, "KEGG_MODULES")
+kkfiles_directory = path.join(Modules_directory, "kk_files")
+
+def _flat_files():
+    return { module_txt[:6]: module_txt for module_txt in sorted(os.listdir(Modules_directory))
+             if module_txt.endswith(".txt") and re.match("M[0-9]{5}", module_txt) }
+
+@pytest.fixture(scope="module")
+def records():
+    return { module: kemet.parse_module_flat_file(path.join(Modules_directory, module_txt))
+             for module, module_txt in _flat_files().items() }
+
+@pytest.fixture(scope="module")
+def manifest():
+    with open(path.join(kkfiles_directory, setup._kk_manifest)) as f:
+        return json.load(f)
+
+def _compile(module, records):
+    definitions = { other: record["definition"] for other, record in records.items() }
+    return setup.compile_kk_file(module, records[module]["name"], records[module]["definition"], definitions)
+
+def _ko_sets(kos, count=200, seed=0):
+    # KO sets of different density, so that blocks of every KEGG Module are found present and missing
+    rng = random.Random(seed)
+    ko_sets = []
+    for _ in range(count):
+        density = rng.choice([0.2, 0.4, 0.6, 0.8, 0.95])
+        ko_sets.append({ ko for ko in kos if rng.random() < density })
+    return ko_sets
+
+@pytest.fixture(scope="module")
+def diverging(records, tmp_path_factory):
+    """
+    KEGG Modules whose compiled and curated .kk files give a different completeness, for any random KO set.
+    """
+    compiled_directory = tmp_path_factory.mktemp("kk_files")
+    for module in records:
+        kk_content = _compile(module, records)
+        if kk_content:
+            with open(compiled_directory / (module + ".kk"), "w") as f:
+                f.write(kk_content)
+    compiled = kemet.compile_kk_database(str(compiled_directory))
+    curated = kemet.compile_kk_database(kkfiles_directory)
+    assert sorted(compiled["modules"]) == sorted(curated["modules"])
+
+    diverging = set()
+    for ko_set in _ko_sets(sorted(set(compiled["ko_ids"]) | set(curated["ko_ids"]))):
+        compiled_completeness = kemet.evaluate(ko_set, kk_database=compiled)
+        curated_completeness = kemet.evaluate(ko_set, kk_database=curated)
+        for module, completeness in compiled_completeness.items():
+            if any( completeness[key] != curated_completeness[module][key]
+                    for key in ("completeness", "present_blocks", "total_blocks") ):
+                diverging.add(module)
+    return diverging
+
+def test_compiled_completeness_matches_curated_kk_files(diverging, manifest):
+    # a curated .kk file matching again (e.g. after fixing it) should not be listed anymore
+    listed = { module for module, entry in manifest["modules"].items() if "curated" in entry }
+    assert sorted(diverging - listed) == []
+    assert sorted(listed - diverging) == []
+
+def test_manifest_matches_shipped_files(records, manifest):
+    # an update ("-u") of the shipped KEGG Modules compiles nothing
+    module_files = _flat_files()
+    definitions = { module: record["definition"] for module, record in records.items() }
+    digests = setup._source_digests(Modules_directory, module_files, definitions)
+    assert manifest["compiler_version"] == setup._kk_compiler_version
+    assert sorted(manifest["modules"]) == sorted(module_files)
+    for module, entry in manifest["modules"].items():
+        assert entry["source"] == module_files[module]
+        assert entry["source_sha1"] == digests[module], module
+        with open(path.join(kkfiles_directory, module + ".kk"), "rb") as f:
+            assert entry["kk_sha1"] == hashlib.sha1(f.read()).hexdigest(), module
+
+def test_update_keeps_curated_kk_files(manifest, tmp_path):
+    modules = ["M00001", "M00022", "M00846"]
+    os.makedirs(tmp_path / "KEGG_MODULES" / "kk_files")
+    for module in modules:
+        shutil.copy(path.join(Modules_directory, _flat_files()[module]), tmp_path / "KEGG_MODULES")
+        shutil.copy(path.join(kkfiles_directory, module + ".kk"), tmp_path / "KEGG_MODULES" / "kk_files")
+    with open(tmp_path / "KEGG_MODULES" / "kk_files" / setup._kk_manifest, "w") as f:
+        json.dump(dict(manifest, modules={ module: manifest["modules"][module] for module in modules }), f)
+    def kk_file(module):
+        with open(tmp_path / "KEGG_MODULES" / "kk_files" / (module + ".kk")) as f:
+            return f.read()
+    def read_manifest():
+        return setup.read_kk_manifest(str(tmp_path / "KEGG_MODULES" / "kk_files"))
+    shipped = { module: kk_file(module) for module in modules }
+
+    # "-k": curated .kk files are kept, the others compiled again
+    setup.set_kk_database(str(tmp_path))
+    assert kk_file("M00022") == shipped["M00022"] and kk_file("M00846") == shipped["M00846"]
+    # a .kk file edited by hand is kept, and then curated
+    with open(tmp_path / "KEGG_MODULES" / "kk_files" / "M00001.kk", "a") as f:
+        f.write("OPTIONAL_LIST\nK00844\n")
+    edited = kk_file("M00001")
+    setup.update_kk_database(str(tmp_path))
+    assert read_manifest()["modules"]["M00001"]["curated"] == "edited after compilation"
+    assert kk_file("M00001") == edited
+    # a curated .kk file is compiled again after its own flat-file changed
+    with open(tmp_path / "KEGG_MODULES" / _flat_files()["M00022"], "a") as f:
+        f.write("\n")
+    setup.update_kk_database(str(tmp_path))
+    assert "curated" not in read_manifest()["modules"]["M00022"] and kk_file("M00022") != shipped["M00022"]
+    assert kk_file("M00846") == shipped["M00846"]
+    # "-f" replaces every curated .kk file
+    setup.update_kk_database(str(tmp_path), force=True)
+    assert not any( "curated" in entry for entry in read_manifest()["modules"].values() )
+    assert kk_file("M00846") != shipped["M00846"]
+
+def test_alternatives_of_same_length_are_not_mixed(records, tmp_path):
+    # M00849: (K00869 K17942/complexes) and (K18689 K18690 K22813) are both 3 steps long
+    with open(tmp_path / "M00849.kk", "w") as f:
+        f.write(_compile("M00849", records))
+    kk_database = kemet.compile_kk_database(str(tmp_path))
+    ko_set = {"K00626", "K01641", "K00021", "K00869", "K18690", "K22813", "K06981", "K01823"}
+    completeness = kemet.evaluate(ko_set, kk_database=kk_database)["M00849"]
+    assert (completeness["present_blocks"], completeness["total_blocks"]) == (7, 8)
+
+@pytest.mark.parametrize("definition, blocks", [
+    ("K00001,K00002 K00003", [["K00001", "K00002"], ["K00003"]]),
+    ("((K00001,K00002) K00003,K00004) K00005", [["K00001", "K00002", "K00004"], ["K00003", "K00004"], ["K00005"]]),
+    ("(K00001 K00002),(K00003 K00004),K00005 K00006", None),
+])
+def test_definition_precedence(definition, blocks):
+    kk_content = setup.compile_kk_file("M99999", "test", [definition], {})
+    if blocks is None:
+        assert kk_content.count("//\n") == 2
+        assert "K00001, K00005\nK00002, K00005\nK00006\n" in kk_content
+    else:
+        assert kk_content.split("\n")[1:len(blocks)+1] == [ ", ".join(block) for block in blocks ]
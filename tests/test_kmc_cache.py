@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Tests of the KEGG Modules completeness cache of kemet.py ("--kmc_cache").
+"""
+
+import os
+from os import path
+import subprocess
+import sys
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+import kemet
+
+def test_cache_size_bound(tmp_path, monkeypatch):
+    cache_directory = str(tmp_path / "kmc_cache")
+    scanned = []
+    scandir = os.scandir
+    def counting_scandir(folder):
+        scanned.append(folder)
+        return scandir(folder)
+    monkeypatch.setattr(kemet.os, "scandir", counting_scandir)
+
+    entry = {"results": {"M00001.kk": ("digest", "x" * 1000)}}
+    for i in range(100):
+        kemet._write_kmc_cache(path.join(cache_directory, f"{i:03d}.pkl"), entry, 20000)
+        # entries are not ordered by last use within the same time resolution otherwise
+        os.utime(path.join(cache_directory, f"{i:03d}.pkl"), ns=(i * 10**9, i * 10**9))
+
+    cached = sorted(os.listdir(cache_directory))
+    total = sum( path.getsize(path.join(cache_directory, file)) for file in cached )
+    assert 0 < total <= 20000
+    # least recently used entries were evicted
+    assert cached == [ f"{i:03d}.pkl" for i in range(100 - len(cached), 100) ]
+    # the folder is measured once, then only when crossing the bound, i.e. not at every write
+    assert 1 < len(scanned) < 100 / 2
+
+def test_kmc_cache_rejected_with_batch_completeness(tmp_path):
+    completed = subprocess.run([sys.executable, path.join(repo_dir, "kemet.py"), "--batch_completeness", "--kmc_cache"],
+                               cwd=tmp_path, capture_output=True, text=True)
+    assert completed.returncode == 2
+    assert "--kmc_cache is not supported with --batch_completeness" in completed.stderr
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Tests of the KEGG Modules selected for the "onebm" HMM mode ("create_tuple_modules_1BM()"):
+the in-memory completeness of the run and the tab-separated report select the same KEGG Modules.
+"""
+
+from os import path
+import sys
+
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+import kemet
+
+# KOs of glycolysis (M00001) and of the TCA cycle (M00009):
+# KEGG Modules missing 1 block range from 0% (single-block Modules) to 90% completeness
+ko_list = ["K00844", "K01810", "K00850", "K01623", "K01803", "K00134", "K00927", "K01834", "K01689",
+           "K01647", "K01681", "K00031", "K00164", "K00658", "K00382", "K01902", "K01903", "K00239", "K00240", "K01676"]
+
+@pytest.fixture(scope="module")
+def kk_database():
+    return kemet.compile_kk_database(path.join(repo_dir, "KEGG_MODULES", "kk_files"))
+
+@pytest.mark.parametrize("cutoff", [0, 50, 90])
+def test_genome_state_matches_report(kk_database, tmp_path, cutoff):
+    genome_state = kemet.testcompleteness(ko_list, kk_database, str(tmp_path), "reportKMC_bin1.txt",
+                                          str(tmp_path), "reportKMC_bin1.tsv", cutoff=cutoff)
+
+    from_report = kemet.create_tuple_modules_1BM("bin1", "report.instruction", str(tmp_path), str(tmp_path))
+    from_state = kemet.create_tuple_modules_1BM("bin1", "state.instruction", str(tmp_path), str(tmp_path),
+                                                genome_state=genome_state, cutoff=cutoff)
+    assert from_report
+    assert sorted(from_state) == sorted(from_report)
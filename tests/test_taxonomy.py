@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Tests of KEGG taxonomies resolution ("taxonomy_organisms()"), on an excerpt of the KEGG Organisms hierarchy.
+"""
+
+from os import path
+import sys
+
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+import kemet
+
+_br08601 = """+C\tOrganisms
+!
+A<b>Prokaryotes</b>
+B  Bacteria
+C    Gammaproteobacteria - Enterobacteria
+D      Escherichia
+E        T00007  eco  Escherichia coli K-12 MG1655
+E        T00068  ecs  Escherichia coli O157:H7 Sakai
+D      Salmonella
+E        T00045  stm  Salmonella enterica subsp. enterica serovar Typhimurium LT2
+C    Gammaproteobacteria - Others
+D      Pseudomonas
+E        T00035  pae  Pseudomonas aeruginosa PAO1
+C    Firmicutes - Bacilli
+D      Bacillus
+E        T00010  bsu  Bacillus subtilis subsp. subtilis 168
+!
+"""
+
+@pytest.fixture
+def taxonomy_index(tmp_path):
+    with open(tmp_path / "br08601.keg", "w") as f:
+        f.write(_br08601)
+    return kemet.compile_taxonomy_index(str(tmp_path / "br08601.keg"))
+
+@pytest.mark.parametrize("taxonomy, organisms", [
+    ("Gammaproteobacteria - Enterobacteria", {"eco", "ecs", "stm"}),
+    ("escherichia", {"eco", "ecs"}),
+    ("Bacteria", {"eco", "ecs", "stm", "pae", "bsu"}),
+])
+def test_taxonomy_names(taxonomy_index, taxonomy, organisms, capsys):
+    assert kemet.taxonomy_organisms(taxonomy_index, taxonomy) == organisms
+    assert "WARNING" not in capsys.readouterr().out
+
+def test_taxonomy_prefix_of_c_level(taxonomy_index, capsys):
+    # as in previous KEMET versions, the first C-level entry including the taxonomy
+    assert kemet.taxonomy_organisms(taxonomy_index, "Gammaproteobacteria") == {"eco", "ecs", "stm"}
+    out = capsys.readouterr().out
+    assert 'using "Gammaproteobacteria - Enterobacteria" (first of 2 C-level matches)' in out
+
+def test_unknown_taxonomy(taxonomy_index):
+    with pytest.raises(ValueError, match="not a KEGG Organisms taxonomy"):
+        kemet.taxonomy_organisms(taxonomy_index, "Archaea")
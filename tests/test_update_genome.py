@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Tests of the incremental KEGG Modules completeness ("update_genome()"), on the shipped .kk files:
+after adding or removing KOs, results are the same of a full evaluation of the new KO set.
+"""
+
+from os import path
+import random
+import sys
+
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+import kemet
+
+_result_keys = ("txt", "tsv", "Kmissing", "Kpresent", "presence")
+
+@pytest.fixture(scope="module")
+def kk_database():
+    return kemet.compile_kk_database(path.join(repo_dir, "KEGG_MODULES", "kk_files"))
+
+def _results(genome_state):
+    return { kk_file: { key: result[key] for key in _result_keys } for kk_file, result in genome_state["results"].items() }
+
+@pytest.mark.parametrize("seed", range(4))
+def test_updates_match_full_evaluation(kk_database, seed):
+    rng = random.Random(seed)
+    ko_ids = sorted(kk_database["ko_ids"])
+    genome_state = kemet.evaluate_genome(rng.sample(ko_ids, len(ko_ids) // 4), kk_database)
+    for _ in range(10):
+        # KOs of complexes, of optional blocks and of no KEGG Module are added and removed as well
+        added = rng.sample(ko_ids, rng.randint(0, 30)) + ["K99999"] * rng.randint(0, 1)
+        removed = rng.sample(sorted(genome_state["ko_set"]), min(len(genome_state["ko_set"]), rng.randint(0, 30)))
+        new_state, changed = kemet.update_genome(genome_state, kk_database, added=added, removed=removed)
+
+        full_state = kemet.evaluate_genome(sorted(new_state["ko_set"]), kk_database)
+        old_results, full_results = _results(genome_state), _results(full_state)
+        assert new_state["ko_set"] == (genome_state["ko_set"] | set(added)) - set(removed)
+        assert new_state["ko_bits"] == full_state["ko_bits"]
+        assert _results(new_state) == full_results
+        assert changed == sorted( kk_file for kk_file, result in full_results.items() if result != old_results[kk_file] )
+
+        completeness = kemet.evaluate(new_state["ko_set"], kk_database)
+        for kk_file, result in new_state["results"].items():
+            module = completeness[kk_file[:-3]]
+            assert (module["completeness"], module["present_blocks"], module["total_blocks"]) == result["tsv"]
+            assert (module["missing_KOs"], module["present_KOs"]) == (result["Kmissing"], result["Kpresent"])
+        genome_state = new_state
+
+def test_inverted_index_covers_changed_modules(kk_database):
+    rng = random.Random(0)
+    ko_ids = sorted(kk_database["ko_ids"])
+    genome_state = kemet.evaluate_genome(rng.sample(ko_ids, len(ko_ids) // 2), kk_database)
+    old_results = _results(genome_state)
+    for ko in rng.sample(ko_ids, 100):
+        if ko in genome_state["ko_set"]:
+            new_state, changed = kemet.update_genome(genome_state, kk_database, removed=[ko])
+        else:
+            new_state, changed = kemet.update_genome(genome_state, kk_database, added=[ko])
+        full_results = _results(kemet.evaluate_genome(sorted(new_state["ko_set"]), kk_database))
+        # every KEGG Module changed by a KO is reached through its index entries
+        indexed = { kk_file for kk_file, _, _ in kk_database["ko_index"][ko] }
+        assert { kk_file for kk_file, result in full_results.items() if result != old_results[kk_file] } <= indexed
+        assert _results(new_state) == full_results
+        assert set(changed) <= indexed